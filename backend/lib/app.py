@@ -131,21 +131,27 @@ class MultiTenantRagStack(Stack):
             vpc=vpc_stack.vpc
         )
         
-        # generation_handler_stack = GenerationHandlerStack(self, 'GenerationHandlerApiStack',
+        # tools_provider_stack = ToolsProviderStack(self, 'Tools-Provider-Stack',
         #     app_security_group=vpc_stack.app_security_group,
         #     auth_fn=auth_provider_stack.cognito_stack.cognito_auth_provider_function,
-        #     auth_role_arn=auth_provider_stack.cognito_stack.authenticated_role_arn,
-        #     graph_handler_fn_arn=graph_store_provider_stack.graph_store_provider.function_arn,
         #     parent_stack_name=self.stack_name,
-        #     user_pool_client_id=auth_provider_stack.cognito_stack.user_pool_client.user_pool_client_id,
-        #     user_pool_id=auth_provider_stack.cognito_stack.user_pool.user_pool_id,
         #     vpc=vpc_stack.vpc
         # )
 
-        # tools_provider_stack = ToolsProviderStack(self, 'Tools-Provider-Stack',
+        # generation_handler_stack = GenerationHandlerStack(self, 'GenerationHandlerApiStack',
         #     app_security_group=vpc_stack.app_security_group,
         #     auth_fn=auth_provider_stack.cognito_stack.cognito_auth_provider_function,
+        #     auth_role_arn=auth_provider_stack.cognito_stack.authenticated_role_arn,
+        #     doc_collections_fn_arn=doc_collections_stack.doc_collections_function.function_arn,
+        #     embeddings_fn_arn=embeddings_provider_stack.embeddings_provider_function.function_arn,
+        #     graph_handler_fn_arn=graph_store_provider_stack.graph_store_provider.function_arn,
+        #     ingestion_status_fn_arn=ingestion_provider_stack.ingestion_status_function.function_arn,
         #     parent_stack_name=self.stack_name,
+        #     prompt_templates_fn_arn=prompt_templates_handler_stack.prompt_template_handler_function.function_arn,
+        #     tools_fn_arn=tools_provider_stack.tools_provider_function.function_arn,
+        #     user_pool_client_id=auth_provider_stack.cognito_stack.user_pool_client.user_pool_client_id,
+        #     user_pool_id=auth_provider_stack.cognito_stack.user_pool.user_pool_id,
+        #     vector_store_fn_arn=vector_store_provider_stack.vector_store_stack.vector_store_provider.function_arn,
         #     vpc=vpc_stack.vpc
         # )
 
@@ -103,7 +103,9 @@ class DocumentCollectionsHandlerStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_13,
             architecture=lambda_.Architecture.ARM_64,
             handler='multi_tenant_full_stack_rag_application.document_collections_handler.document_collections_handler.handler',
-            timeout=Duration.seconds(60),
+            # api requests are cut off at 29s by api gateway. The long
+            # timeout is for the async invocations that migrate indices.
+            timeout=Duration.seconds(900),
             environment={
                 "DOCUMENT_COLLECTIONS_TABLE": self.doc_collections_table_stack2.table.table_name,
                 "STACK_NAME": parent_stack_name,
@@ -117,6 +117,13 @@ class EmbeddingsProviderStack(Stack):
         )
         emb_provider_origin_param.apply_removal_policy(RemovalPolicy.DESTROY)
 
+        # callers key their query embedding caches on this.
+        emb_model_id_param = ssm.StringParameter(self, 'EmbeddingsModelId',
+            parameter_name=f'/{parent_stack_name}/embeddings_model_id',
+            string_value=embeddings_model_id
+        )
+        emb_model_id_param.apply_removal_policy(RemovalPolicy.DESTROY)
+
         self.embeddings_provider_function.add_to_role_policy(
             iam.PolicyStatement(
                 actions=["bedrock:InvokeModel"],
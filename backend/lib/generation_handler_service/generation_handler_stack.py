@@ -29,10 +29,16 @@ class GenerationHandlerStack(Stack):
         app_security_group: ec2.ISecurityGroup,
         auth_fn: lambda_.IFunction,
         auth_role_arn: str,
+        doc_collections_fn_arn: str,
+        embeddings_fn_arn: str,
         graph_handler_fn_arn: str,
+        ingestion_status_fn_arn: str,
         parent_stack_name: str,
+        prompt_templates_fn_arn: str,
+        tools_fn_arn: str,
         user_pool_client_id: str,
         user_pool_id: str,
+        vector_store_fn_arn: str,
         vpc: ec2.IVpc,
         **kwargs
     ) -> None:
@@ -40,33 +46,46 @@ class GenerationHandlerStack(Stack):
 
         cognito_auth_role = iam.Role.from_role_arn(self, 'GhCognitoAuthRoleRef', auth_role_arn)
 
+        # bedrock_provider is bundled too, so model calls are dispatched
+        # in-process (RPC_IN_PROCESS_TARGETS) and converse_stream deltas
+        # reach the generation handler as they arrive, rather than in one
+        # buffered lambda response.
         bundling_cmds = [
+            "mkdir -p /asset-output/multi_tenant_full_stack_rag_application/bedrock_provider",
             "mkdir -p /asset-output/multi_tenant_full_stack_rag_application/generation_handler",
             "mkdir -p /asset-output/multi_tenant_full_stack_rag_application/utils",
+            "pip3 install -r /asset-input/bedrock_provider/bedrock_provider_requirements.txt -t /asset-output",
             "pip3 install -r /asset-input/generation_handler/generation_handler_requirements.txt -t /asset-output",
             "pip3 install -r /asset-input/utils/utils_requirements.txt -t /asset-output",
+            "cp -r /asset-input/bedrock_provider/* /asset-output/multi_tenant_full_stack_rag_application/bedrock_provider/",
+            "cp /asset-input/service_provider* /asset-output/multi_tenant_full_stack_rag_application/",
             "cp /asset-input/generation_handler/*.{py,txt} /asset-output/multi_tenant_full_stack_rag_application/generation_handler/",
             "cp /asset-input/utils/*.py /asset-output/multi_tenant_full_stack_rag_application/utils/",
         ]
 
+        generation_handler_code = lambda_.Code.from_asset('src/multi_tenant_full_stack_rag_application/',
+            bundling=BundlingOptions(
+                image=lambda_.Runtime.PYTHON_3_13.bundling_image,
+                bundling_file_access=BundlingFileAccess.VOLUME_COPY,
+                command=[
+                    "bash", "-c", " && ".join(bundling_cmds)
+                ]
+            )
+        )
+
+        generation_handler_env = {
+            'RPC_IN_PROCESS_TARGETS': 'bedrock_provider_function_name',
+            'STACK_NAME': parent_stack_name,
+        }
+
         self.generation_handler_function = lambda_.Function(self, 'GenerationHandlerFunction',
-            code=lambda_.Code.from_asset('src/multi_tenant_full_stack_rag_application/',
-                bundling=BundlingOptions(
-                    image=lambda_.Runtime.PYTHON_3_13.bundling_image,
-                    bundling_file_access=BundlingFileAccess.VOLUME_COPY,
-                    command=[
-                        "bash", "-c", " && ".join(bundling_cmds)
-                    ]
-                )
-            ),
+            code=generation_handler_code,
             memory_size=768,
             runtime=lambda_.Runtime.PYTHON_3_13,
             architecture=lambda_.Architecture.ARM_64,
             handler='multi_tenant_full_stack_rag_application.generation_handler.generation_handler.handler',
             timeout=Duration.seconds(120),
-            environment={
-                'STACK_NAME': parent_stack_name,
-            },
+            environment=generation_handler_env,
             vpc=vpc,
             vpc_subnets=ec2.SubnetSelection(
                 subnet_type=ec2.SubnetType.PRIVATE_ISOLATED,
@@ -74,22 +93,72 @@ class GenerationHandlerStack(Stack):
             security_groups=[app_security_group]
         )
 
-        self.generation_handler_function.add_to_role_policy(iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            actions=['ssm:GetParameter','ssm:GetParametersByPath'],
-            resources=[
-                f"arn:aws:ssm:{self.region}:{self.account}:parameter/{parent_stack_name}*"
-            ]
-        ))
-
-        self.generation_handler_function.add_to_role_policy(iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            actions=['lambda:InvokeFunction'],
-            resources=[
-                auth_fn.function_arn,
-                graph_handler_fn_arn,
-            ]
-        ))
+        # same code, behind the websocket api, which pushes the response to
+        # the browser as it's generated.
+        self.generation_handler_stream_function = lambda_.Function(self, 'GenerationHandlerStreamFunction',
+            code=generation_handler_code,
+            memory_size=768,
+            runtime=lambda_.Runtime.PYTHON_3_13,
+            architecture=lambda_.Architecture.ARM_64,
+            handler='multi_tenant_full_stack_rag_application.generation_handler.generation_handler.websocket_handler',
+            timeout=Duration.seconds(120),
+            environment=generation_handler_env,
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE_ISOLATED,
+            ),
+            security_groups=[app_security_group]
+        )
+
+        for fn in [self.generation_handler_function, self.generation_handler_stream_function]:
+            fn.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=['ssm:GetParameter','ssm:GetParametersByPath'],
+                resources=[
+                    f"arn:aws:ssm:{self.region}:{self.account}:parameter/{parent_stack_name}*"
+                ]
+            ))
+
+            # bedrock_provider runs in-process, so it isn't invoked.
+            fn.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=['lambda:InvokeFunction'],
+                resources=[
+                    auth_fn.function_arn,
+                    doc_collections_fn_arn,
+                    embeddings_fn_arn,
+                    graph_handler_fn_arn,
+                    ingestion_status_fn_arn,
+                    prompt_templates_fn_arn,
+                    tools_fn_arn,
+                    vector_store_fn_arn,
+                ]
+            ))
+
+            # cross-region inference profiles route to the foundation
+            # model in whichever region serves the call.
+            fn.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'bedrock:Converse',
+                    'bedrock:ConverseStream',
+                    'bedrock:InvokeModel',
+                    'bedrock:InvokeModelWithResponseStream',
+                ],
+                resources=[
+                    "arn:aws:bedrock:*::foundation-model/*",
+                    f"arn:aws:bedrock:{self.region}:{self.account}:inference-profile/*",
+                    f"arn:aws:bedrock:{self.region}:{self.account}:application-inference-profile/*",
+                ]
+            ))
+
+            # rerank has no resource-level permissions. The rerank model
+            # is still checked against bedrock:InvokeModel above.
+            fn.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=['bedrock:Rerank'],
+                resources=["*"]
+            ))
 
         self.generation_handler_function.grant_invoke(cognito_auth_role)
 
@@ -131,6 +200,36 @@ class GenerationHandlerStack(Stack):
         )
 
         CfnOutput(self, "GenerationHandlerHttpApiUrl", value=self.http_api.url.rstrip('/'))
+
+        generation_handler_ws_integration = apigwi.WebSocketLambdaIntegration(
+            "GenerationHandlerWebSocketIntegration",
+            self.generation_handler_stream_function,
+        )
+
+        # browsers can't send an Authorization header when they open a
+        # websocket, so the generate route checks the auth token in each
+        # message instead of using the jwt authorizer.
+        self.websocket_api = apigw.WebSocketApi(self, "GenerationHandlerWebSocketApi",
+            api_name=f"{api_name}-stream",
+            connect_route_options=apigw.WebSocketRouteOptions(
+                integration=generation_handler_ws_integration
+            ),
+            disconnect_route_options=apigw.WebSocketRouteOptions(
+                integration=generation_handler_ws_integration
+            ),
+        )
+        self.websocket_api.add_route('generate',
+            integration=generation_handler_ws_integration
+        )
+
+        websocket_stage = apigw.WebSocketStage(self, "GenerationHandlerWebSocketStage",
+            web_socket_api=self.websocket_api,
+            stage_name='prod',
+            auto_deploy=True
+        )
+        websocket_stage.grant_management_api_access(self.generation_handler_stream_function)
+
+        CfnOutput(self, "GenerationHandlerWebSocketUrl", value=websocket_stage.url)
         
         gen_handler_api_url_param = ssm.StringParameter(self, 'GenerationHandlerHttpApiUrlParam',
             parameter_name=f'/{parent_stack_name}/generation_handler_api_url',
@@ -143,3 +242,9 @@ class GenerationHandlerStack(Stack):
             string_value=self.generation_handler_function.function_name
         )
         gen_handler_origin_param.apply_removal_policy(RemovalPolicy.DESTROY)
+
+        gen_handler_ws_url_param = ssm.StringParameter(self, 'GenerationHandlerWebSocketUrlParam',
+            parameter_name=f'/{parent_stack_name}/generation_handler_websocket_url',
+            string_value=websocket_stage.url
+        )
+        gen_handler_ws_url_param.apply_removal_policy(RemovalPolicy.DESTROY)
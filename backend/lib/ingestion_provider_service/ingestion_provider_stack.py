@@ -217,6 +217,8 @@ class IngestionProviderStack(Stack):
         )
         
         self.ingestion_queue.queue.grant_consume_messages(self.ingestion_function.grant_principal)
+        # for continuation messages when a file takes longer than one invocation.
+        self.ingestion_queue.queue.grant_send_messages(self.ingestion_function.grant_principal)
 
         CfnOutput(self, 'IngestionBucketName',
             value=self.ingestion_bucket.bucket.bucket_name,
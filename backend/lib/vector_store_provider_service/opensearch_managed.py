@@ -129,7 +129,10 @@ class OpenSearchManagedStack(NestedStack):
             runtime=lambda_.Runtime.PYTHON_3_13,
             architecture=lambda_.Architecture.ARM_64,
             handler='multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_vector_store_provider.handler',
-            timeout=Duration.seconds(60),
+            # migrate_index copies a whole collection. It's invoked by the
+            # document collections handler's async migrations, which wait
+            # up to 900s for it.
+            timeout=Duration.seconds(840),
             environment={
                 'STACK_NAME': parent_stack_name,
                 'VECTOR_STORE_ENDPOINT': self.vector_store_endpoint,
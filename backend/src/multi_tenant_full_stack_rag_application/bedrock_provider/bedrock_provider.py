@@ -1,19 +1,23 @@
 #  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 #  SPDX-License-Identifier: MIT-0
 
-import jq
 import json
 import os
 import sys
 
 from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
 from math import ceil
 from os import getcwd, getenv, path
 from pathlib import Path
+from time import monotonic
 # from queue import Queue
 # from threading import Thread
 
 from multi_tenant_full_stack_rag_application.bedrock_provider.bedrock_provider_event import BedrockProviderEvent
+from multi_tenant_full_stack_rag_application.bedrock_provider.bedrock_scheduler import BedrockScheduler, event_priority
+from multi_tenant_full_stack_rag_application.bedrock_provider.default_args import DefaultArgs
+from multi_tenant_full_stack_rag_application.bedrock_provider.prompt_cache import apply_cache_points, usage_metrics
 from multi_tenant_full_stack_rag_application.service_provider import ServiceProvider
 from multi_tenant_full_stack_rag_application.service_provider_event import ServiceProviderEvent
 from multi_tenant_full_stack_rag_application import utils
@@ -21,25 +25,48 @@ from multi_tenant_full_stack_rag_application import utils
 """
 API
 event {
-    "operation": [embed_text, get_model_dimensions, get_model_max_tokens, get_token_count, invoke_model, list_models ]
+    "operation": [embed_text, embed_texts, get_model_context_window, get_model_dimensions, get_model_max_tokens, get_scheduler_metrics, get_token_count, invoke_model, invoke_model_stream, list_models, rerank ]
     "origin": the function name of the calling function, or the frontend_origin.,
     "args": 
+        for embed_text, embed_texts, invoke_model, invoke_model_stream and rerank:
+            "priority": str=None, one of interactive, enrichment or ingestion.
+            Defaults to ingestion for embed_texts and for ingestion callers,
+            enrichment for enrichment callers, and interactive otherwise.
+            Calls to each model are queued by priority, and lower priorities
+            get a smaller share of the model's concurrency limit.
+
         for embed_text:
             "model_id": str,
             "input_text": str,
             "dimensions": int=1024,
             "input_type": str="search_query",
 
+        for embed_texts:
+            "model_id": str,
+            "input_texts": [str],
+            "dimensions": int=1024,
+            "input_type": str="search_document",
+
+        for get_model_context_window:
+            "model_id": str
+
         for get_model_dimensions:
             "model_id": str
 
         for get_model_max_tokens:
             "model_id": str
 
+        for get_scheduler_metrics:
+            none. Returns {model_id: {limit, active, queue_depth, max_queue_depth, calls, throttles}}
+
         for get_prompt:
             "prompt_id"
 
-        for invoke_model:
+        for get_token_count:
+            "input_text": str,
+            "model_id": str=None
+
+        for invoke_model and invoke_model_stream:
             messages: [dict],
             model_id: str,
             additional_model_req_fields: any=None, 
@@ -48,15 +75,48 @@ event {
             inference_config: dict={},
             system: list=None, 
             tool_config: dict=None
+        system and messages' content can include {"cachePoint": {"type": "default"}}
+        blocks after prefixes that are the same from call to call, for models
+        with promptCaching in bedrock_model_params.json. They're removed for
+        other models, and where the prefix is too short to cache.
+        invoke_model results include "usage": {
+            input_tokens, output_tokens, cache_read_input_tokens, cache_write_input_tokens
+        }
         
         for list_models:
                 none
+
+        for rerank:
+            model_id: str,
+            query: str,
+            texts: [str]
 }
 """
 
 
 bedrock_provider = None
 
+# Cohere embed models accept up to 96 texts per request. Titan only
+# accepts a single inputText, so batches are fanned out in parallel instead.
+cohere_max_texts_per_request = 96
+titan_embed_concurrency = int(os.getenv('TITAN_EMBED_CONCURRENCY', 10))
+# the scheduler is the only layer that retries throttled calls, and
+# needs to see the throttles to adapt, so the runtime client makes one
+# attempt rather than botocore's adaptive retries taking up to 20.
+bedrock_client_max_attempts = int(os.getenv('BEDROCK_CLIENT_MAX_ATTEMPTS', 1))
+# the time left at the end of an invocation for a throttled call to
+# fail and be reported, rather than being retried into a timeout.
+bedrock_retry_margin_seconds = float(os.getenv('BEDROCK_RETRY_MARGIN_SECONDS', 5))
+
+# exception events converse_stream can send mid-stream.
+stream_error_types = [
+    'internalServerException',
+    'modelStreamErrorException',
+    'serviceUnavailableException',
+    'throttlingException',
+    'validationException',
+]
+
 parent_path = Path(__file__).parent.resolve()
 params_path = path.join(parent_path, 'bedrock_model_params.json')
 
@@ -65,6 +125,7 @@ with open(params_path, 'r') as params_in:
     bedrock_model_params_json = params_in.read()
     # print(f"Got bedrock_model_params before parsing: {bedrock_model_params_json}")
     bedrock_model_params = json.loads(bedrock_model_params_json)
+    bedrock_default_args = DefaultArgs(bedrock_model_params)
 
 class BedrockProvider(ServiceProvider):
     def __init__(self,
@@ -73,7 +134,8 @@ class BedrockProvider(ServiceProvider):
         bedrock_agent_rt_client = None,
         bedrock_rt_client = None,
         # cognito_identity_client = None,
-        ssm_client = None
+        ssm_client = None,
+        scheduler: BedrockScheduler = None
     ):
         self.utils = utils
         if not bedrock_client:
@@ -95,7 +157,10 @@ class BedrockProvider(ServiceProvider):
             self.bedrock_agent_rt = bedrock_agent_rt_client
         
         if not bedrock_rt_client:
-            self.bedrock_rt = utils.get_bedrock_runtime_client()
+            self.bedrock_rt = utils.BotoClientProvider.get_client(
+                'bedrock-runtime',
+                max_attempts=bedrock_client_max_attempts
+            )
         else:
             # print("Used brt client passed in.")
             self.bedrock_rt = bedrock_rt_client
@@ -112,14 +177,16 @@ class BedrockProvider(ServiceProvider):
             # print("Used ssm client passed in")
             self.ssm = ssm_client
 
+        self.scheduler = scheduler if scheduler else BedrockScheduler()
         self.model_params = bedrock_model_params
+        self.default_args = bedrock_default_args
         self.stack_name = os.getenv('STACK_NAME')
         print(f"Bedrock_provider loaded with stack_name {self.stack_name}")
         self.ssm_params = self.utils.get_ssm_params(ssm_client=ssm_client)
         self.allowed_origins = self.utils.get_allowed_origins()
         print(f"Got allowed_origins {self.allowed_origins}")
     
-    def embed_text(self, text, model_id, input_type='search_query', *, dimensions=1024):
+    def embed_text(self, text, model_id, input_type='search_query', *, dimensions=1024, priority='interactive'):
         print(f"Embedding text with model {model_id} and dimensions {dimensions}")
         if model_id.startswith('cohere'):
             args = {
@@ -144,7 +211,10 @@ class BedrockProvider(ServiceProvider):
             raise Exception("Unknown model ID provided.")
         body = json.dumps(args).encode('utf-8')
         
-        response = self.bedrock_rt.invoke_model(
+        response = self.scheduler.call(
+            model_id,
+            priority,
+            self.bedrock_rt.invoke_model,
             modelId=model_id,
             body=body,
             contentType = 'application/json',
@@ -155,7 +225,46 @@ class BedrockProvider(ServiceProvider):
         # print(f"embed_text result: {body.keys()}")
         # print(f"Got response from bedrock.invoke_model: {body}")
         return body['embedding']
+
+    def embed_texts(self, texts, model_id, input_type='search_document', *, dimensions=1024, priority='ingestion'):
+        print(f"Embedding {len(texts)} texts with model {model_id} and dimensions {dimensions}")
+        if len(texts) == 0:
+            return []
+        if model_id.startswith('cohere'):
+            vectors = []
+            for i in range(0, len(texts), cohere_max_texts_per_request):
+                batch = texts[i:i + cohere_max_texts_per_request]
+                body = json.dumps({
+                    "texts": batch,
+                    "input_type": input_type
+                }).encode('utf-8')
+                response = self.scheduler.call(
+                    model_id,
+                    priority,
+                    self.bedrock_rt.invoke_model,
+                    modelId=model_id,
+                    body=body,
+                    contentType='application/json',
+                    accept='*/*'
+                )
+                vectors += json.loads(response['body'].read())['embeddings']
+            return vectors
+        elif model_id.startswith('amazon'):
+            # executor.map yields results in input order.
+            workers = min(titan_embed_concurrency, len(texts))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(
+                    lambda text: self.embed_text(text, model_id, input_type, dimensions=dimensions, priority=priority),
+                    texts
+                ))
+        else:
+            raise Exception("Unknown model ID provided.")
         
+    # the most input and output tokens the model accepts, or None if it's
+    # not known.
+    def get_model_context_window(self, model_id):
+        return self._get_model_params(model_id).get('contextWindow')
+
     def get_model_dimensions(self, model_id):
         if 'dimensions' in self.model_params[model_id].keys():
             return self.model_params[model_id]['dimensions']
@@ -195,6 +304,9 @@ class BedrockProvider(ServiceProvider):
             promptVersion=version
         )
 
+    def get_token_count(self, input_text, model_id=None):
+        return self.utils.get_token_count(input_text, model_id)
+
     def handler(self, handler_evt: BedrockProviderEvent, context):
         print(f"Got event {handler_evt}")
         if not isinstance(handler_evt, BedrockProviderEvent):
@@ -205,6 +317,12 @@ class BedrockProvider(ServiceProvider):
         
         status = 200
         operation = handler_evt.operation
+        usage = {}
+        time_limit = None
+        if hasattr(context, 'get_remaining_time_in_millis'):
+            time_limit = context.get_remaining_time_in_millis() / 1000 - bedrock_retry_margin_seconds
+        self.scheduler.set_time_limit(time_limit)
+        priority = event_priority(operation, handler_evt.origin, handler_evt.args, self.allowed_origins)
 
         if handler_evt.origin not in self.allowed_origins.values():
             status = 403
@@ -214,20 +332,33 @@ class BedrockProvider(ServiceProvider):
             model_id = handler_evt.args['model_id']
             text = handler_evt.args['input_text']
             dimensions = handler_evt.args['dimensions']
-            response = self.embed_text(text, model_id, dimensions=dimensions)
+            response = self.embed_text(text, model_id, dimensions=dimensions, priority=priority)
+
+        elif operation == 'embed_texts':
+            model_id = handler_evt.args['model_id']
+            texts = handler_evt.args['input_texts']
+            dimensions = handler_evt.args.get('dimensions', 1024)
+            input_type = handler_evt.args.get('input_type', 'search_document')
+            response = self.embed_texts(texts, model_id, input_type, dimensions=dimensions, priority=priority)
         
+        elif operation == 'get_model_context_window':
+            response = self.get_model_context_window(handler_evt.args['model_id'])
+
         elif operation == 'get_model_dimensions':
             response = self.get_model_dimensions(handler_evt.args['model_id'])
         
         elif operation == 'get_model_max_tokens':
             response = self.get_model_max_tokens(handler_evt.args['model_id'])
 
+        elif operation == 'get_scheduler_metrics':
+            response = self.scheduler.metrics()
+
         elif operation == 'get_prompt':
             response = self.get_prompt(handler_evt.args['prompt_id'])
 
         elif operation == 'get_token_count':
             input_text = handler_evt.args['input_text']
-            response = self.get_token_count(input_text)
+            response = self.get_token_count(input_text, handler_evt.args.get('model_id'))
 
         elif operation == 'invoke_model':
             model_id = handler_evt.args['model_id']
@@ -237,11 +368,28 @@ class BedrockProvider(ServiceProvider):
                 inference_config=inference_config,
                 messages=messages,
                 model_id=model_id,
+                system=handler_evt.args.get('system'),
+                usage=usage,
+                priority=priority,
             )
+
+        elif operation == 'invoke_model_stream':
+            # lambda can't stream a RequestResponse invocation back to the
+            # caller, so remote callers get all of the deltas at once.
+            # In-process callers use stream_handler instead.
+            response = list(self.stream(handler_evt))
             
         elif operation == 'list_models':
             response = self.list_models()
 
+        elif operation == 'rerank':
+            response = self.rerank(
+                handler_evt.args['query'],
+                handler_evt.args['texts'],
+                handler_evt.args['model_id'],
+                priority=priority
+            )
+
         else: 
             raise Exception(f"Unknown operation {operation}")
 
@@ -250,9 +398,30 @@ class BedrockProvider(ServiceProvider):
             "operation": handler_evt.operation,
             "response": response,
         }
+        if usage:
+            result['usage'] = usage
         print(f"Bedrock_provider returning result {result}") 
         return result
         
+    def stream(self, handler_evt: BedrockProviderEvent):
+        if not isinstance(handler_evt, BedrockProviderEvent):
+            handler_evt = BedrockProviderEvent(**handler_evt)
+        if not self.allowed_origins:
+            self.allowed_origins = self.utils.get_allowed_origins()
+        if handler_evt.origin not in self.allowed_origins.values():
+            raise Exception("forbidden")
+        if handler_evt.operation != 'invoke_model_stream':
+            raise Exception(f"Operation {handler_evt.operation} can't be streamed")
+        return self.invoke_model_stream(
+            inference_config=handler_evt.args.get('inference_config', {}),
+            messages=handler_evt.args.get('messages', []),
+            model_id=handler_evt.args['model_id'],
+            system=handler_evt.args.get('system'),
+            priority=event_priority(handler_evt.operation, handler_evt.origin, handler_evt.args, self.allowed_origins),
+        )
+
+    # If a usage dict is passed, the call's token counts are added to it,
+    # including the prompt cache's reads and writes.
     def invoke_model(self, *, 
         messages: [dict], 
         model_id: str, 
@@ -261,58 +430,74 @@ class BedrockProvider(ServiceProvider):
         guardrail_config: dict=None, 
         inference_config: dict={},
         system: list=None, 
-        tool_config: dict=None
+        tool_config: dict=None,
+        usage: dict=None,
+        priority: str='interactive'
     ):
-        content_type = 'application/json'
-        accept = '*/*'
-        inference_config = self._populate_default_args(model_id, inference_config)
-        print(f"After merging default args, inference_config = {inference_config}")
-        final_msgs = []
-        for msg in messages:
-            print(f"msg type: {type(msg)}")
-            if isinstance(msg, str):
-                msg = json.loads(msg)
-            print(msg)
-            print(msg.keys())
-            for i in range(len(msg['content'])):
-                print(f"message content array: {msg['content']}")
-                print(f"type(msg[content][i]) {type(msg['content'][i])}")
-                if isinstance(msg['content'][i], str):
-                    print("Loading json string.")
-                    msg['content'][i] = json.loads(msg['content'][i])
-                if 'image' in msg['content'][i].keys():
-                    print(f"image dict: {msg['content'][i]['image']}")
-                    print(f"image dict type: {type(msg['content'][i]['image'])}")
-                    print(f"src dict type: {type(msg['content'][i]['image']['source'])}")
-                    print(msg['content'][i]['image']['source'])
-                    if isinstance(msg['content'][i]['image']['source']['bytes'], str):
-                        print("Converting content payload from string to bytes.")
-                        msg['content'][i]['image']['source']['bytes'] = b64decode(msg['content'][i]['image']['source']['bytes'].encode('utf-8'))
-            final_msgs.append(msg)
-        args = {
-            "modelId": model_id,
-            "messages": final_msgs,
-            "inferenceConfig": inference_config
-        }
-
-        if additional_model_req_fields:
-            args['additionalModelRequestFields'] = additional_model_req_fields
-        
-        if additional_model_resp_field_paths:
-            args['additionalModelResponseFieldPaths']
-
-        if guardrail_config:
-            args['guardrailConfig'] = guardrail_config
-
-        if system:
-            args['system'] = system
-        
-        if tool_config:
-            args['toolConfig'] = tool_config
-    
-        response = self.bedrock_rt.converse(**args)
+        args = self._get_converse_args(
+            messages=messages,
+            model_id=model_id,
+            additional_model_req_fields=additional_model_req_fields,
+            additional_model_resp_field_paths=additional_model_resp_field_paths,
+            guardrail_config=guardrail_config,
+            inference_config=inference_config,
+            system=system,
+            tool_config=tool_config
+        )
+        response = self.scheduler.call(model_id, priority, self.bedrock_rt.converse, **args)
         print(f"invoke_model got response from bedrock_rt.invoke_model: {response}")
+        if usage is not None:
+            usage.update(usage_metrics(response.get('usage', {})))
         return response['output']['message']['content'][0]['text']
+
+    # Same args as invoke_model, but uses converse_stream and yields the
+    # text deltas as they arrive. usage is filled in once the stream ends.
+    def invoke_model_stream(self, *, 
+        messages: [dict], 
+        model_id: str, 
+        additional_model_req_fields: any=None, 
+        additional_model_resp_field_paths: [str]=None,
+        guardrail_config: dict=None, 
+        inference_config: dict={},
+        system: list=None, 
+        tool_config: dict=None,
+        usage: dict=None,
+        priority: str='interactive'
+    ):
+        args = self._get_converse_args(
+            messages=messages,
+            model_id=model_id,
+            additional_model_req_fields=additional_model_req_fields,
+            additional_model_resp_field_paths=additional_model_resp_field_paths,
+            guardrail_config=guardrail_config,
+            inference_config=inference_config,
+            system=system,
+            tool_config=tool_config
+        )
+        start = monotonic()
+        first_token_at = None
+        # the scheduler's slot is held while the stream is opened, which is
+        # when Bedrock throttles, not while it's read.
+        response = self.scheduler.call(model_id, priority, self.bedrock_rt.converse_stream, **args)
+        for event in response['stream']:
+            if 'contentBlockDelta' in event:
+                text = event['contentBlockDelta']['delta'].get('text', '')
+                if text == '':
+                    continue
+                if first_token_at is None:
+                    first_token_at = monotonic()
+                    print(f"invoke_model_stream got first token from {model_id} after {round(first_token_at - start, 3)}s")
+                yield text
+            elif 'messageStop' in event:
+                print(f"invoke_model_stream stopped with reason {event['messageStop'].get('stopReason')}")
+            elif 'metadata' in event:
+                print(f"invoke_model_stream usage {event['metadata'].get('usage')}, metrics {event['metadata'].get('metrics')}")
+                if usage is not None:
+                    usage.update(usage_metrics(event['metadata'].get('usage', {})))
+            else:
+                for error_type in stream_error_types:
+                    if error_type in event:
+                        raise Exception(f"{error_type}: {event[error_type].get('message', '')}")
         # body = json.loads(response['body'].read())
         # print(f"Invocation result: {body}")
         # print(f"Got response from bedrock.converse: {body}")
@@ -450,32 +635,114 @@ class BedrockProvider(ServiceProvider):
             self.models = self.bedrock.list_foundation_models()['modelSummaries']
         return self.models
     
-    def _populate_default_args(self, model_id, inference_config={}):
-        params = None
-        alt_model_id = model_id.replace('us.', '')
-        if model_id in self.model_params:
-            params = self.model_params[model_id]
-        elif alt_model_id in self.model_params:
-            params = self.model_params[alt_model_id]
-        else:
-            raise Exception(f"Could not find model {model_id} or {alt_model_id} in models.")
-        
-        paths = params['default_paths']
+    # returns the relevance score of each of texts to query, in the same
+    # order as texts. Bedrock returns them best first, by index.
+    def rerank(self, query, texts, model_id, *, priority='interactive'):
+        if len(texts) == 0:
+            return []
+        region = self.bedrock_agent_rt.meta.region_name
+        response = self.scheduler.call(
+            model_id,
+            priority,
+            self.bedrock_agent_rt.rerank,
+            queries=[{
+                "type": "TEXT",
+                "textQuery": {"text": query}
+            }],
+            sources=[{
+                "type": "INLINE",
+                "inlineDocumentSource": {
+                    "type": "TEXT",
+                    "textDocument": {"text": text}
+                }
+            } for text in texts],
+            rerankingConfiguration={
+                "type": "BEDROCK_RERANKING_MODEL",
+                "bedrockRerankingConfiguration": {
+                    "modelConfiguration": {
+                        "modelArn": f"arn:aws:bedrock:{region}::foundation-model/{model_id}"
+                    },
+                    "numberOfResults": len(texts)
+                }
+            }
+        )
+        scores = [0.0] * len(texts)
+        for result in response['results']:
+            scores[result['index']] = result['relevanceScore']
+        return scores
+
+    def _get_converse_args(self, *,
+        messages: [dict], 
+        model_id: str, 
+        additional_model_req_fields: any=None, 
+        additional_model_resp_field_paths: [str]=None,
+        guardrail_config: dict=None, 
+        inference_config: dict={},
+        system: list=None, 
+        tool_config: dict=None
+    ):
+        inference_config = self._populate_default_args(model_id, inference_config)
+        print(f"After merging default args, inference_config = {inference_config}")
+        final_msgs = []
+        for msg in messages:
+            print(f"msg type: {type(msg)}")
+            if isinstance(msg, str):
+                msg = json.loads(msg)
+            print(msg)
+            print(msg.keys())
+            for i in range(len(msg['content'])):
+                print(f"message content array: {msg['content']}")
+                print(f"type(msg[content][i]) {type(msg['content'][i])}")
+                if isinstance(msg['content'][i], str):
+                    print("Loading json string.")
+                    msg['content'][i] = json.loads(msg['content'][i])
+                if 'image' in msg['content'][i].keys():
+                    print(f"image dict: {msg['content'][i]['image']}")
+                    print(f"image dict type: {type(msg['content'][i]['image'])}")
+                    print(f"src dict type: {type(msg['content'][i]['image']['source'])}")
+                    print(msg['content'][i]['image']['source'])
+                    if isinstance(msg['content'][i]['image']['source']['bytes'], str):
+                        print("Converting content payload from string to bytes.")
+                        msg['content'][i]['image']['source']['bytes'] = b64decode(msg['content'][i]['image']['source']['bytes'].encode('utf-8'))
+            final_msgs.append(msg)
         args = {
-            **inference_config
+            "modelId": model_id,
+            "messages": final_msgs,
+            "inferenceConfig": inference_config
         }
-        for path in paths:
-            parts = path.split('.')
-            if len(parts) > 1:
-                key = parts[-2]
-            else: 
-                key = parts[0]
-    
-            if key in inference_config:
-                args[key] = inference_config[key]
-            else:
-                args[key] = jq.compile(f'.{path}').input_value(params).first()
-        return args
+
+        if additional_model_req_fields:
+            args['additionalModelRequestFields'] = additional_model_req_fields
+        
+        if additional_model_resp_field_paths:
+            args['additionalModelResponseFieldPaths'] = additional_model_resp_field_paths
+
+        if guardrail_config:
+            args['guardrailConfig'] = guardrail_config
+
+        if system:
+            args['system'] = system
+        
+        if tool_config:
+            args['toolConfig'] = tool_config
+
+        return apply_cache_points(
+            args,
+            self._get_model_params(model_id).get('promptCaching'),
+            lambda texts: self.utils.get_token_counts(texts, model_id)
+        )
+
+    # Cross region inference profile IDs like us.amazon.nova-pro-v1:0 are
+    # looked up by the ID of the model they're for. Returns {} for unknown
+    # models.
+    def _get_model_params(self, model_id):
+        params = self.model_params.get(model_id)
+        if not params and model_id.count('.') > 1:
+            params = self.model_params.get(model_id.split('.', 1)[1])
+        return params or {}
+
+    def _populate_default_args(self, model_id, inference_config={}):
+        return self.default_args.merge(model_id, inference_config)
 
     # TODO temporarily not integrated with the rest of the code
     # def save_to_bedrock_kbs(docs: [KBDocument], s3_prefix, auto_sync=True) -> None: 
@@ -552,3 +819,13 @@ def handler(event: BedrockProviderEvent, context):
         bedrock_provider = BedrockProvider()
     
     return bedrock_provider.handler(event, context)
+
+
+# generator counterpart to handler, used by in-process callers to
+# receive invoke_model_stream deltas as they arrive.
+def stream_handler(event: BedrockProviderEvent, context):
+    global bedrock_provider
+    if not bedrock_provider:
+        bedrock_provider = BedrockProvider()
+
+    return bedrock_provider.stream(event)
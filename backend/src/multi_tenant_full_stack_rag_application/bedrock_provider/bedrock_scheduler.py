@@ -0,0 +1,127 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+import random
+from threading import Lock
+from time import monotonic, sleep
+
+from multi_tenant_full_stack_rag_application.utils.adaptive_limiter import AdaptiveConcurrencyLimiter, is_throttling_error
+
+
+default_bedrock_max_concurrency = int(os.getenv('BEDROCK_MAX_CONCURRENCY', 16))
+default_bedrock_max_retries = int(os.getenv('BEDROCK_THROTTLE_MAX_RETRIES', 6))
+default_bedrock_backoff_base = float(os.getenv('BEDROCK_BACKOFF_BASE_SECONDS', 0.5))
+default_bedrock_backoff_max = float(os.getenv('BEDROCK_BACKOFF_MAX_SECONDS', 20))
+
+# highest first.
+priorities = ['interactive', 'enrichment', 'ingestion']
+# the share of a model's concurrency limit each priority can use, so
+# batch work always leaves room for interactive calls.
+default_priority_shares = {
+    'interactive': 1.0,
+    'enrichment': 0.75,
+    'ingestion': 0.5,
+}
+# callers whose calls are batch work, by their origin's ssm param name.
+origin_priorities = {
+    'origin_enrichment_pipelines_stream_processor': 'enrichment',
+    'origin_entity_extraction': 'enrichment',
+    'origin_ingestion_provider': 'ingestion',
+}
+# operations that are batch work whoever calls them.
+operation_priorities = {
+    'embed_texts': 'ingestion',
+}
+
+
+# the priority of an event: args.priority if it's given, otherwise the
+# priority of its origin or operation. Everything else is interactive.
+def event_priority(operation, origin, args, allowed_origins):
+    if args.get('priority') in priorities:
+        return args['priority']
+    for (name, value) in (allowed_origins or {}).items():
+        if value == origin and name in origin_priorities:
+            return origin_priorities[name]
+    return operation_priorities.get(operation, 'interactive')
+
+
+# Runs Bedrock calls through an AdaptiveConcurrencyLimiter per model ID,
+# retrying throttled calls with jittered exponential backoff. This is
+# the only layer that retries throttling: the runtime client doesn't,
+# and callers like the OCR pipeline don't retry throttling errors that
+# get past it.
+#
+# A container handles one invocation at a time, so priorities only
+# order the calls one invocation fans out, like embed_texts' or an
+# in-process caller's. Across containers, lower priorities just back
+# off longer. Retries stop at the deadline set by set_time_limit, so a
+# throttled call fails before the function times out.
+class BedrockScheduler:
+    def __init__(self, *,
+        backoff_base: float=default_bedrock_backoff_base,
+        backoff_max: float=default_bedrock_backoff_max,
+        max_concurrency: int=default_bedrock_max_concurrency,
+        max_retries: int=default_bedrock_max_retries,
+        shares: dict=default_priority_shares,
+        sleep=sleep
+    ):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.shares = shares
+        self.sleep = sleep
+        self.limiters = {}
+        self.deadline = None
+        self.lock = Lock()
+
+    def backoff(self, attempt, priority):
+        delay = self.backoff_base * (2 ** attempt) * (priorities.index(priority) + 1)
+        return random.uniform(0.5, 1) * min(self.backoff_max, delay)
+
+    def call(self, model_id, priority, fn, *args, **kwargs):
+        limiter = self.get_limiter(model_id)
+        attempt = 0
+        while True:
+            limiter.acquire(priority)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e):
+                    raise
+                limiter.on_throttle(priority)
+                delay = self.backoff(attempt, priority)
+                if attempt >= self.max_retries or \
+                    (self.deadline is not None and monotonic() + delay > self.deadline):
+                    print(f"{priority} call to {model_id} still throttled after {attempt} retries")
+                    raise
+                print(f"{priority} call to {model_id} was throttled, retrying in {delay:.2f}s. Metrics {limiter.metrics()}")
+            else:
+                limiter.on_success()
+                return result
+            finally:
+                limiter.release()
+            self.sleep(delay)
+            attempt += 1
+
+    def get_limiter(self, model_id):
+        with self.lock:
+            if model_id not in self.limiters:
+                self.limiters[model_id] = AdaptiveConcurrencyLimiter(
+                    self.max_concurrency,
+                    priorities=priorities,
+                    shares=self.shares
+                )
+            return self.limiters[model_id]
+
+    # the seconds the current invocation has left for retries. None
+    # retries up to max_retries whatever the time.
+    def set_time_limit(self, seconds):
+        self.deadline = monotonic() + seconds if seconds is not None else None
+
+    # {model_id: its limiter's metrics}
+    def metrics(self):
+        with self.lock:
+            limiters = dict(self.limiters)
+        return {model_id: limiter.metrics() for (model_id, limiter) in limiters.items()}
@@ -0,0 +1,98 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+from threading import Lock
+
+
+def get_path(params, path):
+    value = params
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(path)
+        value = value[part]
+    return value
+
+
+# Each model's default_paths in bedrock_model_params.json, like
+# maxTokens.default, name an arg (maxTokens) and its default. Returns
+# ({arg: default}, {arg: its spec, with type, min and max}).
+def resolve_defaults(model_id, params):
+    defaults = {}
+    specs = {}
+    for path in params.get('default_paths', []):
+        parts = path.split('.')
+        key = parts[-2] if len(parts) > 1 else parts[0]
+        try:
+            defaults[key] = get_path(params, path)
+        except KeyError:
+            raise ValueError(f"Default path {path} for model {model_id} isn't in its params.")
+        spec = get_path(params, '.'.join(parts[:-1])) if len(parts) > 1 else None
+        if isinstance(spec, dict):
+            specs[key] = spec
+    return (defaults, specs)
+
+
+# Converts value to the spec's type, as the frontend's inputs can send
+# numbers as strings, and checks it's within the spec's range, so bad
+# args fail here with the arg's name rather than in Bedrock.
+def validate_arg(key, value, spec):
+    if not spec:
+        return value
+    arg_type = spec.get('type')
+    try:
+        if arg_type == 'int' and not isinstance(value, int):
+            value = int(value)
+        elif arg_type == 'float' and not isinstance(value, (int, float)):
+            value = float(value)
+        elif arg_type == 'json' and isinstance(value, str):
+            value = json.loads(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be {arg_type}, got {value!r}.")
+    if arg_type in ['int', 'float'] and \
+        (('min' in spec and value < spec['min']) or ('max' in spec and value > spec['max'])):
+        raise ValueError(f"{key} must be between {spec.get('min')} and {spec.get('max')}, got {value}.")
+    return value
+
+
+# The default inference args for every model, resolved once at cold start
+# from bedrock_model_params.json, so each call only merges its overrides
+# into a copy of them.
+class DefaultArgs:
+    def __init__(self, model_params):
+        self.defaults = {}
+        self.specs = {}
+        for (model_id, params) in model_params.items():
+            (self.defaults[model_id], self.specs[model_id]) = resolve_defaults(model_id, params)
+        # model IDs as callers send them -> the ID in model_params.
+        self.model_ids = {model_id: model_id for model_id in model_params}
+        self.lock = Lock()
+
+    # Returns the model's defaults with inference_config's args in place of
+    # them. Args without defaults are passed through as they are.
+    def merge(self, model_id, inference_config=None):
+        model_id = self.resolve_model_id(model_id)
+        args = {
+            key: list(value) if isinstance(value, list) else value
+            for (key, value) in self.defaults[model_id].items()
+        }
+        specs = self.specs[model_id]
+        for (key, value) in (inference_config or {}).items():
+            args[key] = validate_arg(key, value, specs.get(key))
+        return args
+
+    # Cross region inference profile IDs like us.amazon.nova-pro-v1:0 are
+    # looked up by the ID of the model they're for.
+    def resolve_model_id(self, model_id):
+        resolved = self.model_ids.get(model_id)
+        if resolved:
+            return resolved
+        candidates = [model_id.replace('us.', '')]
+        if model_id.count('.') > 1:
+            candidates.insert(0, model_id.split('.', 1)[1])
+        for candidate in candidates:
+            if candidate in self.defaults:
+                with self.lock:
+                    self.model_ids[model_id] = candidate
+                return candidate
+        raise Exception(f"Could not find model {model_id} or {', '.join(candidates)} in models.")
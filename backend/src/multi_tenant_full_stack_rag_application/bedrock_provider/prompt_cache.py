@@ -0,0 +1,75 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from copy import copy
+
+
+# Converse prompt caching. A cachePoint content block in system or in a
+# message marks everything before it as a prefix Bedrock can cache, so
+# later calls that start the same way don't process it again. Models
+# that support it have a promptCaching entry in bedrock_model_params.json:
+# {"minTokens": the smallest prefix a cache point caches,
+#  "maxCachePoints": how many a request can have}
+cache_point = {"cachePoint": {"type": "default"}}
+
+
+def is_cache_point(block):
+    return isinstance(block, dict) and 'cachePoint' in block
+
+
+def block_text(block):
+    if isinstance(block, dict):
+        return block.get('text', '')
+    return ''
+
+
+# Returns converse args with the cache points the model can use. Models
+# without prompt caching would reject them, so all are removed for them.
+# Cache points with a prefix below minTokens wouldn't cache anything but
+# would still be billed as cache writes on some models, so they're
+# removed too, as are the earliest ones past maxCachePoints; later ones
+# cover more of the prompt. args aren't changed.
+def apply_cache_points(args, caching, token_counter):
+    sections = [('system', args.get('system') or [])] + \
+        [(i, message.get('content', [])) for (i, message) in enumerate(args.get('messages', []))]
+    if not any(is_cache_point(block) for (_, blocks) in sections for block in blocks):
+        return args
+
+    # (section, index in section) of each cache point worth keeping.
+    keep = []
+    if caching:
+        prefix_tokens = 0
+        for (section, blocks) in sections:
+            counts = token_counter([block_text(block) for block in blocks])
+            for (i, (block, count)) in enumerate(zip(blocks, counts)):
+                if is_cache_point(block):
+                    if prefix_tokens >= caching.get('minTokens', 0):
+                        keep.append((section, i))
+                else:
+                    prefix_tokens += count
+        keep = keep[-caching.get('maxCachePoints', 4):] if keep else []
+
+    args = copy(args)
+    for (section, blocks) in sections:
+        kept = [block for (i, block) in enumerate(blocks) if not is_cache_point(block) or (section, i) in keep]
+        if len(kept) == len(blocks):
+            continue
+        if section == 'system':
+            if kept:
+                args['system'] = kept
+            else:
+                del args['system']
+        else:
+            args['messages'] = copy(args['messages'])
+            args['messages'][section] = {**args['messages'][section], "content": kept}
+    return args
+
+
+# the token counts of a converse usage block, including the cache's.
+def usage_metrics(usage):
+    return {
+        "input_tokens": usage.get('inputTokens', 0),
+        "output_tokens": usage.get('outputTokens', 0),
+        "cache_read_input_tokens": usage.get('cacheReadInputTokens', 0),
+        "cache_write_input_tokens": usage.get('cacheWriteInputTokens', 0),
+    }
@@ -23,7 +23,7 @@ class DocumentCollection:
         shared_with=[], 
         created_date: str=None, 
         updated_date: str=None, 
-        *, enrichment_pipelines="{}", graph_schema = "{}",
+        *, enrichment_pipelines="{}", graph_schema = "{}", index_profile="{}", index_migration="{}",
     ):
         self.user_id = user_id
         self.sort_key = f"collection::{collection_name}"
@@ -42,6 +42,14 @@ class DocumentCollection:
         self.enrichment_pipelines = json.loads(enrichment_pipelines) if isinstance(enrichment_pipelines, str) else enrichment_pipelines
         print(f"graph_schema is {graph_schema}, type {type(graph_schema)}")
         self.graph_schema = json.loads(graph_schema) if isinstance(graph_schema, str) else graph_schema
+        # how the collection's vector index is built. See
+        # vector_store_provider/opensearch_index_profile.py.
+        self.index_profile = json.loads(index_profile) if isinstance(index_profile, str) else index_profile
+        # the latest change of index profile: {"status": in_progress |
+        # complete | failed, "index_profile": the profile being moved to,
+        # "started_date", "updated_date", "errors"}. index_profile only
+        # changes once a migration is complete.
+        self.index_migration = json.loads(index_migration) if isinstance(index_migration, str) else index_migration
 
     @staticmethod
     def check_allowed_email_domains(shared_with):
@@ -77,6 +85,8 @@ class DocumentCollection:
             rec['updated_date']['S'],
             enrichment_pipelines=rec['enrichment_pipelines']['S'],
             graph_schema=rec['graph_schema']['S'],
+            index_profile=rec.get('index_profile', {}).get('S', '{}'),
+            index_migration=rec.get('index_migration', {}).get('S', '{}'),
         )
 
     def to_ddb_record(self): 
@@ -94,6 +104,8 @@ class DocumentCollection:
             'updated_date': {'S': self.updated_date},
             'graph_schema': {'S': json.dumps(self.graph_schema if self.graph_schema else {})},
             'enrichment_pipelines': {'S': json.dumps(self.enrichment_pipelines if self.enrichment_pipelines else {})},
+            'index_profile': {'S': json.dumps(self.index_profile if self.index_profile else {})},
+            'index_migration': {'S': json.dumps(self.index_migration if self.index_migration else {})},
         }
         if len(self.shared_with) > 0:
             record[self.collection_name]['M']['shared_with'] = {'SS': self.shared_with}
@@ -117,6 +129,8 @@ class DocumentCollection:
             'updated_date': self.updated_date,
             'enrichment_pipelines': json.dumps(self.enrichment_pipelines),
             'graph_schema': json.dumps(self.graph_schema),
+            'index_profile': json.dumps(self.index_profile),
+            'index_migration': json.dumps(self.index_migration),
         }
 
     def __str__(self):
@@ -135,6 +149,8 @@ class DocumentCollection:
             'updated_date': self.updated_date,
             'enrichment_pipelines': json.dumps(self.enrichment_pipelines),
             'graph_schema': json.dumps(self.graph_schema),
+            'index_profile': json.dumps(self.index_profile),
+            'index_migration': json.dumps(self.index_migration),
         })
     
     def __eq__(self, obj):
@@ -156,6 +172,7 @@ class DocumentCollection:
 
         return shared_with_eq and \
             enrichment_pipelines_eq and \
+            self.index_profile == obj.index_profile and \
             graph_schema_eq and \
             self.user_id == obj.user_id and \
             self.user_email == obj.user_email and \
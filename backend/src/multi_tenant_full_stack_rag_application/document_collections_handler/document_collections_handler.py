@@ -22,12 +22,22 @@ POST /document_collections: create or update document collections
 PUT /document_collections/{collection_id}/{share_with_user_email}: share a collection with a user.
 DELETE /document_collections/{collection_id}: delete a doc collection
 DELETE /document_collections/{collection_id}/{file_name}: delete a file from a doc collection
+
+and asynchronously by itself:
+{"operation": "migrate_vector_index", "origin": its own origin,
+ "args": {"user_id", "collection_id", "index_profile"}}: moves a collection's
+    vector index to a new index profile, and saves the profile once it's done.
 """
 
 # initialize global var for the class, so that
 # it's only initialized once.
 
 doc_collections_handler = None
+# how long an index migration can run before it's taken to have failed
+# and can be started again. The function's own timeout.
+default_index_migration_timeout = int(getenv('INDEX_MIGRATION_TIMEOUT_SECONDS', 900))
+# the most errors kept on the collection record for a failed migration.
+max_index_migration_errors = 10
 
 
 class DocumentCollectionsHandler:
@@ -58,6 +68,10 @@ class DocumentCollectionsHandler:
         
         self.allowed_origins = self.utils.get_allowed_origins()
         self.my_origin = self.utils.get_ssm_params('origin_document_collections_handler')
+        self.index_migration_timeout = default_index_migration_timeout
+        # for the vector store's migrate_index, which can run for as long
+        # as the migration does, so it waits that long and isn't retried.
+        self.migration_lambda = None
         
         # origin_domain_name = self.utils.get_ssm_params('origin_frontend', ssm_client=ssm_client)
         # origin_domain_name = ssm_client.get_parameter(
@@ -102,12 +116,11 @@ class DocumentCollectionsHandler:
             coll_dict['graph_schema'] = {}
 
         # print(f"coll_dict is {coll_dict}")
-        created = datetime.now().isoformat() + 'Z' if 'created_date' \
-            not in coll_dict else coll_dict['created_date']
-        updated = created if 'updated_date' not in coll_dict else \
-            coll_dict['updated_date']
-
-        updated = created
+        now = datetime.now().isoformat() + 'Z'
+        created = now if 'created_date' not in coll_dict else coll_dict['created_date']
+        # every upsert is an update, which caches of the collection's
+        # description and graph schema go by.
+        updated = now
         shared_with = [] if 'shared_with' not in coll_dict else coll_dict['shared_with']
         if not 'enrichment_pipelines' in coll_dict:
             coll_dict['enrichment_pipelines'] = {}
@@ -148,7 +161,8 @@ class DocumentCollectionsHandler:
             shared_with,
             created,
             updated,
-            enrichment_pipelines=coll_dict['enrichment_pipelines']
+            enrichment_pipelines=coll_dict['enrichment_pipelines'],
+            index_profile=coll_dict.get('index_profile', {})
         )
         
         # print(f"Created doc collection record {dc.__dict__()}")
@@ -616,9 +630,26 @@ class DocumentCollectionsHandler:
             print(f"creating doc collection from event {handler_evt}")
             new_collection_record = self.create_doc_collection_record(handler_evt)
             print(f"Created new collection record {new_collection_record}")
+            previous_collection = self.get_doc_collection(
+                handler_evt.user_id,
+                new_collection_record.collection_id,
+                consistent=True,
+                include_shared=False
+            )
+            requested_profile = None
+            if previous_collection:
+                if new_collection_record.index_profile != previous_collection.index_profile and \
+                    'index_profile' in handler_evt.document_collection:
+                    requested_profile = new_collection_record.index_profile
+                # the profile only changes once the index has been
+                # migrated to it, and updates that don't mention it,
+                # like the graph schema updates from ingestion, keep it.
+                new_collection_record.index_profile = previous_collection.index_profile
+                new_collection_record.index_migration = previous_collection.index_migration
             upserted_collection = self.upsert_doc_collection(new_collection_record, handler_evt)
             print(f"Upserted collection {upserted_collection}")
             if upserted_collection:
+                self.update_vector_index(previous_collection, upserted_collection, requested_profile)
                 result = self.collections_to_dict([upserted_collection])
                 print(f"Result from POST /document_collections {result}")
             else:
@@ -749,6 +780,139 @@ class DocumentCollectionsHandler:
             else:
                 raise Exception(f"Failed to upsert collection for {new_collection.__dict__()}.")
 
+    # creates a new collection's vector index with its index profile, so
+    # it exists before the first document is ingested, or starts moving
+    # an existing collection to requested_profile. Migrations can take
+    # far longer than the api allows, so they run in their own async
+    # invocation of this function, and collection.index_migration says
+    # how it's going.
+    def update_vector_index(self, previous_collection, collection, requested_profile=None):
+        if not collection.vector_ingestion_enabled:
+            return None
+        if not previous_collection:
+            return self.utils.create_vector_index(
+                collection.collection_id,
+                collection.index_profile,
+                self.my_origin
+            )
+        elif requested_profile is not None:
+            return self.start_index_migration(collection, requested_profile)
+        return None
+
+    # the key of a collection's record, for updating single attributes of it.
+    def collection_key(self, collection):
+        return {
+            'partition_key': {'S': collection.user_id},
+            'sort_key': {'S': f"collection::{collection.collection_name}"},
+        }
+
+    def is_migrating(self, collection, index_profile):
+        migration = collection.index_migration or {}
+        if migration.get('status') != 'in_progress' or migration.get('index_profile') != index_profile:
+            return False
+        started = datetime.fromisoformat(migration['started_date'].rstrip('Z'))
+        return (datetime.now() - started).total_seconds() < self.index_migration_timeout
+
+    # Handles the async invocation update_vector_index starts. The new
+    # profile is only saved once every document is in the new index and
+    # the collection points at it. Until then, and if it fails, the
+    # record keeps the old one, so asking for the new one again retries.
+    def migrate_vector_index(self, user_id, collection_id, index_profile):
+        collection = self.get_doc_collection(user_id, collection_id, consistent=True, include_shared=False)
+        if not collection:
+            print(f"Collection {collection_id} no longer exists, not migrating it")
+            return None
+        if not self.migration_lambda:
+            self.migration_lambda = self.utils.BotoClientProvider.get_client(
+                'lambda',
+                max_attempts=1,
+                read_timeout=self.index_migration_timeout
+            )
+        errors = []
+        try:
+            response = self.utils.migrate_vector_index(
+                collection_id,
+                index_profile,
+                self.my_origin,
+                lambda_client=self.migration_lambda
+            )
+            if 'errorMessage' in response or response.get('statusCode') != 200:
+                errors = [{"error": response.get('errorMessage', response.get('body'))}]
+            else:
+                errors = json.loads(response['body']).get('errors', [])
+        except Exception as e:
+            errors = [{"error": str(e)}]
+
+        migration = {
+            **collection.index_migration,
+            "status": "failed" if errors else "complete",
+            "updated_date": datetime.now().isoformat() + 'Z',
+            "errors": errors[:max_index_migration_errors],
+        }
+        if errors:
+            print(f"Migration of {collection_id} to {index_profile} failed with {len(errors)} errors: {errors[:max_index_migration_errors]}")
+            self.ddb.update_item(
+                TableName=self.doc_collections_table,
+                Key=self.collection_key(collection),
+                UpdateExpression='SET index_migration = :migration',
+                ExpressionAttributeValues={
+                    ':migration': {'S': json.dumps(migration)}
+                }
+            )
+        else:
+            print(f"Migrated {collection_id} to {index_profile}")
+            self.ddb.update_item(
+                TableName=self.doc_collections_table,
+                Key=self.collection_key(collection),
+                UpdateExpression='SET index_profile = :profile, index_migration = :migration',
+                ExpressionAttributeValues={
+                    ':profile': {'S': json.dumps(index_profile)},
+                    ':migration': {'S': json.dumps(migration)}
+                }
+            )
+        return migration
+
+    # records that the collection is moving to index_profile and invokes
+    # this function asynchronously to do it. A migration to the same
+    # profile that's still running isn't started again.
+    def start_index_migration(self, collection, index_profile):
+        if self.is_migrating(collection, index_profile):
+            print(f"Collection {collection.collection_id} is already migrating to {index_profile}")
+            return collection.index_migration
+        now = datetime.now().isoformat() + 'Z'
+        migration = {
+            "status": "in_progress",
+            "index_profile": index_profile,
+            "started_date": now,
+            "updated_date": now,
+            "errors": [],
+        }
+        self.ddb.update_item(
+            TableName=self.doc_collections_table,
+            Key=self.collection_key(collection),
+            UpdateExpression='SET index_migration = :migration',
+            ExpressionAttributeValues={
+                ':migration': {'S': json.dumps(migration)}
+            }
+        )
+        collection.index_migration = migration
+        self.lambda_.invoke(
+            FunctionName=self.utils.get_ssm_params('document_collections_handler_function_name'),
+            InvocationType='Event',
+            Payload=json.dumps({
+                "operation": "migrate_vector_index",
+                "origin": self.my_origin,
+                "args": {
+                    "user_id": collection.user_id,
+                    "collection_id": collection.collection_id,
+                    "index_profile": index_profile
+                }
+            }).encode('utf-8')
+        )
+        print(f"Started migrating {collection.collection_id} to {index_profile}")
+        return migration
+
+
 def handler(event, context):
     global doc_collections_handler
     if not doc_collections_handler:
@@ -767,6 +931,16 @@ def handler(event, context):
             s3, 
             ssm
         )
+    if event.get('operation') == 'migrate_vector_index':
+        # only this function starts migrations.
+        if event.get('origin') != doc_collections_handler.my_origin:
+            print(f"Ignoring migrate_vector_index from origin {event.get('origin')}")
+            return None
+        return doc_collections_handler.migrate_vector_index(
+            event['args']['user_id'],
+            event['args']['collection_id'],
+            event['args']['index_profile']
+        )
     result = doc_collections_handler.handler(event, context)
     # print(f"document_collections_handler returning {result}")
     return result
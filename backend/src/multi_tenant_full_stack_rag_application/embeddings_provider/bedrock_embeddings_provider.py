@@ -11,7 +11,7 @@ from multi_tenant_full_stack_rag_application import utils
 """
 API
  event = {
-    "operation": [get_model_dimensions | get_model_max_tokens | embed_text | get_token_count ]
+    "operation": [get_model_dimensions | get_model_max_tokens | embed_text | embed_texts | get_token_count ]
     "origin": set to the name of the calling lambda function.
     "args" { # Dependent on operation. See below }
  }
@@ -19,6 +19,7 @@ API
  get_model_dimensions:      model_id
  get_model_max_tokens:      model_id
  embed_text                 input_text, model_id, dimensions
+ embed_texts                input_texts, model_id, dimensions, embedding_type
  get_token_count:           input_text
 """
 
@@ -71,6 +72,24 @@ class BedrockEmbeddingsProvider(EmbeddingsProvider):
         print(f"Got response from embed_text: {response}")
         return response
 
+    # Embeds a list of texts with as few bedrock_provider round trips as
+    # possible. Vectors are returned in the same order as input_texts.
+    def embed_texts(self, input_texts, model_id=None, dimensions=1024, input_type='search_document'):
+        if model_id == None:
+            model_id = self.model_id
+        response = self.utils.invoke_bedrock(
+            "embed_texts",
+            {
+                "dimensions": dimensions,
+                "input_texts": input_texts,
+                "model_id": model_id,
+                "input_type": input_type
+            },
+            self.utils.get_ssm_params('embeddings_provider_function_name')
+        )
+        print(f"Got {len(response.get('response', []))} vectors from embed_texts")
+        return response
+
     def get_model_dimensions(self, model_id=None):
         if model_id == None:
             model_id = self.model_id
@@ -99,7 +118,7 @@ class BedrockEmbeddingsProvider(EmbeddingsProvider):
         return response
 
     def get_token_count(self, input_text):
-        return self.utils.get_token_count(input_text)
+        return self.utils.get_token_count(input_text, self.model_id)
             
     def handler(self, event, context):
         print(f"Embeddings provider received event {event}")
@@ -123,6 +142,17 @@ class BedrockEmbeddingsProvider(EmbeddingsProvider):
                 "response": response['response'],
             }
 
+        elif handler_evt.operation == 'embed_texts':
+            response = self.embed_texts(
+                handler_evt.input_texts, 
+                handler_evt.model_id, 
+                handler_evt.dimensions, 
+                handler_evt.embedding_type
+            )
+            result = {
+                "response": response['response'],
+            }
+
         elif handler_evt.operation == 'get_model_dimensions':
             response = self.get_model_dimensions(handler_evt.model_id)
             result = {
@@ -21,6 +21,10 @@ class EmbeddingsProvider(ABC):
     def embed_text(self, input_text, emb_type: EmbeddingType):
         pass
 
+    @abstractmethod
+    def embed_texts(self, input_texts: [str], emb_type: EmbeddingType) -> [[float]]:
+        pass
+
     @abstractmethod
     def get_model_dimensions(self, model_id) -> int:
         pass
@@ -7,6 +7,7 @@ class EmbeddingsProviderEvent:
     def __init__(self, 
         dimensions='',
         input_text='',
+        input_texts=[],
         model_id='',
         operation='',
         origin='',
@@ -14,6 +15,7 @@ class EmbeddingsProviderEvent:
     ):
         self.dimensions = dimensions
         self.input_text = input_text
+        self.input_texts = input_texts
         self.model_id = model_id
         self.operation = operation
         self.origin = origin
@@ -32,6 +34,8 @@ class EmbeddingsProviderEvent:
             self.dimensions = 1024
         if 'input_text' in self.args:
             self.input_text = self.args['input_text']
+        if 'input_texts' in self.args:
+            self.input_texts = self.args['input_texts']
         if 'model_id' in self.args:
             self.model_id = self.args['model_id']
         if 'embedding_type' in self.args:
@@ -44,6 +48,7 @@ class EmbeddingsProviderEvent:
         return json.dumps({
             "dimensions": self.dimensions,
             "input_text": self.input_text,
+            "input_texts": self.input_texts,
             "model_id": self.model_id,
             "operation": self.operation,
             "origin": self.origin
@@ -2,7 +2,6 @@
 #  SPDX-License-Identifier: MIT-0
 import json
 import os
-from math import ceil
 
 from multi_tenant_full_stack_rag_application.utils import BotoClientProvider, utils
 from .embeddings_provider import EmbeddingsProvider, EmbeddingType
@@ -12,6 +11,10 @@ from .embeddings_provider_event import EmbeddingsProviderEvent
 
 sm_embeddings_provider = None
 
+# TEI endpoints reject requests with more inputs than their
+# --max-client-batch-size, which defaults to 32.
+sm_max_batch_size = int(os.getenv('SAGEMAKER_EMBEDDINGS_MAX_BATCH_SIZE', 32))
+
 
 class SageMakerEmbeddingsProvider(EmbeddingsProvider):
     def __init__(self, 
@@ -45,6 +48,24 @@ class SageMakerEmbeddingsProvider(EmbeddingsProvider):
         )
         return json.loads(response['Body'].read())[0]
 
+    def embed_texts(self, input_texts, embedding_type=EmbeddingType.search_document):
+        if self.use_embedding_type:
+            input_texts = [embedding_type.name + ': ' + text for text in input_texts]
+        print(f'Generating {len(input_texts)} embeddings of dimensions: {self.dimensions}')
+        vectors = []
+        for i in range(0, len(input_texts), sm_max_batch_size):
+            response = self.sm_client.invoke_endpoint(
+                EndpointName=self.endpoint,
+                Body=json.dumps({
+                    "inputs": input_texts[i:i + sm_max_batch_size], 
+                    "dimensions": self.dimensions
+                }).encode('utf-8'),
+                ContentType="application/json",
+                Accept="*/*"
+            )
+            vectors += json.loads(response['Body'].read())
+        return vectors
+
     def get_model_dimensions(self, model_id=None) -> int:
         return self.dimensions
     
@@ -52,8 +73,7 @@ class SageMakerEmbeddingsProvider(EmbeddingsProvider):
         return self.max_tokens
 
     def get_token_count(self, input_text) -> int:
-        #estimate 1.3 tokens per word on average
-        return ceil(len(input_text.split()) * 1.3)
+        return self.utils.get_token_count(input_text, self.model_id)
     
     def handler(self, event, context):
         print(f"SageMakerEmbeddingsProvider received event {event}")
@@ -85,6 +105,14 @@ class SageMakerEmbeddingsProvider(EmbeddingsProvider):
                 "response": response,
             }
 
+        elif handler_evt.operation == 'embed_texts':
+            embedding_type = EmbeddingType.search_document
+            if handler_evt.embedding_type == 'search_query':
+                embedding_type = EmbeddingType.search_query
+            result = {
+                "response": self.embed_texts(handler_evt.input_texts, embedding_type),
+            }
+
         elif handler_evt.operation == 'get_model_dimensions':
             response = self.get_model_dimensions(handler_evt.model_id)
             result = {
@@ -0,0 +1,205 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+
+from multi_tenant_full_stack_rag_application.utils.tokenizer_service import estimate_token_counts
+
+
+# for models bedrock_model_params.json doesn't have a contextWindow for.
+default_context_window = int(os.getenv('DEFAULT_CONTEXT_WINDOW_TOKENS', 32000))
+# the most tokens of context a prompt gets, however big the model's
+# window is. Bigger prompts cost more and are slower to first token.
+default_max_context_tokens = int(os.getenv('MAX_CONTEXT_TOKENS', 24000))
+# tokens left free for the context's wrapper tags and for differences
+# between the token counts here and the model's own tokenizer.
+default_context_margin = int(os.getenv('CONTEXT_TOKEN_MARGIN', 512))
+# for models without a tokenizer of their own, whose tokens are estimated,
+# the prompt is budgeted as if it had this many times the estimated
+# tokens. Claude and Llama tokenizers can count 30% or more over the
+# words * 1.3 estimate for code, numbers and non-English text.
+default_estimate_safety_factor = float(os.getenv('CONTEXT_ESTIMATE_SAFETY_FACTOR', 1.5))
+# the share of the context budget each source gets. Tokens a source
+# doesn't need go to the others, in this order.
+default_source_shares = OrderedDict([
+    ('semantic_search', float(os.getenv('SEMANTIC_SEARCH_CONTEXT_SHARE', 0.5))),
+    ('graph', float(os.getenv('GRAPH_CONTEXT_SHARE', 0.2))),
+    ('tool', float(os.getenv('TOOL_CONTEXT_SHARE', 0.3))),
+])
+# a block is only cut down to fit if at least this many tokens of it can stay.
+default_min_truncated_tokens = int(os.getenv('MIN_TRUNCATED_CONTEXT_TOKENS', 64))
+default_max_compiled_templates = int(os.getenv('MAX_COMPILED_PROMPT_TEMPLATES', 64))
+truncation_marker = '\n[truncated]\n'
+
+
+# A prompt template split once at its placeholders, so filling it in is a
+# single join instead of a .replace over the whole prompt per placeholder.
+# Values are inserted as is, so a value that contains a placeholder, like
+# a document that mentions {user_prompt}, isn't filled in too. Placeholders
+# without a value are left in the prompt, as .replace would have.
+class PromptTemplate:
+    def __init__(self, text, placeholders):
+        self.text = text
+        pattern = '|'.join(re.escape('{' + name + '}') for name in placeholders)
+        # split with a capturing group alternates literal text and placeholders.
+        self.parts = re.split(f"({pattern})", text) if pattern else [text]
+
+    # the text before the first placeholder, which is the same whatever
+    # it's formatted with.
+    @property
+    def prefix(self):
+        return self.parts[0]
+
+    def format(self, **values):
+        parts = self.parts.copy()
+        for i in range(1, len(parts), 2):
+            name = parts[i][1:-1]
+            if name in values:
+                parts[i] = values[name]
+        return ''.join(parts)
+
+
+# Fits retrieved context into the part of the model's context window the
+# rest of the prompt and the response leave free. Each source gets a share
+# of that budget. Blocks are kept whole, in order, while they fit, and the
+# first that doesn't is cut down to what's left.
+#
+# blocks are (head, body, tail) tuples, like a tool's wrapper tags and its
+# output. Only the body is cut, so tags are always closed.
+#
+# Tokens are counted with the generation model's tokenizer, by passing its
+# ID to token_counter. When has_tokenizer says the model doesn't have one,
+# the counts are estimates, and the budget leaves room for them to be low.
+class ContextAssembler:
+    def __init__(self, get_context_window, *,
+        estimate_safety_factor: float=default_estimate_safety_factor,
+        has_tokenizer=None,
+        margin: int=default_context_margin,
+        max_compiled_templates: int=default_max_compiled_templates,
+        max_context_tokens: int=default_max_context_tokens,
+        min_truncated_tokens: int=default_min_truncated_tokens,
+        source_shares: dict=default_source_shares,
+        token_counter=None
+    ):
+        # takes a model ID and returns its context window, or None.
+        self.get_context_window = get_context_window
+        self.estimate_safety_factor = estimate_safety_factor
+        # takes a model ID and returns whether its tokens are counted
+        # exactly. Without it, all counts are treated as estimates.
+        self.has_tokenizer = has_tokenizer
+        self.margin = margin
+        self.max_compiled_templates = max_compiled_templates
+        self.max_context_tokens = max_context_tokens
+        self.min_truncated_tokens = min_truncated_tokens
+        self.source_shares = source_shares
+        # takes a list of texts and a model ID, and returns the texts'
+        # token counts for that model.
+        self.token_counter = token_counter if token_counter else estimate_token_counts
+        self.context_windows = {}
+        self.templates = OrderedDict()
+        self.lock = Lock()
+
+    def allocate(self, needs, budget):
+        total_share = sum(self.source_shares.get(source, 0) for source in needs) or 1
+        allocations = {
+            source: min(need, int(budget * self.source_shares.get(source, 0) / total_share))
+            for (source, need) in needs.items()
+        }
+        spare = budget - sum(allocations.values())
+        for source in sorted(needs, key=self.source_priority):
+            extra = min(spare, needs[source] - allocations[source])
+            allocations[source] += extra
+            spare -= extra
+        return allocations
+
+    # returns {source: blocks that fit its share of budget}, counting
+    # tokens for model_id.
+    def assemble(self, blocks_by_source, budget, model_id=None):
+        counts = {
+            source: self.token_counter([''.join(block) for block in blocks], model_id)
+            for (source, blocks) in blocks_by_source.items()
+        }
+        allocations = self.allocate({source: sum(source_counts) for (source, source_counts) in counts.items()}, budget)
+        assembled = {}
+        for (source, blocks) in blocks_by_source.items():
+            assembled[source] = self.fit(blocks, counts[source], allocations[source], model_id)
+            if len(assembled[source]) < len(blocks) or sum(counts[source]) > allocations[source]:
+                print(f"Fit {source} context of {sum(counts[source])} tokens in {len(blocks)} blocks into {allocations[source]} tokens")
+        return assembled
+
+    # the compiled template for text. Templates are compiled once per
+    # text, so an edited template is compiled again.
+    def compile(self, text, placeholders=('context', 'conversation_history', 'user_prompt')):
+        key = (text, tuple(placeholders))
+        with self.lock:
+            if key in self.templates:
+                self.templates.move_to_end(key)
+                return self.templates[key]
+        template = PromptTemplate(text, placeholders)
+        with self.lock:
+            self.templates[key] = template
+            while len(self.templates) > self.max_compiled_templates:
+                self.templates.popitem(last=False)
+        return template
+
+    # the tokens left for context once the rest of the prompt and the
+    # response are accounted for, in model_id's token counts. Estimated
+    # counts are scaled by the safety factor, so the prompt still fits
+    # if the model's tokenizer counts that much more.
+    def context_budget(self, model_id, prompt_without_context, max_output_tokens=0):
+        prompt_tokens = self.token_counter([prompt_without_context], model_id)[0]
+        available = self.context_window(model_id) - int(max_output_tokens or 0) - self.margin
+        free = int(available / self.safety_factor(model_id)) - prompt_tokens
+        return max(0, min(free, self.max_context_tokens))
+
+    def context_window(self, model_id):
+        if model_id not in self.context_windows:
+            try:
+                window = self.get_context_window(model_id)
+            except Exception as e:
+                print(f"Couldn't get the context window of {model_id}: {e}")
+                # not cached, so it's tried again next time.
+                return default_context_window
+            self.context_windows[model_id] = int(window) if window else default_context_window
+        return self.context_windows[model_id]
+
+    def fit(self, blocks, counts, budget, model_id=None):
+        fitted = []
+        used = 0
+        for (block, count) in zip(blocks, counts):
+            if used + count <= budget:
+                fitted.append(block)
+                used += count
+                continue
+            (head, body, tail) = block
+            wrapper_count = self.token_counter([head + tail + truncation_marker], model_id)[0]
+            body_budget = budget - used - wrapper_count
+            if body_budget >= self.min_truncated_tokens:
+                fitted.append((head, self.truncate(body, body_budget, model_id) + truncation_marker, tail))
+            break
+        return fitted
+
+    def safety_factor(self, model_id):
+        if self.has_tokenizer and self.has_tokenizer(model_id):
+            return 1.0
+        return max(1.0, self.estimate_safety_factor)
+
+    def source_priority(self, source):
+        sources = list(self.source_shares)
+        return sources.index(source) if source in sources else len(sources)
+
+    # the longest run of text's leading words within max_tokens, found by
+    # binary search so it takes a handful of token counts, not one per word.
+    def truncate(self, text, max_tokens, model_id=None):
+        words = re.split(r'(?<=\s)(?=\S)', text)
+        (low, high) = (0, len(words))
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.token_counter([''.join(words[:mid])], model_id)[0] <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return ''.join(words[:low])
@@ -0,0 +1,98 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import Lock
+from time import monotonic
+
+
+default_max_workers = int(os.getenv('CONTEXT_RETRIEVAL_MAX_WORKERS', 16))
+
+# seconds each kind of source gets before its results are left out
+# of the context. Tools get longer because web search downloads pages.
+default_source_timeouts = {
+    'graph': float(os.getenv('GRAPH_CONTEXT_TIMEOUT_SECONDS', 15)),
+    'semantic_search': float(os.getenv('SEMANTIC_SEARCH_CONTEXT_TIMEOUT_SECONDS', 15)),
+    'tool': float(os.getenv('TOOL_CONTEXT_TIMEOUT_SECONDS', 45)),
+}
+
+
+# Runs every retrieval task (the semantic search, each graph query and
+# each tool call) concurrently on a bounded thread pool. Each task has a
+# deadline based on its source. Results for tasks that miss their
+# deadline or raise are left out, so the caller can build partial context.
+#
+# Each retrieve call gets its own pool. Threads can't be interrupted, so
+# tasks that miss their deadline keep running, and in a shared pool they'd
+# hold its workers across warm invocations and make later requests queue
+# behind them. They're counted as abandoned until they finish.
+#
+# task format:
+# {
+#     "source": one of default_source_timeouts' keys,
+#     "id": collection id(s) or tool name,
+#     "fn": callable,
+#     "args": tuple of args for fn
+# }
+class ContextRetriever:
+    def __init__(self, *,
+        max_workers: int=default_max_workers,
+        source_timeouts: dict=default_source_timeouts
+    ):
+        self.max_workers = max_workers
+        self.source_timeouts = source_timeouts
+        # timed out tasks that are still running.
+        self.abandoned = 0
+        self.lock = Lock()
+
+    def abandon(self, future):
+        with self.lock:
+            self.abandoned += 1
+        future.add_done_callback(self.on_abandoned_done)
+
+    def on_abandoned_done(self, future):
+        with self.lock:
+            self.abandoned -= 1
+
+    def retrieve(self, tasks):
+        start = monotonic()
+        if len(tasks) == 0:
+            return []
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks)))
+        pending = []
+        for i, task in enumerate(tasks):
+            future = executor.submit(task['fn'], *task.get('args', ()))
+            deadline = start + self.source_timeouts.get(task['source'], 30)
+            pending.append((deadline, i, task, future))
+
+        # returned in the same order as tasks.
+        results = [None] * len(tasks)
+        # wait on the nearest deadline first, so one slow source doesn't
+        # eat into the others' time.
+        for (deadline, i, task, future) in sorted(pending, key=lambda p: p[0]):
+            result = {
+                "source": task['source'],
+                "id": task['id'],
+                "status": "ok",
+                "response": None
+            }
+            try:
+                result['response'] = future.result(timeout=max(0, deadline - monotonic()))
+            except TimeoutError:
+                # can't interrupt the thread, but its result is discarded,
+                # and it won't start if it hasn't yet.
+                result['status'] = 'timeout'
+                if not future.cancel():
+                    self.abandon(future)
+            except Exception as e:
+                result['status'] = 'error'
+                result['error'] = str(e)
+            result['elapsed'] = round(monotonic() - start, 3)
+            if result['status'] != 'ok':
+                print(f"Context retrieval for {task['source']} {task['id']} failed with status {result['status']} after {result['elapsed']}s: {result.get('error', '')}")
+            results[i] = result
+        executor.shutdown(wait=False, cancel_futures=True)
+        print(f"Retrieved context from {len(tasks)} sources in {round(monotonic() - start, 3)}s, " +
+            f"{self.abandoned} timed out tasks still running")
+        return results
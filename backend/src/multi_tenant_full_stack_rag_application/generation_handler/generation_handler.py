@@ -6,27 +6,48 @@ import json
 import markdown
 from lxml import objectify
 import os
+from datetime import datetime
 from importlib import import_module
 from pathlib import Path
+from time import monotonic
 from multi_tenant_full_stack_rag_application import utils
+from multi_tenant_full_stack_rag_application.utils.reranker import BedrockRerankScorer, Reranker, default_rerank_model_id, rerank_query
+from .context_assembler import ContextAssembler
+from .context_retriever import ContextRetriever
 from .generation_handler_event import GenerationHandlerEvent
-
-from queue import Queue
-from threading import Thread
+from .markdown_stream import IncrementalMarkdownRenderer
+from .orchestration_prompt import OrchestrationPrompt
+from .query_router import QueryRouter, default_query_router_enabled
+from .response_cache import ResponseCache, default_response_cache_enabled, response_cache_scope
+from .websocket_push import FragmentPusher, connection_endpoint
 
 """ 
 API calls served by this function (via API Gateway):
 GET /generation: list models
 POST /generation: invoke model
+
+and via the websocket API, which pushes the response as it's generated:
+generate route: invoke model
 """
 
 # search_query_model = 'anthropic.claude-3-5-haiku-20241022-v1:0'
 # search_query_model = 'us.amazon.nova-pro-v1:0'
 default_top_k = 5
+# messageObj.stream overrides this per request.
+default_stream = os.getenv('STREAM_GENERATION', 'false').lower() == 'true'
+# prompt template text before the first placeholder is sent as system
+# content Bedrock can cache when it's at least this many tokens. Shorter
+# prefixes are too short to cache, and stay in the user message.
+default_prompt_cache_min_tokens = int(os.getenv('PROMPT_CACHE_MIN_TOKENS', 1000))
+# marks the end of a prefix Bedrock can cache. bedrock_provider removes
+# it for models that don't support prompt caching.
+cache_point = {"cachePoint": {"type": "default"}}
 
 # init global variables to hold injected data, because otherwise the
 # clients will be re-initialized every time the function is invoked, slowing things down.
 generation_handler = None
+# management api clients by websocket api endpoint.
+websocket_clients = {}
 
 class GenerationHandler:
     def __init__(self,
@@ -45,46 +66,224 @@ class GenerationHandler:
         self.llms = None
         self.top_k = os.getenv('TOP_K', default_top_k)
         self.tool_list = self.get_tool_list()
-        self.context_queue = Queue()
+        self.orchestration_prompt = OrchestrationPrompt(self.search_query_template, self.tool_list)
+        self.context_retriever = ContextRetriever()
+        scorer = None
+        if default_rerank_model_id:
+            scorer = BedrockRerankScorer(default_rerank_model_id, self.my_origin, self.utils.invoke_bedrock)
+        self.reranker = Reranker(scorer, token_counter=self.utils.get_token_counts)
+        self.context_assembler = ContextAssembler(
+            self.get_model_context_window,
+            has_tokenizer=self.utils.has_tokenizer,
+            token_counter=self.utils.get_token_counts
+        )
+        self.prompt_cache_min_tokens = default_prompt_cache_min_tokens
+        self.query_router = None
+        if default_query_router_enabled:
+            self.query_router = QueryRouter(
+                lambda prompt: self.utils.embed_text(prompt, self.my_origin),
+                lambda texts: self.utils.embed_texts(texts, self.my_origin)
+            )
+        self.response_cache = None
+        if default_response_cache_enabled:
+            # prompts are only embedded if a similarity threshold is set.
+            self.response_cache = ResponseCache(
+                lambda prompt: self.utils.embed_text(prompt, self.my_origin)
+            )
+
+    def generate(self, handler_evt, *, stream=False):
+        msg_obj = handler_evt.message_obj
+        doc_collections = self.utils.get_document_collections(handler_evt.user_id, origin=self.my_origin)
+        template_text = None
+        cache_scope = None
+        if self.response_cache:
+            # the template's text is part of the cache scope.
+            template_text = self.get_prompt_template_text(msg_obj)
+            cache_scope = self.get_response_cache_scope(handler_evt, doc_collections, template_text)
+        if cache_scope:
+            response = self.response_cache.get(cache_scope, msg_obj['human_message'])
+            print(f"Response cache {'hit' if response is not None else 'miss'}, metrics {self.response_cache.metrics()}")
+            if response is not None:
+                yield response
+                return
+
+        # if 'document_collections' in msg_obj:
+        # first assemble the chat history and find a sensible set of
+        # search terms given the most recent question. Clear cases are
+        # routed locally, without the orchestration model.
+        (hist, curr_prompt) = self.get_conversation(msg_obj)
+        recommendations = None
+        if self.query_router:
+            recommendations = self.query_router.route(curr_prompt, hist, doc_collections)
+        if recommendations is None:
+            start = monotonic()
+            recommendations = self.get_orchestration(handler_evt, doc_collections=doc_collections)
+            if self.query_router:
+                self.query_router.record_orchestration(monotonic() - start)
+        print(f"Got {len(recommendations) if recommendations else 0} recommendations")
+        vector_search_recommendations = []
+        graph_search_recommendations = []
+        tool_recommendations = []
+
+        if 'final_answer' in recommendations.keys() and \
+            recommendations['final_answer']:
+            response = markdown.markdown(recommendations['final_answer'])
+            if cache_scope:
+                self.response_cache.put(cache_scope, msg_obj['human_message'], response)
+            yield response
+            return
+
+        for item_id in list(recommendations.keys()):
+            if 'tool_inputs' in recommendations[item_id].keys():
+                print(f"Found tool recommendation {recommendations[item_id]}")
+                tool_recommendations.append(recommendations[item_id])
+            else:
+                recommendation = recommendations[item_id]
+                if "search_terms" in recommendation and \
+                    recommendation['search_terms'] not in ['',None,'None']:
+                    search_recommendation = {
+                        "id": item_id,
+                        "search_terms": recommendation['search_terms']
+                    }
+                    if recommendation.get('filters'):
+                        search_recommendation['filters'] = recommendation['filters']
+                    vector_search_recommendations.append(search_recommendation)
+                    
+                if "graph_database_query" in recommendation and\
+                recommendation['graph_database_query'] not in ['',None,'None']:
+                    graph_search_recommendations.append({
+                        "id": item_id,
+                        "graph_database_query": recommendation['graph_database_query']
+                    })
+
+        if template_text is None:
+            template_text = self.get_prompt_template_text(msg_obj)
+        template = self.context_assembler.compile(template_text)
+        model_args = msg_obj['model']['model_args']
+        # the context gets whatever the rest of the prompt and the
+        # response leave of the model's context window.
+        token_budget = self.context_assembler.context_budget(
+            msg_obj['model']['model_id'],
+            template.format(context='', user_prompt=curr_prompt, conversation_history=hist),
+            model_args.get('maxTokens', 0) if isinstance(model_args, dict) else 0
+        )
+        context = self.get_context(
+            graph_search_recommendations,
+            vector_search_recommendations,
+            tool_recommendations,
+            model_id=msg_obj['model']['model_id'],
+            token_budget=token_budget
+        )
+        prompt = template.format(context=context, user_prompt=curr_prompt, conversation_history=hist)
+        # tool results, like web search's, can change from one call to the next.
+        cacheable = cache_scope is not None and len(tool_recommendations) == 0
+        print(f"sending model_args {model_args}")
+        system = None
+        if template.prefix.strip() and \
+            self.context_assembler.token_counter([template.prefix], msg_obj['model']['model_id'])[0] >= self.prompt_cache_min_tokens:
+            system = [{"text": template.prefix}, cache_point]
+            prompt = prompt[len(template.prefix):]
+        # only sizes are logged: prompts and context are the user's data.
+        print(f"sending a {len(prompt)} character prompt with {len(context)} characters of context, cached prefix {len(template.prefix) if system else 0} characters")
+        bedrock_args = {
+            "model_id": msg_obj['model']['model_id'], 
+            "messages": [{
+                "role": "user",
+                "content": [{
+                    "text": prompt
+                }]
+            }], 
+            "inference_config": model_args
+        }
+        if system:
+            bedrock_args['system'] = system
+        if stream:
+            fragments = []
+            for fragment in self.stream_model(bedrock_args):
+                fragments.append(fragment)
+                yield fragment
+            if cacheable:
+                self.response_cache.put(cache_scope, curr_prompt, ''.join(fragments))
+            return
+
+        result = self.utils.invoke_bedrock(
+            'invoke_model', 
+            bedrock_args,
+            self.my_origin
+        )
+        if result["statusCode"] != 200:
+            raise Exception(f"Failed to invoke bedrock {result}")
+        print(f"Generation token usage {result.get('usage')}")
+        response = markdown.markdown(result['response'])
+        if cacheable:
+            self.response_cache.put(cache_scope, curr_prompt, response)
+        yield response
 
     def get_context(self, 
         graph_recommendations,
         search_recommendations,
-        tool_recommendations
+        tool_recommendations,
+        *,
+        model_id=None,
+        token_budget=None
     ):
-        graph_ctx = Thread(
-            target=self.get_graph_context,
-            args=(self.context_queue, graph_recommendations),
-            daemon=True
-        )
-        graph_ctx.start()
-
-        search_ctx = Thread(
-            target=self.get_semantic_search_context,
-            args=(self.context_queue, search_recommendations),
-            daemon=True
-        )
-        search_ctx.start()
-
-        tool_ctx = Thread(
-            target=self.get_tool_context,
-            args=(self.context_queue, tool_recommendations),
-            daemon=True
-        )
-        tool_ctx.start()
-        graph_ctx.join()
-        search_ctx.join()
-        tool_ctx.join()
-        self.context_queue.put(None)
-        context = ''
-        while True:
-            result = self.context_queue.get()
-            print(f"Got item from queue: {result}")
-            if not result:
-                break
-            else:
-                context += result
-        print(f"Got assembled context:\n\n{context}\n\n")
+        tasks = []
+        for recommendation in graph_recommendations:
+            tasks.append({
+                "source": "graph",
+                "id": recommendation['id'],
+                "fn": self.get_graph_results,
+                "args": (recommendation,)
+            })
+        if len(search_recommendations) > 0:
+            # one search across all the collections, so the top k are
+            # chosen with scores that are comparable between them.
+            tasks.append({
+                "source": "semantic_search",
+                "id": ','.join(recommendation['id'] for recommendation in search_recommendations),
+                "fn": self.get_semantic_search_results,
+                "args": (search_recommendations, model_id)
+            })
+        for recommendation in tool_recommendations:
+            tasks.append({
+                "source": "tool",
+                "id": recommendation['tool_name'],
+                "fn": self.invoke_tool,
+                "args": (recommendation['tool_name'], recommendation['tool_inputs'])
+            })
+        results = self.context_retriever.retrieve(tasks)
+
+        # (head, body, tail) blocks for each source. The assembler only
+        # cuts bodies, so the tags stay balanced.
+        blocks = {"semantic_search": [], "graph": [], "tool": []}
+        for result in results:
+            if result['status'] != 'ok':
+                continue
+            if result['source'] == 'graph':
+                (graph_query, graph_results) = result['response']
+                blocks['graph'].append((
+                    f"<graph_query>\n{graph_query}\n</graph_query>\n<graph_query_results>\n",
+                    graph_results,
+                    "\n</graph_query_results>\n"
+                ))
+            elif result['source'] == 'semantic_search':
+                # in reranked order, best first.
+                blocks['semantic_search'] += [('', doc['content'], '') for doc in result['response']]
+            elif result['source'] == 'tool':
+                tool_name = result['id']
+                blocks['tool'].append((
+                    f"\t<{tool_name}_context>\n\n",
+                    json.dumps(result['response'], indent=2),
+                    f"\n\t</{tool_name}_context>\n"
+                ))
+        if token_budget is not None:
+            blocks = self.context_assembler.assemble(blocks, token_budget, model_id)
+
+        graph_context = "<graph_context>\n" + ''.join(map(''.join, blocks['graph'])) + "</graph_context>\n"
+        semantic_context = "<semantic_search_context>\n" + ''.join(map(''.join, blocks['semantic_search'])) + "</semantic_search_context>\n\n"
+        tool_context = "<tool_context>\n" + ''.join(map(''.join, blocks['tool'])) + "</tool_context>\n\n"
+        context = graph_context + semantic_context + tool_context
+        print(f"Assembled {len(context)} characters of context from {len(blocks['graph'])} graph, {len(blocks['semantic_search'])} semantic search and {len(blocks['tool'])} tool results")
         return context
 
     def get_conversation(self, msg_obj): 
@@ -95,40 +294,28 @@ class GenerationHandler:
             hist = msg_obj['memory']['history']
         return (hist, curr_prompt)
 
-    def get_graph_context(self, queue, search_recommendations):
-        context = "<graph_context>\n"
-        try: 
-            graph_results = []
-            for recommendation in search_recommendations:
-                graph_query = recommendation['graph_database_query'].replace('g.V()', f'g.V().has(id, startingWith("{recommendation["id"]}")')
-                response = self.utils.neptune_statement(recommendation["id"], graph_query, 'gremlin', self.my_origin)
-                body = json.loads(response['body'])
-                print(f"Got neptune response {body}")
-                graph_results.append(str(body['response']))
-            print(f"Got graph_results {graph_results}")
-            
-            if len(graph_results) > 0:
-                graph_results = "\n".join(graph_results)
-                context += f"<graph_query>\n{graph_query}\n</graph_query>\n"
-                context += f"<graph_query_results>\n{graph_results}\n</graph_query_results>\n"
-        except Exception as e:
-            print(f"ERROR: Failed to fetch graph data context.")
-        context += '</graph_context>\n'
-        print(f"queuing graph context result {context}")
-        queue.put(context)
-        return
-
-    def get_orchestration(self, handler_evt): 
-        print(f"get_orchestration got handler_evt {handler_evt.__dict__()}")
+    def get_graph_results(self, recommendation):
+        graph_query = recommendation['graph_database_query'].replace('g.V()', f'g.V().has(id, startingWith("{recommendation["id"]}")')
+        response = self.utils.neptune_statement(recommendation["id"], graph_query, 'gremlin', self.my_origin)
+        body = json.loads(response['body'])
+        print(f"Got neptune response {body}")
+        return (graph_query, str(body['response']))
+
+    def get_model_context_window(self, model_id):
+        result = self.utils.invoke_bedrock('get_model_context_window', {"model_id": model_id}, self.my_origin)
+        if result['statusCode'] != 200:
+            raise Exception(f"Failed to get the context window of {model_id}: {result}")
+        return result['response']
+
+    # doc_collections are the user's collections, if the caller has
+    # already fetched them.
+    def get_orchestration(self, handler_evt, *, doc_collections=None): 
         msg_obj = handler_evt.message_obj
-        print(f"Got msg_obj {msg_obj}")
         (hist, curr_prompt) = self.get_conversation(msg_obj)
-        print(f"Got history {hist}, curr_prompt {curr_prompt}")
-        doc_collections = self.utils.get_document_collections(handler_evt.user_id, origin=self.my_origin)
-        print(f"get_orchestration got doc_collections {doc_collections}")
-        doc_collections_dicts = []
-        collection_names = list(doc_collections.keys())
-        print(f"Got collection_names {collection_names}")
+        print(f"get_orchestration got {len(hist)} characters of history and a {len(curr_prompt)} character prompt")
+        if doc_collections is None:
+            doc_collections = self.utils.get_document_collections(handler_evt.user_id, origin=self.my_origin)
+        print(f"get_orchestration got {len(doc_collections)} doc_collections")
         
         if isinstance(msg_obj['document_collections'], str):
             msg_obj['document_collections'] = json.loads(msg_obj['document_collections'])
@@ -136,39 +323,30 @@ class GenerationHandler:
         if msg_obj['document_collections'] == ['']:
             msg_obj['document_collections'] = []
 
-        for collection_name in collection_names:
-            print(f"msg_obj['document_collections'] = {msg_obj['document_collections']}, type {type(msg_obj['document_collections'])}, len {len(msg_obj['document_collections'])}")
-            if not isinstance(msg_obj['document_collections'], list):
-                if collection_name not in enabled_collections:
-                    print(f"skipping collection {collection_name} because it's not in {msg_obj['document_collections']}")
-                    continue
-
-            print(f"get_orchestration processing collection {collection_name}")
-            collection = doc_collections[collection_name]
-            print(f"collection is now {collection}")
-            doc_collections_dicts.append({
-                'id': collection['collection_id'],
-                'name': collection['collection_name'],
-                'description': collection['description'],
-                'graph_schema': json.loads(collection['graph_schema']) if isinstance(collection['graph_schema'], str) else collection['graph_schema'],
-            })
-
-        print(f"doc_collections_dicts = {doc_collections_dicts}")
-        prompt =  self.search_query_template.replace('{conversation_history}', hist)\
-            .replace('{current_user_prompt}', curr_prompt)\
-            .replace('{available_document_collections}', json.dumps(doc_collections_dicts, indent=2))\
-            .replace('{available_tools}', json.dumps(self.tool_list, indent=2))
-        
-        print(f"get_orchestration sending prompt {prompt}")
+        # the collections and tools part of the prompt is only rendered
+        # when they change, and goes first, as cacheable system content,
+        # so it's the same prefix on every turn. The turn's prompt and
+        # date follow it in the user message.
+        static_prefix = self.orchestration_prompt.static_prefix(handler_evt.user_id, doc_collections)
+        dynamic_suffix = self.orchestration_prompt.dynamic_suffix(
+            conversation_history=hist,
+            current_user_prompt=curr_prompt,
+            current_date=datetime.now().date().isoformat()
+        )
+        print(f"get_orchestration sending a {len(static_prefix)} character prefix and a {len(dynamic_suffix)} character prompt")
+        print(f"Orchestration prefix cache hits {self.orchestration_prompt.hits}, misses {self.orchestration_prompt.misses}")
         
         response = self.utils.invoke_bedrock(
             "invoke_model",
             {
                 "model_id": msg_obj['model']['model_id'],
+                "system": [{
+                    "text": static_prefix
+                }, cache_point],
                 "messages": [{
                     "role": "user",
                     "content": [{
-                        "text": prompt
+                        "text": dynamic_suffix
                     }]
                 }],
                 "inference_config": {
@@ -180,13 +358,13 @@ class GenerationHandler:
             },
             self.my_origin
         )
-        print(f"Got response from bedrock: {response}")
+        print(f"Orchestration token usage {response.get('usage')}")
         status = response['statusCode']
         if not status == 200:
             print(f"Error invoking bedrock: {response}")
             return None
         response = response['response']
-        print(f"generation_handler.get_orchestration got response {response}")
+        print(f"generation_handler.get_orchestration got a {len(response)} character response")
         response = response.replace('</NONE>', '').replace('<NONE>', '').strip()
         if '<final_answer>' in response and \
             '</final_answer>' not in response:
@@ -214,6 +392,8 @@ class GenerationHandler:
                                 result[coll_id] = {}
                             if hasattr(collection, 'search_terms'):
                                 result[coll_id]['search_terms'] = str(collection.search_terms.text)
+                            if hasattr(collection, 'filters'):
+                                result[coll_id]['filters'] = self.parse_filters(collection.filters.text)
                             if hasattr(collection, 'graph_database_query'):
                                 result[coll_id]['graph_database_query'] = str(collection.graph_database_query.text)
                             if hasattr(collection, 'reasoning'):
@@ -222,59 +402,77 @@ class GenerationHandler:
                     elif  child.tag == 'tools_selected':
                         for tool in child.getchildren():
                             tool_name = str(tool.id.text)
-                            print(f"Tool inputs are type: {type(str(tool.tool_inputs.text))},dir: {dir(tool.tool_inputs)}, value: {str(tool.tool_inputs.text)}")
                             inputs = json.loads(str(tool.tool_inputs.text))
                             inputs["tool_name"] = tool_name
                             inputs['user_id'] = handler_evt.user_id
-                            print(f"final inputs for tool: {inputs}")
+                            print(f"final inputs for tool {tool_name}: {sorted(inputs.keys())}")
                             result[tool_name] = {
                                 'tool_name': tool_name,
                                 'tool_inputs': inputs,
                             }
 
-        print(f"Get_orchestration returning {result}")
+        print(f"Get_orchestration returning {len(result)} recommendations")
         return result
         
-    def get_semantic_search_context(self, queue, search_recommendations):
-        context = "<semantic_search_context>\n"
+    # the search filters the orchestration model chose for a collection, or
+    # None if it didn't choose any or they aren't a JSON object.
+    @staticmethod
+    def parse_filters(text):
+        if not text or str(text).strip() in ['', 'None', 'NONE', '{}']:
+            return None
         try:
-            if len(search_recommendations) > 0:
-                response = self.utils.search_vector_docs(search_recommendations, self.top_k, self.my_origin)
-                print(f"Got rag_results {response}")
-                rag_results = json.loads(response['body'])
-                for doc in rag_results:
-                    context += doc['content']
-        except Exception as e:
-            print(f"ERROR: Failed to fetch semantic search context.")
-            context += 'Error: failed to fetch semantic search context.'
-        context += "</semantic_search_context>\n\n"
-        print(f"queuing semantic search context result {context}")
-        queue.put(context)
-        return
-
-    def get_tool_context(self, queue, tool_recommendations):
-        context = "<tool_context>\n"
+            filters = json.loads(str(text))
+        except json.JSONDecodeError:
+            print(f"Ignoring search filters that aren't JSON: {text}")
+            return None
+        return filters if isinstance(filters, dict) and filters else None
+
+    def get_prompt_template_text(self, msg_obj):
+        print(f"Getting prompt template {msg_obj['prompt_template']}")
+        template_response = self.utils.get_prompt_template(msg_obj['prompt_template'], msg_obj['user_id'], self.my_origin)
+        print(f"Got prompt template response: {template_response}")
+        body = json.loads(template_response['body'])
+        return body[msg_obj['prompt_template']]['template_text']
+
+    # the scope the response to this request is cached in, or None if
+    # responses aren't being cached or the collections' versions can't be
+    # checked.
+    def get_response_cache_scope(self, handler_evt, doc_collections, template_text):
+        if not self.response_cache or not getattr(handler_evt, 'user_id', None):
+            return None
+        msg_obj = handler_evt.message_obj
         try:
-            print(f"Tool recommendations? {tool_recommendations}")
-            for recommendation in tool_recommendations:
-                print(f"Got recommendation {recommendation}")
-                tool_name = recommendation['tool_name']
-                context += f"\t<{tool_name}_context>\n"
-                if tool_name == 'file_storage_tool' and \
-                'user_id' not in recommendation['tool_inputs']: 
-                    recommendation['tool_inputs']['user_id'] = handler_evt.user_id
-                print(f"Invoking tool {tool_name} with inputs {recommendation['tool_inputs']}")
-                response = self.invoke_tool(tool_name, recommendation['tool_inputs'])  
-                print(f"{recommendation['tool_name']} response {response}")   
-                context += f"\n{json.dumps(response, indent=2)}\n"
-                context += f"\t</{tool_name}_context>\n"
+            versions = self.utils.get_collection_versions(
+                [collection['collection_id'] for collection in doc_collections.values()],
+                self.my_origin
+            )
         except Exception as e:
-            print(f"ERROR: Failed to fetch tool context.")
-            context = 'Error: failed to fetch tool context.'
-        context += "</tool_context>\n\n"
-        print(f"queuing tool context result {context}")
-        queue.put(context)
-        return
+            print(f"Not caching the response: {e}")
+            return None
+        # the collection record's updated_date covers changes to its
+        # description and graph schema, which the orchestration prompt uses.
+        collection_versions = {
+            collection['collection_id']: [collection.get('updated_date'), versions.get(collection['collection_id'], 0)]
+            for collection in doc_collections.values()
+        }
+        (hist, _) = self.get_conversation(msg_obj)
+        return response_cache_scope(
+            handler_evt.user_id,
+            collection_versions,
+            msg_obj['prompt_template'],
+            template_text,
+            msg_obj['model']['model_id'],
+            msg_obj['model']['model_args'],
+            hist
+        )
+
+    # over-fetches from the vector store and reranks the candidates down
+    # to top_k that fit the context's token budget, in model_id's tokens.
+    def get_semantic_search_results(self, recommendations, model_id=None):
+        response = self.utils.search_vector_docs(recommendations, self.reranker.fetch_k(self.top_k), self.my_origin)
+        rag_results = json.loads(response['body'])
+        print(f"Got {len(rag_results)} rag_results for {len(recommendations)} collections")
+        return self.reranker.rerank(rerank_query(recommendations), rag_results, self.top_k, model_id)
 
     def get_tool_list(self):
         response = self.utils.invoke_lambda(
@@ -290,9 +488,8 @@ class GenerationHandler:
         return body
 
     def handler(self, event, context):
-        print(f"Got event {event}")
         handler_evt = GenerationHandlerEvent().from_lambda_event(event)
-        print(f"Got generationHandlerEvent {handler_evt.__dict__()}, type {type(handler_evt)}")
+        print(f"Got generationHandlerEvent {handler_evt.method} {handler_evt.path}")
         method = handler_evt.method
         path = handler_evt.path
 
@@ -310,7 +507,6 @@ class GenerationHandler:
             )
             print(f"Got user_id {user_id}")
             handler_evt.user_id = user_id
-        print(f"Event is now {handler_evt.__dict__()}")
 
         if handler_evt.method == 'GET': 
             pass
@@ -331,84 +527,13 @@ class GenerationHandler:
 
         elif handler_evt.method == 'POST':
             msg_obj = handler_evt.message_obj
-            context = ''
-            # if 'document_collections' in msg_obj:
-            # first assemble the chat history and find a sensible set of
-            # search terms given the most recent question
             msg_obj['user_id'] = user_id
-            recommendations = self.get_orchestration(handler_evt)   
-            print(f"Got recommendations: {recommendations}, type {type(recommendations)}")
-            vector_search_recommendations = []
-            graph_search_recommendations = []
-            tool_recommendations = []
-            result = ''
-
-            if 'final_answer' in recommendations.keys() and \
-                recommendations['final_answer']:
-                result = markdown.markdown(recommendations['final_answer'])
-            else:
-                for item_id in list(recommendations.keys()):
-                    if 'tool_inputs' in recommendations[item_id].keys():
-                        print(f"Found tool recommendation {recommendations[item_id]}")
-                        tool_recommendations.append(recommendations[item_id])
-                    else:
-                        recommendation = recommendations[item_id]
-                        if "search_terms" in recommendation and \
-                            recommendation['search_terms'] not in ['',None,'None']:
-                            vector_search_recommendations.append({
-                                "id": item_id,
-                                "search_terms": recommendation['search_terms']
-                            })
-                            
-                        if "graph_database_query" in recommendation and\
-                        recommendation['graph_database_query'] not in ['',None,'None']:
-                            graph_search_recommendations.append({
-                                "id": item_id,
-                                "graph_database_query": recommendation['graph_database_query']
-                            })
-
-                context += self.get_context(
-                    graph_search_recommendations,
-                    vector_search_recommendations,
-                    tool_recommendations
-                )
-
-                (hist, curr_prompt) = self.get_conversation(msg_obj)
-                print(f'msg_obj before get_prompt_template {msg_obj}')
-                # TODO replace with call to utils.invoke_service
-                template_response = self.utils.get_prompt_template(msg_obj['prompt_template'], user_id, self.my_origin)
-                # template = self.prompt_template_handler.get_prompt_template(user_id, msg_obj['prompt_template'])
-                # template = get_prompt_template(template_id, user_id, self.my_origin)
-                print(f"Got prompt template response: {template_response}")
-                body = json.loads(template_response['body'])
-                template = body[msg_obj['prompt_template']]
-                prompt = template['template_text'].replace('{context}', context).replace('{user_prompt}', curr_prompt).replace('{conversation_history}', hist)
-                model_args = msg_obj['model']['model_args']
-                print(f"sending model_args {model_args}")
-                print(f"sending populated prompt {prompt}")
-                # TODO replace with call to utils.invoke_service
-                print()
-                result = self.utils.invoke_bedrock(
-                    'invoke_model', 
-                    {
-                        "model_id": msg_obj['model']['model_id'], 
-                        "messages": [{
-                            "role": "user",
-                            "content": [{
-                                "text": prompt
-                            }]
-                        }], 
-                        "inference_config": model_args
-                    },
-                    self.my_origin
-                )
-                print(f"Got result from bedrock: {result}")
-                if result["statusCode"] != 200:
-                    raise Exception(f"Failed to invoke bedrock {result}")
-                else:
-                    result = markdown.markdown(result['response'])
+            stream = msg_obj.get('stream', default_stream)
+            # the http api buffers the response, so join the fragments here.
+            # websocket_handler pushes them as they're generated instead.
+            result = ''.join(self.generate(handler_evt, stream=stream))
         response = self.utils.format_response(status, result, handler_evt.origin)
-        print(f"generation_handler returning response {response}")
+        print(f"generation_handler returning status {response['statusCode']}")
         return response
 
     def invoke_tool(self, tool_name, inputs):
@@ -425,9 +550,53 @@ class GenerationHandler:
         print(f"Got invoke_tool response {response}")
         return json.loads(response['body'])
 
+    # yields rendered html fragments as the model's deltas arrive.
+    def stream_model(self, bedrock_args):
+        start = monotonic()
+        first_fragment_at = None
+        renderer = IncrementalMarkdownRenderer()
+        for delta in self.utils.invoke_bedrock_stream('invoke_model_stream', bedrock_args, self.my_origin):
+            fragment = renderer.feed(delta)
+            if fragment != '':
+                if first_fragment_at is None:
+                    first_fragment_at = monotonic()
+                    print(f"First rendered fragment after {round(first_fragment_at - start, 3)}s")
+                yield fragment
+        fragment = renderer.close()
+        if fragment != '':
+            yield fragment
+        print(f"Streamed {len(renderer.text)} characters in {round(monotonic() - start, 3)}s")
+
 
 def handler(event, context):
     global generation_handler
     if not generation_handler:
         generation_handler = GenerationHandler()
     return generation_handler.handler(event, context)
+
+
+# entry point for the websocket api. The generate route pushes html
+# fragments to the connection as they're rendered, so the first one
+# reaches the browser long before the completion finishes.
+def websocket_handler(event, context):
+    global generation_handler
+    route_key = event['requestContext']['routeKey']
+    if route_key in ['$connect', '$disconnect']:
+        return {"statusCode": 200}
+    if not generation_handler:
+        generation_handler = GenerationHandler()
+    endpoint = connection_endpoint(event)
+    if endpoint not in websocket_clients:
+        websocket_clients[endpoint] = boto3.client('apigatewaymanagementapi', endpoint_url=endpoint)
+    handler_evt = GenerationHandlerEvent().from_websocket_event(event)
+    pusher = FragmentPusher(websocket_clients[endpoint], handler_evt.connection_id)
+    handler_evt.user_id = generation_handler.utils.get_userid_from_token(
+        handler_evt.auth_token,
+        generation_handler.my_origin
+    )
+    if not handler_evt.user_id:
+        pusher.send({"type": "error", "message": "forbidden"})
+        return {"statusCode": 403}
+    handler_evt.message_obj['user_id'] = handler_evt.user_id
+    pusher.push(generation_handler.generate(handler_evt, stream=True))
+    return {"statusCode": 200}
@@ -18,7 +18,22 @@ class GenerationHandlerEvent:
                 self.origin = event['headers']['origin']
         if 'body' in event:
             self.message_obj = json.loads(event['body'])['messageObj']
-        print(f"GenerationHandlerEvent returning evt {self.__dict__()}")
+        print(f"GenerationHandlerEvent returning {self.method} {self.path} evt")
+        return self
+
+    # a message sent to the websocket api's generate route. Browsers can't
+    # set headers on websockets, so the auth token is in the message body:
+    # {"action": "generate", "auth_token": ..., "messageObj": ...}
+    def from_websocket_event(self, event):
+        self.account_id = event['requestContext'].get('accountId')
+        self.method = 'POST'
+        self.path = '/generation'
+        self.connection_id = event['requestContext']['connectionId']
+        body = json.loads(event['body'])
+        self.auth_token = body.get('auth_token')
+        # user_id will be inserted later
+        self.user_id = None
+        self.message_obj = body['messageObj']
         return self
 
     def __dict__(self):
@@ -0,0 +1,97 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import markdown
+import re
+
+list_item_re = re.compile(r'^\s*([-*+]|\d+[.)])\s')
+# the start of a line that could still turn out to be a list item.
+list_item_prefix_re = re.compile(r'^([-*+]|\d+[.)]?)$')
+
+
+# Renders markdown incrementally as text deltas arrive. Text is buffered
+# until a block is complete (a blank line outside of a code fence, not
+# followed by an indented line or another list item), then that block is
+# rendered and returned. Blocks are joined the same way markdown.markdown
+# joins them, so concatenating every fragment from feed and close gives
+# the same HTML as rendering the whole text at once for ordinary
+# responses.
+class IncrementalMarkdownRenderer:
+    def __init__(self, render=markdown.markdown):
+        self.render = render
+        self.buffer = ''
+        self.blocks_rendered = 0
+        self.text = ''
+
+    def close(self):
+        fragment = self.render_block(self.buffer)
+        self.buffer = ''
+        return fragment
+
+    def feed(self, delta: str) -> str:
+        self.buffer += delta
+        self.text += delta
+        fragments = []
+        while True:
+            boundary = self.find_block_boundary()
+            if boundary is None:
+                break
+            (end, next_start) = boundary
+            fragments.append(self.render_block(self.buffer[:end]))
+            self.buffer = self.buffer[next_start:]
+        return ''.join(fragments)
+
+    def find_block_boundary(self):
+        search_from = 0
+        while True:
+            end = self.buffer.find('\n\n', search_from)
+            if end == -1:
+                return None
+            next_start = end
+            while next_start < len(self.buffer) and self.buffer[next_start] == '\n':
+                next_start += 1
+            if next_start == len(self.buffer):
+                # wait to see how the next block starts.
+                return None
+            block = self.buffer[:end]
+            next_line = self.buffer[next_start:].split('\n', 1)[0]
+            if list_item_prefix_re.match(next_line) and \
+                '\n' not in self.buffer[next_start:]:
+                return None
+            if self.in_code_fence(block) or \
+                self.continues_block(block, next_line):
+                search_from = next_start
+                continue
+            return (end, next_start)
+
+    def render_block(self, block):
+        if block.strip() == '':
+            return ''
+        html = self.render(block)
+        if html == '':
+            return ''
+        if self.blocks_rendered > 0:
+            html = '\n' + html
+        self.blocks_rendered += 1
+        return html
+
+    @staticmethod
+    def continues_block(block, next_line):
+        if next_line[:1] in [' ', '\t']:
+            # indented continuation or indented code.
+            return True
+        last_line = block.rsplit('\n', 1)[-1]
+        if list_item_re.match(next_line) and \
+            (list_item_re.match(last_line) or last_line[:1] in [' ', '\t']):
+            # blank lines between list items make a loose list, not two lists.
+            return True
+        return False
+
+    @staticmethod
+    def in_code_fence(block):
+        fences = 0
+        for line in block.split('\n'):
+            stripped = line.lstrip()
+            if stripped.startswith('```') or stripped.startswith('~~~'):
+                fences += 1
+        return fences % 2 == 1
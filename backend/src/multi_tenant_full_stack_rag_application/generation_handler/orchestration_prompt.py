@@ -0,0 +1,95 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from .context_assembler import PromptTemplate
+
+
+default_orchestration_prompt_cache_size = int(os.getenv('ORCHESTRATION_PROMPT_CACHE_SIZE', 256))
+# placeholders that change with every turn. Everything in the template
+# before the first of them is the same for every turn until the user's
+# collections or the tools change, so it's rendered once and sent first,
+# where Bedrock can cache it as a prompt prefix.
+dynamic_placeholders = ('conversation_history', 'current_date', 'current_user_prompt')
+static_placeholders = ('available_document_collections', 'available_tools')
+
+
+def fingerprint(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+# changes whenever a collection is added, removed or upserted, since
+# upserts set updated_date, or its graph schema changes.
+def collections_version(doc_collections):
+    return fingerprint(json.dumps([
+        [
+            collection['collection_id'],
+            collection.get('collection_name'),
+            collection.get('description'),
+            collection.get('updated_date'),
+            collection.get('graph_schema') if isinstance(collection.get('graph_schema'), str) else
+                json.dumps(collection.get('graph_schema'), sort_keys=True)
+        ]
+        for collection in sorted(doc_collections.values(), key=lambda c: c['collection_id'])
+    ], default=str))
+
+
+# the collections as the orchestration model sees them.
+def collection_summaries(doc_collections):
+    return [{
+        'id': collection['collection_id'],
+        'name': collection['collection_name'],
+        'description': collection['description'],
+        'graph_schema': json.loads(collection['graph_schema']) if isinstance(collection['graph_schema'], str) else collection['graph_schema'],
+    } for collection in doc_collections.values()]
+
+
+# The orchestration prompt, split into a static prefix, rendered once per
+# (user, collections version, tools version) and kept in an LRU, and a
+# dynamic suffix with the turn's prompt and date.
+class OrchestrationPrompt:
+    def __init__(self, template_text, tool_list, *,
+        max_entries: int=default_orchestration_prompt_cache_size
+    ):
+        positions = [template_text.find('{' + name + '}') for name in dynamic_placeholders]
+        positions = [position for position in positions if position >= 0]
+        # split at the start of the line with the first dynamic placeholder,
+        # so its tags stay with it.
+        split_at = template_text.rfind('\n', 0, min(positions)) + 1 if positions else len(template_text)
+        self.static_template = PromptTemplate(template_text[:split_at], static_placeholders)
+        self.dynamic_template = PromptTemplate(template_text[split_at:], dynamic_placeholders)
+        # the tool list is fetched once per container, so it's only
+        # serialized once.
+        self.tools_json = json.dumps(tool_list, indent=2)
+        self.tools_version = fingerprint(self.tools_json)
+        self.max_entries = max_entries
+        self.static_prefixes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def dynamic_suffix(self, **values):
+        return self.dynamic_template.format(**values)
+
+    def static_prefix(self, user_id, doc_collections):
+        key = (user_id, collections_version(doc_collections), self.tools_version)
+        with self.lock:
+            if key in self.static_prefixes:
+                self.hits += 1
+                self.static_prefixes.move_to_end(key)
+                return self.static_prefixes[key]
+            self.misses += 1
+        prefix = self.static_template.format(
+            available_document_collections=json.dumps(collection_summaries(doc_collections), indent=2),
+            available_tools=self.tools_json
+        )
+        with self.lock:
+            self.static_prefixes[key] = prefix
+            while len(self.static_prefixes) > self.max_entries:
+                self.static_prefixes.popitem(last=False)
+        return prefix
@@ -0,0 +1,160 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from .response_cache import cosine_similarity
+
+
+default_query_router_enabled = os.getenv('QUERY_ROUTER_ENABLED', 'false').lower() == 'true'
+# if it's set, collections whose descriptions are at least this similar
+# to the prompt are searched without asking the orchestration model.
+# Similarities depend on the embedding model, so it has to be tuned for
+# it. Unset, only prompts that need nothing retrieved are routed.
+default_router_match_threshold = float(os.getenv('QUERY_ROUTER_MATCH_THRESHOLD')) \
+    if os.getenv('QUERY_ROUTER_MATCH_THRESHOLD') else None
+# other collections within this much of the best match are searched too.
+default_router_match_margin = float(os.getenv('QUERY_ROUTER_MATCH_MARGIN', 0.05))
+default_router_max_descriptions = int(os.getenv('QUERY_ROUTER_MAX_DESCRIPTIONS', 1000))
+# until the orchestration model has been timed, savings are logged
+# against this many seconds per call.
+default_orchestration_seconds = float(os.getenv('QUERY_ROUTER_ORCHESTRATION_SECONDS', 3))
+
+# greetings and thanks don't need anything retrieved.
+small_talk_pattern = re.compile(
+    r'^\s*((hi|hello|hey)( there)?|thanks?( you)?( very much| so much)?|thank you|good (morning|afternoon|evening)|'
+    r'(good)?bye|ok(ay)?|cool|great|got it)[\s!.,]*$',
+    re.IGNORECASE
+)
+# prompts that may need a tool, like file_storage_tool or web search,
+# rather than a collection search. The orchestration model picks one.
+tool_intent_pattern = re.compile(
+    r'\b(web|internet|online|google|website|url|https?|latest|news|today|current|'
+    r'files?|upload(ed|s)?|attach(ed|ment|ments)?|download(ed)?)\b',
+    re.IGNORECASE
+)
+
+routes = ['no_retrieval', 'orchestrate', 'search']
+
+
+def has_graph_schema(collection):
+    schema = collection.get('graph_schema')
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except json.JSONDecodeError:
+            return bool(schema.strip())
+    return bool(schema)
+
+
+# Decides, without a model call, whether a prompt needs anything retrieved
+# and from which collections, by comparing its embedding to embeddings of
+# the collections' descriptions. Only clear cases are routed here. Any
+# prompt with history (the model writes search terms with it), prompts
+# that may need a tool, prompts no collection clearly matches and matches
+# with graph schemas (the model writes graph queries) go to the
+# orchestration model. Without a match_threshold, only small talk is
+# routed here.
+#
+# route() returns the recommendations get_orchestration would, or None
+# if the orchestration model should decide.
+class QueryRouter:
+    def __init__(self, embed_query, embed_documents, *,
+        match_margin: float=default_router_match_margin,
+        match_threshold: float=default_router_match_threshold,
+        max_descriptions: int=default_router_max_descriptions
+    ):
+        # takes a prompt and returns its embedding.
+        self.embed_query = embed_query
+        # takes a list of texts and returns their embeddings.
+        self.embed_documents = embed_documents
+        self.match_margin = match_margin
+        self.match_threshold = match_threshold
+        self.max_descriptions = max_descriptions
+        # (collection_id, updated_date, description) -> embedding. A
+        # collection's record changes whenever its description does, so
+        # each description is embedded once per version.
+        self.description_vectors = OrderedDict()
+        self.orchestration_seconds = default_orchestration_seconds
+        self.decisions = {route: 0 for route in routes}
+        self.lock = Lock()
+
+    def classify(self, prompt, history, collections):
+        if history:
+            return ('orchestrate', 'has conversation history', {})
+        if small_talk_pattern.match(prompt):
+            return ('no_retrieval', 'small talk', {})
+        if self.match_threshold is None:
+            return ('orchestrate', 'collection matching is off', {})
+        if tool_intent_pattern.search(prompt):
+            return ('orchestrate', 'may need a tool', {})
+        if len(collections) == 0:
+            return ('orchestrate', 'no collections to match', {})
+
+        vectors = self.get_description_vectors(collections)
+        prompt_vector = self.embed_query(prompt)
+        scores = {
+            collection['collection_id']: cosine_similarity(prompt_vector, vector)
+            for (collection, vector) in zip(collections, vectors)
+        }
+        best = max(scores.values())
+        if best < self.match_threshold:
+            return ('orchestrate', 'no clear collection match', scores)
+        matches = [
+            collection for collection in collections
+            if scores[collection['collection_id']] >= max(self.match_threshold, best - self.match_margin)
+        ]
+        if any(has_graph_schema(collection) for collection in matches):
+            return ('orchestrate', 'graph collection matched', scores)
+        return ('search', f"matched {len(matches)} collections", {
+            collection['collection_id']: scores[collection['collection_id']] for collection in matches
+        })
+
+    def get_description_vectors(self, collections):
+        keys = [
+            (collection['collection_id'], collection.get('updated_date'), collection.get('description') or collection.get('collection_name', ''))
+            for collection in collections
+        ]
+        with self.lock:
+            missing = [key for key in dict.fromkeys(keys) if key not in self.description_vectors]
+        if len(missing) > 0:
+            vectors = self.embed_documents([key[2] for key in missing])
+            with self.lock:
+                for (key, vector) in zip(missing, vectors):
+                    self.description_vectors[key] = vector
+        with self.lock:
+            for key in keys:
+                self.description_vectors.move_to_end(key)
+            result = [self.description_vectors[key] for key in keys]
+            while len(self.description_vectors) > self.max_descriptions:
+                self.description_vectors.popitem(last=False)
+        return result
+
+    # the orchestration model's latency, as a moving average, for
+    # estimating what skipping it saves.
+    def record_orchestration(self, seconds):
+        self.orchestration_seconds = 0.8 * self.orchestration_seconds + 0.2 * seconds
+
+    # doc_collections are the user's collections, as get_document_collections
+    # returns them.
+    def route(self, prompt, history, doc_collections):
+        start = monotonic()
+        try:
+            (route, reason, scores) = self.classify(prompt, history, list(doc_collections.values()))
+        except Exception as e:
+            (route, reason, scores) = ('orchestrate', f"routing failed: {e}", {})
+        elapsed = monotonic() - start
+        self.decisions[route] += 1
+        saved = round(self.orchestration_seconds - elapsed, 3) if route != 'orchestrate' else 0
+        print(f"Query router chose {route} ({reason}) in {round(elapsed, 3)}s, saving ~{saved}s. " +
+            f"Scores {scores}, decisions so far {self.decisions}")
+        if route == 'no_retrieval':
+            return {}
+        if route == 'search':
+            return {collection_id: {"search_terms": prompt} for collection_id in scores}
+        return None
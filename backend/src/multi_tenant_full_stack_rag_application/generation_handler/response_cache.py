@@ -0,0 +1,165 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from math import sqrt
+from threading import Lock
+from time import monotonic
+
+
+default_response_cache_enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+default_response_cache_max_entries = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 500))
+# bounds how stale an answer can get from changes that don't bump a
+# collection version or the scope, like a changed model alias.
+default_response_cache_ttl = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 3600))
+# if it's set, prompts whose embeddings are at least this similar share
+# an answer. It's unset by default, leaving exact matches of the
+# normalized prompt: prompts that differ only in a number or a "not"
+# embed almost identically but have different answers.
+default_response_cache_similarity = float(os.getenv('RESPONSE_CACHE_SIMILARITY_THRESHOLD')) \
+    if os.getenv('RESPONSE_CACHE_SIMILARITY_THRESHOLD') else None
+
+
+# case, whitespace and trailing punctuation don't change the answer.
+def normalize_prompt(text):
+    return ' '.join(text.lower().split()).rstrip(' ?!.')
+
+
+# Everything besides the prompt that decides a response. Only prompts in
+# the same scope are compared, and it starts with the user ID, so a
+# response is only ever served to the user it was generated for.
+# collection_versions is {collection_id: version}, so new ingestion into
+# any of the collections starts a new scope, and editing the template's
+# text does too.
+def response_cache_scope(user_id, collection_versions, template_id, template_text, model_id, model_args, history=''):
+    if not user_id:
+        raise ValueError("Responses can only be cached per user.")
+    key = json.dumps({
+        "collections": collection_versions,
+        "history": normalize_prompt(history),
+        "model_args": model_args,
+        "model_id": model_id,
+        "template_id": template_id,
+        "template_text": hashlib.sha256(template_text.encode('utf-8')).hexdigest(),
+    }, sort_keys=True, default=str)
+    return f"{user_id}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for (x, y) in zip(a, b))
+    norms = sqrt(sum(x * x for x in a)) * sqrt(sum(y * y for y in b))
+    return dot / norms if norms else 0.0
+
+
+# In-process cache of generated responses, by scope and prompt. A lookup
+# tries the exact normalized prompt first, then, if there's an embed
+# function and a similarity_threshold, the most similar prompt in the
+# scope. Entries expire after
+# ttl seconds and the least recently used are evicted past max_entries.
+class ResponseCache:
+    def __init__(self, embed=None, *,
+        max_entries: int=default_response_cache_max_entries,
+        similarity_threshold: float=default_response_cache_similarity,
+        ttl: int=default_response_cache_ttl,
+        clock=monotonic
+    ):
+        # takes a prompt and returns its embedding.
+        self.embed = embed
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.clock = clock
+        # (scope, normalized prompt) -> (expires at, embedding, response)
+        self.entries = OrderedDict()
+        # scope -> {normalized prompt: True}, for similarity lookups.
+        self.scopes = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, scope, prompt):
+        key = (scope, normalize_prompt(prompt))
+        with self.lock:
+            entry = self.live_entry(key)
+            if entry:
+                self.exact_hits += 1
+                return entry[2]
+            if not self.similar_lookups() or not self.scopes.get(scope):
+                self.misses += 1
+                return None
+        vector = self.embed_prompt(key[1])
+        if vector is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            best = (self.similarity_threshold, None)
+            for other in list(self.scopes.get(scope, {})):
+                entry = self.live_entry((scope, other))
+                if entry and entry[1] is not None:
+                    similarity = cosine_similarity(vector, entry[1])
+                    if similarity >= best[0]:
+                        best = (similarity, (scope, other))
+            if best[1] is None:
+                self.misses += 1
+                return None
+            self.similar_hits += 1
+            self.entries.move_to_end(best[1])
+            print(f"Response cache matched a prompt with similarity {round(best[0], 4)}")
+            return self.entries[best[1]][2]
+
+    def embed_prompt(self, prompt):
+        try:
+            return self.embed(prompt)
+        except Exception as e:
+            print(f"Response cache couldn't embed the prompt: {e}")
+            return None
+
+    # the entry for key if it hasn't expired. Expired entries are removed.
+    def live_entry(self, key):
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if entry[0] < self.clock():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def metrics(self):
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 3) if lookups else 0,
+            "entries": len(self.entries),
+        }
+
+    def put(self, scope, prompt, response):
+        key = (scope, normalize_prompt(prompt))
+        vector = self.embed_prompt(key[1]) if self.similar_lookups() else None
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, vector, response)
+            self.entries.move_to_end(key)
+            self.scopes.setdefault(scope, {})[key[1]] = True
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        del self.entries[key]
+        prompts = self.scopes.get(key[0], {})
+        prompts.pop(key[1], None)
+        if not prompts:
+            self.scopes.pop(key[0], None)
+
+    def similar_lookups(self):
+        return self.embed is not None and self.similarity_threshold is not None and \
+            self.similarity_threshold <= 1
+
+    def __len__(self):
+        return len(self.entries)
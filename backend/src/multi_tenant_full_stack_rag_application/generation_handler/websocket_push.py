@@ -0,0 +1,58 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+
+
+# the management api endpoint fragments are posted back through, from a
+# websocket api event's request context.
+def connection_endpoint(event):
+    request_context = event['requestContext']
+    return f"https://{request_context['domainName']}/{request_context['stage']}"
+
+
+# Pushes generation output to a websocket api connection as it's
+# rendered, so the browser shows the first fragment without waiting for
+# the whole completion. Each message is a json object:
+# {"type": "fragment", "html": ...} for each fragment, then
+# {"type": "done"}, or {"type": "error", "message": ...} if generation
+# failed part way.
+class FragmentPusher:
+    def __init__(self, client, connection_id):
+        self.client = client
+        self.connection_id = connection_id
+        self.gone = False
+        self.sent = 0
+
+    # returns False once the browser has disconnected.
+    def send(self, message):
+        if self.gone:
+            return False
+        try:
+            self.client.post_to_connection(
+                ConnectionId=self.connection_id,
+                Data=json.dumps(message).encode('utf-8')
+            )
+        except Exception as e:
+            if type(e).__name__ != 'GoneException' and 'GoneException' not in str(e):
+                raise
+            print(f"Connection {self.connection_id} closed after {self.sent} messages")
+            self.gone = True
+            return False
+        self.sent += 1
+        return True
+
+    # sends fragments as they're yielded. Stops generating if the browser
+    # disconnects, so the rest of the completion isn't paid for.
+    def push(self, fragments):
+        try:
+            for fragment in fragments:
+                if not self.send({"type": "fragment", "html": fragment}):
+                    if hasattr(fragments, 'close'):
+                        fragments.close()
+                    return False
+        except Exception as e:
+            print(f"Generation failed while streaming to {self.connection_id}: {e}")
+            self.send({"type": "error", "message": str(e)})
+            return False
+        return self.send({"type": "done"})
@@ -0,0 +1,80 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+from time import monotonic
+
+from multi_tenant_full_stack_rag_application import utils
+
+
+default_checkpoint_interval = float(os.getenv('INGESTION_CHECKPOINT_SECONDS', 30))
+# how long before the function times out to stop, checkpoint and hand
+# the rest of the file off to a continuation message.
+default_continuation_margin = float(os.getenv('INGESTION_CONTINUATION_MARGIN_SECONDS', 90))
+
+
+# Raised by IngestionCheckpoint.advance once the deadline is near, after
+# the checkpoint has been saved. The caller should re-enqueue the file so
+# another invocation resumes it.
+class IngestionContinuationNeeded(Exception):
+    def __init__(self, checkpoint):
+        super().__init__(f"Stopped at {checkpoint.lines_processed} for a continuation")
+        self.checkpoint = checkpoint
+
+
+# Tracks how far a loader has got through a file and persists it as the
+# document's ingestion status every interval seconds. lines_processed
+# counts the loader's unit of progress (json lines, pdf pages or text
+# chunks) and chunks_processed how many chunk ids it has used so far,
+# so numbering can carry on when it resumes. Loaders should only advance
+# past work that's been saved to the vector store.
+class IngestionCheckpoint:
+    def __init__(self, user_id, doc_id, etag, origin, *,
+        chunks_processed: int=0,
+        clock=monotonic,
+        deadline: float=None,
+        interval: float=default_checkpoint_interval,
+        lines_processed: int=0
+    ):
+        self.user_id = user_id
+        self.doc_id = doc_id
+        self.etag = etag
+        self.origin = origin
+        self.chunks_processed = chunks_processed
+        self.clock = clock
+        self.deadline = deadline
+        self.interval = interval
+        self.lines_processed = lines_processed
+        self.resumed_from = lines_processed
+        self.last_saved = clock()
+        self.saves = 0
+
+    @staticmethod
+    def deadline_from_context(context, *, margin: float=default_continuation_margin, clock=monotonic):
+        if not context or not hasattr(context, 'get_remaining_time_in_millis'):
+            return None
+        return clock() + context.get_remaining_time_in_millis() / 1000 - margin
+
+    def advance(self, lines_processed, chunks_processed=None):
+        self.lines_processed = lines_processed
+        if chunks_processed is not None:
+            self.chunks_processed = chunks_processed
+        if self.deadline is not None and self.clock() >= self.deadline:
+            self.save()
+            raise IngestionContinuationNeeded(self)
+        if self.clock() - self.last_saved >= self.interval:
+            self.save()
+
+    def save(self):
+        print(f"Checkpointing {self.doc_id} at {self.lines_processed} ({self.chunks_processed} chunks)")
+        utils.set_ingestion_status(
+            self.user_id,
+            self.doc_id,
+            self.etag,
+            self.lines_processed,
+            'IN_PROGRESS',
+            self.origin,
+            chunks_processed=self.chunks_processed
+        )
+        self.last_saved = self.clock()
+        self.saves += 1
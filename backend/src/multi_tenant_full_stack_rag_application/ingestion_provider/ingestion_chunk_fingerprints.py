@@ -0,0 +1,161 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import zlib
+from hashlib import md5
+
+from multi_tenant_full_stack_rag_application import utils
+
+
+# chunk_id: fingerprint pairs per item, which keeps compressed items
+# well under dynamodb's 400KB item limit.
+default_fingerprints_per_item = int(os.getenv('CHUNK_FINGERPRINTS_PER_ITEM', 2000))
+
+
+# Fingerprints of the chunks a document produced the last time it was
+# ingested, and the ones saved so far in this run. Chunks whose
+# fingerprint hasn't changed don't need to be embedded or written again,
+# and chunk ids from the last run that aren't seen again are stale.
+class ChunkFingerprintIndex:
+    def __init__(self, previous: dict={}):
+        self.previous = previous
+        self.current = {}
+        self.seen = set()
+        self.unchanged_count = 0
+
+    # the embedding type is part of the fingerprint, so chunks that were
+    # embedded as another type are embedded again rather than mixing two
+    # embedding spaces in one index. Text chunks were embedded as
+    # search_query before they were batched through embed_texts.
+    @staticmethod
+    def fingerprint(text, embedding_type='search_document'):
+        return md5(f"{embedding_type}\n{text}".encode('utf-8')).hexdigest()
+
+    # records the chunk as current if it's unchanged. Changed chunks
+    # should be recorded once they've been saved.
+    def is_unchanged(self, chunk_id, fingerprint):
+        self.seen.add(chunk_id)
+        if self.previous.get(chunk_id) == fingerprint:
+            self.current[chunk_id] = fingerprint
+            self.unchanged_count += 1
+            return True
+        return False
+
+    # for chunks a resumed ingestion already saved before it stopped.
+    def keep(self, chunk_id):
+        self.seen.add(chunk_id)
+        if chunk_id in self.previous:
+            self.current[chunk_id] = self.previous[chunk_id]
+
+    # what to save when ingestion stops partway through: the chunks saved
+    # so far, plus the ones not reached yet, so the run that resumes it
+    # can still skip the unchanged ones and delete the stale ones.
+    def partial(self):
+        fingerprints = {
+            chunk_id: fingerprint for chunk_id, fingerprint in self.previous.items()
+            if chunk_id not in self.seen
+        }
+        fingerprints.update(self.current)
+        return fingerprints
+
+    def record(self, chunk_id, fingerprint):
+        self.current[chunk_id] = fingerprint
+
+    def stale_ids(self):
+        return [chunk_id for chunk_id in self.previous if chunk_id not in self.seen]
+
+
+# Persists fingerprint indexes in the ingestion status table, next to the
+# document's ingestion status. They're stored under a separate partition
+# key ({user_id}#chunk_fingerprints) so ingestion status queries for the
+# user never return them, sharded across items {doc_id}#00000, #00001...
+class ChunkFingerprintStore:
+    def __init__(self, *,
+        ddb_client=None,
+        fingerprints_per_item: int=default_fingerprints_per_item,
+        table_name: str=None
+    ):
+        if not ddb_client:
+            ddb_client = utils.BotoClientProvider.get_client('dynamodb')
+        self.ddb = ddb_client
+        self.fingerprints_per_item = fingerprints_per_item
+        self.table = table_name if table_name else os.getenv('INGESTION_STATUS_TABLE')
+
+    @staticmethod
+    def partition_key(user_id):
+        return f"{user_id}#chunk_fingerprints"
+
+    def delete(self, user_id, doc_id):
+        for sort_key in self.get_sort_keys(user_id, doc_id):
+            self.ddb.delete_item(
+                TableName=self.table,
+                Key={
+                    'user_id': {'S': self.partition_key(user_id)},
+                    'doc_id': {'S': sort_key}
+                }
+            )
+
+    def get_items(self, user_id, doc_id, projection=None):
+        kwargs = {
+            'TableName': self.table,
+            'KeyConditionExpression': '#user_id = :user_id AND begins_with(#doc_id, :doc_id)',
+            'ExpressionAttributeNames': {
+                '#user_id': 'user_id',
+                '#doc_id': 'doc_id'
+            },
+            'ExpressionAttributeValues': {
+                ':user_id': {'S': self.partition_key(user_id)},
+                ':doc_id': {'S': f"{doc_id}#"}
+            }
+        }
+        if projection:
+            kwargs['ProjectionExpression'] = projection
+        items = []
+        while True:
+            response = self.ddb.query(**kwargs)
+            items += response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_sort_keys(self, user_id, doc_id):
+        items = self.get_items(user_id, doc_id, '#doc_id')
+        return [item['doc_id']['S'] for item in items]
+
+    def load_index(self, user_id, doc_id) -> ChunkFingerprintIndex:
+        fingerprints = {}
+        for item in self.get_items(user_id, doc_id):
+            fingerprints.update(json.loads(zlib.decompress(item['fingerprints']['B'])))
+        print(f"Loaded {len(fingerprints)} chunk fingerprints for {doc_id}")
+        return ChunkFingerprintIndex(fingerprints)
+
+    def save_index(self, user_id, doc_id, index: ChunkFingerprintIndex, *, partial=False):
+        old_keys = set(self.get_sort_keys(user_id, doc_id))
+        current = index.partial() if partial else index.current
+        chunk_ids = list(current.keys())
+        for shard, i in enumerate(range(0, len(chunk_ids), self.fingerprints_per_item)):
+            sort_key = f"{doc_id}#{shard:05d}"
+            fingerprints = {
+                chunk_id: current[chunk_id]
+                for chunk_id in chunk_ids[i:i + self.fingerprints_per_item]
+            }
+            self.ddb.put_item(
+                TableName=self.table,
+                Item={
+                    'user_id': {'S': self.partition_key(user_id)},
+                    'doc_id': {'S': sort_key},
+                    'fingerprints': {'B': zlib.compress(json.dumps(fingerprints).encode('utf-8'))}
+                }
+            )
+            old_keys.discard(sort_key)
+        for sort_key in old_keys:
+            self.ddb.delete_item(
+                TableName=self.table,
+                Key={
+                    'user_id': {'S': self.partition_key(user_id)},
+                    'doc_id': {'S': sort_key}
+                }
+            )
+        print(f"Saved {len(chunk_ids)} chunk fingerprints for {doc_id}")
@@ -29,13 +29,16 @@ class IngestionStatus:
         lines_processed: int=0, 
         progress_status: str='', 
         # presigned_url: str='',
-        last_modified=None
+        last_modified=None,
+        *,
+        chunks_processed: int=0
     ):
         self.user_id = user_id
         self.doc_id = doc_id
         self.etag = etag
         self.lines_processed = lines_processed
         self.progress_status = progress_status
+        self.chunks_processed = chunks_processed
         # if presigned_url:
         #     self.presigned_url = presigned_url
         # else:
@@ -70,12 +73,17 @@ class IngestionStatus:
             else:
                 lines_processed = int(lines_processed)
         
+        chunks_processed = 0
+        if 'chunks_processed' in rec:
+            chunks_processed = int(rec['chunks_processed']['N'])
+
         return IngestionStatus(
             rec['user_id']['S'],
             rec['doc_id']['S'],
             rec['etag']['S'],
             lines_processed,
-            rec['progress_status']['S']
+            rec['progress_status']['S'],
+            chunks_processed=chunks_processed
         )
 
     def to_ddb_record(self):     
@@ -85,7 +93,8 @@ class IngestionStatus:
             'etag': {'S': self.etag},
             'lines_processed': {'N': str(self.lines_processed)},
             'progress_status': {'S': self.progress_status},
-            'last_modified': {'S': self.last_modified}
+            'last_modified': {'S': self.last_modified},
+            'chunks_processed': {'N': str(self.chunks_processed)}
         }
 
     def to_json(self):
@@ -98,6 +107,7 @@ class IngestionStatus:
             'progress_status': self.progress_status,
             # 'presigned_url': self.presigned_url,
             'last_modified': self.last_modified,
+            'chunks_processed': self.chunks_processed,
         }
 
     def __str__(self):
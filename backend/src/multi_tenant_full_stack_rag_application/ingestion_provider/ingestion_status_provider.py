@@ -4,6 +4,7 @@
 import boto3
 import json
 import os
+from .ingestion_chunk_fingerprints import ChunkFingerprintStore
 from .ingestion_status import IngestionStatus
 from .ingestion_status_provider_event import IngestionStatusProviderEvent
 from multi_tenant_full_stack_rag_application import utils
@@ -11,7 +12,7 @@ from multi_tenant_full_stack_rag_application import utils
 """
 API 
 event {
-    "operation": ["get_ingestion_status" | "create_ingestion_status"],
+    "operation": ["get_ingestion_status" | "create_ingestion_status" | "delete_ingestion_status" | "get_collection_versions"],
     "origin": the function name of the calling function, or the frontend_origin.,
     "args": 
         for create_ingestion_status:
@@ -29,12 +30,23 @@ event {
         for get_ingestion_status:
             "user_id": str,
             "doc_id": str
+
+        for get_collection_versions:
+            "collection_ids": [str]
 """
 
 ddb_client = None
 ingestion_status_provider = None
 ingestion_status_table = None
 
+# Each collection's version is bumped whenever ingestion of one of its
+# documents finishes, fails or is deleted, so caches of answers drawn from
+# the collection can tell they're stale. Versions are kept in the status
+# table under their own partition key, so user queries never return them.
+collection_versions_partition = '#collection_versions'
+# dynamodb's limit on keys per batch_get_item.
+batch_get_max_keys = 100
+
 
 class IngestionStatusProvider:
     def __init__(self, 
@@ -46,6 +58,10 @@ class IngestionStatusProvider:
         self.ddb = ddb_client
         self.table = ingestion_status_table
         self.s3 = s3_client
+        self.fingerprint_store = ChunkFingerprintStore(
+            ddb_client=ddb_client,
+            table_name=ingestion_status_table
+        )
         self.allowed_origins = self.utils.get_allowed_origins()
     
     @staticmethod
@@ -74,6 +90,10 @@ class IngestionStatusProvider:
             }
         )
         print(f"delete_ingestion_status deleted record from dynamodb for {user_id}/{doc_id}.\nResult: {ddb_delete_result}")
+        # the document's chunk fingerprints go with it, so a re-upload
+        # is fully re-embedded.
+        self.fingerprint_store.delete(user_id, doc_id)
+        self.increment_collection_version(doc_id)
         status = None
         if delete_from_s3:
             s3_delete_result = self.s3.delete_object(
@@ -87,14 +107,34 @@ class IngestionStatusProvider:
         }
         
         
+    # returns {collection_id: version}, with 0 for collections nothing has
+    # been ingested into since versions were added.
+    def get_collection_versions(self, collection_ids):
+        versions = {collection_id: 0 for collection_id in collection_ids}
+        keys = [{
+            'user_id': {'S': collection_versions_partition},
+            'doc_id': {'S': collection_id}
+        } for collection_id in versions]
+        while len(keys) > 0:
+            batch = keys[:batch_get_max_keys]
+            keys = keys[batch_get_max_keys:]
+            result = self.ddb.batch_get_item(
+                RequestItems={self.table: {'Keys': batch}}
+            )
+            for item in result.get('Responses', {}).get(self.table, []):
+                versions[item['doc_id']['S']] = int(item['version']['N'])
+            keys += result.get('UnprocessedKeys', {}).get(self.table, {}).get('Keys', [])
+        return versions
+
     def get_ingestion_status(self, user_id, doc_id, etag='', lines_processed=0, progress_status='IN_PROGRESS', limit=100, last_eval_key=None)-> IngestionStatus:
-        projection_expression = "#user_id, #doc_id, #etag, #lines_processed, #progress_status"
+        projection_expression = "#user_id, #doc_id, #etag, #lines_processed, #progress_status, #chunks_processed"
         expression_attr_names = {
             "#user_id": "user_id",
             "#doc_id": "doc_id",
             "#etag": "etag",
             "#lines_processed": "lines_processed",
-            "#progress_status": "progress_status"
+            "#progress_status": "progress_status",
+            "#chunks_processed": "chunks_processed"
         }
 
         kwargs = {      
@@ -169,8 +209,9 @@ class IngestionStatusProvider:
                     handler_evt.doc_id,
                     handler_evt.etag,
                     handler_evt.lines_processed,
-                    handler_evt.progress_status
+                    handler_evt.progress_status,
                     # set presigned url
+                    chunks_processed=handler_evt.chunks_processed
                 )
             )
             print(f"set_ingestion_status response {response}")
@@ -179,6 +220,9 @@ class IngestionStatusProvider:
                 "message": "SUCCESS"
             }
         
+        elif handler_evt.operation == 'get_collection_versions':
+            result = self.get_collection_versions(handler_evt.collection_ids)
+
         elif handler_evt.operation == 'delete_ingestion_status':
             # print(f"delete_ingestion_status received user_id {handler_evt.user_id}, doc_id {handler_evt.doc_id}")
             result = self.delete_ingestion_status(
@@ -193,12 +237,30 @@ class IngestionStatusProvider:
         print(f"IngestionStatusProvider returning result {result}")
         return self.utils.format_response(status, result, handler_evt.origin)
 
+    # doc_ids start with the collection ID, as {collection_id}/{file name}.
+    def increment_collection_version(self, doc_id):
+        collection_id = self.__strip_userid_prefix__(doc_id).split('/')[0]
+        self.ddb.update_item(
+            TableName=self.table,
+            Key={
+                'user_id': {'S': collection_versions_partition},
+                'doc_id': {'S': collection_id}
+            },
+            UpdateExpression='ADD #version :one',
+            ExpressionAttributeNames={'#version': 'version'},
+            ExpressionAttributeValues={':one': {'N': '1'}}
+        )
+
     def set_ingestion_status(self, ingestion_status: IngestionStatus): 
         # ingestion_status.doc_id = self.__strip_userid_prefix__(ingestion_status.doc_id)
         result = self.ddb.put_item(
             TableName=self.table,
             Item=ingestion_status.to_ddb_record()
         )
+        # progress updates don't change what's searchable until the
+        # document is done.
+        if ingestion_status.progress_status != 'IN_PROGRESS':
+            self.increment_collection_version(ingestion_status.doc_id)
         # print(f"set_ingestion_status result = {result}")
         return result
     
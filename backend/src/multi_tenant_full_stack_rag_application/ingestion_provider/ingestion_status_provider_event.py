@@ -13,24 +13,29 @@ class IngestionStatusProviderEvent:
     doc_id: str=''
     etag: str=''
     lines_processed: int=0
+    chunks_processed: int=0
     progress_status: str=''
     origin: str=''
     delete_from_s3: bool = False
     limit: int = 100
     last_eval_key: str = None
+    collection_ids: list = []
 
     def from_lambda_event(self, event):
         print(f"IngestionStatusProviderEvent.from_lambda_event: {event}")
         self.operation = event['operation']
         self.origin = event['origin']
 
-        self.user_id = event['args']['user_id']
-        self.doc_id = event['args']['doc_id']
+        # get_collection_versions isn't for one user's document.
+        self.user_id = event['args'].get('user_id', '')
+        self.doc_id = event['args'].get('doc_id', '')
+        self.collection_ids = event['args'].get('collection_ids', [])
 
         if self.operation == 'create_ingestion_status':
             self.etag = event['args']['etag']
             self.lines_processed = event['args']['lines_processed']
             self.progress_status = event['args']['progress_status']
+            self.chunks_processed = event['args'].get('chunks_processed', 0)
         if 'delete_from_s3' in event['args']:
             self.delete_from_s3 = event['args']['delete_from_s3']
         else:
@@ -53,6 +58,7 @@ class IngestionStatusProviderEvent:
             "doc_id": self.doc_id,
             "etag": self.etag,
             "lines_processed": self.lines_processed,
+            "chunks_processed": self.chunks_processed,
             "progress_status": self.progress_status,
             "delete_from_s3": self.delete_from_s3
         }
@@ -78,7 +78,7 @@ class DocxLoader(Loader):
             '',
             0, 
             'IN_PROGRESS',
-            self.utils.get_ssm_params('origin_ingestion_provider')
+            self.my_origin
         )
         try: 
             content = self.load(path)
@@ -100,9 +100,10 @@ class DocxLoader(Loader):
             )
             print(f"Got text_chunks {text_chunks}")
             ctr = 0
+            dimensions = self.utils.get_vector_index_dimensions(collection_id, self.my_origin)
             for chunk in text_chunks:
                 id = f"{source}:{ctr}"
-                vector = self.utils.embed_text(chunk, self.my_origin)
+                vector = self.utils.embed_text(chunk, self.my_origin, dimensions=dimensions)
                 print(f"Creating doc with id {id}")
                 if not return_dicts:
                     docs.append(VectorStoreDocument(
@@ -128,6 +129,6 @@ class DocxLoader(Loader):
                 '',
                 0, 
                 f'ERROR: {e.__dict__}',
-                self.utils.get_ssm_params('origin_ingestion_provider')
+                self.my_origin
             )
             raise e
\ No newline at end of file
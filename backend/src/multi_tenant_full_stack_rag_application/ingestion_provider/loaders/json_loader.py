@@ -9,12 +9,19 @@ from copy import deepcopy
 from hashlib import md5 
 
 from .loader import Loader
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_checkpoint import IngestionCheckpoint, IngestionContinuationNeeded
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_chunk_fingerprints import ChunkFingerprintIndex, ChunkFingerprintStore
 from multi_tenant_full_stack_rag_application.ingestion_provider.splitters import Splitter, OptimizedParagraphSplitter
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_document import VectorStoreDocument
 from multi_tenant_full_stack_rag_application import utils
 
 
 default_embedding_model = os.getenv('EMBEDDING_MODEL_ID')
+# streaming batches are bounded by line count and by the bytes of json
+# read, which keeps each embed_texts and save request well under
+# lambda's 6MB payload limit once vectors are added.
+default_json_batch_max_lines = int(os.getenv('JSON_LOADER_BATCH_MAX_LINES', 100))
+default_json_batch_max_bytes = int(os.getenv('JSON_LOADER_BATCH_MAX_BYTES', 1024 * 1024))
 
 default_json_content_fields = [
     "page_content", "content", "text"
@@ -29,6 +36,9 @@ default_json_title_fields = [
 
 class JsonLoader(Loader):
     def __init__(self, *, 
+        batch_max_bytes: int=default_json_batch_max_bytes,
+        batch_max_lines: int=default_json_batch_max_lines,
+        fingerprint_store: ChunkFingerprintStore=None,
         json_content_fields_order: [str] = default_json_content_fields,
         json_id_fields_order: [str] = default_json_id_fields,
         json_title_fields_order: [str] = default_json_title_fields,
@@ -39,7 +49,10 @@ class JsonLoader(Loader):
 
         self.utils = utils
         self.my_origin = self.utils.get_ssm_params("origin_ingestion_provider")
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_max_lines = batch_max_lines
 
+        self.fingerprint_store = fingerprint_store if fingerprint_store else ChunkFingerprintStore()
         self.json_content_fields_order = json_content_fields_order
         self.json_id_fields_order = json_id_fields_order
         self.json_title_fields_order = json_title_fields_order
@@ -78,55 +91,60 @@ class JsonLoader(Loader):
             if title_field in list(json_record.keys()):
                 return json_record[title_field]
 
-    def extract_line(self, jsonline, source, user_id) -> VectorStoreDocument:
-        if not jsonline or len(jsonline) == 0:
-            return None
-        content = None
-        doc_id = None
-        title = None
-        json_obj = json.loads(jsonline)
-        # print(f"Got line to extract: {json_obj}")
-        meta = deepcopy(json_obj)
-        keys = list(json_obj.keys())
-        # print(f"extract_line got source {source}")
-        collection_id = source.split('/')[-2]
-        filename = source.split('/')[-1]
-        doc_id = self.create_ingestion_id(json_obj, filename, collection_id)
-        # print(f"Created ingestion id {doc_id}")
-        title = self.create_title(json_obj)
-        # print(f"Created title {title}")
-        content = self.create_content(json_obj)
-        # print(f"Created content {content}")
-
-        if not title:
-            title = doc_id
-        if not 'title' in meta:
-            meta['title'] = title
-        if not 'source' in meta:
-            meta['source'] = source
-        
-        etag = md5(jsonline.encode('utf-8')).hexdigest()
-        meta['etag'] = etag
-
+    # Groups (line_num, line) tuples into batches of up to batch_max_lines
+    # lines and batch_max_bytes bytes. A line bigger than batch_max_bytes
+    # gets a batch of its own. Lines are sized in utf-8 bytes, as they're
+    # sent, rather than in characters.
+    def batch_lines(self, lines):
+        batch = []
+        batch_bytes = 0
+        for line_num, line in lines:
+            line_bytes = len(line.encode('utf-8'))
+            if len(batch) > 0 and \
+                (len(batch) == self.batch_max_lines or batch_bytes + line_bytes > self.batch_max_bytes):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append((line_num, line))
+            batch_bytes += line_bytes
+        if len(batch) > 0:
+            yield batch
 
-        if not (content and doc_id and title):
-            print(f"Couldn't find at least one of content ({content}), doc_id ({doc_id}), and title ({title}), skipping.")
+    def extract_line(self, jsonline, source, user_id, fingerprints: ChunkFingerprintIndex=None) -> VectorStoreDocument:
+        record = self.prepare_line(jsonline, source, fingerprints)
+        if not record:
             return None
-        else:
-            # print(f"Found doc_id {doc_id}, title {title}, content\n{content}\n\n")
-
-            doc = VectorStoreDocument.from_dict({
-                "id": doc_id,
-                "content": content,
-                "metadata": meta,
-                "vector": self.utils.embed_text(content, self.my_origin, 'search_document')
-            })
-            # print(f"vector_ingestion_provider.ingest_file saving doc {doc}")
-            self.utils.save_vector_docs([doc],  collection_id, self.my_origin)
+        (doc_id, content, meta, etag) = record
+        collection_id = source.split('/')[-2]
+        doc = VectorStoreDocument.from_dict({
+            "id": doc_id,
+            "content": content,
+            "metadata": meta,
+            "vector": self.utils.embed_text(
+                content,
+                self.my_origin,
+                'search_document',
+                dimensions=self.utils.get_vector_index_dimensions(collection_id, self.my_origin)
+            )
+        })
+        # print(f"vector_ingestion_provider.ingest_file saving doc {doc}")
+        saved = self.utils.save_vector_docs([doc],  collection_id, self.my_origin)
+        if fingerprints and saved == 1:
+            fingerprints.record(doc_id, etag)
         return doc
 
-                    
-    def load(self, path, user_id, json_lines=False, source=None):
+    # yields (line_num, line) for the lines at or after start_line, without
+    # reading the whole file into memory.
+    def iter_lines(self, path, source, fingerprints: ChunkFingerprintIndex=None, *, start_line=0):
+        with open(path, 'r') as f:
+            for line_num, line in enumerate(f):
+                line = line.strip()
+                if line_num < start_line:
+                    self.skip_line(line, source, fingerprints)
+                elif line:
+                    yield (line_num, line)
+
+    def load(self, path, user_id, json_lines=False, source=None, fingerprints: ChunkFingerprintIndex=None, *, start_line=0):
         if not path: 
             return None
         if not source:
@@ -137,37 +155,74 @@ class JsonLoader(Loader):
         with open(path, 'r') as f:
             if not json_lines:
                 # docs.append(self.extract_line(f.read().replace("\n", "").strip()), source, user_id)
-                return self.extract_line(f.read().replace("\n", "").strip(), source, user_id)
+                return self.extract_line(f.read().replace("\n", "").strip(), source, user_id, fingerprints)
             else:
                 # jsonlines format
+                line_num = 0
                 line = f.readline()
                 while line:
-                    yield self.extract_line(line.strip(), source, user_id)
+                    if line_num < start_line:
+                        self.skip_line(line.strip(), source, fingerprints)
+                    else:
+                        yield self.extract_line(line.strip(), source, user_id, fingerprints)
+                    line_num += 1
                     line = f.readline()
 
     
+    # With stream=True, json lines are read, embedded and saved in batches
+    # and the number of docs saved is returned instead of the docs.
     def load_and_split(self, path, user_id, source=None, *, etag='', extra_metadata={}, 
-        extra_header_text='', json_lines=False, return_dicts=False):
+        extra_header_text='', json_lines=False, return_dicts=False, checkpoint: IngestionCheckpoint=None,
+        stream=False):
         if not source:
             source = path
         parts = source.split('/')
         # print(f"source split to parts {parts}")
         collection_id = parts[-2]
         filename = parts[-1]
+        start_line = checkpoint.lines_processed if checkpoint and json_lines else 0
         try: 
             final_docs = []
             docs_processed = 0
-            print(f"load_and_split received path {path}, source {source}, collection_id {collection_id}, json_lines {json_lines}")
-            for doc in self.load(path, user_id, json_lines, source):
-                if not doc:
-                    continue
-                # print(f"self.load yielded doc {doc.to_json()}")
-                if return_dicts:
-                    doc = doc.to_dict()
-                final_docs.append(doc)
-                docs_processed += 1
-            print(f"Processed {docs_processed} document chunks")
+            print(f"load_and_split received path {path}, source {source}, collection_id {collection_id}, json_lines {json_lines}, start_line {start_line}")
+            fingerprints = self.fingerprint_store.load_index(user_id, f"{collection_id}/{filename}")
+            if stream and json_lines:
+                lines = self.iter_lines(path, source, fingerprints, start_line=start_line)
+                for batch in self.batch_lines(lines):
+                    records = [self.prepare_line(line, source, fingerprints) for (_, line) in batch]
+                    docs_processed += self.save_batch(
+                        [record for record in records if record],
+                        collection_id,
+                        fingerprints
+                    )
+                    if checkpoint:
+                        checkpoint.advance(batch[-1][0] + 1)
+            else:
+                line_num = start_line
+                for doc in self.load(path, user_id, json_lines, source, fingerprints, start_line=start_line):
+                    line_num += 1
+                    if doc:
+                        # print(f"self.load yielded doc {doc.to_json()}")
+                        if return_dicts:
+                            doc = doc.to_dict()
+                        final_docs.append(doc)
+                        docs_processed += 1
+                    if checkpoint:
+                        checkpoint.advance(line_num)
+            stale_ids = fingerprints.stale_ids()
+            deleted = self.utils.delete_vector_docs(stale_ids, collection_id, self.my_origin)
+            self.fingerprint_store.save_index(user_id, f"{collection_id}/{filename}", fingerprints)
+            print(f"Processed {docs_processed} document chunks, skipped {fingerprints.unchanged_count} unchanged, deleted {deleted} of {len(stale_ids)} stale")
+            if stream and json_lines:
+                # docs aren't kept in streaming mode, so memory use doesn't
+                # grow with the file.
+                return docs_processed
             return final_docs
+
+        except IngestionContinuationNeeded as e:
+            self.fingerprint_store.save_index(user_id, f"{collection_id}/{filename}", fingerprints, partial=True)
+            print(f"Processed {docs_processed} document chunks before stopping for a continuation")
+            raise e
         
         except Exception as e:
             print(f"Error loading {path}: {e}")
@@ -181,5 +236,78 @@ class JsonLoader(Loader):
             )
             raise e
 
+    # Returns (doc_id, content, metadata, etag) for a json line, or None if
+    # it's missing fields or hasn't changed since it was last saved.
+    def prepare_line(self, jsonline, source, fingerprints: ChunkFingerprintIndex=None):
+        if not jsonline or len(jsonline) == 0:
+            return None
+        content = None
+        doc_id = None
+        title = None
+        json_obj = json.loads(jsonline)
+        # print(f"Got line to extract: {json_obj}")
+        meta = deepcopy(json_obj)
+        keys = list(json_obj.keys())
+        # print(f"extract_line got source {source}")
+        collection_id = source.split('/')[-2]
+        filename = source.split('/')[-1]
+        doc_id = self.create_ingestion_id(json_obj, filename, collection_id)
+        # print(f"Created ingestion id {doc_id}")
+        title = self.create_title(json_obj)
+        # print(f"Created title {title}")
+        content = self.create_content(json_obj)
+        # print(f"Created content {content}")
 
-            
+        if not title:
+            title = doc_id
+        if not 'title' in meta:
+            meta['title'] = title
+        if not 'source' in meta:
+            meta['source'] = source
+        
+        etag = md5(jsonline.encode('utf-8')).hexdigest()
+        meta['etag'] = etag
+
+
+        if not (content and doc_id and title):
+            print(f"Couldn't find at least one of content ({content}), doc_id ({doc_id}), and title ({title}), skipping.")
+            return None
+        elif fingerprints and fingerprints.is_unchanged(doc_id, etag):
+            # already embedded and saved with identical content.
+            return None
+        return (doc_id, content, meta, etag)
+
+    # embeds a batch of prepared lines in one call and saves them in one
+    # bulk request. Returns how many were saved.
+    def save_batch(self, records, collection_id, fingerprints: ChunkFingerprintIndex=None):
+        if len(records) == 0:
+            return 0
+        vectors = self.utils.embed_texts(
+            [content for (_, content, _, _) in records],
+            self.my_origin,
+            dimensions=self.utils.get_vector_index_dimensions(collection_id, self.my_origin)
+        )
+        docs = []
+        for (doc_id, content, meta, _), vector in zip(records, vectors):
+            docs.append(VectorStoreDocument.from_dict({
+                "id": doc_id,
+                "content": content,
+                "metadata": meta,
+                "vector": vector
+            }))
+        saved = self.utils.save_vector_docs(docs, collection_id, self.my_origin)
+        if fingerprints and saved == len(docs):
+            # a partly failed batch is embedded again next time.
+            for (doc_id, _, _, etag) in records:
+                fingerprints.record(doc_id, etag)
+        return saved
+
+    # keeps the fingerprint of a line a resumed ingestion already saved.
+    def skip_line(self, jsonline, source, fingerprints: ChunkFingerprintIndex=None):
+        if not jsonline or not fingerprints:
+            return
+        collection_id = source.split('/')[-2]
+        filename = source.split('/')[-1]
+        doc_id = self.create_ingestion_id(json.loads(jsonline), filename, collection_id)
+        if doc_id:
+            fingerprints.keep(doc_id)
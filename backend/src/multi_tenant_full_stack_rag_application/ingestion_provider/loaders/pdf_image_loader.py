@@ -9,10 +9,12 @@ import time
 
 from base64 import b64encode
 from datetime import datetime
-from pdf2image import convert_from_path
 
 from multi_tenant_full_stack_rag_application import utils 
 from .loader import Loader
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_checkpoint import IngestionCheckpoint, IngestionContinuationNeeded
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_chunk_fingerprints import ChunkFingerprintIndex, ChunkFingerprintStore
+from .pdf_ocr_pipeline import AdaptiveConcurrencyLimiter, PdfOcrPipeline, PdfPageRenderer, default_ocr_max_concurrency, page_windows
 from multi_tenant_full_stack_rag_application.ingestion_provider.splitters import Splitter, OptimizedParagraphSplitter
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_document import VectorStoreDocument
 
@@ -20,13 +22,21 @@ from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_
 default_ocr_template_path = 'multi_tenant_full_stack_rag_application/ingestion_provider/loaders/pdf_image_loader_ocr_template.txt'
 default_ocr_model = os.getenv('OCR_MODEL_ID')
 default_embedding_model = os.getenv('EMBEDDING_MODEL_ID')
+# pages OCRed, embedded and saved together, between checkpoints.
+default_checkpoint_pages = int(os.getenv('PDF_CHECKPOINT_PAGES', 40))
+# chunks are stored for retrieval, so they're embedded as documents.
+pdf_embedding_type = 'search_document'
 
 
 class PdfImageLoader(Loader):
     def __init__(self,*, 
+        checkpoint_pages: int=default_checkpoint_pages,
+        fingerprint_store: ChunkFingerprintStore=None,
         max_tokens_per_chunk: int=0,
+        ocr_limiter: AdaptiveConcurrencyLimiter = None,
         ocr_model_id: str = None,
         ocr_template_text: str = None,
+        page_renderer: PdfPageRenderer = None,
         s3: boto3.client = None,
         splitter: Splitter = None,
         **kwargs
@@ -36,12 +46,19 @@ class PdfImageLoader(Loader):
 
         self.utils = utils
         self.my_origin = self.utils.get_ssm_params('origin_ingestion_provider')
+        self.checkpoint_pages = checkpoint_pages
+        self.fingerprint_store = fingerprint_store if fingerprint_store else ChunkFingerprintStore()
         
         if not ocr_model_id:
             self.ocr_model_id = default_ocr_model
         else:
             self.ocr_model_id = ocr_model_id
 
+        # shared across documents so a warm function remembers how much
+        # OCR concurrency bedrock will take.
+        self.ocr_limiter = ocr_limiter if ocr_limiter else AdaptiveConcurrencyLimiter(default_ocr_max_concurrency)
+        self.page_renderer = page_renderer if page_renderer else PdfPageRenderer()
+
         if not s3:
             self. s3 = self.utils.BotoClientProvider.get_client('s3')
         else:
@@ -74,126 +91,185 @@ class PdfImageLoader(Loader):
         # print(f"PdfImageLoader initialized with ocr template text {self.ocr_template_text}")
 
     def estimate_tokens(self, text):
-        return self.utils.get_token_count(text)
+        return self.utils.get_token_count(text, default_embedding_model)
+
+    def estimate_tokens_many(self, texts):
+        return self.utils.get_token_counts(texts, default_embedding_model)
     
     def get_default_ocr_template_path(self):
         return default_ocr_template_path
 
-    def llm_ocr(self, img_paths, parent_filename, extra_header_text, extra_metadata):
-        if not hasattr(self, 'ocr_template_text') or not self.ocr_template_text:
-            ocr_template_path = self.get_default_ocr_template_path()
-            # print(f"Fetching default ocr_template from {ocr_template_path}")
-            with open(ocr_template_path, 'r') as f_in:
-                self.ocr_template_text = f_in.read()
+    # OCRs, embeds and saves the pages checkpoint_pages at a time. Chunks
+    # don't span those windows, so with a checkpoint lines_processed is
+    # the number of pages saved and chunks_processed the next chunk number.
+    # Chunk ids saved by the last ingestion that this one doesn't produce,
+    # like a longer version's trailing pages, are deleted at the end.
+    def llm_ocr(self, local_file, parent_filename, extra_header_text, extra_metadata, *, checkpoint: IngestionCheckpoint=None, fingerprints: ChunkFingerprintIndex=None):
+        collection_id = parent_filename.split('/')[-2]
+        pipeline = PdfOcrPipeline(
+            lambda page_num, path: self.ocr_page(page_num, path, parent_filename),
+            limiter=self.ocr_limiter,
+            renderer=self.page_renderer
+        )
+        page_count = self.page_renderer.get_page_count(local_file)
+        first_page = checkpoint.lines_processed + 1 if checkpoint else 1
+        chunk_num = checkpoint.chunks_processed if checkpoint else 0
+        if fingerprints is None:
+            fingerprints = ChunkFingerprintIndex()
+        # chunks a resumed ingestion already saved.
+        for prev_num in range(chunk_num):
+            fingerprints.keep(f"{parent_filename}:{prev_num}")
         results = []
-        chunk_num = 0
-        page_num = 1
-        curr_chunk_text = ''
-        curr_chunk_tokens = 0
-
-        file_name_header = f'<FILENAME>\n{parent_filename.split("/")[-1]}\n</FILENAME>\n'
-        file_name_header_tokens = self.estimate_tokens(file_name_header)
-        print(f"** Received {len(img_paths)} pages to process **")
-        
-        for path in img_paths:
-            # print(f"Processing file {path}")
-            page_header = f"<PAGE_NUM>\n{page_num}\n</PAGE_NUM>\n"
-            page_header_tokens = self.estimate_tokens(page_header)
-            chunk_id = f"{parent_filename}:{chunk_num}"
-
-            with open(path, 'rb') as img:
-                content = b64encode(img.read()).decode('utf-8')  # .encode('utf-8')
-                print(f"Type of content is now {type(content)}")
-                
-            msgs = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "image": {
-                                "source": {
-                                    "bytes": content,
-                                },
-                                "format": "jpeg"
-                            }
-                        },
-                        {
-                            "text": f"{file_name_header}\n{page_header}\n{self.ocr_template_text}"
-                        }
-                    ]
-                }
-            ]
-            print(f"Invoking model with msgs {msgs}")
-            response = self.utils.invoke_bedrock(
-                "invoke_model",
-                {
-                    "messages": msgs,
-                    "model_id": self.ocr_model_id,
-                },
-                self.utils.get_ssm_params('origin_ingestion_provider')
+        for window_first, window_last in page_windows(page_count, self.checkpoint_pages, first_page):
+            page_texts = pipeline.run(
+                local_file,
+                self.get_images_path(local_file),
+                first_page=window_first,
+                last_page=window_last
             )
-            print(f"Got response from invoking model: {response}")
-            response = response['response'].replace('<XML_OUTPUT>', '').replace('</XML_OUTPUT>', '')
-            response_tokens = self.estimate_tokens(response)
-            # print(f"curr_chunk_tokens: {curr_chunk_tokens}, file_name_header_tokens {file_name_header_tokens}, page_header_tokens {page_header_tokens} = {curr_chunk_tokens + file_name_header_tokens + page_header_tokens}, max {self.max_tokens_per_chunk}")
-            if curr_chunk_tokens + file_name_header_tokens + page_header_tokens + \
-                response_tokens >= self.max_tokens_per_chunk:
-                print(f"Logging with text {curr_chunk_text}, chunk_id {chunk_id}")
-                results.append(VectorStoreDocument.from_dict({
-                    "id": chunk_id,
-                    "content": curr_chunk_text,
-                    "vector": self.utils.embed_text(curr_chunk_text, self.my_origin),
-                    "metadata": {
-                        "title": f"{parent_filename}:{chunk_num}",
-                        "page_num": page_num,
-                        "source": parent_filename,
-                        **extra_metadata
-                    }
-                }))
-                curr_chunk_text = ''
-                curr_chunk_tokens = 0
+            chunks = self.pack_pages(page_texts, parent_filename, window_first, extra_header_text)
+            # chunk ids are positional, so only chunks whose position and
+            # content both match the last ingestion are skipped.
+            changed = []
+            for text, page_num in chunks:
+                id = f"{parent_filename}:{chunk_num}"
+                fingerprint = fingerprints.fingerprint(text, pdf_embedding_type)
+                if not fingerprints.is_unchanged(id, fingerprint):
+                    changed.append((id, text, page_num, fingerprint))
                 chunk_num += 1
-            else:
-                if not file_name_header in curr_chunk_text:
-                    curr_chunk_text += file_name_header
-                    curr_chunk_tokens += file_name_header_tokens
-                if not page_header in curr_chunk_text:
-                    curr_chunk_text += page_header
-                    curr_chunk_tokens += page_header_tokens
-                curr_chunk_text += response
-                curr_chunk_tokens += response_tokens
-            # print(f"\n\n***Processed page {page_num}***\n\n")
-            # page_num += 1
+            docs = self.save_chunks(changed, collection_id, parent_filename, extra_metadata, fingerprints)
+            results += docs
+            print(f"\n\n***Processed pages {window_first} to {window_last} of {page_count} into {len(chunks)} chunks, {len(docs)} changed***\n\n")
+            if checkpoint:
+                checkpoint.advance(window_last, chunk_num)
+        stale_ids = fingerprints.stale_ids()
+        deleted = self.utils.delete_vector_docs(stale_ids, collection_id, self.my_origin)
+        print(f"Deleted {deleted} of {len(stale_ids)} stale chunks of {parent_filename}")
+        return results
 
-        # print(f"Logging with text {curr_chunk_text}, chunk_id {chunk_id}")
-        if curr_chunk_text != '':
-            print(f"Final chunk text is {curr_chunk_text}")
-            results.append(VectorStoreDocument.from_dict({
-                "id": f"{parent_filename}:{chunk_num}",
-                "content": curr_chunk_text,
-                "vector": self.utils.embed_text(curr_chunk_text, self.my_origin),
+    # prepends the caller's extra_header_text to the file name header, as
+    # the other loaders do.
+    def get_chunk_header(self, parent_filename, extra_header_text=''):
+        file_name_header = self.get_file_name_header(parent_filename)
+        if extra_header_text.strip() == '':
+            return file_name_header
+        return f"{extra_header_text.strip()}\n{file_name_header}"
+
+    def save_chunks(self, changed, collection_id, parent_filename, extra_metadata, fingerprints):
+        if len(changed) == 0:
+            return []
+        vectors = self.utils.embed_texts(
+            [text for (_, text, _, _) in changed],
+            self.my_origin,
+            dimensions=self.utils.get_vector_index_dimensions(collection_id, self.my_origin)
+        )
+        docs = []
+        for (id, text, page_num, _), vector in zip(changed, vectors):
+            docs.append(VectorStoreDocument.from_dict({
+                "id": id,
+                "content": text,
+                "vector": vector,
                 "metadata": {
-                    "title": f"{parent_filename}:{chunk_num}",
+                    "title": id,
                     "page_num": page_num,
                     "source": parent_filename,
                     **extra_metadata
                 }
             }))
-            print(f"\n\n***Processed page {page_num}***\n\n")
+        if self.utils.save_vector_docs(docs, collection_id, self.my_origin) == len(docs):
+            for (id, _, _, fingerprint) in changed:
+                fingerprints.record(id, fingerprint)
+        return docs
 
-        # id = f"{parent_filename}:{page_num}"
-        # results.append(VectorStoreDocument.from_dict({
-        #     "id": id,
-        #     "content": header + response,
-        #     "vector": self.utils.embed_text(header + response, self.my_origin),
-        #     "metadata": {
-        #         "title": id,
-        #         "page_num": page_num,
-        #         "source": parent_filename
-        #     }
-        # }))
-        
-        return results
+    @staticmethod
+    def get_file_name_header(parent_filename):
+        return f'<FILENAME>\n{parent_filename.split("/")[-1]}\n</FILENAME>\n'
+
+    @staticmethod
+    def get_images_path(local_file):
+        tmp_dir = '/'.join(local_file.split('/')[0:3]) 
+        return tmp_dir + '/img_splits'
+
+    @staticmethod
+    def get_page_header(page_num):
+        return f"<PAGE_NUM>\n{page_num}\n</PAGE_NUM>\n"
+
+    def ocr_page(self, page_num, path, parent_filename):
+        with open(path, 'rb') as img:
+            content = b64encode(img.read()).decode('utf-8')
+        msgs = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "image": {
+                            "source": {
+                                "bytes": content,
+                            },
+                            "format": "jpeg"
+                        }
+                    },
+                    {
+                        "text": f"{self.get_file_name_header(parent_filename)}\n{self.get_page_header(page_num)}\n{self.ocr_template_text}"
+                    }
+                ]
+            }
+        ]
+        print(f"Invoking {self.ocr_model_id} to OCR page {page_num} of {parent_filename}")
+        response = self.utils.invoke_bedrock(
+            "invoke_model",
+            {
+                "messages": msgs,
+                "model_id": self.ocr_model_id,
+            },
+            self.my_origin
+        )
+        if 'errorMessage' in response:
+            # keep the error type in the message so throttling can be
+            # recognized and retried.
+            raise Exception(f"{response.get('errorType', 'Error')}: {response['errorMessage']}")
+        return response['response'].replace('<XML_OUTPUT>', '').replace('</XML_OUTPUT>', '')
+
+    # Packs OCRed pages, in page order, into chunks of up to
+    # max_tokens_per_chunk. Each chunk starts with the extra header text
+    # and file name header, and each page with its page header. Pages
+    # too big for a chunk of their own are split with the splitter.
+    # Returns (text, first page number) tuples.
+    def pack_pages(self, page_texts, parent_filename, first_page=1, extra_header_text=''):
+        file_name_header = self.get_chunk_header(parent_filename, extra_header_text)
+        file_name_header_tokens = self.estimate_tokens(file_name_header)
+        chunks = []
+        curr_chunk_text = ''
+        curr_chunk_tokens = 0
+        curr_chunk_page = None
+        page_texts = [
+            (page_num, self.get_page_header(page_num) + text, text)
+            for page_num, text in enumerate(page_texts, start=first_page)
+        ]
+        all_page_tokens = self.estimate_tokens_many([page_text for (_, page_text, _) in page_texts])
+        for (page_num, page_text, text), page_tokens in zip(page_texts, all_page_tokens):
+            if curr_chunk_text != '' and \
+                curr_chunk_tokens + page_tokens >= self.max_tokens_per_chunk:
+                chunks.append((curr_chunk_text, curr_chunk_page))
+                curr_chunk_text = ''
+                curr_chunk_tokens = 0
+            if file_name_header_tokens + page_tokens >= self.max_tokens_per_chunk:
+                for part in self.splitter.split(
+                    text,
+                    parent_filename,
+                    extra_header_text=file_name_header + self.get_page_header(page_num)
+                ):
+                    chunks.append((part, page_num))
+                continue
+            if curr_chunk_text == '':
+                curr_chunk_text = file_name_header
+                curr_chunk_tokens = file_name_header_tokens
+                curr_chunk_page = page_num
+            curr_chunk_text += page_text
+            curr_chunk_tokens += page_tokens
+        if curr_chunk_text != '':
+            chunks.append((curr_chunk_text, curr_chunk_page))
+        return chunks
 
     def load(self, path):
         print(f"Loading path {path}")
@@ -207,34 +283,46 @@ class PdfImageLoader(Loader):
         print(f"Loaded pdf to {local_file}")
         return local_file
 
-    def load_and_split(self, path, user_id, source=None, *, etag='', extra_metadata={}, extra_header_text=''):
+    def load_and_split(self, path, user_id, source=None, *, etag='', extra_metadata={}, extra_header_text='', checkpoint: IngestionCheckpoint=None):
         if not source:
             source = path
         print(f"PdfImageLoader loading {path}, {source}", flush=True)
         collection_id = source.split('/')[-2]
         filename = source.split('/')[-1]
 
-        result = self.utils.set_ingestion_status(
-            user_id, 
-            f"{collection_id}/{filename}",
-            etag,
-            0, 
-            'IN_PROGRESS',
-            self.utils.get_ssm_params('origin_ingestion_provider')
-        )
-        print(f"Result from setting ingestion status to IN_PROGRESS: {result}")
+        if checkpoint:
+            # keeps the position a resumed ingestion starts from.
+            checkpoint.save()
+        else:
+            result = self.utils.set_ingestion_status(
+                user_id, 
+                f"{collection_id}/{filename}",
+                etag,
+                0, 
+                'IN_PROGRESS',
+                self.my_origin
+            )
+            print(f"Result from setting ingestion status to IN_PROGRESS: {result}")
         try:
             print(f"Loading path {path}")
             print(f"does path exist? {os.path.exists(path)}", flush=True)
+            fingerprints = self.fingerprint_store.load_index(user_id, f"{collection_id}/{filename}")
             local_file = self.load(path)
             print(f"Got local file {local_file} loaded...now splitting.", flush=True)
-            split_results = self.split_pages(local_file)
-            print(f"Got split results {split_results}", flush=True)
-            docs: [VectorStoreDocument] = self.llm_ocr(split_results['splits'], source, extra_header_text, extra_metadata)
-            print(f"Returning {len(docs)} docs: {docs}", flush=True)
-            print(f"vector_ingestion_provider.ingest_file saving docs {docs}")
-            self.utils.save_vector_docs(docs, file_dict['collection_id'], self.my_origin)
+            docs: [VectorStoreDocument] = self.llm_ocr(
+                local_file,
+                source,
+                extra_header_text,
+                extra_metadata,
+                checkpoint=checkpoint,
+                fingerprints=fingerprints
+            )
+            self.fingerprint_store.save_index(user_id, f"{collection_id}/{filename}", fingerprints)
+            print(f"Saved {len(docs)} docs", flush=True)
             return docs
+        except IngestionContinuationNeeded as e:
+            self.fingerprint_store.save_index(user_id, f"{collection_id}/{filename}", fingerprints, partial=True)
+            raise e
         except Exception as e:
             print(dir(e))
             print(f"Error loading {path}: {e}")
@@ -245,7 +333,7 @@ class PdfImageLoader(Loader):
                 etag,
                 0, 
                 f'ERROR: {e.__dict__}',
-                self.utils.get_ssm_params('origin_ingestion_provider')
+                self.my_origin
             )
             
             raise e
@@ -269,33 +357,3 @@ class PdfImageLoader(Loader):
         #     self.my_origin,
         # )
         return docs
-
-    @staticmethod
-    def split_pages(local_file):
-        # print(f"splitting local file {local_file}")
-        tmp_dir = '/'.join(local_file.split('/')[0:3]) 
-        local_imgs_path = tmp_dir + '/img_splits'
-        os.makedirs(local_imgs_path, exist_ok=True)
-        # print(f"Saving images to {local_imgs_path}")
-        convert_from_path(local_file, fmt="jpeg", output_folder=local_imgs_path)
-        paths = []
-        files = os.listdir(local_imgs_path)
-        # print(f"Got {len(files)} pages extracted from pdf.")
-        for path in files:
-            paths.append(f"{local_imgs_path}/{path}")
-        paths.sort()
-        # print(f"{len(paths)} pages to process")
-
-        return {
-            "data_type": "image_path",
-            "splits": paths
-        }
-
-        
-
-            
-            
-        
-
-
-
@@ -0,0 +1,138 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pdf2image import convert_from_path, pdfinfo_from_path
+from threading import Event
+from time import monotonic
+
+from multi_tenant_full_stack_rag_application.utils.adaptive_limiter import AdaptiveConcurrencyLimiter, is_throttling_error
+
+
+default_render_window_pages = int(os.getenv('PDF_RENDER_WINDOW_PAGES', 10))
+default_render_workers = int(os.getenv('PDF_RENDER_WORKERS', 2))
+default_ocr_max_concurrency = int(os.getenv('PDF_OCR_MAX_CONCURRENCY', 8))
+
+
+def page_windows(last_page, window_pages, first_page=1):
+    return [
+        (window_start, min(window_start + window_pages - 1, last_page))
+        for window_start in range(first_page, last_page + 1, window_pages)
+    ]
+
+
+# Renders a pdf to jpeg files a window of pages at a time, with windows
+# rendered in parallel. Pages are yielded in page order as soon as their
+# window is done, so they can be processed while later windows are still
+# rendering, and only file paths are kept rather than the images.
+class PdfPageRenderer:
+    def __init__(self, *,
+        convert=convert_from_path,
+        get_page_count=None,
+        max_workers: int=default_render_workers,
+        window_pages: int=default_render_window_pages
+    ):
+        self.convert = convert
+        self.get_page_count = get_page_count if get_page_count \
+            else lambda path: pdfinfo_from_path(path)['Pages']
+        self.max_workers = max_workers
+        self.window_pages = window_pages
+
+    def render(self, local_file, output_folder, *, first_page=1, last_page=None):
+        os.makedirs(output_folder, exist_ok=True)
+        if not last_page:
+            last_page = self.get_page_count(local_file)
+        windows = page_windows(last_page, self.window_pages, first_page)
+        print(f"Rendering pages {first_page} to {last_page} in {len(windows)} windows of {self.window_pages}")
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            rendered = executor.map(
+                lambda window: self.render_window(local_file, output_folder, *window),
+                windows
+            )
+            for (first_page, last_page), paths in zip(windows, rendered):
+                for page_num, path in zip(range(first_page, last_page + 1), paths):
+                    yield (page_num, path)
+        finally:
+            # if the caller stops early, don't render windows that
+            # haven't started yet.
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def render_window(self, local_file, output_folder, first_page, last_page):
+        return self.convert(
+            local_file,
+            fmt='jpeg',
+            output_folder=output_folder,
+            output_file=f"page_{first_page:05d}_",
+            first_page=first_page,
+            last_page=last_page,
+            paths_only=True
+        )
+
+
+# Runs ocr_page(page_num, path) for every rendered page with bounded,
+# adaptive concurrency. The bedrock provider's scheduler retries
+# throttled calls, so one that's still throttled fails the run, but
+# halves the concurrency first. Returns the texts of pages first_page to last_page (or
+# the end of the document) in page order. Page images are deleted once
+# they've been OCRed.
+class PdfOcrPipeline:
+    def __init__(self, ocr_page, *,
+        limiter: AdaptiveConcurrencyLimiter=None,
+        renderer: PdfPageRenderer=None
+    ):
+        self.ocr_page = ocr_page
+        self.limiter = limiter if limiter else AdaptiveConcurrencyLimiter(default_ocr_max_concurrency)
+        self.renderer = renderer if renderer else PdfPageRenderer()
+
+    def ocr_with_limit(self, page_num, path):
+        try:
+            with self.limiter:
+                text = self.ocr_page(page_num, path)
+        except Exception as e:
+            if is_throttling_error(e):
+                self.limiter.on_throttle()
+                print(f"OCR of page {page_num} was still throttled after the bedrock provider's retries")
+            raise e
+        self.limiter.on_success()
+        if os.path.exists(path):
+            os.unlink(path)
+        return text
+
+    def run(self, local_file, output_folder, *, first_page=1, last_page=None):
+        start = monotonic()
+        failed = Event()
+        futures = {}
+
+        def ocr(page_num, path):
+            try:
+                return self.ocr_with_limit(page_num, path)
+            except Exception as e:
+                failed.set()
+                raise e
+
+        with ThreadPoolExecutor(max_workers=self.limiter.max_concurrency) as executor:
+            pages = self.renderer.render(
+                local_file,
+                output_folder,
+                first_page=first_page,
+                last_page=last_page
+            )
+            for page_num, path in pages:
+                if failed.is_set():
+                    break
+                futures[page_num] = executor.submit(ocr, page_num, path)
+            pages.close()
+            wait(futures.values(), return_when=FIRST_EXCEPTION)
+            if failed.is_set():
+                for future in futures.values():
+                    future.cancel()
+        for page_num in sorted(futures.keys()):
+            future = futures[page_num]
+            if not future.cancelled() and future.exception():
+                print(f"OCR of page {page_num} failed: {future.exception()}")
+                raise future.exception()
+        texts = [futures[page_num].result() for page_num in sorted(futures.keys())]
+        print(f"OCRed {len(texts)} pages in {monotonic() - start:.1f}s with {self.limiter.throttles} throttles")
+        return texts
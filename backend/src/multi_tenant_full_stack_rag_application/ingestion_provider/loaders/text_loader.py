@@ -4,22 +4,33 @@ import json
 import os
 
 from .loader import Loader
+from multi_tenant_full_stack_rag_application.ingestion_provider.splitters import OptimizedParagraphSplitter
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_checkpoint import IngestionCheckpoint, IngestionContinuationNeeded
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_chunk_fingerprints import ChunkFingerprintStore
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_document import VectorStoreDocument
 from multi_tenant_full_stack_rag_application import utils
 from datetime import datetime
 
 
 default_embedding_model = os.getenv('EMBEDDING_MODEL_ID')
+# chunks embedded and saved together, between checkpoints.
+default_text_batch_chunks = int(os.getenv('TEXT_LOADER_BATCH_CHUNKS', 50))
+# chunks are stored for retrieval, so they're embedded as documents.
+text_embedding_type = 'search_document'
 
 
 class TextLoader(Loader):
     def __init__(self, *, 
+        batch_chunks: int=default_text_batch_chunks,
+        fingerprint_store: ChunkFingerprintStore=None,
         max_tokens_per_chunk: int=0,
         splitter=None
     ):
         super().__init__()
         self.utils = utils
         self.my_origin = self.utils.get_ssm_params('origin_ingestion_provider')
+        self.batch_chunks = batch_chunks
+        self.fingerprint_store = fingerprint_store if fingerprint_store else ChunkFingerprintStore()
 
         if max_tokens_per_chunk == 0:
             response = self.utils.get_model_max_tokens(self.my_origin, default_embedding_model)   
@@ -36,7 +47,7 @@ class TextLoader(Loader):
             self.splitter = splitter
 
     def estimate_tokens(self, text):
-        return self.utils.get_token_count(text)
+        return self.utils.get_token_count(text, default_embedding_model)
       
     def load(self, path):
         print(f"loading path {path}")
@@ -50,20 +61,25 @@ class TextLoader(Loader):
         with open(local_file, 'r') as f_in:
             return f_in.read()
     
-    def load_and_split(self, path, user_id, source=None, *, etag='', extra_metadata={}, extra_header_text='', return_dicts=False):
+    def load_and_split(self, path, user_id, source=None, *, etag='', extra_metadata={}, extra_header_text='', return_dicts=False, checkpoint: IngestionCheckpoint=None):
         if not source:
             source = path
         collection_id = source.split('/')[-2]
         filename = path.split('/')[-1]
 
-        self.utils.set_ingestion_status(
-            user_id, 
-            f"{collection_id}/{filename}",
-            etag,
-            0, 
-            'IN_PROGRESS',
-            self.utils.get_ssm_params('origin_ingestion_provider')
-        )
+        if checkpoint:
+            # keeps the position a resumed ingestion starts from.
+            checkpoint.save()
+        else:
+            self.utils.set_ingestion_status(
+                user_id, 
+                f"{collection_id}/{filename}",
+                etag,
+                0, 
+                'IN_PROGRESS',
+                self.my_origin
+            )
+        start_chunk = checkpoint.lines_processed if checkpoint else 0
         try: 
             content = self.load(path)
             docs = []
@@ -81,27 +97,42 @@ class TextLoader(Loader):
                 extra_header_text=extra_header_text,
                 extra_metadata=extra_metadata
             )
-            ctr = 0
-            id = f"{source}:{ctr}"
-            for chunk in text_chunks:
+            # chunk ids are positional, so only chunks whose position and
+            # content both match the last ingestion are skipped. Chunks
+            # are embedded and saved in batches, and lines_processed is
+            # the offset of the next chunk to save.
+            fingerprints = self.fingerprint_store.load_index(user_id, f"{collection_id}/{filename}")
+            changed = []
+            for ctr, chunk in enumerate(text_chunks):
                 id = f"{source}:{ctr}"
-                vector = self.utils.embed_text(chunk, self.my_origin)
-                if not return_dicts:
-                    docs.append(VectorStoreDocument(
-                        id,
-                        chunk,
-                        extra_metadata,
-                        vector
-                    ))
-                else:
-                    docs.append({
-                        'id': id,
-                        'content': chunk,
-                        'metadata': extra_metadata,
-                        'vector': vector
-                    })
-                ctr += 1
+                if ctr < start_chunk:
+                    fingerprints.keep(id)
+                    continue
+                fingerprint = fingerprints.fingerprint(chunk, text_embedding_type)
+                if not fingerprints.is_unchanged(id, fingerprint):
+                    changed.append((id, chunk, fingerprint))
+                if len(changed) == self.batch_chunks or ctr == len(text_chunks) - 1:
+                    docs += self.save_batch(changed, collection_id, extra_metadata, fingerprints)
+                    changed = []
+                    if checkpoint:
+                        checkpoint.advance(ctr + 1, ctr + 1)
+            stale_ids = fingerprints.stale_ids()
+            deleted = self.utils.delete_vector_docs(stale_ids, collection_id, self.my_origin)
+            self.fingerprint_store.save_index(user_id, f"{collection_id}/{filename}", fingerprints)
+            print(f"Embedded {len(docs)} of {len(text_chunks)} chunks, skipped {fingerprints.unchanged_count} unchanged, deleted {deleted} of {len(stale_ids)} stale")
+            if return_dicts:
+                docs = [{
+                    'id': doc.doc_id,
+                    'content': doc.content,
+                    'metadata': doc.metadata,
+                    'vector': doc.vector
+                } for doc in docs]
             return docs
+
+        except IngestionContinuationNeeded as e:
+            self.fingerprint_store.save_index(user_id, f"{collection_id}/{filename}", fingerprints, partial=True)
+            print(f"Embedded {len(docs)} chunks before stopping for a continuation")
+            raise e
     
         except Exception as e:
             print(f"Error loading {path}: {e}")
@@ -114,4 +145,27 @@ class TextLoader(Loader):
                 self.utils.get_ssm_params('origin_ingestion_provider')
             )
             raise e
-            
+
+    # embeds and saves (id, chunk, fingerprint) tuples, recording their
+    # fingerprints if they were all saved.
+    def save_batch(self, changed, collection_id, extra_metadata, fingerprints):
+        if len(changed) == 0:
+            return []
+        vectors = self.utils.embed_texts(
+            [chunk for (_, chunk, _) in changed],
+            self.my_origin,
+            text_embedding_type,
+            dimensions=self.utils.get_vector_index_dimensions(collection_id, self.my_origin)
+        )
+        docs = []
+        for (id, chunk, fingerprint), vector in zip(changed, vectors):
+            docs.append(VectorStoreDocument(
+                id,
+                chunk,
+                extra_metadata,
+                vector
+            ))
+        if self.utils.save_vector_docs(docs, collection_id, self.my_origin) == len(docs):
+            for (id, _, fingerprint) in changed:
+                fingerprints.record(id, fingerprint)
+        return docs
@@ -5,22 +5,28 @@
 # It improves upon the former by combining small chunks into larger chunks,
 # to ensure that chunks are as close as possible to the max tokens per chunk without going over.
 import os
-from math import ceil
+from bisect import bisect_left
+from itertools import accumulate
 
 from multi_tenant_full_stack_rag_application import utils
 from multi_tenant_full_stack_rag_application.ingestion_provider.splitters import Splitter
 
 default_split_seqs = ['\n\n\n', '\n\n', '\n', '. ', ' ']
+# bounds how far a hard split looks for the end of a piece, as a word
+# a tokenizer doesn't know can be one token however long it is.
+max_chars_per_token = 16
 
 class OptimizedParagraphSplitter(Splitter):
     def __init__(self, *,
         max_tokens_per_chunk: int,
         lambda_client=None,
+        model_id: str=None,
         ssm_client=None,
         split_seqs=default_split_seqs,
     ):
         super().__init__(
             max_tokens_per_chunk=max_tokens_per_chunk, 
+            model_id=model_id,
             split_seqs=split_seqs
         )
         
@@ -70,61 +76,97 @@ class OptimizedParagraphSplitter(Splitter):
     #     )
 
     def split(self, content, source, *, extra_header_text='', extra_metadata={}, return_dicts=False, split_seq_num=0):
-        print(f"OptimizedParagraphSplitter got content {content}")
         results = []
         content = content.replace('\xa0', '')
         content = content.replace('\t','')
         split_seq = self.split_seqs[split_seq_num]
-        header_len = self.utils.get_token_count(extra_header_text)
-        text_len = self.utils.get_token_count(content)
-        print(f"Got header_len {header_len} and text_len {text_len}")
-        # header_len = self.emb_provider_fn_name.get_token_count(extra_header_text)
-        # text_len = self.emb_provider_fn_name.get_token_count(content)
+        header_len = self.estimate_tokens(extra_header_text)
+        text_len = self.estimate_tokens(content)
+        print(f"OptimizedParagraphSplitter got {len(content)} chars, header_len {header_len} and text_len {text_len}")
         token_ct = header_len + text_len
         if token_ct <= self.max_tokens_per_chunk:
             print(f"Token count is less than max tokens. Keeping it all one chunk.")
             results = [f"{extra_header_text}\n{content}"]
         else:
-            parts = content.split(self.split_seqs[split_seq_num])
-            if not isinstance(parts, list):
-                parts = [parts]
-            print(f"Got {len(parts)} parts after splitting with split_seq {self.split_seqs[split_seq_num]}")
-            # aggregate parts back together so they approach the desired max tokens
-            # per chunk.
-            running_part = ''
-            running_part_toks = 0
-            for part in parts:
-                if part.strip() == '':
+            self.split_parts(content, extra_header_text, split_seq_num, results)
+        print(f"optimized paragraph splitter returning {len(results)} chunks")
+        return results
+
+    # Packs the parts of content split on split_seqs[split_seq_num] into
+    # chunks approaching max_tokens_per_chunk, appending them to results.
+    # Each part's tokens are counted once and prefix summed, so the end
+    # of each chunk is found with a binary search rather than by adding
+    # up parts one at a time, and each chunk is joined from its parts
+    # in one go. Parts too big for a chunk of their own are split again
+    # with the next split seq, and hard split once there are none left.
+    def split_parts(self, content, extra_header_text, split_seq_num, results):
+        if split_seq_num >= len(self.split_seqs):
+            self.hard_split(content, extra_header_text, results)
+            return
+        split_seq = self.split_seqs[split_seq_num]
+        max_toks = self.max_tokens_per_chunk
+        parts = list(filter(str.strip, content.split(split_seq)))
+        # the tokens are counted with split_seq appended, as the parts
+        # are used.
+        part_toks = self.estimate_tokens_many([part + split_seq for part in parts])
+        # toks_before[i] is the number of tokens in parts[:i]
+        toks_before = list(accumulate(part_toks, initial=0))
+        part_joiner = split_seq + ' '
+        running_start = None
+        running_starts_bare = False
+        i = 0
+        while i < len(parts):
+            if running_start is None:
+                # nothing is running yet, so a part smaller than a chunk
+                # is added to the running part, one the exact size of a
+                # chunk starts it and a bigger one gets split.
+                if part_toks[i] > max_toks:
+                    self.split_parts(parts[i] + split_seq, extra_header_text, split_seq_num + 1, results)
+                    i += 1
                     continue
-                part += split_seq
-                num_toks = self.utils.get_token_count(part)
-                # num_toks = self.emb_provider_fn_name.get_token_count(part)
-                if running_part_toks + num_toks < self.max_tokens_per_chunk:
-                    running_part += ' ' + part
-                    running_part_toks += num_toks
-                else: 
-                    # The running part is full. Append to the results array.
-                    if running_part != '':
-                        print(f"Appending running part to results ({len(running_part.split())} words)")
-                        results.append(f"{extra_header_text} {running_part}")
-                        running_part = ''
-                        running_part_toks = 0
-                    # Now check how to handle the current part. If this chunk is too big by itself 
-                    # to fit in the max_tokens_per_chunk, split it. Otherwise, just us it as
-                    # the beginning of a new running part.
-                    if num_toks > self.max_tokens_per_chunk:
-                        print(f"Recursing because the number of tokens is still too big {num_toks}.")
-                        results += self.split(
-                            part, 
-                            source,
-                            extra_header_text=extra_header_text, 
-                            extra_metadata=extra_metadata,
-                            split_seq_num=split_seq_num + 1
-                        )
-                    else:
-                        running_part = part
-                        running_part_toks = num_toks
+                running_start = i
+                running_starts_bare = part_toks[i] == max_toks
+            # the first part after running_start that doesn't fit.
+            end = bisect_left(toks_before, toks_before[running_start] + max_toks, i + 2) - 1
+            if end >= len(parts):
+                break
+            # The running part is full. Append to the results array.
+            results.append(self.join_chunk(parts[running_start:end], part_joiner, split_seq, extra_header_text, running_starts_bare))
+            running_start = None
+            if part_toks[end] > max_toks:
+                self.split_parts(parts[end] + split_seq, extra_header_text, split_seq_num + 1, results)
+                i = end + 1
+            else:
+                running_start = end
+                running_starts_bare = True
+                i = end
+        running_parts = parts[running_start:] if running_start is not None else []
+        results.append(self.join_chunk(running_parts, part_joiner, split_seq, extra_header_text, running_starts_bare))
+
+    # Cuts content with none of the split seqs in it, like a run of CJK
+    # text or minified code, into the longest pieces within
+    # max_tokens_per_chunk, found by binary search on character offsets.
+    # Pieces are at least one character, so this always finishes.
+    def hard_split(self, content, extra_header_text, results):
+        start = 0
+        while start < len(content):
+            lo = start + 1
+            hi = min(len(content), start + self.max_tokens_per_chunk * max_chars_per_token)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self.estimate_tokens(content[start:mid]) <= self.max_tokens_per_chunk:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            if content[start:lo].strip():
+                results.append(f"{extra_header_text} {content[start:lo]}")
+            start = lo
 
-            results.append(f"{extra_header_text} {running_part}")   
-        print(f"optimized paragraph splitter returning {results}")  
-        return results
\ No newline at end of file
+    # Each part is followed by split_seq and preceded by a space, except
+    # the first when it started the running part by itself.
+    @staticmethod
+    def join_chunk(running_parts, part_joiner, split_seq, extra_header_text, running_starts_bare):
+        if len(running_parts) == 0:
+            return f"{extra_header_text} "
+        leading = ' ' if running_starts_bare else '  '
+        return ''.join([extra_header_text, leading, part_joiner.join(running_parts), split_seq])
@@ -3,19 +3,29 @@
 
 from abc import ABC, abstractmethod
 
+from multi_tenant_full_stack_rag_application import utils
+
 
 class Splitter(ABC):
+    # the model whose tokenizer counts tokens. None is the function's
+    # EMBEDDING_MODEL_ID.
+    model_id = None
+
     def __init__(self, *,
         max_tokens_per_chunk: int = 0,
+        model_id: str = None,
         split_seqs = [],
         **kwargs
     ):
+        self.model_id = model_id
         self.split_seqs = split_seqs
     
-    @staticmethod
-    def estimate_tokens(text):
-        return len(text.split()) * 1.3
+    def estimate_tokens(self, text):
+        return utils.get_token_count(text, self.model_id)
+
+    def estimate_tokens_many(self, texts):
+        return utils.get_token_counts(texts, self.model_id)
 
     @abstractmethod
     def split(self, content, path, source, *, extra_header_text='', extra_metadata={}, split_seq_num=0):
-        pass
\ No newline at end of file
+        pass
@@ -17,6 +17,7 @@ from .loaders.pdf_image_loader import PdfImageLoader
 from .loaders.text_loader import TextLoader
 from .splitters.optimized_paragraph_splitter import OptimizedParagraphSplitter
 from .vector_ingestion_provider_event import VectorIngestionProviderEvent
+from .ingestion_checkpoint import IngestionCheckpoint, IngestionContinuationNeeded
 from .ingestion_status import IngestionStatus
 
 
@@ -131,6 +132,24 @@ class VectorIngestionProvider:
             s3_key = f"{s3_prefix}/{unquote_plus(filename)}"
             return self.download_s3_file(bucket, s3_key, attempts + 1)
 
+    # re-enqueues the file's s3 event so another invocation picks up
+    # where this one stopped.
+    def enqueue_continuation(self, file_dict, queue_url):
+        body = {
+            "Records": [{
+                "eventName": file_dict['event_name'],
+                "s3": {
+                    "bucket": {"name": file_dict['bucket']},
+                    "object": {
+                        "key": file_dict['key'],
+                        "eTag": file_dict['etag']
+                    }
+                }
+            }]
+        }
+        self.sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(body))
+        print(f"Enqueued a continuation for {file_dict['key']}")
+
     def find_json_title_field(self, json_dict):
         for field in self.json_title_fields_order:
             if field in json_dict:
@@ -158,7 +177,29 @@ class VectorIngestionProvider:
         final_val = f'{dir_name}/{file_name}'
         return final_val
 
-    def handle_object_created(self, file_dict):
+    def get_checkpoint(self, file_dict, *, deadline=None):
+        doc_id = f"{file_dict['collection_id']}/{file_dict['filename']}"
+        checkpoint = IngestionCheckpoint(
+            file_dict['user_id'],
+            doc_id,
+            file_dict['etag'],
+            self.my_origin,
+            deadline=deadline
+        )
+        status = self.utils.get_ingestion_status(file_dict['user_id'], doc_id, self.my_origin)
+        if status and status['etag'] == file_dict['etag'] and \
+            status['progress_status'] == 'IN_PROGRESS' and \
+            int(status['lines_processed']) > 0:
+            checkpoint.lines_processed = int(status['lines_processed'])
+            checkpoint.chunks_processed = int(status.get('chunks_processed', 0))
+            checkpoint.resumed_from = checkpoint.lines_processed
+            print(f"Resuming {doc_id} from {checkpoint.lines_processed} ({checkpoint.chunks_processed} chunks)")
+        return checkpoint
+
+    # Resumes from the last checkpoint when the file's etag hasn't changed.
+    # With a context and queue_url, the loader stops before the function
+    # times out and the rest of the file is re-enqueued as a continuation.
+    def handle_object_created(self, file_dict, *, context=None, queue_url=None):
         user_id = file_dict['user_id']
         collection_id = file_dict['collection_id']
         filename = file_dict['filename']
@@ -186,21 +227,19 @@ class VectorIngestionProvider:
             return
 
         local_path = self.download_s3_file(file_dict['bucket'], s3_key)
-        ingestion_status_args = [
-            user_id,
-            doc_id,
-            file_dict['etag'],
-            0,
-            "IN_PROGRESS",
-            self.my_origin
-        ]
-        ing_status = self.utils.set_ingestion_status(*ingestion_status_args)
+        deadline = IngestionCheckpoint.deadline_from_context(context) if queue_url else None
+        checkpoint = self.get_checkpoint(file_dict, deadline=deadline)
+        checkpoint.save()
 
         enrichment_enabled= False
         if 'enrichment_pipelines' in verified_doc_collection and \
             verified_doc_collection['enrichment_pipelines'] not in [{}, "{}"]:
             enrichment_enabled = True
-        result = self.ingest_file(local_path, file_dict)
+        try:
+            result = self.ingest_file(local_path, file_dict, checkpoint=checkpoint)
+        except IngestionContinuationNeeded:
+            self.enqueue_continuation(file_dict, queue_url)
+            return None
         print(f"Got result {result}")
         ingestion_status_args = [
             user_id,
@@ -240,7 +279,7 @@ class VectorIngestionProvider:
                 continue
             
             if 'ObjectCreated' in event_name:
-                result = self.handle_object_created(file)
+                result = self.handle_object_created(file, context=context, queue_url=queue_url)
 
             elif 'ObjectRemoved' in event_name:
                 # print(f"Removing file {filename}")
@@ -286,24 +325,26 @@ class VectorIngestionProvider:
     # The loader will yield documents until it's complete. For a multi-document
     # format like jsonlines, that means you'll get one doc back out per
     # line in the file, as a VectorDocument object. 
-    def ingest_file(self, local_path, file_dict): #  source, user_id, extra_meta={}) -> [VectorStoreDocument]:
+    def ingest_file(self, local_path, file_dict, *, checkpoint: IngestionCheckpoint=None): #  source, user_id, extra_meta={}) -> [VectorStoreDocument]:
         docs = []
         try:
             # collection_id = file_dict['collection_id']  # source.split('/')[0]
             if local_path.lower().endswith('.jsonl'):
                 print(f'Ingesting jsonl file.')
-                docs = self.ingest_json_file(local_path, file_dict, json_lines=True)
+                docs = self.ingest_json_file(local_path, file_dict, json_lines=True, checkpoint=checkpoint)
             elif local_path.lower().endswith('.json'): 
                 docs = self.ingest_json_file(local_path, file_dict, json_lines=False)
             elif local_path.lower().endswith('.pdf'):
-                docs = self.ingest_pdf_file(local_path, file_dict)
+                docs = self.ingest_pdf_file(local_path, file_dict, checkpoint=checkpoint)
             # elif local_path.lower().endswith('.docx'):
             #     docs = self.ingest_docx_file(local_path, file_dict)
             else:
                 # local_path.endswith('.txt'):
                 # assume you can parse it as text for now
-                docs = self.ingest_text_file(local_path, file_dict)
+                docs = self.ingest_text_file(local_path, file_dict, checkpoint=checkpoint)
             return docs
+        except IngestionContinuationNeeded as e:
+            raise e
         except Exception as e:
             print(f"Error occurred while ingesting file: {e.args[0]}")
             self.utils.set_ingestion_status(
@@ -321,32 +362,32 @@ class VectorIngestionProvider:
     #     docs = loader.load_and_split(local_path, file_dict['user_id'])
     #     return docs
 
-    def ingest_json_file(self, local_path, file_dict, *, json_lines=True, extra_meta={}):
+    def ingest_json_file(self, local_path, file_dict, *, json_lines=True, extra_meta={}, checkpoint: IngestionCheckpoint=None):
         # print(f"ingest_json_file got local path {local_path}")
         loader = JsonLoader(
             splitter=self.splitter
         )
         if not 'etag' in extra_meta:
             extra_meta['etag'] = file_dict['etag']
-        docs = loader.load_and_split(local_path, file_dict['user_id'], f"{file_dict['collection_id']}/{file_dict['filename']}", extra_metadata=extra_meta, json_lines=json_lines)
+        docs = loader.load_and_split(local_path, file_dict['user_id'], f"{file_dict['collection_id']}/{file_dict['filename']}", extra_metadata=extra_meta, json_lines=json_lines, checkpoint=checkpoint, stream=json_lines)
         # docs = loader.load_and_split(local_path, user_id, source, extra_metadata=extra_meta, json_lines=json_lines)
         return docs
 
-    def ingest_pdf_file(self, local_path, file_dict, *, extra_meta={}, ocr_model_id=None):
+    def ingest_pdf_file(self, local_path, file_dict, *, extra_meta={}, ocr_model_id=None, checkpoint: IngestionCheckpoint=None):
         # print(f"Ingesting pdf file {local_path}")
         if not ocr_model_id:
             ocr_model_id = self.ocr_model_id
 
-        docs = self.pdf_loader.load_and_split(local_path, file_dict['user_id'], f"{file_dict['collection_id']}/{file_dict['filename']}", etag=file_dict['etag'], extra_metadata=extra_meta)
+        docs = self.pdf_loader.load_and_split(local_path, file_dict['user_id'], f"{file_dict['collection_id']}/{file_dict['filename']}", etag=file_dict['etag'], extra_metadata=extra_meta, checkpoint=checkpoint)
         print(f"ingest_pdf_file returning {docs}")
         return docs
 
-    def ingest_text_file(self, local_path, file_dict, *, extra_meta={}):
+    def ingest_text_file(self, local_path, file_dict, *, extra_meta={}, checkpoint: IngestionCheckpoint=None):
         # print(f"Ingesting text file {local_path}")
         loader = TextLoader(
             splitter=self.splitter
         )
-        docs = loader.load_and_split(local_path, f"{file_dict['collection_id']}/{file_dict['filename']}", extra_metadata=extra_meta)
+        docs = loader.load_and_split(local_path, file_dict['user_id'], f"{file_dict['collection_id']}/{file_dict['filename']}", etag=file_dict['etag'], extra_metadata=extra_meta, checkpoint=checkpoint)
         # print(f"Ingest_text_file returning docs {docs}")
         return docs
 
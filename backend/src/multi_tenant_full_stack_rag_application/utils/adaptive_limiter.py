@@ -0,0 +1,110 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from math import floor
+from threading import Condition
+
+
+# bedrock throttling comes back as a ThrottlingException, from bedrock or
+# from the bedrock provider, and lambda throttling of the bedrock
+# provider itself as a TooManyRequestsException.
+throttling_error_markers = [
+    'ThrottlingException',
+    'ServiceUnavailableException',
+    'TooManyRequestsException',
+    'Too many requests',
+    'Rate exceeded',
+]
+
+
+def is_throttling_error(e):
+    text = f"{type(e).__name__}: {e}"
+    return any(marker in text for marker in throttling_error_markers)
+
+
+# Caps how many calls run at once, adapting the cap AIMD style: it's
+# halved whenever a call is throttled and grows back by one after limit
+# consecutive successes, up to max_concurrency.
+#
+# Callers can give each call a priority, highest first. Each priority
+# can only use its share of the limit, and waiting calls start highest
+# priority first. This only orders calls that share the limiter, so
+# threads in one process.
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, max_concurrency: int, *,
+        min_concurrency: int=1,
+        priorities: list=['default'],
+        shares: dict={}
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.priorities = priorities
+        self.shares = shares
+        self.limit = max_concurrency
+        self.active = 0
+        self.successes = 0
+        self.throttles = 0
+        self.waiting = {priority: 0 for priority in priorities}
+        self.max_waiting = 0
+        self.priority_calls = {priority: 0 for priority in priorities}
+        self.priority_throttles = {priority: 0 for priority in priorities}
+        self.condition = Condition()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self, priority=None):
+        priority = priority if priority else self.priorities[-1]
+        with self.condition:
+            self.waiting[priority] += 1
+            self.max_waiting = max(self.max_waiting, sum(self.waiting.values()))
+            while not self.can_start(priority):
+                self.condition.wait()
+            self.waiting[priority] -= 1
+            self.active += 1
+            self.priority_calls[priority] += 1
+
+    # with the condition held.
+    def can_start(self, priority):
+        higher = self.priorities[:self.priorities.index(priority)]
+        if any(self.waiting[other] > 0 for other in higher):
+            return False
+        return self.active < max(self.min_concurrency, floor(self.limit * self.shares.get(priority, 1.0)))
+
+    def metrics(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "queue_depth": dict(self.waiting),
+                "max_queue_depth": self.max_waiting,
+                "calls": dict(self.priority_calls),
+                "throttles": dict(self.priority_throttles),
+            }
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.limit < self.max_concurrency and \
+                self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_throttle(self, priority=None):
+        priority = priority if priority else self.priorities[-1]
+        with self.condition:
+            self.throttles += 1
+            self.priority_throttles[priority] += 1
+            self.successes = 0
+            self.limit = max(self.min_concurrency, self.limit // 2)
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            # waiters check their own priority, so all of them are woken.
+            self.condition.notify_all()
@@ -14,11 +14,35 @@ class BotoClientProvider:
     def get_client(
         service_name: str, 
         region: str=region,
+        *,
+        max_attempts: int=None,
+        max_pool_connections: int=None,
+        read_timeout: int=None,
     ) -> boto3.client: 
         global boto_config
         if not boto_config:
             from botocore.config import Config
             boto_config = Config(retries={"max_attempts": 20, "mode": "adaptive"})
+        config = boto_config
+        if max_pool_connections:
+            # for clients shared across threads. Keeps connections alive so
+            # repeated calls skip the TLS handshake.
+            from botocore.config import Config
+            config = boto_config.merge(Config(
+                max_pool_connections=max_pool_connections,
+                tcp_keepalive=True
+            ))
+        if max_attempts:
+            # for callers that retry throttling themselves, and need to
+            # see it rather than have botocore retry it.
+            from botocore.config import Config
+            config = config.merge(Config(
+                retries={"max_attempts": max_attempts, "mode": "standard"}
+            ))
+        if read_timeout:
+            # for calls that take longer than the 60s default, like
+            # invoking a long running lambda.
+            from botocore.config import Config
+            config = config.merge(Config(read_timeout=read_timeout))
         # print(f"Getting client for service {service_name}")
-        return boto3.client(service_name, region_name=region, config=boto_config)
-
+        return boto3.client(service_name, region_name=region, config=config)
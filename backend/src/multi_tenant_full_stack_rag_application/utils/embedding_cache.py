@@ -0,0 +1,169 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import hashlib
+import os
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+
+default_embedding_cache_max_entries = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 2000))
+default_embedding_cache_max_bytes = int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+default_embedding_cache_ttl = int(os.getenv('EMBEDDING_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+
+def normalize_text(text):
+    # only whitespace is normalized. Embedding models are case sensitive.
+    return ' '.join(text.split())
+
+
+def embedding_cache_key(model_id, dimensions, input_type, text):
+    text_hash = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{model_id}:{dimensions}:{input_type}:{text_hash}"
+
+
+# vectors are stored as float32, the same precision the vector store
+# keeps them at, which is about an eighth of the size of a list of floats.
+def pack_vector(vector) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def unpack_vector(data: bytes) -> [float]:
+    vector = array('f')
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class LruEmbeddingCache:
+    def __init__(self, *,
+        max_entries: int=default_embedding_cache_max_entries,
+        max_bytes: int=default_embedding_cache_max_bytes
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return unpack_vector(self.entries[key])
+
+    def put(self, key, vector):
+        data = pack_vector(vector)
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size_bytes -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size_bytes += len(data)
+            while len(self.entries) > self.max_entries or \
+                self.size_bytes > self.max_bytes:
+                (_, evicted) = self.entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Shared tier backed by a DynamoDB table with a string partition key
+# named cache_key. Items expire through the table's TTL on expires_at.
+class DynamoDbEmbeddingCache:
+    def __init__(self, table_name, dynamodb_client, *, ttl: int=default_embedding_cache_ttl):
+        self.table_name = table_name
+        self.ddb = dynamodb_client
+        self.ttl = ttl
+
+    def get(self, key):
+        response = self.ddb.get_item(
+            TableName=self.table_name,
+            Key={"cache_key": {"S": key}}
+        )
+        if 'Item' not in response:
+            return None
+        return unpack_vector(response['Item']['vector']['B'])
+
+    def put(self, key, vector):
+        self.ddb.put_item(
+            TableName=self.table_name,
+            Item={
+                "cache_key": {"S": key},
+                "vector": {"B": pack_vector(vector)},
+                "expires_at": {"N": str(int(time()) + self.ttl)}
+            }
+        )
+
+
+# Local stand-in for a shared tier, for tests and offline runs.
+class InMemorySharedEmbeddingCache:
+    def __init__(self):
+        self.items = {}
+
+    def get(self, key):
+        if key not in self.items:
+            return None
+        return unpack_vector(self.items[key])
+
+    def put(self, key, vector):
+        self.items[key] = pack_vector(vector)
+
+
+# Checks the in-process tier, then the shared tier if there is one.
+# Shared tier hits are copied into the local tier. Shared tier failures
+# are logged and treated as misses so they never fail a query.
+class EmbeddingCache:
+    def __init__(self, local: LruEmbeddingCache=None, shared=None):
+        self.local = local if local else LruEmbeddingCache()
+        self.shared = shared
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.shared_errors = 0
+
+    def get(self, key):
+        vector = self.local.get(key)
+        if vector is not None:
+            self.local_hits += 1
+            return vector
+        if self.shared:
+            try:
+                vector = self.shared.get(key)
+            except Exception as e:
+                self.shared_errors += 1
+                print(f"Shared embedding cache get failed: {e}")
+            if vector is not None:
+                self.shared_hits += 1
+                self.local.put(key, vector)
+                return vector
+        self.misses += 1
+        return None
+
+    def put(self, key, vector):
+        self.local.put(key, vector)
+        if self.shared:
+            try:
+                self.shared.put(key, vector)
+            except Exception as e:
+                self.shared_errors += 1
+                print(f"Shared embedding cache put failed: {e}")
+
+    def metrics(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.shared_hits) / lookups, 3) if lookups else 0,
+            "shared_errors": self.shared_errors,
+            "entries": len(self.local),
+            "size_bytes": self.local.size_bytes,
+            "evictions": self.local.evictions,
+        }
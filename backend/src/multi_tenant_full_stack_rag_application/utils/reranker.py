@@ -0,0 +1,160 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+import re
+from abc import ABC, abstractmethod
+
+from .tokenizer_service import estimate_token_counts
+
+
+# a Bedrock rerank model, like amazon.rerank-v1:0 or cohere.rerank-v3-5:0.
+# Without one, results keep the vector store's order but are still
+# deduped and packed into the token budget.
+default_rerank_model_id = os.getenv('RERANK_MODEL_ID', '')
+# how many times top_k candidates are fetched for the reranker to choose from.
+default_rerank_overfetch = int(os.getenv('RERANK_OVERFETCH', 3))
+# results whose word shingles overlap a better result's this much or more
+# are dropped as near-duplicates, like the same paragraph in two documents.
+default_near_duplicate_threshold = float(os.getenv('RERANK_NEAR_DUPLICATE_THRESHOLD', 0.9))
+# the most tokens of semantic search results put in a prompt's context.
+default_context_token_budget = int(os.getenv('SEMANTIC_CONTEXT_TOKEN_BUDGET', 6000))
+shingle_size = 3
+word_pattern = re.compile(r'\w+')
+
+
+class RerankScorer(ABC):
+    # returns the relevance of each of texts to query, higher is better.
+    @abstractmethod
+    def score(self, query, texts) -> [float]:
+        pass
+
+
+# Scores texts by the share of the query's distinct words they contain,
+# with ties going to the text that repeats them more. It's a stand-in
+# for a rerank model in tests and local runs, not a substitute for one.
+class LexicalOverlapScorer(RerankScorer):
+    def score(self, query, texts) -> [float]:
+        query_words = set(words(query))
+        scores = []
+        for text in texts:
+            text_words = words(text)
+            if not query_words or not text_words:
+                scores.append(0.0)
+                continue
+            matches = [word for word in text_words if word in query_words]
+            coverage = len(set(matches)) / len(query_words)
+            scores.append(coverage + len(matches) / len(text_words) / 100)
+        return scores
+
+
+# Scores texts with a Bedrock rerank model through the bedrock provider.
+# invoke_bedrock is utils.invoke_bedrock, passed in so this module
+# doesn't import utils.
+class BedrockRerankScorer(RerankScorer):
+    def __init__(self, model_id, origin, invoke_bedrock):
+        self.model_id = model_id
+        self.origin = origin
+        self.invoke_bedrock = invoke_bedrock
+
+    def score(self, query, texts) -> [float]:
+        if len(texts) == 0:
+            return []
+        result = self.invoke_bedrock('rerank', {
+            "model_id": self.model_id,
+            "query": query,
+            "texts": texts
+        }, self.origin)
+        if result.get('statusCode') != 200:
+            raise Exception(f"Failed to rerank with {self.model_id}: {result}")
+        return result['response']
+
+
+class Reranker:
+    def __init__(self, scorer: RerankScorer=None, *,
+        near_duplicate_threshold: float=default_near_duplicate_threshold,
+        overfetch: int=default_rerank_overfetch,
+        token_budget: int=default_context_token_budget,
+        token_counter=None
+    ):
+        self.scorer = scorer
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.overfetch = max(1, overfetch)
+        self.token_budget = token_budget
+        # takes a list of texts and a model ID, and returns the texts'
+        # token counts for that model.
+        self.token_counter = token_counter if token_counter else estimate_token_counts
+
+    # how many candidates to search for to rerank down to top_k.
+    def fetch_k(self, top_k):
+        return int(top_k) * self.overfetch
+
+    # Returns the best top_k of docs for query, best first, without
+    # near-duplicates and with no more than token_budget tokens of
+    # content between them. A doc that doesn't fit is skipped so smaller
+    # ones after it still can, but the best doc is always kept, even
+    # over the budget, so a search that found something isn't empty.
+    # Reranked docs get metadata.rerank_score. If the scorer fails,
+    # the docs keep their order. Tokens are counted for model_id, the
+    # model the docs will be sent to.
+    def rerank(self, query, docs, top_k, model_id=None):
+        if len(docs) == 0:
+            return []
+        texts = [doc.get('content', '') for doc in docs]
+        order = list(range(len(docs)))
+        scores = None
+        if self.scorer:
+            try:
+                scores = self.scorer.score(query, texts)
+            except Exception as e:
+                print(f"Reranking failed, keeping search order: {e}")
+            if scores:
+                order.sort(key=lambda i: scores[i], reverse=True)
+
+        kept = []
+        kept_shingles = []
+        token_counts = self.token_counter([texts[i] for i in order], model_id)
+        total_tokens = 0
+        for (i, token_count) in zip(order, token_counts):
+            if len(kept) >= int(top_k):
+                break
+            if len(kept) > 0 and total_tokens + token_count > self.token_budget:
+                continue
+            doc_shingles = shingles(texts[i])
+            if any(jaccard(doc_shingles, other) >= self.near_duplicate_threshold for other in kept_shingles):
+                continue
+            doc = docs[i]
+            if scores:
+                doc = {**doc, "metadata": {**doc.get('metadata', {}), "rerank_score": scores[i]}}
+            kept.append(doc)
+            kept_shingles.append(doc_shingles)
+            total_tokens += token_count
+        print(f"Reranked {len(docs)} docs to {len(kept)} with {total_tokens} tokens")
+        return kept
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# the search terms of every search recommendation, as the one query the
+# results of all of them are reranked against.
+def rerank_query(search_recommendations):
+    return '\n'.join(dict.fromkeys(
+        recommendation['search_terms'] for recommendation in search_recommendations
+    ))
+
+
+# the set of runs of shingle_size words in text, or of its words if it's
+# shorter than that.
+def shingles(text):
+    text_words = words(text)
+    if len(text_words) < shingle_size:
+        return {tuple(text_words)} if text_words else set()
+    return {tuple(text_words[i:i + shingle_size]) for i in range(len(text_words) - shingle_size + 1)}
+
+
+def words(text):
+    return word_pattern.findall(text.lower())
@@ -0,0 +1,196 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import os
+from importlib import import_module
+
+from .boto_client_provider import BotoClientProvider
+
+# Intra-stack RPC used by utils.invoke_lambda. Requests go through a codec
+# and a transport. The in-process transport calls the target provider's
+# handler directly when it's bundled into the same runtime and the caller
+# has opted in via RPC_IN_PROCESS_TARGETS. Everything else goes through a
+# pooled boto3 lambda client.
+
+default_max_pool_connections = int(os.getenv('RPC_MAX_POOL_CONNECTIONS', 50))
+log_payloads = os.getenv('RPC_LOG_PAYLOADS', 'false').lower() == 'true'
+
+# Maps the SSM parameter holding each provider's function name to the
+# handler that function runs.
+provider_handlers = {
+    'auth_provider_function_name': 'multi_tenant_full_stack_rag_application.auth_provider.cognito_auth_provider.handler',
+    'bedrock_provider_function_name': 'multi_tenant_full_stack_rag_application.bedrock_provider.bedrock_provider.handler',
+    'document_collections_handler_function_name': 'multi_tenant_full_stack_rag_application.document_collections_handler.document_collections_handler.handler',
+    'embeddings_provider_function_name': 'multi_tenant_full_stack_rag_application.embeddings_provider.bedrock_embeddings_provider.handler',
+    'graph_store_provider_function_name': 'multi_tenant_full_stack_rag_application.graph_store_provider.neptune_graph_store_provider.handler',
+    'ingestion_status_provider_function_name': 'multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_status_provider.handler',
+    'prompt_template_handler_function_name': 'multi_tenant_full_stack_rag_application.prompt_template_handler.prompt_template_handler.handler',
+    'tools_provider_function_name': 'multi_tenant_full_stack_rag_application.tools_provider.tools_provider.handler',
+    'vector_store_provider_function_name': 'multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_vector_store_provider.handler',
+}
+
+# providers whose implementation is chosen at deploy time.
+provider_py_path_env_vars = {
+    'embeddings_provider_function_name': 'EMBEDDINGS_PROVIDER_PY_PATH',
+    'vector_store_provider_function_name': 'VECTOR_STORE_PROVIDER_PY_PATH',
+}
+
+
+def get_handler_path(param_name):
+    if param_name in provider_py_path_env_vars:
+        py_path = os.getenv(provider_py_path_env_vars[param_name], '')
+        if py_path != '':
+            # same convention the stacks use: swap the class name for handler.
+            return '.'.join(py_path.split('.')[:-1]) + '.handler'
+    return provider_handlers[param_name]
+
+
+class JsonCodec:
+    content_type = 'application/json'
+
+    def encode(self, payload) -> bytes:
+        return json.dumps(payload).encode('utf-8')
+
+    def decode(self, data: bytes):
+        return json.loads(data.decode('utf-8'))
+
+
+class BotoLambdaTransport:
+    def __init__(self, lambda_client=None, *, max_pool_connections: int=default_max_pool_connections):
+        if not lambda_client:
+            lambda_client = BotoClientProvider.get_client(
+                'lambda',
+                max_pool_connections=max_pool_connections
+            )
+        self.lambda_ = lambda_client
+
+    def invoke(self, function_name, payload_bytes: bytes) -> bytes:
+        response = self.lambda_.invoke(
+            FunctionName=function_name,
+            InvocationType='RequestResponse',
+            Payload=payload_bytes
+        )
+        return response['Payload'].read()
+
+
+class InProcessTransport:
+    # targets is a list of keys from provider_handlers, or ['*'] for
+    # any provider that can be imported in this runtime. function_names
+    # is a callable returning the ssm params dict, so function names are
+    # resolved lazily.
+    def __init__(self, targets: [str], function_names):
+        self.targets = targets
+        self.function_names = function_names
+        self.modules = {}
+        self.unavailable = set()
+
+    def get_handler(self, function_name, handler_name='handler'):
+        module = self.get_module(function_name)
+        if not module:
+            return None
+        return getattr(module, handler_name, None)
+
+    def get_module(self, function_name):
+        if function_name in self.modules:
+            return self.modules[function_name]
+        if function_name in self.unavailable or len(self.targets) == 0:
+            return None
+        params = self.function_names() or {}
+        for param_name in provider_handlers:
+            if params.get(param_name) != function_name:
+                continue
+            if '*' not in self.targets and param_name not in self.targets:
+                break
+            py_path = get_handler_path(param_name)
+            try:
+                self.modules[function_name] = import_module('.'.join(py_path.split('.')[:-1]))
+                print(f"RPC calls to {function_name} will be dispatched in-process to {py_path}")
+                return self.modules[function_name]
+            except Exception as e:
+                print(f"In-process dispatch unavailable for {function_name}: {e}")
+                break
+        self.unavailable.add(function_name)
+        return None
+
+    def can_handle(self, function_name):
+        return self.get_handler(function_name) is not None
+
+    def invoke(self, function_name, payload):
+        handler = self.get_handler(function_name)
+        try:
+            return handler(payload, None)
+        except Exception as e:
+            # mirror the shape of a failed lambda invocation so callers that
+            # check for errorMessage behave the same way.
+            return {
+                "errorMessage": str(e),
+                "errorType": type(e).__name__
+            }
+
+    # providers can expose a stream_handler generator alongside handler.
+    # Returns None when the target doesn't have one.
+    def stream(self, function_name, payload):
+        stream_handler = self.get_handler(function_name, 'stream_handler')
+        if not stream_handler:
+            return None
+        return stream_handler(payload, None)
+
+
+class RpcClient:
+    def __init__(self, *,
+        codec=None,
+        in_process: InProcessTransport=None,
+        transport: BotoLambdaTransport=None
+    ):
+        self.codec = codec if codec else JsonCodec()
+        self.in_process = in_process
+        self.transport = transport
+
+    def get_transport(self):
+        if not self.transport:
+            self.transport = BotoLambdaTransport()
+        return self.transport
+
+    def invoke(self, function_name, payload={}, *, lambda_client=None):
+        payload_bytes = self.codec.encode(payload)
+        if log_payloads:
+            print(f"Invoking {function_name} with payload {payload}")
+        else:
+            print(f"Invoking {function_name} ({len(payload_bytes)} bytes)")
+
+        if not lambda_client and self.in_process and \
+            self.in_process.can_handle(function_name):
+            # round trip through the codec so the target sees the same
+            # data it would have received over the wire.
+            response = self.in_process.invoke(function_name, self.codec.decode(payload_bytes))
+            return self.codec.decode(self.codec.encode(response))
+
+        if lambda_client:
+            transport = BotoLambdaTransport(lambda_client)
+        else:
+            transport = self.get_transport()
+        return self.codec.decode(transport.invoke(function_name, payload_bytes))
+
+    # Yields items from the target's stream_handler when it's dispatched
+    # in-process. Lambda's RequestResponse invocations can't stream, so
+    # remote targets are invoked normally and the items in their response
+    # are yielded once it arrives.
+    def stream(self, function_name, payload={}, *, lambda_client=None):
+        if not lambda_client and self.in_process and \
+            self.in_process.can_handle(function_name):
+            items = self.in_process.stream(
+                function_name,
+                self.codec.decode(self.codec.encode(payload))
+            )
+            if items is not None:
+                print(f"Streaming {function_name} in-process")
+                for item in items:
+                    yield self.codec.decode(self.codec.encode(item))
+                return
+
+        response = self.invoke(function_name, payload, lambda_client=lambda_client)
+        if 'errorMessage' in response:
+            raise Exception(f"{function_name} failed: {response['errorMessage']}")
+        for item in response.get('response', []):
+            yield item
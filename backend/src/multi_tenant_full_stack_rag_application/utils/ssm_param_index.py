@@ -0,0 +1,140 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+from collections import OrderedDict
+from time import monotonic
+
+
+# GetParametersByPath won't return more than 10 per page.
+ssm_page_size = 10
+default_ssm_params_ttl = float(os.getenv('SSM_PARAMS_TTL_SECONDS', 300))
+# callers can look up any prefix, so only the most recent are memoized.
+default_max_prefix_results = int(os.getenv('SSM_PARAMS_MAX_PREFIX_RESULTS', 256))
+
+
+class PrefixTrie:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        # None can't collide with a single character key.
+        node[None] = key
+
+    def keys_with_prefix(self, prefix):
+        node = self.root
+        for char in prefix:
+            if char not in node:
+                return []
+            node = node[char]
+        keys = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char is None:
+                    keys.append(child)
+                else:
+                    stack.append(child)
+        return sorted(keys)
+
+
+# Holds the stack's SSM params (with the /{stack_name}/ prefix removed)
+# in an exact-key map plus a prefix trie, and reloads them from SSM once
+# they're older than ttl or after invalidate is called. Lookups are
+# memoized, least recently used first out.
+class SsmParamIndex:
+    def __init__(self, stack_name, *,
+        max_prefix_results: int=default_max_prefix_results,
+        ttl: float=default_ssm_params_ttl
+    ):
+        self.stack_name = stack_name
+        self.max_prefix_results = max_prefix_results
+        self.ttl = ttl
+        self.params = {}
+        self.trie = PrefixTrie()
+        self.prefix_results = OrderedDict()
+        self.loaded_at = None
+        self.stale = False
+
+    def build(self, params):
+        trie = PrefixTrie()
+        for name in params:
+            trie.insert(name)
+        self.params = params
+        self.trie = trie
+        self.prefix_results = OrderedDict()
+        self.loaded_at = monotonic()
+        self.stale = False
+
+    def get(self, param=None, *, ssm_client=None):
+        self.ensure_loaded(ssm_client)
+        if not param:
+            return self.params
+        return self.lookup(param)
+
+    def ensure_loaded(self, ssm_client):
+        if self.loaded_at is None or \
+            self.stale or \
+            monotonic() - self.loaded_at > self.ttl:
+            self.load_from_ssm(ssm_client)
+
+    # forces a reload from SSM on next access.
+    def invalidate(self):
+        self.stale = True
+
+    def load_from_ssm(self, ssm_client):
+        params = {}
+        path = f"/{self.stack_name}"
+        next_token = ''
+        pages = 0
+        while next_token != None:
+            args = {
+                "Path": path,
+                "Recursive": True,
+                "MaxResults": ssm_page_size,
+            }
+            if next_token != '':
+                args['NextToken'] = next_token
+            response = ssm_client.get_parameters_by_path(**args)
+            pages += 1
+            for p in response['Parameters']:
+                name = p['Name'].replace(f'/{self.stack_name}/', '')
+                if name == 'origin_frontend' and \
+                    not p['Value'].startswith('http'):
+                    p['Value'] = 'https://' + p['Value']
+                params[name] = p['Value']
+            if 'NextToken' in response.keys():
+                next_token = response['NextToken']
+            else:
+                next_token = None
+        print(f"Loaded {len(params)} ssm params in {pages} pages")
+        self.build(params)
+
+    # Same results as scanning every name with startswith: None for no
+    # matches, the value for a single match, or a dict of name: value.
+    def lookup(self, param):
+        if param in self.prefix_results:
+            self.prefix_results.move_to_end(param)
+        else:
+            self.prefix_results[param] = self.match(param)
+            while len(self.prefix_results) > self.max_prefix_results:
+                self.prefix_results.popitem(last=False)
+        result = self.prefix_results[param]
+        if isinstance(result, dict):
+            # callers may modify what they get back.
+            return dict(result)
+        return result
+
+    def match(self, param):
+        names = self.trie.keys_with_prefix(param)
+        if len(names) == 0:
+            result = None
+        elif len(names) == 1:
+            result = self.params[names[0]]
+        else:
+            result = {name: self.params[name] for name in names}
+        return result
@@ -0,0 +1,299 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import re
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from math import ceil
+from itertools import repeat
+from operator import mul
+from threading import Lock
+
+
+# tokenizers are looked for at {vocab_dir}/{model_id}/tokenizer.json (a
+# hugging face tokenizer file) or {vocab_dir}/{model_id}/vocab.txt (a
+# BERT style WordPiece vocab), by default in a lambda layer. Models
+# without either use the words * 1.3 estimate.
+default_tokenizer_vocab_dir = os.getenv('TOKENIZER_VOCAB_DIR', '/opt/tokenizer_vocabs')
+default_tokenizer_max_loaded = int(os.getenv('TOKENIZER_MAX_LOADED', 4))
+default_tokenizer_word_cache_size = int(os.getenv('TOKENIZER_WORD_CACHE_SIZE', 65536))
+default_tokenizer_model = os.getenv('EMBEDDING_MODEL_ID')
+
+
+class Tokenizer(ABC):
+    @abstractmethod
+    def count(self, text) -> int:
+        pass
+
+    def count_many(self, texts) -> [int]:
+        return list(map(self.count, texts))
+
+
+# The estimate everything used before there were tokenizers. It's kept
+# as the fallback so chunking, and so chunk fingerprints, don't change
+# for models without a vocab file.
+class WordEstimateTokenizer(Tokenizer):
+    def count(self, text) -> int:
+        # line breaks are all whitespace, so this is the same count as
+        # len(text.split()) without a list of every word in the text.
+        return ceil(sum(map(len, map(str.split, text.splitlines()))) * 1.3)
+
+    def count_many(self, texts) -> [int]:
+        return list(map(ceil, map(mul, map(len, map(str.split, texts)), repeat(1.3))))
+
+
+# a token_counter for callers without a TokenizerService. model_id is
+# ignored.
+def estimate_token_counts(texts, model_id=None) -> [int]:
+    return WordEstimateTokenizer().count_many(texts)
+
+
+# Counts tokens the way BERT style WordPiece tokenizers do: text is
+# cleaned, optionally lower cased and stripped of accents, split on
+# whitespace and punctuation, with each CJK character a word of its own,
+# and then each word is matched greedily against the vocab, longest
+# prefix first. Special tokens like [CLS] aren't counted.
+class WordPieceTokenizer(Tokenizer):
+    def __init__(self, vocab, *,
+        continuing_subword_prefix: str='##',
+        lowercase: bool=True,
+        max_input_chars_per_word: int=100,
+        word_cache_size: int=default_tokenizer_word_cache_size
+    ):
+        self.vocab = vocab if isinstance(vocab, (set, frozenset)) else frozenset(vocab)
+        self.continuing_subword_prefix = continuing_subword_prefix
+        self.lowercase = lowercase
+        self.max_input_chars_per_word = max_input_chars_per_word
+        self.count_word = lru_cache(maxsize=word_cache_size)(self.count_word_pieces)
+
+    def count(self, text) -> int:
+        return sum(map(self.count_word, self.pre_tokenize(text)))
+
+    def count_word_pieces(self, word) -> int:
+        if len(word) > self.max_input_chars_per_word:
+            return 1
+        pieces = 0
+        start = 0
+        while start < len(word):
+            end = len(word)
+            while end > start:
+                piece = word[start:end]
+                if start > 0:
+                    piece = self.continuing_subword_prefix + piece
+                if piece in self.vocab:
+                    break
+                end -= 1
+            if end == start:
+                # the whole word becomes one unknown token.
+                return 1
+            pieces += 1
+            start = end
+        return pieces
+
+    @staticmethod
+    def is_cjk(char):
+        code = ord(char)
+        return 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or \
+            0x20000 <= code <= 0x2A6DF or 0x2A700 <= code <= 0x2CEAF or \
+            0xF900 <= code <= 0xFAFF or 0x2F800 <= code <= 0x2FA1F
+
+    @staticmethod
+    def is_punctuation(char):
+        code = ord(char)
+        if 33 <= code <= 47 or 58 <= code <= 64 or 91 <= code <= 96 or 123 <= code <= 126:
+            return True
+        return unicodedata.category(char).startswith('P')
+
+    def pre_tokenize(self, text):
+        if self.lowercase:
+            text = text.lower()
+        if text.isascii():
+            # the same rules, with the regex engine doing the work.
+            return wordpiece_ascii_pattern.findall(wordpiece_ascii_control_pattern.sub('', text))
+        if self.lowercase:
+            text = unicodedata.normalize('NFD', text)
+        words = []
+        word = []
+        for char in text:
+            category = unicodedata.category(char)
+            if char in '\x00\ufffd' or (category in ('Cc', 'Cf') and char not in '\t\n\r'):
+                continue
+            if self.lowercase and category == 'Mn':
+                # accents, once NFD has separated them from their letters.
+                continue
+            if char in ' \t\n\r' or category == 'Zs':
+                if word:
+                    words.append(''.join(word))
+                    word = []
+            elif self.is_punctuation(char) or self.is_cjk(char):
+                if word:
+                    words.append(''.join(word))
+                    word = []
+                words.append(char)
+            else:
+                word.append(char)
+        if word:
+            words.append(''.join(word))
+        return words
+
+
+wordpiece_ascii_control_pattern = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+wordpiece_ascii_pattern = re.compile(r'[A-Za-z0-9]+|[!-/:-@\[-`{-~]')
+
+
+def bytes_to_unicode():
+    printable = list(range(ord('!'), ord('~') + 1)) + \
+        list(range(ord('¡'), ord('¬') + 1)) + \
+        list(range(ord('®'), ord('ÿ') + 1))
+    mapping = {}
+    extra = 0
+    for byte in range(256):
+        if byte in printable:
+            mapping[byte] = chr(byte)
+        else:
+            mapping[byte] = chr(256 + extra)
+            extra += 1
+    return mapping
+
+
+# GPT-2's pre-tokenizer pattern. re has no \p{L} or \p{N}, so letters are
+# [^\W\d_] and numbers \d, which agree with them for nearly all text.
+byte_level_pattern = re.compile(
+    r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"""
+)
+
+
+# Counts tokens the way byte level BPE tokenizers (GPT-2, RoBERTa and
+# the like) do: text is split into words with the GPT-2 pattern, each
+# word's utf-8 bytes are mapped to printable characters, and the merges
+# are applied in rank order.
+class ByteLevelBpeTokenizer(Tokenizer):
+    def __init__(self, merges, *,
+        word_cache_size: int=default_tokenizer_word_cache_size
+    ):
+        self.merge_ranks = {tuple(merge): rank for rank, merge in enumerate(merges)}
+        self.byte_encoder = bytes_to_unicode()
+        self.count_word = lru_cache(maxsize=word_cache_size)(self.count_merged)
+
+    def count(self, text) -> int:
+        return sum(map(self.count_word, byte_level_pattern.findall(text)))
+
+    def count_merged(self, word) -> int:
+        symbols = [self.byte_encoder[byte] for byte in word.encode('utf-8')]
+        while len(symbols) > 1:
+            pairs = [
+                pair for pair in zip(symbols, symbols[1:])
+                if pair in self.merge_ranks
+            ]
+            if not pairs:
+                break
+            (first, second) = min(pairs, key=self.merge_ranks.get)
+            merged = []
+            i = 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and symbols[i] == first and symbols[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(symbols[i])
+                    i += 1
+            symbols = merged
+        return len(symbols)
+
+
+# Builds a tokenizer from a hugging face tokenizer.json with a WordPiece
+# or byte level BPE model, or from a WordPiece vocab.txt with one token
+# per line. Raises ValueError for other kinds of tokenizer.
+def load_tokenizer(path) -> Tokenizer:
+    if path.endswith('.txt'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return WordPieceTokenizer(line.rstrip('\n') for line in f)
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    model = config.get('model', {})
+    if model.get('type') == 'WordPiece':
+        normalizer = config.get('normalizer') or {}
+        return WordPieceTokenizer(
+            model['vocab'].keys(),
+            continuing_subword_prefix=model.get('continuing_subword_prefix', '##'),
+            lowercase=normalizer.get('lowercase', True),
+            max_input_chars_per_word=model.get('max_input_chars_per_word', 100)
+        )
+    pre_tokenizer = json.dumps(config.get('pre_tokenizer'))
+    if model.get('type') == 'BPE' and 'ByteLevel' in pre_tokenizer:
+        return ByteLevelBpeTokenizer(
+            merge.split(' ', 1) if isinstance(merge, str) else merge
+            for merge in model['merges']
+        )
+    raise ValueError(f"Unsupported tokenizer in {path}: {model.get('type')} with pre_tokenizer {pre_tokenizer}")
+
+
+# Gives each model its own tokenizer, loaded from vocab_dir the first
+# time the model's tokens are counted. Up to max_loaded tokenizers are
+# kept, least recently used first out, since vocabs can be large. Models
+# with no vocab file, or one that can't be loaded, use the fallback.
+class TokenizerService:
+    def __init__(self, *,
+        default_model_id: str=default_tokenizer_model,
+        fallback: Tokenizer=None,
+        loader=load_tokenizer,
+        max_loaded: int=default_tokenizer_max_loaded,
+        vocab_dir: str=default_tokenizer_vocab_dir
+    ):
+        self.default_model_id = default_model_id
+        self.fallback = fallback if fallback else WordEstimateTokenizer()
+        self.loader = loader
+        self.max_loaded = max_loaded
+        self.vocab_dir = vocab_dir
+        self.tokenizers = OrderedDict()
+        self.missing = set()
+        self.loads = 0
+        self.lock = Lock()
+
+    def count(self, text, model_id=None) -> int:
+        return self.get_tokenizer(model_id).count(text)
+
+    def count_many(self, texts, model_id=None) -> [int]:
+        return self.get_tokenizer(model_id).count_many(texts)
+
+    # whether model_id's tokens are counted with its own tokenizer, rather
+    # than estimated.
+    def has_tokenizer(self, model_id) -> bool:
+        return bool(model_id) and self.get_tokenizer(model_id) is not self.fallback
+
+    def find_vocab_file(self, model_id):
+        for filename in ['tokenizer.json', 'vocab.txt']:
+            path = os.path.join(self.vocab_dir, model_id, filename)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def get_tokenizer(self, model_id=None) -> Tokenizer:
+        if not model_id:
+            model_id = self.default_model_id
+        if not model_id or model_id in self.missing:
+            return self.fallback
+        with self.lock:
+            if model_id in self.tokenizers:
+                self.tokenizers.move_to_end(model_id)
+                return self.tokenizers[model_id]
+            path = self.find_vocab_file(model_id)
+            tokenizer = None
+            if path:
+                try:
+                    tokenizer = self.loader(path)
+                    self.loads += 1
+                    print(f"Loaded tokenizer for {model_id} from {path}")
+                except Exception as e:
+                    print(f"Couldn't load tokenizer for {model_id} from {path}, estimating instead: {e}")
+            if not tokenizer:
+                self.missing.add(model_id)
+                return self.fallback
+            self.tokenizers[model_id] = tokenizer
+            while len(self.tokenizers) > self.max_loaded:
+                self.tokenizers.popitem(last=False)
+            return tokenizer
@@ -7,8 +7,13 @@ import os
 import requests
 from aws_requests_auth.aws_auth import AWSRequestsAuth
 from math import ceil
+from time import monotonic
 
 from .boto_client_provider import BotoClientProvider
+from .embedding_cache import DynamoDbEmbeddingCache, EmbeddingCache, embedding_cache_key
+from .rpc_client import InProcessTransport, RpcClient
+from .ssm_param_index import SsmParamIndex
+from .tokenizer_service import TokenizerService
 
 sanitize_attributes = ['user_id', 'shared_by_userid', 'shared_with_userid']
 
@@ -16,12 +21,18 @@ bedrock_agent_client_singleton = None
 bedrock_agent_runtime_client_singleton = None
 bedrock_client_singleton = None
 bedrock_runtime_client_singleton = None
+embedding_cache_singleton = None
 
 lambda_client_singleton = None
+rpc_client_singleton = None
 s3_client_singleton = None
 sqs_client_singleton = None
 ssm_client_singleton = None
-ssm_params = None
+ssm_param_index = None
+tokenizer_service_singleton = None
+# {collection_id: (dimensions, monotonic time loaded)}
+vector_index_dimensions = {}
+default_vector_index_dimensions_ttl = int(os.getenv('VECTOR_INDEX_DIMENSIONS_TTL_SECONDS', 60))
 stack_name = os.getenv('STACK_NAME')
 if not stack_name:
     raise Exception('STACK_NAME variable must be set in the lambda environment.')
@@ -72,6 +83,22 @@ def upsert_doc_collection(collection, origin, *, account_id=None, lambda_client=
     return response
 
 
+# creates the collection's vector index with the given index profile, if
+# it doesn't exist yet.
+def create_vector_index(collection_id, index_profile, origin):
+    return invoke_lambda(
+        get_ssm_params('vector_store_provider_function_name'),
+        {
+            "operation": "create_index",
+            "origin": origin,
+            "args": {
+                "collection_id": collection_id,
+                "index_profile": index_profile
+            }
+        }
+    )
+
+
 def delete_ingestion_status(user_id, doc_id, origin, *, delete_from_s3=False):
     return invoke_lambda(
         get_ssm_params('ingestion_status_provider_function_name'),
@@ -86,6 +113,26 @@ def delete_ingestion_status(user_id, doc_id, origin, *, delete_from_s3=False):
         }
     )
 
+def delete_vector_docs(doc_ids, collection_id, origin):
+    if len(doc_ids) == 0:
+        return 0
+    response = invoke_lambda(
+        get_ssm_params('vector_store_provider_function_name'),
+        {
+            "operation": "delete_records",
+            "origin": origin,
+            "args": {
+                "collection_id": collection_id,
+                "doc_ids": doc_ids
+            }
+        }
+    )
+    body = json.loads(response['body'])
+    if len(body['errors']) > 0:
+        print(f"delete_vector_docs failed to delete {len(body['errors'])} docs: {body['errors']}")
+    return len(body['doc_ids'])
+
+
 def download_from_s3(bucket, s3_path):
     ts = datetime.now().isoformat()
     tmpdir = f"/tmp/{ts}"
@@ -99,7 +146,16 @@ def download_from_s3(bucket, s3_path):
     return local_file_path
 
 def embed_text(text, origin, embedding_type='search_query', *, dimensions=1024, lambda_client=None):
-    print(f'utils.embed_text got text {text}, origin {origin}')
+    print(f'utils.embed_text got text of {len(text)} chars, origin {origin}')
+    cache = get_embedding_cache()
+    # fall back to the function name on stacks that don't publish the model id.
+    model_id = get_ssm_params('embeddings_model_id') or \
+        get_ssm_params('embeddings_provider_function_name')
+    cache_key = embedding_cache_key(model_id, dimensions, embedding_type, text)
+    embeddings = cache.get(cache_key)
+    if embeddings is not None:
+        print(f"utils.embed_text cache hit, metrics {cache.metrics()}")
+        return embeddings
     response = invoke_lambda(
         get_ssm_params('embeddings_provider_function_name'),
         {
@@ -113,9 +169,37 @@ def embed_text(text, origin, embedding_type='search_query', *, dimensions=1024,
         }, 
         lambda_client=lambda_client
     )
-    print(f"utils.embed_text received response {response} from invoke_lambda")
     embeddings = json.loads(response['body'])['response']
-    print(f"utils.embed_text returning {embeddings}")
+    cache.put(cache_key, embeddings)
+    print(f"utils.embed_text returning vector of {len(embeddings)} dimensions, cache metrics {cache.metrics()}")
+    return embeddings
+
+
+# batched version of embed_text. Returns one vector per input text, in
+# the same order as texts, using a single embeddings provider invocation.
+def embed_texts(texts, origin, embedding_type='search_document', *, dimensions=1024, lambda_client=None):
+    if len(texts) == 0:
+        return []
+    print(f'utils.embed_texts got {len(texts)} texts, origin {origin}')
+    response = invoke_lambda(
+        get_ssm_params('embeddings_provider_function_name'),
+        {
+            'operation': 'embed_texts',
+            'origin': origin, 
+            'args': {
+                'input_texts': texts,
+                'dimensions': dimensions,
+                'embedding_type': embedding_type
+            }
+        }, 
+        lambda_client=lambda_client
+    )
+    if "errorMessage" in response:
+        raise Exception(f"Error embedding texts: {response}")
+    embeddings = json.loads(response['body'])['response']
+    if len(embeddings) != len(texts):
+        raise Exception(f"utils.embed_texts expected {len(texts)} vectors but got {len(embeddings)}")
+    print(f"utils.embed_texts returning {len(embeddings)} vectors")
     return embeddings
 
 
@@ -168,6 +252,24 @@ def get_bedrock_runtime_client():
     return bedrock_runtime_client_singleton
 
 
+# returns {collection_id: version}. A collection's version changes
+# whenever ingestion of one of its documents finishes or it's deleted.
+def get_collection_versions(collection_ids, origin):
+    response = invoke_lambda(
+        get_ssm_params('ingestion_status_provider_function_name'),
+        {
+            "operation": "get_collection_versions",
+            "origin": origin,
+            "args": {
+                "collection_ids": collection_ids
+            }
+        }
+    )
+    if "errorMessage" in response:
+        raise Exception(f"Error getting collection versions for {collection_ids}: {response}")
+    return json.loads(response['body'])
+
+
 def get_document_collections(user_id, collection_id=None, *, account_id=None, consistent=False, lambda_client=None, origin=None):
     if not user_id:
         raise Exception("Must send user ID with request to get document collections.")
@@ -229,6 +331,20 @@ def get_document_collections(user_id, collection_id=None, *, account_id=None, co
     return dcs
         
 
+def get_embedding_cache():
+    global embedding_cache_singleton
+    if not embedding_cache_singleton:
+        shared = None
+        table_name = os.getenv('EMBEDDING_CACHE_TABLE', '')
+        if table_name != '':
+            shared = DynamoDbEmbeddingCache(
+                table_name,
+                BotoClientProvider.get_client('dynamodb')
+            )
+        embedding_cache_singleton = EmbeddingCache(shared=shared)
+    return embedding_cache_singleton
+
+
 def get_graph_schema(user_id, collection_name, *, account_id=None, lambda_client=None, origin=None): 
     if not user_id:
         raise Exception("Must send user ID with request to get_graph_schema.")
@@ -304,6 +420,27 @@ def get_identity_pool_id():
     return get_ssm_params('identity_pool_id')
 
 
+# returns the ingestion status dict for exactly doc_id, or None.
+def get_ingestion_status(user_id, doc_id, origin):
+    response = invoke_lambda(
+        get_ssm_params('ingestion_status_provider_function_name'),
+        {
+            "operation": "get_ingestion_status",
+            "origin": origin,
+            "args": {
+                "user_id": user_id,
+                "doc_id": doc_id
+            }
+        }
+    )
+    if "errorMessage" in response:
+        raise Exception(f"Error getting ingestion status for {doc_id}: {response}")
+    for status in json.loads(response['body']):
+        if status['doc_id'] == doc_id:
+            return status
+    return None
+
+
 def get_model_dimensions(origin, model_id=None):
     fn_name = get_ssm_params('embeddings_provider_function_name')
     return invoke_lambda(
@@ -366,6 +503,20 @@ def get_prompt_template(template_id, user_id, origin, *, account_id=None, lambda
     return response
 
 
+def get_rpc_client():
+    global rpc_client_singleton
+    if not rpc_client_singleton:
+        in_process_targets = [
+            target.strip() for target in 
+            os.getenv('RPC_IN_PROCESS_TARGETS', '').split(',') 
+            if target.strip() != ''
+        ]
+        rpc_client_singleton = RpcClient(
+            in_process=InProcessTransport(in_process_targets, get_ssm_params)
+        )
+    return rpc_client_singleton
+
+
 def get_s3_client():
     global s3_client_singleton
     if not s3_client_singleton:
@@ -381,60 +532,36 @@ def get_ssm_client():
 
 
 # use without a param to get all params in the 
-# stack
+# stack. Otherwise returns the value of the only param starting
+# with param, a dict of all of them if there are several, or None.
 def get_ssm_params(param=None,*, ssm_client=None):
-    global ssm_params
+    global ssm_param_index
     if not ssm_client:
         ssm_client = get_ssm_client()
-    # print(f"Stack name is {stack_name}")
-    if not ssm_params:  
-        ssm_params = {}
-        next_token = ''
-        path =  f"/{stack_name}"
-        # print(f"Getting all params with prefix {path}")
-        while next_token != None:
-            args = {
-                "Path": path,
-                "Recursive": True,
-                "MaxResults": 10,
-            }
-            if next_token != '':
-                args['NextToken'] = next_token
-            # print(f"Calling get_parameters_by_path with arg {args}")
-            response = ssm_client.get_parameters_by_path(**args)
-            # print(f"get_parameters_by_path response = {response}")
-            for p in response['Parameters']:
-                name = p['Name'].replace(f'/{stack_name}/', '')
-                if name == 'origin_frontend' and \
-                    not p['Value'].startswith('http'):
-                    p['Value'] = 'https://' + p['Value']
-                ssm_params[name] = p['Value']
-            if 'NextToken' in response.keys():
-                next_token = response['NextToken']
-            else:
-                next_token = None
-    # print(f"All ssm_params: {json.dumps(ssm_params, indent=2)}")
-    if param:
-        # print(f"Got here and param is {param}")
-        return_vals = {}
-        for param_name in ssm_params:
-            if param_name.startswith(param):
-                return_vals[param_name] = ssm_params[param_name]
-        
-        if len(return_vals.keys()) == 0:
-            return None
-        elif len(return_vals.keys()) == 1:
-            return return_vals[list(return_vals.keys())[0]]
-        else:
-            print(f"get_ssm_params got {return_vals}")
-            return return_vals
-    else:
-        print(f"Returning all params {ssm_params}")
-        return ssm_params
+    if not ssm_param_index:
+        ssm_param_index = SsmParamIndex(stack_name)
+    return ssm_param_index.get(param, ssm_client=ssm_client)
+
+
+# model_id defaults to the EMBEDDING_MODEL_ID the function was deployed
+# with. Models without a tokenizer vocab get the words * 1.3 estimate.
+def get_token_count(text, model_id=None):
+    return get_tokenizer_service().count(text, model_id)
+
+
+def get_token_counts(texts, model_id=None):
+    return get_tokenizer_service().count_many(texts, model_id)
+
+
+def has_tokenizer(model_id):
+    return get_tokenizer_service().has_tokenizer(model_id)
 
 
-def get_token_count(text):
-    return ceil(len(text.split())* 1.3)
+def get_tokenizer_service():
+    global tokenizer_service_singleton
+    if not tokenizer_service_singleton:
+        tokenizer_service_singleton = TokenizerService()
+    return tokenizer_service_singleton
 
 
 def get_userid_from_token(auth_token, origin, *, lambda_client=None ):
@@ -472,6 +599,36 @@ def get_user_pool_id():
     return get_ssm_params('user_pool_id')
 
 
+# the dimensions a collection's vector index stores, so loaders embed
+# chunks at that size and save doesn't have to embed them again. Cached
+# for a minute, as a migration can change them.
+def get_vector_index_dimensions(collection_id, origin, *, lambda_client=None):
+    cached = vector_index_dimensions.get(collection_id)
+    if cached and monotonic() - cached[1] <= default_vector_index_dimensions_ttl:
+        return cached[0]
+    response = invoke_lambda(
+        get_ssm_params('vector_store_provider_function_name'),
+        {
+            "operation": "get_index_profile",
+            "origin": origin,
+            "args": {
+                "collection_id": collection_id
+            }
+        },
+        lambda_client=lambda_client
+    )
+    if "errorMessage" in response:
+        raise Exception(f"Error getting the index profile of {collection_id}: {response}")
+    dimensions = json.loads(response['body'])['dimensions']
+    vector_index_dimensions[collection_id] = (dimensions, monotonic())
+    return dimensions
+
+
+def invalidate_ssm_params():
+    if ssm_param_index:
+        ssm_param_index.invalidate()
+
+
 def invoke_bedrock(operation, kwargs, origin):
     fn_name = get_ssm_params('bedrock_provider_function_name')
     payload = {
@@ -479,34 +636,33 @@ def invoke_bedrock(operation, kwargs, origin):
         "origin": origin,
         "args": kwargs
     }
-    print(f'invoking {fn_name} with payload {payload}')
+    print(f'invoking {fn_name} operation {operation}')
     response = invoke_lambda(
         fn_name,
         payload,
     )
-    print(f"invoke_bedrock got response from lambda {response}")
+    print(f"invoke_bedrock got {operation} response from lambda with status {response.get('statusCode')}")
     return response
 
 
-def invoke_lambda(function_name, payload={}, *, lambda_client=None):
-    global lambda_client_singleton
-    if not lambda_client:
-        if not lambda_client_singleton:
-            lambda_client_singleton = BotoClientProvider.get_client('lambda')
-        lambda_client = lambda_client_singleton
+# yields text deltas for operations like invoke_model_stream.
+def invoke_bedrock_stream(operation, kwargs, origin):
+    fn_name = get_ssm_params('bedrock_provider_function_name')
+    payload = {
+        "operation": operation,
+        "origin": origin,
+        "args": kwargs
+    }
+    print(f'streaming {fn_name} operation {operation}')
+    return get_rpc_client().stream(fn_name, payload)
 
-    print(f"Invoking {function_name}")
-    print(f"Invoking lambda with payload: {payload}")
 
-    payload_bytes = json.dumps(payload).encode('utf-8')
-    print(f"Payload bytes: {payload_bytes}")
-    response = lambda_client.invoke(
-        FunctionName=function_name,
-        InvocationType='RequestResponse',
-        Payload=payload_bytes
+def invoke_lambda(function_name, payload={}, *, lambda_client=None):
+    return get_rpc_client().invoke(
+        function_name, 
+        payload, 
+        lambda_client=lambda_client
     )
-    response = json.loads(response['Payload'].read().decode("utf-8"))
-    return response
 
 
 # def invoke_service(method, url, user_creds, *, body={}):
@@ -551,6 +707,25 @@ def invoke_lambda(function_name, payload={}, *, lambda_client=None):
 #     return response
 
 
+# reindexes the collection's documents into a new index with the given
+# index profile, then points the collection at it.
+def migrate_vector_index(collection_id, index_profile, origin, *, lambda_client=None):
+    response = invoke_lambda(
+        get_ssm_params('vector_store_provider_function_name'),
+        {
+            "operation": "migrate_index",
+            "origin": origin,
+            "args": {
+                "collection_id": collection_id,
+                "index_profile": index_profile
+            }
+        },
+        lambda_client=lambda_client
+    )
+    print(f"migrate_vector_index got response {response}")
+    return response
+
+
 def neptune_statement(collection_id, statement, statement_type, origin):
     response = invoke_lambda(
         get_ssm_params('graph_store_provider_function_name'),
@@ -588,7 +763,8 @@ def save_vector_docs(docs, collection_id, origin):
     converted_docs = []
     for doc in docs:
         converted_docs.append(doc.to_dict())
-    print(f"utils.save_vector_docs called with {converted_docs}, {collection_id}, {origin}")
+    # the docs include their vectors, so only log how many there are.
+    print(f"utils.save_vector_docs called with {len(converted_docs)} docs, {collection_id}, {origin}")
     evt = {
         "operation": "save",
         "origin": origin,
@@ -597,13 +773,24 @@ def save_vector_docs(docs, collection_id, origin):
             "documents": converted_docs
         }
     }
-    print(f"utils.save_vector_docs sending event {evt}")
     response = invoke_lambda(
         get_ssm_params('vector_store_provider_function_name'),
         evt
     )
     print(f"save_vector_docs got response {response}")
-    return len(converted_docs)
+    # loaders only record the fingerprints of saved chunks, so anything
+    # but a successful save counts as nothing saved.
+    if 'errorMessage' in response or 'body' not in response or \
+        int(response.get('statusCode', 0)) != 200:
+        print(f"save_vector_docs failed to save {len(converted_docs)} docs: {response}")
+        return 0
+    body = json.loads(response['body'])
+    if not isinstance(body, dict) or 'doc_ids' not in body:
+        print(f"save_vector_docs got an unexpected response body {body}")
+        return 0
+    if len(body.get('errors', [])) > 0:
+        print(f"save_vector_docs failed to save {len(body['errors'])} docs: {body['errors']}")
+    return len(body['doc_ids'])
 
 
 def search_vector_docs(search_recommendations, top_k, origin):
@@ -625,7 +812,7 @@ def search_vector_docs(search_recommendations, top_k, origin):
     return response
 
 
-def set_ingestion_status(user_id, doc_id, etag, lines_processed, progress_status, origin):
+def set_ingestion_status(user_id, doc_id, etag, lines_processed, progress_status, origin, *, chunks_processed=0):
     response = invoke_lambda(
         get_ssm_params('ingestion_status_provider_function_name'),
         {
@@ -637,6 +824,7 @@ def set_ingestion_status(user_id, doc_id, etag, lines_processed, progress_status
                 "etag": etag,
                 "lines_processed": lines_processed,
                 "progress_status": progress_status,
+                "chunks_processed": chunks_processed,
                 "origin": "system"
             }
         }
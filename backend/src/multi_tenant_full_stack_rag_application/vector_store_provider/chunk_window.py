@@ -0,0 +1,102 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import os
+
+from multi_tenant_full_stack_rag_application.vector_store_provider.search_result_fusion import hit_key
+
+
+# how many chunks either side of each search hit are added to it.
+default_chunk_window = int(os.getenv('VECTOR_STORE_CHUNK_WINDOW', 0))
+# the most chunks fetched for the parent documents of one search.
+default_max_parent_chunks = int(os.getenv('VECTOR_STORE_MAX_PARENT_CHUNKS', 500))
+
+
+# The loaders give chunks positional IDs, {source}:{chunk number}, so a
+# hit's neighbors can be fetched by ID. Returns (source, chunk number),
+# or None for documents that aren't chunks, like JSON records.
+def chunk_position(doc_id):
+    (source, sep, num) = doc_id.rpartition(':')
+    if sep and source and num.isdigit():
+        return (source, int(num))
+    return None
+
+
+def window(num, chunk_window):
+    return range(max(0, num - chunk_window), num + chunk_window + 1)
+
+
+# The (index, ID) of every neighbor of the hits within chunk_window that
+# isn't a hit itself, for fetching them all at once.
+def neighbor_keys(results, chunk_window):
+    hits = {hit_key(hit) for (_, hit) in results}
+    keys = {}
+    for (_, hit) in results:
+        position = chunk_position(hit['_id'])
+        if not position:
+            continue
+        (source, num) = position
+        for neighbor in window(num, chunk_window):
+            key = (hit.get('_index'), f"{source}:{neighbor}")
+            if key not in hits:
+                keys[key] = True
+    return list(keys)
+
+
+# The sources of the hits that are chunks, for fetching every chunk of
+# their parent documents.
+def parent_sources(results):
+    sources = {}
+    for (_, hit) in results:
+        source = hit['_source'].get('metadata', {}).get('source')
+        if chunk_position(hit['_id']) and isinstance(source, str):
+            sources[source] = True
+    return list(sources)
+
+
+# Merges each hit with its fetched neighbors, given as a mapping of
+# (index, ID) to _source, or with every fetched chunk of its source if
+# chunk_window is None. Hits from the same source become one hit, with
+# its best score and the content of all their chunks in order, so
+# overlapping windows aren't repeated. metadata.chunks lists the chunk
+# numbers included. results are (score, hit), best first.
+def expand_chunk_windows(results, neighbors, chunk_window):
+    fetched = {}
+    for ((index, doc_id), source) in neighbors.items():
+        position = chunk_position(doc_id)
+        if position:
+            fetched.setdefault((index, position[0]), {})[position[1]] = source['content']
+
+    groups = {}
+    for (score, hit) in results:
+        position = chunk_position(hit['_id'])
+        if not position:
+            groups[('hit',) + hit_key(hit)] = (score, hit, None)
+            continue
+        (source, num) = position
+        group_key = ('source', hit.get('_index'), source)
+        if group_key not in groups:
+            groups[group_key] = (score, hit, {})
+        chunks = groups[group_key][2]
+        chunks[num] = hit['_source']['content']
+        source_chunks = fetched.get((hit.get('_index'), source), {})
+        nums = source_chunks.keys() if chunk_window is None else window(num, chunk_window)
+        for neighbor in nums:
+            if neighbor in source_chunks and neighbor not in chunks:
+                chunks[neighbor] = source_chunks[neighbor]
+
+    expanded = []
+    for (score, hit, chunks) in groups.values():
+        if chunks is None:
+            expanded.append((score, hit))
+            continue
+        chunk_nums = sorted(chunks)
+        expanded.append((score, {
+            **hit,
+            "_source": {
+                **hit['_source'],
+                "content": '\n'.join(chunks[num] for num in chunk_nums),
+                "metadata": {**hit['_source'].get('metadata', {}), "chunks": chunk_nums}
+            }
+        }))
+    return expanded
@@ -0,0 +1,84 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import re
+
+
+# Filters a search recommendation can carry to scope a search to some of
+# a collection's documents:
+# {
+#     "source": a document's source, or a list of them. A value without a
+#               slash matches any source with that file name.
+#     "upsert_date": {"gte": date, "lte": date}, or gt/lt. Dates are ISO
+#                    8601, or date math like "now-7d/d".
+#     "fields": {metadata field: value or list of values}, matched exactly.
+# }
+# Metadata is dynamically mapped, so strings are text with a keyword
+# subfield, and dates in upsert_date are dates.
+field_name_pattern = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]*$')
+range_operators = ['gt', 'gte', 'lt', 'lte']
+filter_keys = ['fields', 'source', 'upsert_date']
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def exact_match(field, values):
+    clauses = []
+    for value in as_list(values):
+        if isinstance(value, (bool, int, float)):
+            clauses.append({"term": {f"metadata.{field}": value}})
+        elif isinstance(value, str):
+            clauses.append({"term": {f"metadata.{field}.keyword": value}})
+        else:
+            raise ValueError(f"Filter values for {field} must be strings, numbers or booleans, got {value}.")
+    if len(clauses) == 0:
+        raise ValueError(f"The filter for {field} has no values.")
+    return clauses[0] if len(clauses) == 1 else {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+
+def escape_wildcard(value):
+    return re.sub(r'([\\*?])', r'\\\1', value)
+
+
+def source_match(sources):
+    clauses = []
+    for source in as_list(sources):
+        if not isinstance(source, str) or not source:
+            raise ValueError(f"Source filters must be non-empty strings, got {source}.")
+        clauses.append({"term": {"metadata.source.keyword": source}})
+        if '/' not in source:
+            clauses.append({"wildcard": {"metadata.source.keyword": {"value": f"*/{escape_wildcard(source)}"}}})
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+
+def date_range(field, bounds):
+    if not isinstance(bounds, dict) or len(bounds) == 0 or \
+        any(op not in range_operators for op in bounds):
+        raise ValueError(f"The {field} filter must be a mapping of {range_operators} to dates, got {bounds}.")
+    return {"range": {f"metadata.{field}": bounds}}
+
+
+# Builds an OpenSearch bool filter from filters, or returns None if there
+# aren't any. Raises ValueError for filters it can't build.
+def build_metadata_filter(filters):
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError(f"Filters must be a mapping, got {filters}.")
+    unknown = [key for key in filters if key not in filter_keys]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown filters {unknown}. Use {filter_keys}.")
+    clauses = []
+    if filters.get('source'):
+        clauses.append(source_match(filters['source']))
+    if filters.get('upsert_date'):
+        clauses.append(date_range('upsert_date', filters['upsert_date']))
+    for (field, values) in (filters.get('fields') or {}).items():
+        if not field_name_pattern.match(field):
+            raise ValueError(f"Invalid metadata field name {field}.")
+        clauses.append(exact_match(field, values))
+    if len(clauses) == 0:
+        return None
+    return {"bool": {"filter": clauses}}
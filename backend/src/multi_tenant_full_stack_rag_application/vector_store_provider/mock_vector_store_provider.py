@@ -19,7 +19,7 @@ class MockVectorStoreProvider(VectorStoreProvider):
     def query(self, collection_id, query):
         return { "collection_id": collection_id, "query": query}
     
-    def semantic_query(self, search_recommendations, top_k=5, score_threshold=0.2):
+    def semantic_query(self, search_recommendations, top_k=5, score_threshold=0.2, **kwargs):
         return { "collection_id": collection_id, "query": query}
     
     def save(self, doc_chunks, collection_id, *, return_docs=False, return_vectors=False):
@@ -0,0 +1,93 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import os
+
+
+default_bulk_max_bytes = int(os.getenv('VECTOR_STORE_BULK_MAX_BYTES', 5 * 1024 * 1024))
+default_bulk_max_docs = int(os.getenv('VECTOR_STORE_BULK_MAX_DOCS', 500))
+
+
+# Buffers index actions and sends them to OpenSearch's _bulk API
+# whenever the buffered payload reaches max_bytes or max_docs.
+# Failures are collected per item instead of failing the whole batch.
+class OpenSearchBulkWriter:
+    def __init__(self,
+        os_client,
+        index: str,
+        *,
+        max_bytes: int=default_bulk_max_bytes,
+        max_docs: int=default_bulk_max_docs
+    ):
+        self.os_client = os_client
+        self.index = index
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.buffer = []
+        self.buffer_ids = []
+        self.buffer_bytes = 0
+        self.saved_ids = []
+        self.errors = []
+        self.bulk_requests = 0
+
+    def add(self, doc_id, doc):
+        action = json.dumps({"index": {"_index": self.index, "_id": doc_id}})
+        self.append(doc_id, [action, json.dumps(doc)])
+
+    def add_error(self, doc_id, error):
+        self.errors.append({"doc_id": doc_id, "error": str(error)})
+
+    def append(self, doc_id, lines):
+        size = sum(len(line) + 1 for line in lines)
+        if len(self.buffer) > 0 and self.buffer_bytes + size > self.max_bytes:
+            self.flush()
+        self.buffer += lines
+        self.buffer_ids.append(doc_id)
+        self.buffer_bytes += size
+        if len(self.buffer_ids) >= self.max_docs:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        return self.results()
+
+    def delete(self, doc_id):
+        action = json.dumps({"delete": {"_index": self.index, "_id": doc_id}})
+        self.append(doc_id, [action])
+
+    def flush(self):
+        if len(self.buffer_ids) == 0:
+            return
+        payload = "\n".join(self.buffer) + "\n"
+        ids = self.buffer_ids
+        self.buffer = []
+        self.buffer_ids = []
+        self.buffer_bytes = 0
+        self.bulk_requests += 1
+        print(f"Flushing {len(ids)} docs ({len(payload)} bytes) to {self.index}")
+        try:
+            result = self.os_client.bulk(body=payload)
+        except Exception as e:
+            print(f"Bulk request to {self.index} failed: {e}")
+            for doc_id in ids:
+                self.add_error(doc_id, e)
+            return
+
+        if not result.get('errors'):
+            self.saved_ids += ids
+            return
+
+        for i, item in enumerate(result['items']):
+            action_result = list(item.values())[0]
+            doc_id = action_result.get('_id', ids[i])
+            if 'error' in action_result:
+                self.add_error(doc_id, json.dumps(action_result['error']))
+            else:
+                self.saved_ids.append(doc_id)
+
+    def results(self):
+        return {
+            "doc_ids": self.saved_ids,
+            "errors": self.errors
+        }
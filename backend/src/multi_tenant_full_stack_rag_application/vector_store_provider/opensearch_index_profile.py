@@ -0,0 +1,227 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import os
+from math import sqrt
+
+
+# the profile used for indices created without one. The empty profile
+# is the plain float knn_vector with the engine's default method.
+default_index_profile = json.loads(os.getenv('OPENSEARCH_DEFAULT_INDEX_PROFILE', '{}'))
+
+engines = [None, 'faiss', 'lucene', 'nmslib']
+data_types = ['float', 'byte', 'fp16']
+# byte vectors are stored as the lucene or faiss byte data_type. fp16 is
+# faiss's scalar quantizer, so vectors are still sent as floats.
+engine_data_types = {
+    None: ['float'],
+    'faiss': ['float', 'byte', 'fp16'],
+    'lucene': ['float', 'byte'],
+    'nmslib': ['float'],
+}
+# byte vectors are float vectors scaled by the index's byte_scale and
+# rounded. Components of a normalized d dimension embedding are mostly
+# within 4 / sqrt(d), so by default that's scaled to 127, and the rest
+# are clipped. Calibrating the scale on a collection's own vectors clips
+# at their byte_scale_quantile of absolute values instead.
+byte_scale_stddevs = 4
+byte_scale_quantile = 0.999
+# indices written before byte_scale was stored scaled by 127.
+legacy_byte_scale = 127.0
+# models that can embed at fewer dimensions than their default. Others
+# have to use their default.
+supported_dimensions = {
+    'amazon.titan-embed-text-v2:0': [256, 512, 1024],
+}
+
+
+# How a collection's vectors are indexed: the engine and its HNSW
+# parameters, how vectors are stored and at how many dimensions. The
+# profile is kept in the index mapping's _meta, so an index describes
+# itself. dimensions of None means the embedding model's default.
+# byte_scale is how byte vectors are quantized. It's stored in the
+# mapping's _meta alongside the profile, but isn't part of it, as it's
+# calibrated when the index is created rather than chosen.
+class OpenSearchIndexProfile:
+    def __init__(self, *,
+        byte_scale: float=None,
+        data_type: str='float',
+        dimensions: int=None,
+        ef_construction: int=None,
+        ef_search: int=None,
+        engine: str=None,
+        m: int=None,
+        space_type: str=None
+    ):
+        self.byte_scale = byte_scale
+        self.data_type = data_type
+        self.dimensions = dimensions
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.engine = engine
+        self.m = m
+        self.space_type = space_type
+        self.validate()
+
+    @staticmethod
+    def from_dict(profile):
+        if isinstance(profile, OpenSearchIndexProfile):
+            return profile
+        if isinstance(profile, str):
+            profile = json.loads(profile) if profile else {}
+        return OpenSearchIndexProfile(**(profile if profile else {}))
+
+    # reads the profile back from an index's mapping. Indices created
+    # before there were profiles have no _meta, so theirs is the default
+    # profile at the dimension they were created with.
+    @staticmethod
+    def from_mapping(mapping):
+        meta = mapping.get('_meta', {})
+        if 'index_profile' in meta:
+            profile = OpenSearchIndexProfile.from_dict(meta['index_profile'])
+            if profile.data_type == 'byte':
+                profile.byte_scale = meta.get('byte_scale', legacy_byte_scale)
+            return profile
+        vector = mapping.get('properties', {}).get('vector', {})
+        return OpenSearchIndexProfile(dimensions=vector.get('dimension'))
+
+    # a short, stable name for the profile, used to name the physical
+    # index a collection is migrated to.
+    def name(self):
+        profile_json = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha256(profile_json.encode('utf-8')).hexdigest()[:8]
+
+    def encode_vector(self, vector):
+        if self.data_type != 'byte':
+            return vector
+        scale = self.get_byte_scale()
+        return [max(-128, min(127, round(x * scale))) for x in vector]
+
+    # the calibrated scale, or the default for normalized embeddings at
+    # the profile's dimensions.
+    def get_byte_scale(self):
+        if self.byte_scale:
+            return self.byte_scale
+        return 127 * sqrt(self.dimensions) / byte_scale_stddevs
+
+    def index_body(self):
+        if not self.dimensions:
+            raise ValueError("The profile's dimensions must be resolved before creating an index.")
+        vector_mapping = {
+            "type": "knn_vector",
+            "dimension": self.dimensions,
+        }
+        if self.data_type == 'byte':
+            vector_mapping['data_type'] = 'byte'
+        if self.engine:
+            parameters = {}
+            if self.m:
+                parameters['m'] = self.m
+            if self.ef_construction:
+                parameters['ef_construction'] = self.ef_construction
+            if self.data_type == 'fp16':
+                parameters['encoder'] = {"name": "sq", "parameters": {"type": "fp16"}}
+            vector_mapping['method'] = {
+                "name": "hnsw",
+                "engine": self.engine,
+                "space_type": self.space_type if self.space_type else 'l2',
+                "parameters": parameters
+            }
+        meta = {"index_profile": self.to_dict()}
+        if self.data_type == 'byte':
+            meta['byte_scale'] = self.get_byte_scale()
+        index_settings = {"knn": True}
+        if self.ef_search and self.engine in ['faiss', 'nmslib']:
+            index_settings['knn.algo_param.ef_search'] = self.ef_search
+        return {
+            "settings": {
+                "index": index_settings
+            },
+            "mappings": {
+                "_meta": meta,
+                "properties": {
+                    "content": {"type": "text"},
+                    "vector": vector_mapping,
+                    "metadata": {"type": "object"}
+                }
+            }
+        }
+
+    # the knn clause for a query vector. Lucene has no ef_search index
+    # setting, so it's passed with the query instead. Lucene and faiss
+    # apply a filter while searching the graph, so k results still come
+    # back. Other engines can only filter the k nearest afterwards.
+    def knn_query(self, vector, k, filter=None):
+        knn = {
+            "vector": self.encode_vector(vector),
+            "k": k
+        }
+        if self.ef_search and self.engine == 'lucene':
+            knn['method_parameters'] = {"ef_search": self.ef_search}
+        if filter and self.engine in ['faiss', 'lucene']:
+            knn['filter'] = filter
+        elif filter:
+            return {"bool": {"must": [{"knn": {"vector": knn}}], "filter": [filter]}}
+        return {"knn": {"vector": knn}}
+
+    # whether documents can be copied between indices with these profiles
+    # as they are, or have to be embedded again.
+    def stores_vectors_like(self, other):
+        return self.dimensions == other.dimensions and \
+            (self.data_type == 'byte') == (other.data_type == 'byte')
+
+    def to_dict(self):
+        return {
+            key: value for key, value in {
+                "data_type": self.data_type,
+                "dimensions": self.dimensions,
+                "ef_construction": self.ef_construction,
+                "ef_search": self.ef_search,
+                "engine": self.engine,
+                "m": self.m,
+                "space_type": self.space_type,
+            }.items() if value is not None
+        }
+
+    def validate(self):
+        if self.engine not in engines:
+            raise ValueError(f"Unknown engine {self.engine}. Use one of {engines[1:]}.")
+        if self.data_type not in data_types:
+            raise ValueError(f"Unknown data_type {self.data_type}. Use one of {data_types}.")
+        if self.data_type not in engine_data_types[self.engine]:
+            raise ValueError(f"The {self.engine if self.engine else 'default'} engine doesn't support {self.data_type} vectors.")
+        if self.byte_scale is not None and \
+            (not isinstance(self.byte_scale, (int, float)) or self.byte_scale <= 0):
+            raise ValueError("byte_scale must be a positive number.")
+        if not self.engine and (self.m or self.ef_construction or self.ef_search or self.space_type):
+            raise ValueError("Set the engine to set m, ef_construction, ef_search or space_type.")
+        for param in ['dimensions', 'ef_construction', 'ef_search', 'm']:
+            value = getattr(self, param)
+            if value is not None and (not isinstance(value, int) or value <= 0):
+                raise ValueError(f"{param} must be a positive integer.")
+
+    # the profile with byte_scale calibrated on sample float vectors, so
+    # their byte_scale_quantile of absolute values is scaled to 127.
+    def with_calibrated_byte_scale(self, vectors):
+        values = sorted(abs(x) for vector in vectors for x in vector)
+        if self.data_type != 'byte' or len(values) == 0:
+            return self
+        max_abs = values[min(len(values) - 1, int(len(values) * byte_scale_quantile))]
+        if max_abs <= 0:
+            return self
+        return OpenSearchIndexProfile(**self.to_dict(), byte_scale=127 / max_abs)
+
+    # fills in the model's default dimensions, or checks the model can
+    # embed at the profile's.
+    def with_model_dimensions(self, model_id, model_dimensions):
+        if not self.dimensions:
+            return OpenSearchIndexProfile(**{**self.to_dict(), "dimensions": model_dimensions}, byte_scale=self.byte_scale)
+        allowed = supported_dimensions.get(model_id, [model_dimensions])
+        if self.dimensions not in allowed:
+            raise ValueError(f"{model_id} can't embed at {self.dimensions} dimensions. Use one of {allowed}.")
+        return self
+
+    def __eq__(self, obj):
+        return isinstance(obj, OpenSearchIndexProfile) and self.to_dict() == obj.to_dict()
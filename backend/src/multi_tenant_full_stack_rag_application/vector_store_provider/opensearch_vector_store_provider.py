@@ -5,11 +5,16 @@ import boto3
 import json
 import os
 from boto3.session import Session
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import monotonic, sleep
 from opensearchpy import  OpenSearch, RequestsHttpConnection
-from queue import Queue
 from requests_aws4auth import AWS4Auth
-from threading import Thread
 
+from multi_tenant_full_stack_rag_application.vector_store_provider.chunk_window import default_chunk_window, default_max_parent_chunks, expand_chunk_windows, neighbor_keys, parent_sources
+from multi_tenant_full_stack_rag_application.vector_store_provider.metadata_filter import build_metadata_filter
+from multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_bulk_writer import OpenSearchBulkWriter, default_bulk_max_bytes, default_bulk_max_docs
+from multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_index_profile import OpenSearchIndexProfile, default_index_profile
+from multi_tenant_full_stack_rag_application.vector_store_provider.search_result_fusion import default_hybrid_weights, default_score_normalization, fuse_search_results
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_document import VectorStoreDocument
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_provider import VectorStoreProvider
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_provider_event import VectorStoreProviderEvent
@@ -17,18 +22,47 @@ from multi_tenant_full_stack_rag_application import utils
 
 
 # API
-#    operation: [ create_index | delete_index | delete_record | query | save | semantic_query | ]
+#    operation: [ create_index | delete_index | delete_record | get_index_profile | migrate_index | query | save | semantic_query | ]
 #    args:
-#       for create_index: collection_id
+#       for create_index: collection_id, index_profile (optional, see opensearch_index_profile.py)
 #       for delete_index: collection_id
 #       for delete_record: collection_id, doc_id
+#       for delete_records: collection_id, doc_ids. Returns deleted doc_ids and per-item errors.
+#       for get_index_profile: collection_id
+#       for migrate_index: collection_id, index_profile. Copies the collection's documents
+#                          to a new index with the profile, re-embedding them if its
+#                          dimensions differ, and then points the collection at it.
 #       for query: collection_id, query, top_k
-#       for save: collection_id, document
-#       for semantic_query: search_recommendations (mapping of collection IDs to keywords to search for in those collections), 
-#                           top_k
+#       for save: collection_id, documents. Documents that already have a valid
+#                 vector aren't re-embedded. Returns saved doc_ids and per-item errors.
+#       for semantic_query: search_recommendations (list of {"id": collection ID, "search_terms": text to search for,
+#                           "filters": optional metadata filters, see metadata_filter.py}),
+#                           top_k (across all the collections), normalization (optional: raw | min_max | rrf),
+#                           score_threshold (optional, minimum kNN score), search_mode (optional: semantic | hybrid),
+#                           hybrid_weights (optional, {"lexical": float, "semantic": float}),
+#                           chunk_window (optional, neighboring chunks to add to each result, see chunk_window.py),
+#                           parent_docs (optional, replace results with all of their source's chunks)
 
 
 vector_store_provider = None
+default_embed_batch_size = int(os.getenv('VECTOR_STORE_EMBED_BATCH_SIZE', 32))
+default_embed_concurrency = int(os.getenv('VECTOR_STORE_EMBED_CONCURRENCY', 4))
+default_embedding_model = os.getenv('EMBEDDING_MODEL_ID')
+default_migration_batch_size = int(os.getenv('VECTOR_STORE_MIGRATION_BATCH_SIZE', 500))
+default_migration_poll_seconds = float(os.getenv('VECTOR_STORE_MIGRATION_POLL_SECONDS', 5))
+# the time a migration leaves itself to clean up before the function
+# times out.
+default_migration_cleanup_seconds = int(os.getenv('VECTOR_STORE_MIGRATION_CLEANUP_SECONDS', 60))
+# documents sampled to calibrate a byte index's quantization when a
+# collection is migrated to one. One embedding batch by default.
+default_byte_scale_sample_size = int(os.getenv('VECTOR_STORE_BYTE_SCALE_SAMPLE_SIZE', 32))
+# how long a collection's index profile is cached. Another container can
+# migrate the collection meanwhile, so it's reloaded after this long, and
+# straight away if a search or save on the collection fails.
+default_index_profile_ttl = int(os.getenv('VECTOR_STORE_INDEX_PROFILE_TTL_SECONDS', 60))
+# hybrid adds a BM25 match on the content to each kNN query.
+search_modes = ['semantic', 'hybrid']
+default_search_mode = os.getenv('VECTOR_STORE_SEARCH_MODE', 'semantic')
 
 
 class OpenSearchVectorStoreProvider(VectorStoreProvider): 
@@ -36,6 +70,17 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
         vector_store_endpoint: str,
         port=443,
         proto='https',
+        *,
+        byte_scale_sample_size: int=default_byte_scale_sample_size,
+        bulk_max_bytes: int=default_bulk_max_bytes,
+        bulk_max_docs: int=default_bulk_max_docs,
+        embed_batch_size: int=default_embed_batch_size,
+        embed_concurrency: int=default_embed_concurrency,
+        index_profile_ttl: int=default_index_profile_ttl,
+        max_parent_chunks: int=default_max_parent_chunks,
+        migration_batch_size: int=default_migration_batch_size,
+        migration_cleanup_seconds: int=default_migration_cleanup_seconds,
+        migration_poll_seconds: float=default_migration_poll_seconds,
         **kwargs
     ):         
         super().__init__(vector_store_endpoint)
@@ -43,43 +88,38 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
         self.vector_store_endpoint = vector_store_endpoint
         self.port = port
         self.proto = proto
+        self.byte_scale_sample_size = byte_scale_sample_size
+        self.bulk_max_bytes = bulk_max_bytes
+        self.bulk_max_docs = bulk_max_docs
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.index_profile_ttl = index_profile_ttl
+        self.max_parent_chunks = max_parent_chunks
+        self.migration_batch_size = migration_batch_size
+        self.migration_cleanup_seconds = migration_cleanup_seconds
+        self.migration_poll_seconds = migration_poll_seconds
+        # index profiles by collection ID, so save and semantic_query
+        # know the dimensions to embed at and how to encode vectors, and
+        # the monotonic time each was loaded.
+        self.index_profiles = {}
+        self.index_profile_loaded = {}
         # self.user = user
         # self.pwd = pwd
         self.allowed_origins = self.utils.get_allowed_origins()
         self.my_origin = self.utils.get_ssm_params('origin_vector_store_provider')
     
-    def create_index(self, collection_id):
+    def create_index(self, collection_id, index_profile=None):
         os_vector_db = self.get_vector_store(collection_id)
-        
-        response = self.utils.get_model_dimensions(self.my_origin)
-        print(f"response from get_model_dimensions: {response}")
-        dims = json.loads(response['body'])['response']
-        print(f"Creating vector index with dims {dims}")
-        # {'statusCode': '200', 'headers': {'Access-Control-Allow-Headers': 'Authorization, Content-Type, x-csrf-token, X-Api-Key, *', 'Access-Control-Allow-Credentials': 'true', 'Access-Control-Allow-Origin': 'dmtfsradbVectorStoreProvi-VectorStoreProviderFunct-ADohbMUuwwWz', 'Access-Control-Allow-Methods': 'DELETE,OPTIONS,GET,POST,PUT', 'Vary': 'Origin'}, 'body': '{"response": 1024}'}
-        index_body = {
-            "settings": {
-                "index": {
-                    "knn": True
-                }
-            },
-            "mappings": {
-                "properties": {
-                    "content": {"type": "text"},
-                    "vector": {
-                        "type": "knn_vector",
-                        "dimension": dims,
-                    },
-                    "metadata": {"type": "object"}
-                }
-            }
-        }
+        profile = self.resolve_index_profile(index_profile)
+        print(f"Creating vector index with profile {profile.to_dict()}")
         try: 
             print(f"Checking if collection id {collection_id} exists")
             if not os_vector_db.indices.exists(index=collection_id):
                 os_vector_db.indices.create(
                     index=collection_id, 
-                    body=index_body
+                    body=profile.index_body()
                 )
+                self.cache_index_profile(collection_id, profile)
         except Exception:
             pass
 
@@ -87,8 +127,12 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
 
     def delete_index(self, collection_id):
         os_vector_db = self.get_vector_store(collection_id)
+        self.forget_index_profile(collection_id)
+        # a migrated collection's ID is an alias for its current index,
+        # and indices can't be deleted through an alias.
+        indices = list(os_vector_db.indices.get(index=collection_id).keys())
         return os_vector_db.indices.delete(
-            index = collection_id
+            index = ','.join(indices)
         )
 
     def delete_record(self, collection_id, doc_id):
@@ -98,6 +142,108 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
             id=doc_id
         )
         
+    def delete_records(self, collection_id, doc_ids):
+        writer = OpenSearchBulkWriter(
+            self.get_vector_store(collection_id),
+            collection_id,
+            max_bytes=self.bulk_max_bytes,
+            max_docs=self.bulk_max_docs
+        )
+        for doc_id in doc_ids:
+            # same id normalization as save.
+            if doc_id.startswith(f"{collection_id}/"):
+                doc_id = doc_id.replace(f"{collection_id}/", "")
+            writer.delete(doc_id)
+        result = writer.close()
+        print(f"Deleted {len(result['doc_ids'])} documents with {len(result['errors'])} failures.")
+        return result
+
+    # fetches the chunks around each search hit in one _mget request.
+    # Returns a mapping of (index, doc ID) to _source for the ones found.
+    def get_chunk_neighbors(self, os_vector_db, results, chunk_window):
+        keys = neighbor_keys(results, chunk_window)
+        if len(keys) == 0:
+            return {}
+        response = os_vector_db.mget(body={
+            "docs": [
+                {"_index": index, "_id": doc_id, "_source": ["content"]}
+                for (index, doc_id) in keys
+            ]
+        })
+        return {
+            (doc['_index'], doc['_id']): doc['_source']
+            for doc in response['docs'] if doc.get('found')
+        }
+
+    # fetches every chunk of the search hits' sources in one search, up to
+    # max_parent_chunks of them.
+    def get_parent_chunks(self, os_vector_db, results):
+        sources = parent_sources(results)
+        if len(sources) == 0:
+            return {}
+        indices = list(dict.fromkeys(hit['_index'] for (_, hit) in results))
+        response = os_vector_db.search(
+            body={
+                "size": self.max_parent_chunks,
+                "_source": ["content"],
+                "query": {"bool": {"filter": [{"terms": {"metadata.source.keyword": sources}}]}}
+            },
+            index=','.join(indices)
+        )
+        return {
+            (hit['_index'], hit['_id']): hit['_source']
+            for hit in response['hits']['hits']
+        }
+
+    # byte indices quantize vectors by a byte_scale calibrated on a sample
+    # of the collection's vectors at the new profile's dimensions. Byte
+    # vectors that are copied as they are keep the scale they have.
+    def calibrate_byte_scale(self, os_vector_db, index, current_profile, new_profile):
+        if new_profile.data_type != 'byte' or new_profile.byte_scale:
+            return new_profile
+        if new_profile.stores_vectors_like(current_profile):
+            return OpenSearchIndexProfile(**new_profile.to_dict(), byte_scale=current_profile.get_byte_scale())
+        response = os_vector_db.search(
+            body={
+                "size": self.byte_scale_sample_size,
+                "_source": ["content", "vector"],
+                "query": {"match_all": {}}
+            },
+            index=index
+        )
+        hits = response['hits']['hits']
+        if new_profile.dimensions == current_profile.dimensions and current_profile.data_type != 'byte':
+            vectors = [hit['_source']['vector'] for hit in hits]
+        else:
+            vectors = self.utils.embed_texts(
+                [hit['_source']['content'] for hit in hits],
+                self.my_origin,
+                'search_document',
+                dimensions=new_profile.dimensions
+            )
+        calibrated = new_profile.with_calibrated_byte_scale(vectors)
+        print(f"Calibrated byte_scale {calibrated.get_byte_scale()} on {len(vectors)} vectors from {index}")
+        return calibrated
+
+    def cache_index_profile(self, collection_id, profile):
+        self.index_profiles[collection_id] = profile
+        self.index_profile_loaded[collection_id] = monotonic()
+
+    def forget_index_profile(self, collection_id):
+        self.index_profiles.pop(collection_id, None)
+        self.index_profile_loaded.pop(collection_id, None)
+
+    def get_index_profile(self, collection_id) -> OpenSearchIndexProfile:
+        loaded = self.index_profile_loaded.get(collection_id)
+        if loaded is None or monotonic() - loaded > self.index_profile_ttl:
+            os_vector_db = self.get_vector_store(collection_id)
+            response = os_vector_db.indices.get_mapping(index=collection_id)
+            # keyed by the index's own name, which isn't the collection
+            # ID once the collection has been migrated.
+            mapping = list(response.values())[0]['mappings']
+            self.cache_index_profile(collection_id, OpenSearchIndexProfile.from_mapping(mapping))
+        return self.index_profiles[collection_id]
+
     def get_vector_store(self, collection_id):
         if not hasattr(self, 'vector_db_client') or not self.vector_db_client:
             service = 'es'
@@ -146,7 +292,7 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
             result = {"error": "Access denied"}
             
         elif handler_evt.operation == 'create_index':
-            result = self.create_index(handler_evt.args['collection_id'])
+            result = self.create_index(handler_evt.args['collection_id'], handler_evt.args.get('index_profile'))
     
         elif handler_evt.operation == 'delete_index':
             result = self.delete_index(handler_evt.args['collection_id'])
@@ -154,6 +300,18 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
         elif handler_evt.operation == 'delete_record':
             result = self.delete_record(handler_evt.args['collection_id'], handler_evt.args['doc_id'])
 
+        elif handler_evt.operation == 'delete_records':
+            result = self.delete_records(handler_evt.args['collection_id'], handler_evt.args['doc_ids'])
+
+        elif handler_evt.operation == 'get_index_profile':
+            result = self.get_index_profile(handler_evt.args['collection_id']).to_dict()
+
+        elif handler_evt.operation == 'migrate_index':
+            time_limit = None
+            if hasattr(context, 'get_remaining_time_in_millis'):
+                time_limit = context.get_remaining_time_in_millis() / 1000 - self.migration_cleanup_seconds
+            result = self.migrate_index(handler_evt.args['collection_id'], handler_evt.args['index_profile'], time_limit)
+
         elif handler_evt.operation == 'query':
             print(f"Got collection_id {handler_evt.args['collection_id']}, query {handler_evt.args['query']}")
             result = self.query(handler_evt.args['collection_id'], handler_evt.args['query'], handler_evt.top_k, handler_evt.scroll)
@@ -162,7 +320,16 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
             result = self.save(handler_evt.args['documents'], handler_evt.args['collection_id'])
 
         elif handler_evt.operation == 'semantic_query':
-            result = self.semantic_query(handler_evt.args['search_recommendations'], handler_evt.args['top_k'])
+            result = self.semantic_query(
+                handler_evt.args['search_recommendations'],
+                handler_evt.args['top_k'],
+                handler_evt.args.get('score_threshold', 0.2),
+                chunk_window=handler_evt.args.get('chunk_window', default_chunk_window),
+                parent_docs=handler_evt.args.get('parent_docs', False),
+                hybrid_weights=handler_evt.args.get('hybrid_weights', default_hybrid_weights),
+                normalization=handler_evt.args.get('normalization', default_score_normalization),
+                search_mode=handler_evt.args.get('search_mode', default_search_mode)
+            )
 
         else:
             status = 400
@@ -170,6 +337,168 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
         print(f"OpenSearchVectorStoreProvider returning {result}")
         return self.utils.format_response(status, result, self.my_origin)
     
+    # Moves a collection to a new index with the given profile. Its
+    # documents are reindexed server side when their vectors can be used
+    # as they are, quantized by save when only the data type changes, or
+    # re-embedded when the dimensions change. The collection ID then
+    # becomes an alias for the new index, and the old one is deleted. If
+    # any document fails to copy, the collection stays where it was.
+    #
+    # Writes to the old index are blocked while it's copied, so documents
+    # saved meanwhile fail instead of being left behind, and the ID is
+    # never without an index, so a write can't auto-create a plain one
+    # in its place. Their chunk fingerprints aren't recorded, so
+    # re-ingesting the file saves them. Other containers' cached profiles
+    # expire after index_profile_ttl seconds.
+    #
+    # time_limit is how many seconds it has, so it can give up and clean
+    # up before the function times out.
+    def migrate_index(self, collection_id, index_profile, time_limit=None):
+        deadline = monotonic() + time_limit if time_limit is not None else float('inf')
+        os_vector_db = self.get_vector_store(collection_id)
+        current_profile = self.get_index_profile(collection_id)
+        new_profile = self.resolve_index_profile(index_profile)
+        result = {
+            "collection_id": collection_id,
+            "index_profile": new_profile.to_dict(),
+            "doc_count": 0,
+            "errors": []
+        }
+        if new_profile == current_profile:
+            print(f"Collection {collection_id} already has index profile {new_profile.to_dict()}")
+            return result
+
+        old_index = list(os_vector_db.indices.get(index=collection_id).keys())[0]
+        new_profile = self.calibrate_byte_scale(os_vector_db, old_index, current_profile, new_profile)
+        new_index = f"{collection_id}-{new_profile.name()}"
+        if os_vector_db.indices.exists(index=new_index):
+            # left over from a migration that failed.
+            os_vector_db.indices.delete(index=new_index)
+        os_vector_db.indices.create(index=new_index, body=new_profile.index_body())
+        self.cache_index_profile(new_index, new_profile)
+        self.set_write_block(os_vector_db, old_index, True)
+        print(f"Migrating {collection_id} from {old_index} to {new_index}")
+        migrated = False
+        try:
+            try:
+                if new_profile.stores_vectors_like(current_profile):
+                    self.reindex_docs(os_vector_db, old_index, new_index, deadline, result)
+                else:
+                    self.copy_docs(os_vector_db, old_index, new_index, current_profile, new_profile, deadline, result)
+            except Exception as e:
+                result['errors'].append({"error": f"Copying {old_index} to {new_index} failed: {e}"})
+
+            if len(result['errors']) == 0:
+                os_vector_db.indices.refresh(index=new_index)
+                old_count = os_vector_db.count(index=old_index)['count']
+                new_count = os_vector_db.count(index=new_index)['count']
+                if new_count != old_count:
+                    result['errors'].append({"error": f"{new_index} has {new_count} documents but {old_index} has {old_count}"})
+
+            if len(result['errors']) == 0:
+                if old_index == collection_id:
+                    # the collection's original index has the name the alias
+                    # needs. Removing it in the same request as the alias is
+                    # added leaves no moment without one or the other.
+                    actions = [
+                        {"remove_index": {"index": old_index}},
+                        {"add": {"index": new_index, "alias": collection_id}}
+                    ]
+                else:
+                    actions = [
+                        {"remove": {"index": old_index, "alias": collection_id}},
+                        {"add": {"index": new_index, "alias": collection_id}}
+                    ]
+                try:
+                    response = os_vector_db.indices.update_aliases(body={"actions": actions})
+                    if not response.get('acknowledged'):
+                        result['errors'].append({"error": f"Pointing {collection_id} at {new_index} wasn't acknowledged: {response}"})
+                except Exception as e:
+                    result['errors'].append({"error": f"Couldn't point {collection_id} at {new_index}: {e}"})
+            migrated = len(result['errors']) == 0
+        finally:
+            # whatever went wrong, the collection is left writable where
+            # it was.
+            if not migrated:
+                print(f"Migration of {collection_id} failed with {len(result['errors'])} errors, keeping {old_index}")
+                self.set_write_block(os_vector_db, old_index, False)
+                os_vector_db.indices.delete(index=new_index)
+                self.forget_index_profile(new_index)
+        if not migrated:
+            return result
+
+        if old_index != collection_id:
+            os_vector_db.indices.delete(index=old_index)
+        self.forget_index_profile(new_index)
+        self.cache_index_profile(collection_id, new_profile)
+        print(f"Migrated {result['doc_count']} documents in {collection_id} to {new_index}")
+        return result
+
+    # copies documents to new_index through save, which quantizes them
+    # and re-embeds them when the dimensions change, a scroll page at a
+    # time.
+    def copy_docs(self, os_vector_db, old_index, new_index, current_profile, new_profile, deadline, result):
+        keep_vectors = new_profile.dimensions == current_profile.dimensions and \
+            current_profile.data_type != 'byte'
+        response = os_vector_db.search(
+            body={"size": self.migration_batch_size, "query": {"match_all": {}}},
+            index=old_index,
+            scroll='5m'
+        )
+        try:
+            while len(response['hits']['hits']) > 0:
+                if monotonic() > deadline:
+                    raise TimeoutError(f"ran out of time after copying {result['doc_count']} documents")
+                docs = []
+                for hit in response['hits']['hits']:
+                    doc = {**hit['_source'], "doc_id": hit['_id']}
+                    if not keep_vectors:
+                        doc['vector'] = None
+                    docs.append(doc)
+                saved = self.save(docs, new_index)
+                result['doc_count'] += len(saved['doc_ids'])
+                result['errors'] += saved['errors']
+                response = os_vector_db.scroll(scroll_id=response['_scroll_id'], scroll='5m')
+        finally:
+            os_vector_db.clear_scroll(scroll_id=response['_scroll_id'])
+
+    # reindexes old_index into new_index server side. The reindex runs as
+    # a task, polled until it's done, as it can take far longer than an
+    # http request. If it isn't done by the deadline it's cancelled, so
+    # it isn't still writing to new_index when that's deleted.
+    def reindex_docs(self, os_vector_db, old_index, new_index, deadline, result):
+        response = os_vector_db.reindex(
+            body={
+                "source": {"index": old_index},
+                "dest": {"index": new_index}
+            },
+            refresh=True,
+            wait_for_completion=False
+        )
+        task_id = response['task']
+        print(f"Reindexing {old_index} to {new_index} in task {task_id}")
+        task = self.wait_for_task(os_vector_db, task_id, deadline)
+        if not task:
+            os_vector_db.tasks.cancel(task_id=task_id)
+            self.wait_for_task(os_vector_db, task_id, monotonic() + self.migration_poll_seconds * 10)
+            raise TimeoutError(f"reindex task {task_id} didn't finish in time")
+        print(f"reindex task: {task}")
+        if 'error' in task:
+            result['errors'].append({"error": task['error']})
+        task_response = task.get('response', {})
+        result['errors'] += [{"error": failure} for failure in task_response.get('failures', [])]
+        result['doc_count'] = task_response.get('created', 0)
+
+    # the finished task, or None if it's still running at the deadline.
+    def wait_for_task(self, os_vector_db, task_id, deadline):
+        while True:
+            task = os_vector_db.tasks.get(task_id=task_id)
+            if task.get('completed'):
+                return task
+            if monotonic() + self.migration_poll_seconds > deadline:
+                return None
+            sleep(self.migration_poll_seconds)
+
     def query(self, collection_id, query, top_k=10, scroll='1m'):
         os_vector_db = self.get_vector_store(collection_id)
         if 'size' not in query:
@@ -181,105 +510,211 @@ class OpenSearchVectorStoreProvider(VectorStoreProvider):
             scroll=scroll
         )
         
+    # the profile with its dimensions filled in from the embedding model.
+    # Collections without a profile get the default one.
+    def resolve_index_profile(self, index_profile=None) -> OpenSearchIndexProfile:
+        profile = OpenSearchIndexProfile.from_dict(index_profile if index_profile else default_index_profile)
+        response = self.utils.get_model_dimensions(self.my_origin)
+        print(f"response from get_model_dimensions: {response}")
+        model_dims = json.loads(response['body'])['response']
+        return profile.with_model_dimensions(default_embedding_model, model_dims)
+
+    @staticmethod
+    def set_write_block(os_vector_db, index, blocked):
+        os_vector_db.indices.put_settings(
+            index=index,
+            body={"index": {"blocks.write": blocked}}
+        )
+
+    @staticmethod
+    def is_valid_vector(vector, dims=None):
+        if not isinstance(vector, list) or len(vector) == 0:
+            return False
+        if dims and len(vector) != dims:
+            return False
+        return all(isinstance(x, (int, float)) for x in vector)
+
     def save(self, doc_chunks: [VectorStoreDocument], collection_id, *, return_docs=False, return_vectors=False): 
         os_vector_db = self.get_vector_store(collection_id)
-        payload = ''
-        print(f"Saving {len(doc_chunks)} (type {type(doc_chunks[0])}) documents to vector store {collection_id}")
-        doc_ids = []
+        profile = self.get_index_profile(collection_id)
+        print(f"Saving {len(doc_chunks)} documents to vector store {collection_id}")
+        writer = OpenSearchBulkWriter(
+            os_vector_db,
+            collection_id,
+            max_bytes=self.bulk_max_bytes,
+            max_docs=self.bulk_max_docs
+        )
+        needs_embedding = []
 
         for doc in doc_chunks:
             if isinstance(doc, VectorStoreDocument):
-                doc = doc.to_json()
-            print(f"saving doc {doc}")
+                doc = doc.to_dict()
             doc_id = doc['doc_id']
-            doc_ids.append(doc_id)
             if doc_id.startswith(f"{collection_id}/"):
                 doc_id = doc_id.replace(f"{collection_id}/", "")
-            # print(f"ingesting document {doc}")
-            if 'doc_id' in list(doc.keys()):
-                del doc['doc_id']
-            # delattr(doc, 'id')
-            doc['vector'] = self.utils.embed_text(doc['content'], self.my_origin)
-            if isinstance(doc['vector'], str):
+            del doc['doc_id']
+            if isinstance(doc.get('vector'), str):
                 doc['vector'] = json.loads(doc['vector'])
-            print(f"doc['vector'] is of type {type(doc['vector'])}")
-            payload += '{"index": { "_index": "' + collection_id + '", "_id": "' + doc_id + '"}}\n' + json.dumps(doc) + "\n"
+            if self.is_valid_vector(doc.get('vector'), profile.dimensions):
+                # the loader already embedded this one, so it can be
+                # written while the others are still embedding.
+                doc['vector'] = profile.encode_vector(doc['vector'])
+                writer.add(doc_id, doc)
+            else:
+                needs_embedding.append((doc_id, doc))
         
-        print(f"Saving payload {payload}")
-        result = os_vector_db.bulk(
-            body=payload
-        )
-        print(f"Result from os bulk call {result}")
-        if result['errors']:
-            raise Exception(f"Error saving to vector store: {result}")
-            
-        print(f"Result from saving doc to vector store: {result}")
-        return doc_ids
+        print(f"{len(needs_embedding)} of {len(doc_chunks)} documents need embedding")
+        batches = [
+            needs_embedding[i:i + self.embed_batch_size] 
+            for i in range(0, len(needs_embedding), self.embed_batch_size)
+        ]
+        if len(batches) > 0:
+            with ThreadPoolExecutor(max_workers=min(self.embed_concurrency, len(batches))) as executor:
+                futures = {
+                    executor.submit(
+                        self.utils.embed_texts,
+                        [doc['content'] for (_, doc) in batch],
+                        self.my_origin,
+                        'search_document',
+                        dimensions=profile.dimensions
+                    ): batch for batch in batches
+                }
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        print(f"Failed to embed batch of {len(batch)} documents: {e}")
+                        for (doc_id, _) in batch:
+                            writer.add_error(doc_id, e)
+                        continue
+                    for ((doc_id, doc), vector) in zip(batch, vectors):
+                        doc['vector'] = profile.encode_vector(vector)
+                        writer.add(doc_id, doc)
 
-    def semantic_query(self, search_recommendations, top_k: int=5, score_threshold: float=0.2) -> [VectorStoreDocument]:
-        in_queue = Queue()
-        out_queue = Queue()
-        
+        result = writer.close()
+        print(f"Saved {len(result['doc_ids'])} documents in {writer.bulk_requests} bulk requests with {len(result['errors'])} failures.")
+        if len(result['errors']) > 0:
+            print(f"Failed documents: {result['errors']}")
+            # the collection may have been migrated to other dimensions
+            # or data type by another container.
+            self.forget_index_profile(collection_id)
+        return result
+
+    # Searches every recommended collection in one _msearch request and
+    # returns the top_k documents across all of them, scored with the
+    # normalization (see search_result_fusion.py). In hybrid mode each
+    # collection also gets a BM25 match query, fused with the kNN results
+    # by hybrid_weights. With a chunk_window, each result is expanded with
+    # its neighboring chunks, fetched in one _mget request, and results
+    # from the same source are merged. parent_docs does the same with
+    # every chunk of each result's source, fetched in one search. A
+    # collection that can't be searched is left out rather than failing
+    # the rest.
+    def semantic_query(self, search_recommendations, top_k: int=5, score_threshold: float=0.2, *,
+        chunk_window: int=default_chunk_window,
+        hybrid_weights: dict=default_hybrid_weights,
+        normalization: str=default_score_normalization,
+        parent_docs: bool=False,
+        search_mode: str=default_search_mode
+    ) -> [VectorStoreDocument]:
+        if search_mode not in search_modes:
+            raise ValueError(f"Unknown search_mode {search_mode}. Use one of {search_modes}.")
         if not isinstance(search_recommendations, list):
             search_recommendations = [search_recommendations]
 
+        if len(search_recommendations) == 0:
+            return []
+
+        os_vector_db = self.get_vector_store(search_recommendations[0]['id'])
+        searches = []
         for recommendation in search_recommendations:
-            in_queue.put(recommendation)
+            try:
+                profile = self.get_index_profile(recommendation['id'])
+            except Exception as e:
+                print(f"Skipping search of collection {recommendation['id']}: {e}")
+                continue
+            try:
+                metadata_filter = build_metadata_filter(recommendation.get('filters'))
+            except ValueError as e:
+                # filters come from the orchestration model, so a bad
+                # one widens the search rather than failing it.
+                print(f"Searching collection {recommendation['id']} without filters {recommendation.get('filters')}: {e}")
+                metadata_filter = None
+            searches.append((recommendation, profile, metadata_filter))
+        if len(searches) == 0:
+            return []
 
-        q_len = in_queue.qsize() - 1
+        # each distinct query is embedded once per dimension, concurrently.
+        queries = list(dict.fromkeys(
+            (recommendation['search_terms'], profile.dimensions) for (recommendation, profile, _) in searches
+        ))
+        with ThreadPoolExecutor(max_workers=min(self.embed_concurrency, len(queries))) as executor:
+            vectors = dict(zip(queries, executor.map(
+                lambda query: self.utils.embed_text(query[0], self.my_origin, dimensions=query[1]),
+                queries
+            )))
 
-        def consumer(in_queue, out_queue, top_k):
-            recommendation = in_queue.get()
-            while recommendation:
-                id = recommendation['id']
-                search_query = recommendation['search_terms']
-                results = {}
-                vector = self.utils.embed_text(search_query, self.my_origin)
-        
-                search_query = { 
+        body = []
+        # (collection ID, 'semantic' or 'lexical') for each search in body.
+        search_kinds = []
+        for (recommendation, profile, metadata_filter) in searches:
+            vector = vectors[(recommendation['search_terms'], profile.dimensions)]
+            body.append({"index": recommendation['id']})
+            body.append({
+                "size": top_k,
+                "query": profile.knn_query(vector, top_k, metadata_filter)
+            })
+            search_kinds.append((recommendation['id'], 'semantic'))
+            if search_mode == 'hybrid':
+                body.append({"index": recommendation['id']})
+                body.append({
                     "size": top_k,
-                    "query": { 
-                        "knn": {     
-                            "vector": {
-                                "vector": vector,
-                                "k": top_k 
-                            }
+                    "query": {
+                        "bool": {
+                            "must": [{"match": {"content": recommendation['search_terms']}}],
+                            "filter": [metadata_filter] if metadata_filter else []
                         }
                     }
-                }
-                next_token = None
-                os_vector_db = self.get_vector_store(id) 
-                response = os_vector_db.search(
-                    body=search_query,
-                    index=id
-                )
-                docs = []
-                if 'hits' in response:
-                    max_score = 0
-                    if 'max_score' in response['hits']:
-                        max_score = response['hits']['max_score']
-                    if 'hits' in response['hits']:
-                        docs = response['hits']['hits']
-                max_score = response['hits']['max_score']
-                for doc in docs:
-                    score = doc['_score'] / max_score # normalize
-                    new_doc = doc['_source']
-                    new_doc['metadata']['score'] = score
-                    new_doc['id'] = doc['_id']
-                    out_queue.put(new_doc)
-                in_queue.task_done()
-                recommendation = in_queue.get()
-        
-        consumer = Thread(target=consumer, args=(in_queue, out_queue, top_k), daemon=True)
-        consumer.start()
-        in_queue.join()
-    
-        final_docs = []
+                })
+                search_kinds.append((recommendation['id'], 'lexical'))
+        response = os_vector_db.msearch(body=body)
 
-        for i in range(out_queue.qsize()):
-            doc = out_queue.get()
-            final_docs.append(doc)
-        
+        hit_lists = {"semantic": [], "lexical": []}
+        for ((collection_id, kind), result) in zip(search_kinds, response['responses']):
+            if 'error' in result:
+                print(f"{kind} search of collection {collection_id} failed: {result['error']}")
+                # its vectors may no longer match the cached profile.
+                self.forget_index_profile(collection_id)
+                continue
+            hit_lists[kind].append(result['hits']['hits'])
+
+        final_docs = []
+        results = fuse_search_results(
+            hit_lists['semantic'],
+            top_k,
+            lexical_lists=hit_lists['lexical'],
+            normalization=normalization,
+            score_threshold=score_threshold,
+            weights=hybrid_weights
+        )
+        if parent_docs:
+            results = expand_chunk_windows(
+                results,
+                self.get_parent_chunks(os_vector_db, results),
+                None
+            )
+        elif chunk_window > 0:
+            results = expand_chunk_windows(
+                results,
+                self.get_chunk_neighbors(os_vector_db, results, chunk_window),
+                chunk_window
+            )
+        for (score, hit) in results:
+            new_doc = hit['_source']
+            new_doc['metadata']['score'] = score
+            new_doc['id'] = hit['_id']
+            final_docs.append(new_doc)
         return final_docs
 
 
@@ -0,0 +1,92 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import heapq
+import os
+
+
+# raw: OpenSearch's scores as they are. min_max: scaled to [0, 1] by the
+# lowest and highest score across all the result lists, so scores from
+# different collections stay comparable. rrf: reciprocal rank fusion,
+# 1 / (rank_constant + rank) within each list, which ignores scores.
+normalizations = ['raw', 'min_max', 'rrf']
+default_score_normalization = os.getenv('VECTOR_STORE_SCORE_NORMALIZATION', 'min_max')
+default_rrf_rank_constant = int(os.getenv('VECTOR_STORE_RRF_RANK_CONSTANT', 60))
+# how much lexical (BM25) and semantic (kNN) scores count in hybrid search.
+default_hybrid_weights = {
+    "lexical": float(os.getenv('VECTOR_STORE_HYBRID_LEXICAL_WEIGHT', 0.3)),
+    "semantic": float(os.getenv('VECTOR_STORE_HYBRID_SEMANTIC_WEIGHT', 0.7)),
+}
+
+
+# hits are identified by index and ID, since two collections can have
+# documents with the same ID.
+def hit_key(hit):
+    return (hit.get('_index'), hit['_id'])
+
+
+# Scores each list of OpenSearch hits with the normalization. Min-max
+# is over all the lists together. Returns lists of (key, score, hit).
+def normalize_scores(hit_lists, normalization=default_score_normalization, *, rank_constant=default_rrf_rank_constant):
+    if normalization not in normalizations:
+        raise ValueError(f"Unknown score normalization {normalization}. Use one of {normalizations}.")
+    if normalization == 'rrf':
+        return [
+            [(hit_key(hit), 1 / (rank_constant + rank), hit) for rank, hit in enumerate(hits, 1)]
+            for hits in hit_lists
+        ]
+    scores = [hit['_score'] for hits in hit_lists for hit in hits if hit.get('_score') is not None]
+    if normalization == 'raw' or len(scores) == 0:
+        return [
+            [(hit_key(hit), hit.get('_score') or 0, hit) for hit in hits]
+            for hits in hit_lists
+        ]
+    low = min(scores)
+    spread = max(scores) - low
+    return [
+        [(hit_key(hit), (hit['_score'] - low) / spread if spread else 1.0, hit) for hit in hits]
+        for hits in hit_lists
+    ]
+
+
+# Merges scored lists into the top_k hits overall, highest score first.
+# A hit in more than one list scores the weighted sum of its scores.
+# Weights default to 1 for every list. Returns a list of (score, hit).
+def fuse(scored_lists, top_k, weights=None):
+    if not weights:
+        weights = [1] * len(scored_lists)
+    totals = {}
+    hits = {}
+    for (scored, weight) in zip(scored_lists, weights):
+        for (key, score, hit) in scored:
+            totals[key] = totals.get(key, 0) + weight * score
+            if key not in hits:
+                hits[key] = hit
+    # nlargest is stable, so ties keep the order the lists were given in.
+    top_keys = heapq.nlargest(top_k, totals, key=totals.get)
+    return [(totals[key], hits[key]) for key in top_keys]
+
+
+# Merges kNN hit lists, and for hybrid search BM25 hit lists, into the
+# top_k hits. kNN hits scoring under score_threshold are dropped first.
+# It applies to OpenSearch's own kNN score, before normalization, so it
+# means the same whatever the normalization is.
+# Each kind of list is normalized on its own, since BM25 and similarity
+# scores aren't on the same scale, then they're fused with the weights.
+def fuse_search_results(semantic_lists, top_k, *,
+    lexical_lists=[],
+    normalization=default_score_normalization,
+    score_threshold=0,
+    weights=default_hybrid_weights
+):
+    if score_threshold:
+        semantic_lists = [
+            [hit for hit in hits if hit.get('_score', 0) >= score_threshold]
+            for hits in semantic_lists
+        ]
+    scored_lists = normalize_scores(semantic_lists, normalization)
+    if len(lexical_lists) == 0:
+        return fuse(scored_lists, top_k)
+    scored_lists += normalize_scores(lexical_lists, normalization)
+    list_weights = [weights['semantic']] * len(semantic_lists) + [weights['lexical']] * len(lexical_lists)
+    return fuse(scored_lists, top_k, list_weights)
@@ -5,6 +5,7 @@ import boto3
 import json
 from multi_tenant_full_stack_rag_application.document_collections_handler import DocumentCollectionsHandler
 from multi_tenant_full_stack_rag_application.user_settings_provider import UserSettingsProvider
+from multi_tenant_full_stack_rag_application.utils.reranker import Reranker, rerank_query
 from multi_tenant_full_stack_rag_application.vector_store_provider.vector_store_provider import VectorStoreProvider
 
 
@@ -12,7 +13,8 @@ class VectorSearchProvider:
     def __init__(self, 
         document_collections_handler: DocumentCollectionsHandler,
         user_settings_provider: UserSettingsProvider,
-        vector_store_provider: VectorStoreProvider
+        vector_store_provider: VectorStoreProvider,
+        reranker: Reranker=None
     ):
         self.document_collections_handler = document_collections_handler
         self.user_settings_provider = user_settings_provider
@@ -21,6 +23,8 @@ class VectorSearchProvider:
         self.model_max_length = self.vector_store_provider.embeddings_provider.get_model_max_tokens()
         self.get_token_ct = self.vector_store_provider.embeddings_provider.get_token_count
         self.embeddings_provider = self.vector_store_provider.embeddings_provider
+        # without a reranker, results are the vector store's top_k as is.
+        self.reranker = reranker
 
     def compress_results(self, docs, query):
         compression_splitter = RecursiveCharacterTextSplitter(
@@ -36,39 +40,46 @@ class VectorSearchProvider:
         )
         return compressed_docs
 
-    def get_parent_docs(self, docs):
-        tmp_docs = {}
-        for doc in docs:
-            s3_uri = doc.metadata['source']
-            [bucket, s3_key] = s3_uri.split('/', 3)[2:4]
-            obj_body = s3.get_object(
-                Bucket=bucket,
-                Key=s3_key
-            )['Body'].read().decode('utf-8')
-            doc.page_content = self.strip_chunk_header(obj_body)
-            url = doc.metadata['url']
-            if url in tmp_docs:
-                if doc.metadata['score'] > tmp_docs[url].metadata['score']:
-                    tmp_docs[url].metadata['score'] = doc.metadata['score']
-            else:
-                tmp_docs[url] = doc
-        parent_docs = []
-        for url in list(tmp_docs.keys()):
-            parent_docs.append(tmp_docs[url])
-        return parent_docs
+    # searches as semantic_search does, but each result is the whole
+    # document its chunk came from, one per document. The vector store
+    # fetches every parent's chunks in one request.
+    def get_parent_docs(self, search_recommendations, top_k=10, score_threshold=0.2):
+        return self.vector_store_provider.semantic_query(
+            search_recommendations,
+            top_k,
+            score_threshold,
+            parent_docs=True
+        )
 
     def semantic_search(self, 
         search_recommendations, 
         score_threshold=0.2,
         top_k=10,
         retrieve_parent_docs=False,
-        contextual_compression=False
+        contextual_compression=False,
+        filters=None,
+        chunk_window=0
     ):
-        docs = self.vector_store_provider.semantic_query(
-            search_recommendations, 
-            top_k, 
-            score_threshold
-        )
+        # filters (see metadata_filter.py) apply to the recommendations
+        # that don't have their own.
+        if filters:
+            search_recommendations = [
+                {**recommendation, "filters": recommendation.get('filters', filters)}
+                for recommendation in search_recommendations
+            ]
+        # the reranker picks top_k from more candidates than that.
+        fetch_k = self.reranker.fetch_k(top_k) if self.reranker else top_k
+        if retrieve_parent_docs:
+            docs = self.get_parent_docs(search_recommendations, fetch_k, score_threshold)
+        else:
+            docs = self.vector_store_provider.semantic_query(
+                search_recommendations, 
+                fetch_k, 
+                score_threshold,
+                chunk_window=chunk_window
+            )
+        if self.reranker:
+            docs = self.reranker.rerank(rerank_query(search_recommendations), docs, top_k)
         return docs
 
     @staticmethod
@@ -76,7 +87,7 @@ class VectorSearchProvider:
         lines = chunk_text.split('\n')
         final_text = ''
         if lines[0].lower().startswith('<title>') and \
-            lines[0].lower().endwith('</title>'):
+            lines[0].lower().endswith('</title>'):
             final_text = '\n'.join(lines[1:])
         else:
             final_text = chunk_text
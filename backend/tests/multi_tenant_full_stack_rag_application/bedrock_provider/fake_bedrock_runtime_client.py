@@ -0,0 +1,141 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+from threading import Lock
+from time import sleep
+
+
+# what botocore raises for a throttled call, as far as callers can tell:
+# they check the error's name and message.
+class ThrottlingException(Exception):
+    def __init__(self, operation):
+        super().__init__(f"An error occurred (ThrottlingException) when calling the {operation} operation: Too many requests, please wait before trying again.")
+
+
+# Stand-in for the bedrock-runtime client's converse and converse_stream,
+# so generation can be tested offline. Pass it to BedrockProvider
+# as bedrock_rt_client. Each call returns the next of the given response
+# texts (the last one repeats). Streams split the text into chunk_size
+# character deltas, waiting delay seconds before each one. Token counts
+# are words, and prompt caching is simulated: the prompt up to the last
+# cachePoint is written to the cache the first time it's seen and read
+# from it after that.
+#
+# Throttling can be injected: the first throttles calls raise a
+# ThrottlingException, as do calls made while max_concurrency others are
+# in flight. Each converse call takes latency seconds.
+class FakeBedrockRuntimeClient:
+    def __init__(self, responses: [str]=['This is a fake response.'], *,
+        chunk_size: int=4,
+        delay: float=0,
+        latency: float=0,
+        max_concurrency: int=None,
+        throttles: int=0
+    ):
+        self.responses = responses
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.throttles = throttles
+        self.calls = []
+        self.cached_prefixes = set()
+        self.attempts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttled = 0
+        self.lock = Lock()
+
+    def converse(self, **kwargs):
+        self.start_call('Converse')
+        try:
+            if self.latency:
+                sleep(self.latency)
+            text = self.next_response(kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        return {
+            "output": {
+                "message": {
+                    "role": "assistant",
+                    "content": [{"text": text}]
+                }
+            },
+            "stopReason": "end_turn",
+            "usage": self.usage(text, kwargs)
+        }
+
+    def converse_stream(self, **kwargs):
+        self.start_call('ConverseStream')
+        with self.lock:
+            self.in_flight -= 1
+        text = self.next_response(kwargs)
+        return {"stream": self.stream_events(text, kwargs)}
+
+    def next_response(self, kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+            return self.responses[min(len(self.calls), len(self.responses)) - 1]
+
+    def start_call(self, operation):
+        with self.lock:
+            self.attempts += 1
+            if self.attempts <= self.throttles or \
+                (self.max_concurrency and self.in_flight >= self.max_concurrency):
+                self.throttled += 1
+                raise ThrottlingException(operation)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def stream_events(self, text, kwargs):
+        yield {"messageStart": {"role": "assistant"}}
+        for i in range(0, len(text), self.chunk_size):
+            if self.delay:
+                sleep(self.delay)
+            yield {
+                "contentBlockDelta": {
+                    "delta": {"text": text[i:i + self.chunk_size]},
+                    "contentBlockIndex": 0
+                }
+            }
+        yield {"contentBlockStop": {"contentBlockIndex": 0}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {
+            "metadata": {
+                "usage": self.usage(text, kwargs),
+                "metrics": {"latencyMs": 0}
+            }
+        }
+
+    def usage(self, text, kwargs):
+        blocks = list(kwargs.get('system', []))
+        for message in kwargs.get('messages', []):
+            blocks += message['content']
+        input_tokens = 0
+        cached_tokens = 0
+        prefix = []
+        for block in blocks:
+            if 'cachePoint' in block:
+                cached_tokens = input_tokens
+                cached_prefix = json.dumps(prefix)
+            else:
+                input_tokens += len(block.get('text', '').split())
+                prefix.append(block)
+        cache_read = 0
+        cache_write = 0
+        if cached_tokens > 0:
+            if cached_prefix in self.cached_prefixes:
+                cache_read = cached_tokens
+            else:
+                cache_write = cached_tokens
+                self.cached_prefixes.add(cached_prefix)
+        output_tokens = len(text.split())
+        return {
+            "inputTokens": input_tokens - cached_tokens,
+            "outputTokens": output_tokens,
+            "totalTokens": input_tokens + output_tokens,
+            "cacheReadInputTokens": cache_read,
+            "cacheWriteInputTokens": cache_write
+        }
@@ -10,6 +10,7 @@ from moto import mock_aws
 
 from multi_tenant_full_stack_rag_application.bedrock_provider import BedrockProvider
 from multi_tenant_full_stack_rag_application.bedrock_provider.bedrock_provider_event import BedrockProviderEvent
+from fake_bedrock_runtime_client import FakeBedrockRuntimeClient
 from multi_tenant_full_stack_rag_application import utils 
 
 emb_model_id = "amazon.titan-embed-text-v2:0"
@@ -150,6 +151,60 @@ def test_embed_text_direct(bedrock_provider):
     assert all(isinstance(x, float) for x in embedding)
     bedrock_provider.bedrock_rt.invoke_model.assert_called_once()
 
+def test_embed_texts_titan_preserves_order(bedrock_provider):
+    """Test that Titan batch embeddings fan out one request per text and keep input order"""
+    def fake_invoke_model(**kwargs):
+        text = json.loads(kwargs['body'])['inputText']
+        body = MagicMock()
+        body.read.return_value = json.dumps({
+            'embedding': [float(len(text))] * 4
+        }).encode('utf-8')
+        return {'body': body}
+
+    bedrock_provider.bedrock_rt.invoke_model.side_effect = fake_invoke_model
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    embeddings = bedrock_provider.embed_texts(texts, emb_model_id, dimensions=4)
+
+    assert len(embeddings) == len(texts)
+    assert [e[0] for e in embeddings] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert bedrock_provider.bedrock_rt.invoke_model.call_count == len(texts)
+
+def test_embed_texts_cohere_batches_requests(bedrock_provider):
+    """Test that Cohere batch embeddings pack up to 96 texts per request"""
+    def fake_invoke_model(**kwargs):
+        batch = json.loads(kwargs['body'])['texts']
+        body = MagicMock()
+        body.read.return_value = json.dumps({
+            'embeddings': [[float(t)] for t in batch]
+        }).encode('utf-8')
+        return {'body': body}
+
+    bedrock_provider.bedrock_rt.invoke_model.side_effect = fake_invoke_model
+    texts = [str(i) for i in range(200)]
+    embeddings = bedrock_provider.embed_texts(texts, "cohere.embed-english-v3")
+
+    assert [e[0] for e in embeddings] == [float(i) for i in range(200)]
+    assert bedrock_provider.bedrock_rt.invoke_model.call_count == 3
+
+def test_handler_embed_texts(bedrock_provider):
+    """Test embed_texts operation through handler"""
+    event = BedrockProviderEvent(
+        operation="embed_texts",
+        origin="http://localhost:5173",
+        args={
+            "model_id": emb_model_id,
+            "input_texts": ["first sentence", "second sentence"],
+            "dimensions": 1024
+        }
+    )
+    
+    result = bedrock_provider.handler(event, {})
+    
+    assert result['statusCode'] == 200
+    assert result['operation'] == 'embed_texts'
+    assert len(result['response']) == 2
+    assert len(result['response'][0]) == 1024
+
 def test_handler_embed_text(bedrock_provider):
     """Test embed_text operation through handler"""
     event = BedrockProviderEvent(
@@ -255,6 +310,89 @@ def test_handler_invoke_model(bedrock_provider):
     assert isinstance(result['response'], str)
     assert len(result['response']) > 0
 
+def test_invoke_model_stream_yields_deltas(bedrock_provider):
+    """Test streaming generation against the fake runtime client"""
+    bedrock_provider.bedrock_rt = FakeBedrockRuntimeClient(['Hello, streaming world.'], chunk_size=5)
+    deltas = list(bedrock_provider.invoke_model_stream(
+        model_id=claude_model_id,
+        messages=[{"role": "user", "content": [{"text": "Hi"}]}],
+        inference_config={"maxTokens": 100}
+    ))
+    assert deltas == ['Hello', ', str', 'eamin', 'g wor', 'ld.']
+    assert bedrock_provider.bedrock_rt.calls[0]['modelId'] == claude_model_id
+
+def test_handler_invoke_model_reports_prompt_cache_usage(bedrock_provider):
+    """Test that cache points are sent and cache reads and writes reported"""
+    bedrock_provider.bedrock_rt = FakeBedrockRuntimeClient(['Hi'])
+    instructions = ' '.join(['word'] * 2000)
+    event = BedrockProviderEvent(
+        operation="invoke_model",
+        origin="test-bedrock-function",
+        args={
+            "model_id": claude_model_id,
+            "system": [{"text": instructions}, {"cachePoint": {"type": "default"}}],
+            "messages": [{"role": "user", "content": [{"text": "Hello there"}]}],
+        }
+    )
+    first = bedrock_provider.handler(event, {})
+    second = bedrock_provider.handler(event, {})
+    assert bedrock_provider.bedrock_rt.calls[0]['system'][1] == {"cachePoint": {"type": "default"}}
+    assert first['usage']['cache_write_input_tokens'] == 2000
+    assert second['usage']['cache_read_input_tokens'] == 2000
+    assert second['usage']['input_tokens'] == 2
+
+def test_handler_retries_throttled_calls(bedrock_provider):
+    """Test that throttled calls are retried and show in the scheduler metrics"""
+    bedrock_provider.bedrock_rt = FakeBedrockRuntimeClient(['Hi'], throttles=1)
+    bedrock_provider.scheduler.sleep = lambda seconds: None
+    event = BedrockProviderEvent(
+        operation="invoke_model",
+        origin="test-bedrock-function",
+        args={
+            "model_id": claude_model_id,
+            "messages": [{"role": "user", "content": [{"text": "Hello there"}]}],
+        }
+    )
+    assert bedrock_provider.handler(event, {})['response'] == 'Hi'
+    metrics = bedrock_provider.handler(BedrockProviderEvent(
+        operation="get_scheduler_metrics",
+        origin="test-bedrock-function",
+        args={}
+    ), {})['response']
+    assert metrics[claude_model_id]['throttles']['interactive'] == 1
+
+def test_invoke_model_stream_raises_stream_errors(bedrock_provider):
+    """Test that exception events in the stream are raised"""
+    bedrock_provider.bedrock_rt.converse_stream.return_value = {
+        "stream": iter([
+            {"contentBlockDelta": {"delta": {"text": "Hel"}, "contentBlockIndex": 0}},
+            {"throttlingException": {"message": "slow down"}},
+        ])
+    }
+    stream = bedrock_provider.invoke_model_stream(
+        model_id=claude_model_id,
+        messages=[{"role": "user", "content": [{"text": "Hi"}]}],
+    )
+    assert next(stream) == 'Hel'
+    with pytest.raises(Exception) as exc_info:
+        next(stream)
+    assert "slow down" in str(exc_info.value)
+
+def test_handler_invoke_model_stream(bedrock_provider):
+    """Test invoke_model_stream through handler returns all deltas"""
+    bedrock_provider.bedrock_rt = FakeBedrockRuntimeClient(['Hello there'], chunk_size=4)
+    event = BedrockProviderEvent(
+        operation="invoke_model_stream",
+        origin="test-bedrock-function",
+        args={
+            "model_id": claude_model_id,
+            "messages": [{"role": "user", "content": [{"text": "Hi"}]}],
+        }
+    )
+    result = bedrock_provider.handler(event, {})
+    assert result['statusCode'] == 200
+    assert ''.join(result['response']) == 'Hello there'
+
 def test_handler_forbidden_origin(bedrock_provider):
     """Test handler with forbidden origin"""
     event = BedrockProviderEvent(
@@ -0,0 +1,104 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from time import sleep
+
+from multi_tenant_full_stack_rag_application.bedrock_provider.bedrock_scheduler import BedrockScheduler, default_priority_shares, event_priority, priorities
+from multi_tenant_full_stack_rag_application.utils.adaptive_limiter import AdaptiveConcurrencyLimiter
+from fake_bedrock_runtime_client import FakeBedrockRuntimeClient, ThrottlingException
+
+
+model_id = 'amazon.nova-micro-v1:0'
+messages = [{"role": "user", "content": [{"text": 'Hi'}]}]
+
+
+def test_throttled_calls_are_retried_and_counted():
+    delays = []
+    client = FakeBedrockRuntimeClient(['ok'], throttles=2)
+    scheduler = BedrockScheduler(max_concurrency=8, backoff_base=1, sleep=delays.append)
+    response = scheduler.call(model_id, 'interactive', client.converse, modelId=model_id, messages=messages)
+    assert response['output']['message']['content'][0]['text'] == 'ok'
+    metrics = scheduler.metrics()[model_id]
+    assert metrics['throttles']['interactive'] == 2
+    # halved once per throttle.
+    assert metrics['limit'] == 2
+    assert len(delays) == 2 and 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2
+
+
+def test_lower_priorities_back_off_longer_and_give_up():
+    delays = []
+    client = FakeBedrockRuntimeClient(throttles=10)
+    scheduler = BedrockScheduler(max_retries=1, backoff_base=1, sleep=delays.append)
+    with pytest.raises(ThrottlingException):
+        scheduler.call(model_id, 'ingestion', client.converse, modelId=model_id, messages=messages)
+    assert len(delays) == 1 and 1.5 <= delays[0] <= 3
+    with pytest.raises(ValueError):
+        scheduler.call(model_id, 'interactive', lambda: int('x'))
+
+
+def test_retries_stop_before_the_invocation_times_out():
+    delays = []
+    client = FakeBedrockRuntimeClient(throttles=10)
+    scheduler = BedrockScheduler(max_retries=6, backoff_base=1, sleep=delays.append)
+    # ingestion's first backoff is at least 1.5 seconds.
+    scheduler.set_time_limit(1)
+    with pytest.raises(ThrottlingException):
+        scheduler.call(model_id, 'ingestion', client.converse, modelId=model_id, messages=messages)
+    assert delays == []
+    scheduler.set_time_limit(None)
+    client = FakeBedrockRuntimeClient(['ok'], throttles=3)
+    scheduler.call(model_id, 'ingestion', client.converse, modelId=model_id, messages=messages)
+    assert len(delays) == 3
+
+
+def test_concurrency_adapts_to_the_quota():
+    client = FakeBedrockRuntimeClient(latency=0.01, max_concurrency=3)
+    scheduler = BedrockScheduler(max_concurrency=8, backoff_base=0.001)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(
+            lambda i: scheduler.call(model_id, 'ingestion', client.converse, modelId=model_id, messages=messages),
+            range(40)
+        ))
+    assert len(client.calls) == 40
+    assert client.max_in_flight <= 3
+    assert scheduler.metrics()[model_id]['throttles']['ingestion'] == client.throttled
+
+
+def test_interactive_calls_start_before_waiting_batch_calls():
+    limiter = AdaptiveConcurrencyLimiter(1, priorities=priorities, shares=default_priority_shares)
+    limiter.acquire('interactive')
+    started = []
+
+    def run(priority):
+        limiter.acquire(priority)
+        started.append(priority)
+        limiter.release()
+
+    threads = [Thread(target=run, args=(priority,)) for priority in ['ingestion', 'enrichment', 'interactive']]
+    for thread in threads:
+        thread.start()
+        sleep(0.01)
+    assert limiter.metrics()['queue_depth'] == {'interactive': 1, 'enrichment': 1, 'ingestion': 1}
+    limiter.release()
+    for thread in threads:
+        thread.join()
+    assert started == ['interactive', 'enrichment', 'ingestion']
+
+
+def test_batch_work_leaves_room_for_interactive_calls():
+    limiter = AdaptiveConcurrencyLimiter(4, priorities=priorities, shares=default_priority_shares)
+    limiter.acquire('ingestion')
+    limiter.acquire('ingestion')
+    assert not limiter.can_start('ingestion')
+    assert limiter.can_start('interactive')
+
+
+def test_event_priority():
+    origins = {'origin_ingestion_provider': 'ingestion-fn', 'origin_generation_handler': 'generation-fn'}
+    assert event_priority('invoke_model', 'ingestion-fn', {}, origins) == 'ingestion'
+    assert event_priority('invoke_model', 'generation-fn', {}, origins) == 'interactive'
+    assert event_priority('embed_texts', 'generation-fn', {}, origins) == 'ingestion'
+    assert event_priority('invoke_model', 'ingestion-fn', {"priority": 'interactive'}, origins) == 'interactive'
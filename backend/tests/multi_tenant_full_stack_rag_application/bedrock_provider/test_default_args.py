@@ -0,0 +1,44 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import pytest
+from pathlib import Path
+
+from multi_tenant_full_stack_rag_application.bedrock_provider.default_args import DefaultArgs
+
+
+params_path = Path(__file__).parents[3] / 'src/multi_tenant_full_stack_rag_application/bedrock_provider/bedrock_model_params.json'
+model_params = json.loads(params_path.read_text())
+model_id = 'anthropic.claude-sonnet-4-20250514-v1:0'
+
+
+def test_every_model_resolves():
+    default_args = DefaultArgs(model_params)
+    assert set(default_args.defaults) == set(model_params)
+    assert default_args.merge(model_id) == {"maxTokens": 4096, "temperature": 0.0, "topP": 1, "stopSequences": ['Human']}
+
+
+def test_overrides_are_validated_and_merged():
+    default_args = DefaultArgs(model_params)
+    # inference profile IDs and the frontend's string inputs work.
+    args = default_args.merge('us.' + model_id, {"maxTokens": '100', "stopSequences": '["</answer>"]', "other": 'x'})
+    assert args == {"maxTokens": 100, "temperature": 0.0, "topP": 1, "stopSequences": ['</answer>'], "other": 'x'}
+    assert default_args.model_ids['us.' + model_id] == model_id
+    with pytest.raises(ValueError, match='temperature'):
+        default_args.merge(model_id, {"temperature": 2})
+    with pytest.raises(ValueError, match='maxTokens'):
+        default_args.merge(model_id, {"maxTokens": 'lots'})
+
+
+def test_defaults_are_copied():
+    default_args = DefaultArgs(model_params)
+    default_args.merge(model_id)['stopSequences'].append('Assistant')
+    assert default_args.merge(model_id)['stopSequences'] == ['Human']
+
+
+def test_bad_params_fail_at_load():
+    with pytest.raises(ValueError):
+        DefaultArgs({"model": {"default_paths": ['maxTokens.default'], "maxTokens": {"max": 10}}})
+    with pytest.raises(Exception, match='Could not find model'):
+        DefaultArgs(model_params).merge('unknown.model-v1:0')
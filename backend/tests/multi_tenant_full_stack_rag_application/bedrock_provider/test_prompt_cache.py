@@ -0,0 +1,60 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from fake_bedrock_runtime_client import FakeBedrockRuntimeClient
+from multi_tenant_full_stack_rag_application.bedrock_provider.prompt_cache import apply_cache_points, cache_point, usage_metrics
+
+
+caching = {"minTokens": 5, "maxCachePoints": 2}
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def converse_args(system_words, *message_words):
+    return {
+        "modelId": 'model',
+        "system": [{"text": ' '.join(['s'] * system_words)}, cache_point],
+        "messages": [
+            {"role": 'user', "content": [{"text": ' '.join(['m'] * words)}, cache_point]}
+            for words in message_words
+        ]
+    }
+
+
+def test_cache_points_are_removed_for_models_without_caching():
+    args = converse_args(10, 10)
+    result = apply_cache_points(args, None, count_words)
+    assert result['system'] == [args['system'][0]]
+    assert result['messages'][0]['content'] == [args['messages'][0]['content'][0]]
+    # the caller's args aren't changed.
+    assert args['system'][1] == cache_point
+
+
+def test_short_prefixes_and_extra_cache_points_are_removed():
+    # the system prefix is too short, and of the rest only the last two
+    # are kept.
+    result = apply_cache_points(converse_args(2, 3, 3, 3), caching, count_words)
+    assert result['system'] == [{"text": 's s'}]
+    assert [len(message['content']) for message in result['messages']] == [1, 2, 2]
+
+
+def test_args_without_cache_points_are_unchanged():
+    args = {"modelId": 'model', "messages": [{"role": 'user', "content": [{"text": 'hi'}]}]}
+
+    def fail(texts):
+        raise AssertionError('counted tokens')
+
+    assert apply_cache_points(args, caching, fail) is args
+
+
+def test_fake_client_reads_cached_prefixes():
+    client = FakeBedrockRuntimeClient(['ok'])
+    args = converse_args(10, 3)
+    first = usage_metrics(client.converse(**args)['usage'])
+    second = usage_metrics(client.converse(**args)['usage'])
+    assert first == {"input_tokens": 0, "output_tokens": 1, "cache_read_input_tokens": 0, "cache_write_input_tokens": 13}
+    assert second['cache_read_input_tokens'] == 13
+    changed = usage_metrics(client.converse(**converse_args(10, 4))['usage'])
+    assert changed['cache_write_input_tokens'] == 14
@@ -242,3 +242,72 @@ def test_delete_file(doc_collections_handler):
     }
     result = doc_collections_handler.handler(event, {})
     # print(f"delete file result: {result}")
+
+
+class FakeDdb:
+    def __init__(self):
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+def migrating_handler(monkeypatch, collection, migrate_response):
+    handler = DocumentCollectionsHandler.__new__(DocumentCollectionsHandler)
+    handler.doc_collections_table = 'table'
+    handler.ddb = FakeDdb()
+    handler.lambda_ = FakeLambda()
+    handler.my_origin = 'doc-collections-fn'
+    handler.index_migration_timeout = 900
+    handler.migration_lambda = object()
+    handler.utils = utils
+    monkeypatch.setattr(handler, 'get_doc_collection', lambda *args, **kwargs: collection)
+    monkeypatch.setattr(utils, 'get_ssm_params', lambda name: 'doc-collections-fn')
+    monkeypatch.setattr(utils, 'migrate_vector_index', lambda *args, **kwargs: migrate_response)
+    return handler
+
+
+def test_index_migrations_run_async_and_save_the_profile_when_they_succeed(monkeypatch):
+    collection = DocumentCollection(user_id, user_email, collection_name, description, index_profile={"data_type": "float"})
+    handler = migrating_handler(monkeypatch, collection, {
+        "statusCode": 200,
+        "body": json.dumps({"doc_count": 3, "errors": []})
+    })
+    new_profile = {"data_type": "byte", "engine": "lucene"}
+    handler.start_index_migration(collection, new_profile)
+    assert collection.index_migration['status'] == 'in_progress'
+    # the profile isn't saved until the migration is done.
+    assert 'index_profile =' not in handler.ddb.updates[0]['UpdateExpression']
+    [invocation] = handler.lambda_.invocations
+    assert invocation['InvocationType'] == 'Event'
+    assert json.loads(invocation['Payload'])['args']['index_profile'] == new_profile
+
+    # asking again while it's running doesn't start another one.
+    handler.start_index_migration(collection, new_profile)
+    assert len(handler.lambda_.invocations) == 1
+
+    migration = handler.migrate_vector_index(user_id, collection.collection_id, new_profile)
+    assert migration['status'] == 'complete'
+    values = handler.ddb.updates[-1]['ExpressionAttributeValues']
+    assert json.loads(values[':profile']['S']) == new_profile
+
+
+def test_failed_index_migrations_keep_the_old_profile(monkeypatch):
+    collection = DocumentCollection(user_id, user_email, collection_name, description, index_profile={"data_type": "float"})
+    handler = migrating_handler(monkeypatch, collection, {
+        "statusCode": 200,
+        "body": json.dumps({"doc_count": 2, "errors": [{"doc_id": "a", "error": "mapper_parsing_exception"}]})
+    })
+    migration = handler.migrate_vector_index(user_id, collection.collection_id, {"data_type": "byte", "engine": "lucene"})
+    assert migration['status'] == 'failed'
+    assert migration['errors'] == [{"doc_id": "a", "error": "mapper_parsing_exception"}]
+    update = handler.ddb.updates[-1]
+    assert update['UpdateExpression'] == 'SET index_migration = :migration'
@@ -0,0 +1,112 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from multi_tenant_full_stack_rag_application.generation_handler.context_assembler import ContextAssembler, PromptTemplate, default_context_window, truncation_marker
+
+
+def word_counts(texts, model_id=None):
+    return [len(text.split()) for text in texts]
+
+
+def assembler(**kwargs):
+    windows = {'model-a': 1000, 'model-b': 1000}
+    kwargs = {'has_tokenizer': lambda model_id: True, 'token_counter': word_counts, **kwargs}
+    return ContextAssembler(windows.get, margin=0, min_truncated_tokens=3, **kwargs)
+
+
+def words(n, word='w'):
+    return ' '.join([word] * n)
+
+
+def test_prompt_template_fills_placeholders_once():
+    template = PromptTemplate('<c>{context}</c> {user_prompt} {other}', ['context', 'user_prompt'])
+    # values aren't searched for placeholders, unlike chained .replace calls.
+    assert template.format(context='see {user_prompt}', user_prompt='why?') == '<c>see {user_prompt}</c> why? {other}'
+    # placeholders without values are left as they are.
+    assert template.format(user_prompt='why?') == '<c>{context}</c> why? {other}'
+    # the text before the first placeholder is what can be cached.
+    assert template.prefix == '<c>'
+
+
+def test_templates_are_compiled_once_per_text():
+    ctx = assembler(max_compiled_templates=1)
+    first = ctx.compile('{context} a')
+    assert ctx.compile('{context} a') is first
+    ctx.compile('{context} b')
+    assert ctx.compile('{context} a') is not first
+
+
+def test_context_budget():
+    ctx = assembler(max_context_tokens=800)
+    assert ctx.context_budget('model-a', words(100), 200) == 700
+    assert ctx.context_budget('model-a', words(100), 0) == 800
+    assert ctx.context_budget('model-a', words(2000), 0) == 0
+    assert ctx.context_window('unknown-model') == default_context_window
+
+
+def test_context_is_budgeted_in_the_generation_models_tokens():
+    counted_for = []
+    def counter(texts, model_id=None):
+        counted_for.append(model_id)
+        # model-b's tokenizer counts two tokens a word.
+        return [len(text.split()) * (2 if model_id == 'model-b' else 1) for text in texts]
+    ctx = assembler(token_counter=counter)
+    assert ctx.context_budget('model-a', words(100)) == 900
+    assert ctx.context_budget('model-b', words(100)) == 800
+    assembled = ctx.assemble({'semantic_search': [('', words(10), ''), ('', words(10), '')]}, 30, 'model-b')
+    # 20 of model-b's tokens for the first block, and what's left after
+    # the truncation marker's 2 tokens is 4 words of the second.
+    assert assembled['semantic_search'] == [('', words(10), ''), ('', words(4) + ' ' + truncation_marker, '')]
+    assert set(counted_for) == {'model-a', 'model-b'}
+
+
+def test_estimated_counts_leave_a_safety_margin():
+    ctx = assembler(has_tokenizer=lambda model_id: model_id == 'model-a', estimate_safety_factor=1.25)
+    assert ctx.context_budget('model-a', words(100)) == 900
+    # 1000 / 1.25 - 100
+    assert ctx.context_budget('model-b', words(100)) == 700
+    # without has_tokenizer every count is an estimate.
+    ctx = assembler(has_tokenizer=None, estimate_safety_factor=1.25)
+    assert ctx.context_budget('model-a', words(100)) == 700
+
+
+def test_context_window_lookup_failures_are_retried():
+    calls = []
+
+    def get_context_window(model_id):
+        calls.append(model_id)
+        raise Exception('throttled')
+
+    ctx = ContextAssembler(get_context_window)
+    assert ctx.context_window('model-a') == default_context_window
+    assert ctx.context_window('model-a') == default_context_window
+    assert calls == ['model-a', 'model-a']
+
+
+def test_unused_shares_go_to_sources_that_need_them():
+    ctx = assembler()
+    assert ctx.allocate({'semantic_search': 900, 'graph': 0, 'tool': 50}, 1000) == {'semantic_search': 900, 'graph': 0, 'tool': 50}
+    assert ctx.allocate({'semantic_search': 900, 'graph': 100, 'tool': 900}, 1000) == {'semantic_search': 600, 'graph': 100, 'tool': 300}
+    # shares are of the sources present.
+    assert ctx.allocate({'tool': 900}, 500) == {'tool': 500}
+
+
+def test_blocks_are_kept_whole_then_truncated():
+    ctx = assembler()
+    blocks = {
+        'semantic_search': [('', words(40, 'a'), ''), ('', words(40, 'b'), ''), ('', words(40, 'c'), '')],
+        'tool': [('<t>\n', words(500, 'x'), '\n</t>')]
+    }
+    assembled = ctx.assemble(blocks, 100)
+    # without graph results, semantic search gets 5/8 of the budget: the
+    # first doc, then what's left of the second besides the marker.
+    assert assembled['semantic_search'] == [('', words(40, 'a'), ''), ('', words(22, 'b') + ' ' + truncation_marker, '')]
+    # tools get the other 37, less their tags and the marker.
+    assert assembled['tool'] == [('<t>\n', words(34, 'x') + ' ' + truncation_marker, '\n</t>')]
+    assert sum(word_counts([''.join(block) for blocks in assembled.values() for block in blocks])) <= 100
+
+
+def test_blocks_too_small_to_truncate_are_dropped():
+    ctx = assembler()
+    assembled = ctx.assemble({'semantic_search': [('', words(10), ''), ('', words(10), '')]}, 12)
+    assert assembled['semantic_search'] == [('', words(10), '')]
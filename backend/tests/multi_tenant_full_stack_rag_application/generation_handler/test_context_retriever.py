@@ -0,0 +1,59 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+from threading import Event
+
+from multi_tenant_full_stack_rag_application.generation_handler.context_retriever import ContextRetriever
+
+
+@pytest.fixture
+def retriever():
+    return ContextRetriever(
+        max_workers=4,
+        source_timeouts={'graph': 0.2, 'semantic_search': 1, 'tool': 1}
+    )
+
+
+def test_retrieve_returns_results_in_task_order(retriever):
+    tasks = [
+        {"source": "tool", "id": "web_search", "fn": lambda x: x * 2, "args": (2,)},
+        {"source": "semantic_search", "id": "coll1", "fn": lambda x: [x], "args": ("doc",)},
+    ]
+    results = retriever.retrieve(tasks)
+    assert [r['id'] for r in results] == ['web_search', 'coll1']
+    assert [r['status'] for r in results] == ['ok', 'ok']
+    assert results[0]['response'] == 4
+    assert results[1]['response'] == ['doc']
+
+
+def test_retrieve_drops_slow_and_failing_sources(retriever):
+    release = Event()
+
+    def fail():
+        raise Exception("boom")
+
+    tasks = [
+        {"source": "graph", "id": "coll1", "fn": release.wait, "args": (5,)},
+        {"source": "semantic_search", "id": "coll2", "fn": fail},
+        {"source": "semantic_search", "id": "coll3", "fn": lambda: ["ok"]},
+    ]
+    results = retriever.retrieve(tasks)
+    release.set()
+    assert results[0]['status'] == 'timeout'
+    assert results[1]['status'] == 'error'
+    assert results[1]['error'] == 'boom'
+    assert results[2]['status'] == 'ok'
+    assert results[2]['response'] == ['ok']
+
+
+def test_timed_out_tasks_dont_hold_workers_for_later_calls():
+    retriever = ContextRetriever(max_workers=1, source_timeouts={'graph': 0.1, 'semantic_search': 1})
+    release = Event()
+    results = retriever.retrieve([{"source": "graph", "id": "coll1", "fn": release.wait, "args": (5,)}])
+    assert results[0]['status'] == 'timeout'
+    assert retriever.abandoned == 1
+    # the next call isn't stuck behind the abandoned one.
+    results = retriever.retrieve([{"source": "semantic_search", "id": "coll2", "fn": lambda: ["ok"]}])
+    assert results[0]['response'] == ['ok']
+    release.set()
@@ -0,0 +1,54 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import markdown
+import pytest
+
+from multi_tenant_full_stack_rag_application.generation_handler.markdown_stream import IncrementalMarkdownRenderer
+
+
+sample_response = """# Answer
+
+Here is a paragraph with **bold** text
+that spans two lines.
+
+- first item
+- second item
+
+- loose item
+
+```python
+def f():
+
+    return 1
+```
+
+Final paragraph."""
+
+
+def render_in_chunks(text, chunk_size):
+    renderer = IncrementalMarkdownRenderer()
+    fragments = []
+    for i in range(0, len(text), chunk_size):
+        fragments.append(renderer.feed(text[i:i + chunk_size]))
+    fragments.append(renderer.close())
+    return fragments
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1000])
+def test_incremental_render_matches_full_render(chunk_size):
+    fragments = render_in_chunks(sample_response, chunk_size)
+    assert ''.join(fragments) == markdown.markdown(sample_response)
+
+
+def test_blocks_are_emitted_before_close():
+    renderer = IncrementalMarkdownRenderer()
+    assert renderer.feed('First paragraph.\n\n') == ''
+    assert renderer.feed('Second') == '<p>First paragraph.</p>'
+    assert renderer.close() == '\n<p>Second</p>'
+
+
+def test_code_fence_is_held_until_closed():
+    renderer = IncrementalMarkdownRenderer()
+    assert renderer.feed('```\nline one\n\nline two\n') == ''
+    assert renderer.feed('```\n\nafter') != ''
@@ -0,0 +1,55 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+from pathlib import Path
+
+from multi_tenant_full_stack_rag_application.generation_handler.orchestration_prompt import OrchestrationPrompt, collections_version
+
+
+template_path = Path(__file__).parents[3] / 'src/multi_tenant_full_stack_rag_application/generation_handler/system_get_orchestration.txt'
+tools = [{"id": "web_search_tool", "description": "searches the web"}]
+
+
+def doc_collections(description='Refund policies', graph_schema='{}', updated_date='2024-01-01'):
+    return {
+        'returns': {
+            "collection_id": 'c1',
+            "collection_name": 'returns',
+            "description": description,
+            "graph_schema": graph_schema,
+            "updated_date": updated_date,
+        }
+    }
+
+
+def test_static_prefix_has_collections_and_tools_but_not_the_turn():
+    prompt = OrchestrationPrompt(template_path.read_text(), tools)
+    prefix = prompt.static_prefix('user1', doc_collections())
+    assert '"id": "c1"' in prefix and '"web_search_tool"' in prefix
+    assert '{current_user_prompt}' not in prefix and '{current_date}' not in prefix
+    # literal braces in the instructions are left alone.
+    assert '<tool_inputs>{json_inputs}</tool_inputs>' in prefix
+
+    suffix = prompt.dynamic_suffix(current_user_prompt='How do refunds work?', current_date='2024-06-01', conversation_history='')
+    assert suffix.startswith('<current_date>2024-06-01</current_date>')
+    assert 'How do refunds work?' in suffix and suffix.rstrip().endswith('<SELECTIONS>')
+
+
+def test_static_prefix_is_rendered_once_per_version():
+    prompt = OrchestrationPrompt('{available_document_collections}|{available_tools}\n{current_user_prompt}', tools)
+    first = prompt.static_prefix('user1', doc_collections())
+    assert prompt.static_prefix('user1', doc_collections()) is first
+    assert (prompt.hits, prompt.misses) == (1, 1)
+    assert json.loads(first.split('|')[0]) == [{"id": 'c1', "name": 'returns', "description": 'Refund policies', "graph_schema": {}}]
+    # another user, and an upserted collection, get their own.
+    prompt.static_prefix('user2', doc_collections())
+    updated = prompt.static_prefix('user1', doc_collections(description='Refunds and returns', updated_date='2024-02-01'))
+    assert 'Refunds and returns' in updated
+    assert (prompt.hits, prompt.misses) == (1, 3)
+
+
+def test_collections_version():
+    assert collections_version(doc_collections()) == collections_version(doc_collections())
+    assert collections_version(doc_collections()) != collections_version(doc_collections(graph_schema={"person": {}}))
+    assert collections_version(doc_collections()) != collections_version({})
@@ -0,0 +1,109 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from multi_tenant_full_stack_rag_application.generation_handler.query_router import QueryRouter
+
+
+topics = ['refund', 'shipping', 'graph']
+
+
+# one dimension per topic word in the text.
+def embed(text):
+    return [1.0 if topic in text.lower() else 0.0 for topic in topics] + [0.1]
+
+
+class Embedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(texts)
+        return [embed(text) for text in texts]
+
+
+def collection(collection_id, description, graph_schema='{}', updated_date='2024-01-01'):
+    return {
+        "collection_id": collection_id,
+        "collection_name": collection_id,
+        "description": description,
+        "graph_schema": graph_schema,
+        "updated_date": updated_date,
+    }
+
+
+collections = {
+    'returns': collection('c1', 'Refund and returns policies'),
+    'logistics': collection('c2', 'Shipping times and carriers'),
+    'org': collection('c3', 'Org chart graph', graph_schema='{"nodes": ["person"]}'),
+}
+
+
+def test_small_talk_needs_no_retrieval():
+    router = QueryRouter(embed, Embedder())
+    assert router.route('Thanks so much!', '', collections) == {}
+    assert router.route('hello there', '', collections) == {}
+
+
+def test_collections_are_only_matched_with_a_threshold():
+    embedder = Embedder()
+    router = QueryRouter(embed, embedder)
+    assert router.route('How long do refunds take?', '', collections) is None
+    assert embedder.calls == []
+
+
+def test_clear_matches_are_searched():
+    router = QueryRouter(embed, Embedder(), match_threshold=0.45)
+    assert router.route('How long do refunds take?', '', collections) == {"c1": {"search_terms": 'How long do refunds take?'}}
+    assert router.decisions['search'] == 1
+
+
+def test_unclear_cases_go_to_the_orchestration_model():
+    router = QueryRouter(embed, Embedder(), match_threshold=0.45)
+    # nothing matches, so it may need a tool.
+    assert router.route("What's the weather in Paris?", '', collections) is None
+    # graph collections need a graph query written.
+    assert router.route('Who is in the org graph?', '', collections) is None
+    # anything with history may be a follow up, pronoun or not.
+    assert router.route('How long does that take for refunds?', 'Human: what about returns?', collections) is None
+    assert router.route('and for refunds in 2023?', 'Human: refunds in 2024?', collections) is None
+    assert router.route('thanks', 'Human: refunds in 2024?', collections) is None
+    assert router.route('How long do refunds take?', '', {}) is None
+    assert router.decisions == {'no_retrieval': 0, 'orchestrate': 6, 'search': 0}
+
+
+def test_prompts_that_need_a_tool_go_to_the_orchestration_model():
+    router = QueryRouter(embed, Embedder(), match_threshold=0.45)
+    # each of these matches the refunds collection's description.
+    for prompt in [
+        'Search the web for the latest refund rules',
+        'What does the refund policy say in the file I uploaded?',
+        'Summarize the refund page at https://example.com/refunds',
+        'What are the current refund rates online?',
+    ]:
+        assert router.route(prompt, '', collections) is None, prompt
+    assert router.decisions['search'] == 0
+
+
+def test_descriptions_are_embedded_once_per_version():
+    embedder = Embedder()
+    router = QueryRouter(embed, embedder, match_threshold=0.45)
+    router.route('refund times', '', collections)
+    router.route('shipping times', '', collections)
+    assert len(embedder.calls) == 1 and len(embedder.calls[0]) == 3
+    updated = {**collections, 'returns': collection('c1', 'Refunds only', updated_date='2024-02-01')}
+    router.route('refund times', '', updated)
+    assert embedder.calls[1] == ['Refunds only']
+
+
+def test_routing_failures_go_to_the_orchestration_model():
+    def failing_embed(text):
+        raise Exception('throttled')
+
+    assert QueryRouter(failing_embed, Embedder(), match_threshold=0.45).route('refund times', '', collections) is None
+
+
+def test_orchestration_latency_average():
+    router = QueryRouter(embed, Embedder())
+    router.orchestration_seconds = 5
+    router.record_orchestration(10)
+    assert router.orchestration_seconds == 6
@@ -0,0 +1,100 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+
+from multi_tenant_full_stack_rag_application.generation_handler.response_cache import ResponseCache, normalize_prompt, response_cache_scope
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+# prompts about refunds point one way, everything else another.
+def embed(prompt):
+    if 'refund' in prompt:
+        return [1.0, 0.1 if 'policy' in prompt else 0.0]
+    return [0.0, 1.0]
+
+
+def scope(user_id='user1', versions={'coll1': ['2024-01-01', 3]}, model_args={'temperature': 0}, template_text='{context} {user_prompt}'):
+    return response_cache_scope(user_id, versions, 'default_rag', template_text, 'amazon.nova-pro-v1:0', model_args)
+
+
+def test_normalize_prompt():
+    assert normalize_prompt('  What is the  Refund policy?? ') == 'what is the refund policy'
+
+
+def test_scopes_change_with_anything_that_changes_the_answer():
+    assert scope() == scope(versions={'coll1': ['2024-01-01', 3]}, model_args={'temperature': 0})
+    assert scope() != scope(user_id='user2')
+    # a document finished ingesting into the collection.
+    assert scope() != scope(versions={'coll1': ['2024-01-01', 4]})
+    assert scope() != scope(model_args={'temperature': 0.5})
+    # the template was edited.
+    assert scope() != scope(template_text='Answer briefly. {context} {user_prompt}')
+    assert scope().startswith('user1:')
+    with pytest.raises(ValueError):
+        scope(user_id=None)
+
+
+def test_exact_hits():
+    cache = ResponseCache()
+    cache.put(scope(), 'What is the refund policy?', '<p>30 days</p>')
+    assert cache.get(scope(), 'what is the refund policy') == '<p>30 days</p>'
+    assert cache.get(scope(user_id='user2'), 'What is the refund policy?') is None
+    assert cache.get(scope(versions={'coll1': ['2024-01-01', 4]}), 'What is the refund policy?') is None
+    assert cache.metrics()['exact_hits'] == 1 and cache.metrics()['misses'] == 2
+
+
+def test_only_exact_prompts_match_by_default():
+    embedded = []
+
+    def recording_embed(prompt):
+        embedded.append(prompt)
+        return [1.0, 0.0]
+
+    cache = ResponseCache(recording_embed)
+    cache.put(scope(), 'What was revenue in 2023?', '<p>$1M</p>')
+    assert cache.get(scope(), 'what was revenue in 2023') == '<p>$1M</p>'
+    assert cache.get(scope(), 'What was revenue in 2024?') is None
+    assert cache.get(scope(), 'What was revenue not in 2023?') is None
+    assert embedded == []
+
+
+def test_similar_hits_stay_in_their_scope():
+    cache = ResponseCache(embed, similarity_threshold=0.99)
+    cache.put(scope(), 'refund policy', '<p>30 days</p>')
+    assert cache.get(scope(), 'how do refunds work?') == '<p>30 days</p>'
+    assert cache.get(scope(), 'shipping times') is None
+    # another user asking the same question never gets it.
+    assert cache.get(scope(user_id='user2'), 'how do refunds work?') is None
+    assert cache.metrics()['similar_hits'] == 1
+
+
+def test_embedding_failures_are_misses():
+    def failing_embed(prompt):
+        raise Exception('throttled')
+
+    cache = ResponseCache(failing_embed, similarity_threshold=0.95)
+    cache.put(scope(), 'refund policy', '<p>30 days</p>')
+    assert cache.get(scope(), 'refund policy') == '<p>30 days</p>'
+    assert cache.get(scope(), 'refunds?') is None
+
+
+def test_expiry_and_eviction():
+    clock = Clock()
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+    cache.put(scope(), 'a', 'A')
+    cache.put(scope(), 'b', 'B')
+    cache.get(scope(), 'a')
+    cache.put(scope(), 'c', 'C')
+    # b was the least recently used.
+    assert (cache.get(scope(), 'a'), cache.get(scope(), 'b'), cache.get(scope(), 'c')) == ('A', None, 'C')
+    clock.now = 11
+    assert cache.get(scope(), 'a') is None
+    assert len(cache) == 1
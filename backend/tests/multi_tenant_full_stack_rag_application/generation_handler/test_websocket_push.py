@@ -0,0 +1,68 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+from multi_tenant_full_stack_rag_application.generation_handler.websocket_push import FragmentPusher, connection_endpoint
+
+
+class GoneException(Exception):
+    pass
+
+
+class FakeManagementClient:
+    def __init__(self, gone_after=None):
+        self.gone_after = gone_after
+        self.posted = []
+
+    def post_to_connection(self, *, ConnectionId, Data):
+        if self.gone_after is not None and len(self.posted) >= self.gone_after:
+            raise GoneException(f"{ConnectionId} is gone")
+        self.posted.append((ConnectionId, json.loads(Data.decode('utf-8'))))
+
+
+def test_connection_endpoint():
+    event = {"requestContext": {"domainName": "abc.execute-api.us-west-2.amazonaws.com", "stage": "prod"}}
+    assert connection_endpoint(event) == "https://abc.execute-api.us-west-2.amazonaws.com/prod"
+
+
+def test_fragments_are_pushed_as_they_are_generated():
+    client = FakeManagementClient()
+    pusher = FragmentPusher(client, 'conn1')
+
+    def fragments():
+        yield '<p>one</p>'
+        # the first fragment was sent before the second was generated.
+        assert client.posted == [('conn1', {"type": "fragment", "html": '<p>one</p>'})]
+        yield '<p>two</p>'
+
+    assert pusher.push(fragments())
+    assert [message for (_, message) in client.posted] == [
+        {"type": "fragment", "html": '<p>one</p>'},
+        {"type": "fragment", "html": '<p>two</p>'},
+        {"type": "done"},
+    ]
+
+
+def test_generation_stops_when_the_browser_disconnects():
+    client = FakeManagementClient(gone_after=1)
+    generated = []
+
+    def fragments():
+        for i in range(5):
+            generated.append(i)
+            yield f'<p>{i}</p>'
+
+    assert not FragmentPusher(client, 'conn1').push(fragments())
+    assert len(client.posted) == 1
+    assert generated == [0, 1]
+
+
+def test_generation_errors_are_sent_to_the_browser():
+    client = FakeManagementClient()
+
+    def fragments():
+        yield '<p>one</p>'
+        raise Exception('model failed')
+
+    assert not FragmentPusher(client, 'conn1').push(fragments())
+    assert client.posted[-1][1] == {"type": "error", "message": 'model failed'}
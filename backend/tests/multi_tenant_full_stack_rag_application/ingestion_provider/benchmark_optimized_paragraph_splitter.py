@@ -0,0 +1,58 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+# Times OptimizedParagraphSplitter.split against the implementation it
+# replaced on generated multi-MB documents, and checks their output is
+# identical. Run from this directory with the src directory on the path:
+#   PYTHONPATH=../../../src python benchmark_optimized_paragraph_splitter.py [MB ...]
+
+import contextlib
+import io
+import random
+import sys
+from time import perf_counter
+
+from test_optimized_paragraph_splitter import make_splitter, reference_split
+
+
+# paragraphs of sentences, with the occasional run of blank lines and a
+# long unbroken section, so every split seq gets used.
+def generate_document(size_mb, seed=0):
+    rand = random.Random(seed)
+    vocabulary = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do']
+    paragraphs = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        sentences = []
+        for _ in range(rand.randint(1, 12)):
+            sentences.append(' '.join(rand.choice(vocabulary) for _ in range(rand.randint(3, 40))))
+        if rand.random() < 0.02:
+            sentences.append(' '.join(rand.choice(vocabulary) for _ in range(3000)))
+        paragraph = '. '.join(sentences) + '.'
+        paragraphs.append(paragraph)
+        paragraphs.append(rand.choice(['\n', '\n\n', '\n\n\n']))
+        size += len(paragraph) + 2
+    return ''.join(paragraphs)
+
+
+def timed(split, *args, **kwargs):
+    start = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = split(*args, **kwargs)
+    return results, perf_counter() - start
+
+
+def main(sizes_mb):
+    splitter = make_splitter(512)
+    header = '<FILENAME>\nbenchmark.txt\n</FILENAME>\n'
+    print(f"{'MB':>6} {'chunks':>8} {'reference s':>12} {'optimized s':>12} {'speedup':>8}")
+    for size_mb in sizes_mb:
+        content = generate_document(size_mb)
+        expected, reference_secs = timed(reference_split, splitter, content, extra_header_text=header)
+        results, optimized_secs = timed(splitter.split, content, 'benchmark/benchmark.txt', extra_header_text=header)
+        assert results == expected, f"output differs for {size_mb}MB"
+        print(f"{size_mb:>6} {len(results):>8} {reference_secs:>12.3f} {optimized_secs:>12.3f} {reference_secs / optimized_secs:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main([float(arg) for arg in sys.argv[1:]] or [1, 4, 16])
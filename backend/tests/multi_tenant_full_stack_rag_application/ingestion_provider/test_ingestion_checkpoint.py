@@ -0,0 +1,63 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+from unittest.mock import Mock, patch
+
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_checkpoint import IngestionCheckpoint, IngestionContinuationNeeded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def set_ingestion_status():
+    with patch('multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_checkpoint.utils.set_ingestion_status') as mock:
+        yield mock
+
+
+def test_saves_every_interval(set_ingestion_status):
+    clock = FakeClock()
+    checkpoint = IngestionCheckpoint('user', 'c1/doc.jsonl', 'etag', 'origin', clock=clock, interval=10)
+    checkpoint.advance(5)
+    assert set_ingestion_status.call_count == 0
+    clock.now = 11
+    checkpoint.advance(9, 12)
+    set_ingestion_status.assert_called_once_with(
+        'user', 'c1/doc.jsonl', 'etag', 9, 'IN_PROGRESS', 'origin', chunks_processed=12
+    )
+    clock.now = 15
+    checkpoint.advance(10)
+    assert set_ingestion_status.call_count == 1
+
+
+def test_stops_for_a_continuation_at_the_deadline(set_ingestion_status):
+    clock = FakeClock()
+    checkpoint = IngestionCheckpoint('user', 'c1/doc.pdf', 'etag', 'origin',
+        clock=clock,
+        deadline=100,
+        interval=1000,
+        lines_processed=40,
+        chunks_processed=31
+    )
+    checkpoint.advance(80, 60)
+    clock.now = 100
+    with pytest.raises(IngestionContinuationNeeded) as e:
+        checkpoint.advance(120, 95)
+    assert e.value.checkpoint.lines_processed == 120
+    assert checkpoint.resumed_from == 40
+    set_ingestion_status.assert_called_once_with(
+        'user', 'c1/doc.pdf', 'etag', 120, 'IN_PROGRESS', 'origin', chunks_processed=95
+    )
+
+
+def test_deadline_from_context():
+    context = Mock()
+    context.get_remaining_time_in_millis.return_value = 900000
+    assert IngestionCheckpoint.deadline_from_context(context, margin=90, clock=lambda: 5) == 815
+    assert IngestionCheckpoint.deadline_from_context(None) is None
@@ -0,0 +1,96 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+from hashlib import md5
+from unittest.mock import Mock
+
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_chunk_fingerprints import ChunkFingerprintIndex, ChunkFingerprintStore
+
+
+user_id = 'test_user_id'
+doc_id = 'test_doc_id'
+
+
+# just enough of query, put_item and delete_item to run the store against.
+class FakeDynamoDbClient:
+    def __init__(self):
+        self.items = {}
+        self.put_count = 0
+
+    def delete_item(self, TableName, Key):
+        self.items.pop((Key['user_id']['S'], Key['doc_id']['S']), None)
+
+    def put_item(self, TableName, Item):
+        self.put_count += 1
+        self.items[(Item['user_id']['S'], Item['doc_id']['S'])] = Item
+
+    def query(self, **kwargs):
+        values = kwargs['ExpressionAttributeValues']
+        items = [
+            item for (pk, sk), item in sorted(self.items.items())
+            if pk == values[':user_id']['S'] and sk.startswith(values[':doc_id']['S'])
+        ]
+        return {"Items": items}
+
+
+def test_index_tracks_unchanged_and_stale_chunks():
+    fp = ChunkFingerprintIndex.fingerprint
+    index = ChunkFingerprintIndex({
+        'doc:0': fp('a'),
+        'doc:1': fp('b'),
+        'doc:2': fp('c'),
+    })
+    assert index.is_unchanged('doc:0', fp('a'))
+    assert not index.is_unchanged('doc:1', fp('B'))
+    assert not index.is_unchanged('doc:3', fp('d'))
+    index.record('doc:1', fp('B'))
+    assert index.unchanged_count == 1
+    assert index.current == {'doc:0': fp('a'), 'doc:1': fp('B')}
+    assert index.stale_ids() == ['doc:2']
+
+
+def test_partial_index_keeps_chunks_not_reached_yet():
+    index = ChunkFingerprintIndex({'doc:0': 'a', 'doc:1': 'b', 'doc:2': 'c'})
+    index.keep('doc:0')
+    assert not index.is_unchanged('doc:1', 'B')
+    index.record('doc:1', 'B')
+    # doc:2 hasn't been reached, so the resumed run still needs it.
+    assert index.partial() == {'doc:0': 'a', 'doc:1': 'B', 'doc:2': 'c'}
+    assert index.current == {'doc:0': 'a', 'doc:1': 'B'}
+
+
+def test_store_round_trips_sharded_index():
+    ddb = FakeDynamoDbClient()
+    store = ChunkFingerprintStore(ddb_client=ddb, fingerprints_per_item=2, table_name='test-table')
+    index = ChunkFingerprintIndex()
+    for i in range(5):
+        index.record(f"doc:{i}", ChunkFingerprintIndex.fingerprint(str(i)))
+    store.save_index(user_id, doc_id, index)
+    assert store.get_sort_keys(user_id, doc_id) == [f"{doc_id}#0000{i}" for i in range(3)]
+    assert store.load_index(user_id, doc_id).previous == index.current
+
+    # shrinking the index removes the shards it no longer needs.
+    smaller = ChunkFingerprintIndex()
+    smaller.record('doc:0', ChunkFingerprintIndex.fingerprint('0'))
+    store.save_index(user_id, doc_id, smaller)
+    assert store.get_sort_keys(user_id, doc_id) == [f"{doc_id}#00000"]
+
+    store.delete(user_id, doc_id)
+    assert ddb.items == {}
+
+
+def test_store_keeps_fingerprints_out_of_the_users_partition():
+    ddb = FakeDynamoDbClient()
+    store = ChunkFingerprintStore(ddb_client=ddb, table_name='test-table')
+    index = ChunkFingerprintIndex()
+    index.record('doc:0', 'abc')
+    store.save_index(user_id, doc_id, index)
+    assert [pk for (pk, _) in ddb.items] == [f"{user_id}#chunk_fingerprints"]
+
+
+def test_fingerprints_change_with_the_embedding_type():
+    # chunks embedded as queries by earlier ingestions get re-embedded.
+    index = ChunkFingerprintIndex({'doc:0': md5('text'.encode('utf-8')).hexdigest()})
+    assert not index.is_unchanged('doc:0', ChunkFingerprintIndex.fingerprint('text'))
+    assert ChunkFingerprintIndex.fingerprint('text', 'search_query') != ChunkFingerprintIndex.fingerprint('text')
@@ -77,4 +77,20 @@ def test_delete_ingestion_status(ingestion_status_provider):
         evt, {}
     )
     print(f"test_delete_ingestion_status got result: {result}")
-    assert result['statusCode'] == 200
\ No newline at end of file
+    assert result['statusCode'] == 200
+def test_get_collection_versions(ingestion_status_provider):
+    evt = {
+        'operation': 'get_collection_versions',
+        'origin': utils.get_ssm_params('ingestion_status_provider_function_name'),
+        'args': {
+            'collection_ids': [doc_id, 'test_unknown_collection_id']
+        }
+    }
+    result = ingestion_status_provider.handler(
+        evt, {}
+    )
+    assert result['statusCode'] == 200
+    versions = json.loads(result['body'])
+    # the delete above bumped the version of the doc's collection.
+    assert versions[doc_id] > 0 and \
+        versions['test_unknown_collection_id'] == 0
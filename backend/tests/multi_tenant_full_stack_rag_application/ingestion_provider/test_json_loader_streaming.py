@@ -0,0 +1,89 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import pytest
+from unittest.mock import Mock, patch
+
+from multi_tenant_full_stack_rag_application.ingestion_provider.ingestion_chunk_fingerprints import ChunkFingerprintIndex
+from multi_tenant_full_stack_rag_application.ingestion_provider.loaders.json_loader import JsonLoader
+
+
+source = 'collection_id/export.jsonl'
+
+
+@pytest.fixture
+def mock_utils():
+    with patch('multi_tenant_full_stack_rag_application.ingestion_provider.loaders.json_loader.utils') as mock:
+        mock.get_ssm_params.return_value = 'origin'
+        mock.get_vector_index_dimensions.return_value = 256
+        mock.embed_texts.side_effect = lambda texts, origin, dimensions: [[0.1, 0.2] for text in texts]
+        mock.save_vector_docs.side_effect = lambda docs, collection_id, origin: len(docs)
+        mock.delete_vector_docs.return_value = 0
+        yield mock
+
+
+@pytest.fixture
+def fingerprint_store():
+    store = Mock()
+    store.load_index.return_value = ChunkFingerprintIndex()
+    return store
+
+
+def write_jsonl(tmp_path, count, content_size=10):
+    path = tmp_path / 'export.jsonl'
+    with open(path, 'w') as f_out:
+        for i in range(count):
+            f_out.write(json.dumps({"id": i, "content": f"{i} " + "x" * content_size}) + "\n")
+    return str(path)
+
+
+def test_streams_lines_in_bounded_batches(tmp_path, mock_utils, fingerprint_store):
+    loader = JsonLoader(
+        batch_max_lines=4,
+        fingerprint_store=fingerprint_store,
+        max_tokens_per_chunk=100,
+        splitter=Mock()
+    )
+    result = loader.load_and_split(write_jsonl(tmp_path, 10), 'user', source, json_lines=True, stream=True)
+    assert result == 10
+    assert mock_utils.embed_texts.call_count == 3
+    # embedded at the collection's index dimensions, so save doesn't re-embed them.
+    assert {c.kwargs['dimensions'] for c in mock_utils.embed_texts.call_args_list} == {256}
+    assert [len(c.args[0]) for c in mock_utils.save_vector_docs.call_args_list] == [4, 4, 2]
+    mock_utils.embed_text.assert_not_called()
+    index = fingerprint_store.save_index.call_args.args[2]
+    assert len(index.current) == 10
+
+
+def test_batches_are_bounded_by_bytes(mock_utils, fingerprint_store):
+    loader = JsonLoader(
+        batch_max_bytes=100,
+        batch_max_lines=1000,
+        fingerprint_store=fingerprint_store,
+        max_tokens_per_chunk=100,
+        splitter=Mock()
+    )
+    lines = [(i, 'x' * 40) for i in range(5)] + [(5, 'y' * 500), (6, 'z')]
+    batches = list(loader.batch_lines(iter(lines)))
+    assert [[line_num for (line_num, _) in batch] for batch in batches] == [[0, 1], [2, 3], [4], [5], [6]]
+
+    # 20 characters, but 60 bytes.
+    lines = [(i, '\u4e2d' * 20) for i in range(4)]
+    batches = list(loader.batch_lines(iter(lines)))
+    assert [[line_num for (line_num, _) in batch] for batch in batches] == [[0], [1], [2], [3]]
+
+
+def test_streaming_resumes_and_checkpoints_per_batch(tmp_path, mock_utils, fingerprint_store):
+    loader = JsonLoader(
+        batch_max_lines=3,
+        fingerprint_store=fingerprint_store,
+        max_tokens_per_chunk=100,
+        splitter=Mock()
+    )
+    checkpoint = Mock()
+    checkpoint.lines_processed = 4
+    result = loader.load_and_split(write_jsonl(tmp_path, 10), 'user', source,
+        json_lines=True, stream=True, checkpoint=checkpoint)
+    assert result == 6
+    assert [c.args[0] for c in checkpoint.advance.call_args_list] == [7, 10]
@@ -0,0 +1,139 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+import random
+from math import ceil
+from unittest.mock import Mock
+
+from multi_tenant_full_stack_rag_application.ingestion_provider.splitters.optimized_paragraph_splitter import OptimizedParagraphSplitter
+from multi_tenant_full_stack_rag_application.utils.tokenizer_service import WordPieceTokenizer
+
+
+def get_token_count(text):
+    return ceil(len(text.split()) * 1.3)
+
+
+# the splitter as it was before it was made linear, without the prints,
+# which the new one has to match byte for byte.
+def reference_split(splitter, content, *, extra_header_text='', split_seq_num=0):
+    results = []
+    content = content.replace('\xa0', '')
+    content = content.replace('\t','')
+    split_seq = splitter.split_seqs[split_seq_num]
+    token_ct = get_token_count(extra_header_text) + get_token_count(content)
+    if token_ct <= splitter.max_tokens_per_chunk:
+        return [f"{extra_header_text}\n{content}"]
+    running_part = ''
+    running_part_toks = 0
+    for part in content.split(split_seq):
+        if part.strip() == '':
+            continue
+        part += split_seq
+        num_toks = get_token_count(part)
+        if running_part_toks + num_toks < splitter.max_tokens_per_chunk:
+            running_part += ' ' + part
+            running_part_toks += num_toks
+        else:
+            if running_part != '':
+                results.append(f"{extra_header_text} {running_part}")
+                running_part = ''
+                running_part_toks = 0
+            if num_toks > splitter.max_tokens_per_chunk:
+                results += reference_split(
+                    splitter,
+                    part,
+                    extra_header_text=extra_header_text,
+                    split_seq_num=split_seq_num + 1
+                )
+            else:
+                running_part = part
+                running_part_toks = num_toks
+    results.append(f"{extra_header_text} {running_part}")
+    return results
+
+
+# the reference runs out of split seqs when max tokens is tiny, where
+# the splitter hard splits instead.
+def split_or_error(split, *args, **kwargs):
+    try:
+        return split(*args, **kwargs)
+    except IndexError:
+        return IndexError
+
+
+def make_splitter(max_tokens_per_chunk, **kwargs):
+    return OptimizedParagraphSplitter(
+        max_tokens_per_chunk=max_tokens_per_chunk,
+        lambda_client=Mock(),
+        ssm_client=Mock(),
+        **kwargs
+    )
+
+
+def random_document(rand, num_paragraphs):
+    words = ['alpha', 'beta', 'gamma.', 'delta', 'e.g.', 'x', 'été', 'end.']
+    separators = [' ', ' ', ' ', '. ', '\n', '\n\n', '\n\n\n', '\n\n\n\n', ' \n ', '\t', '\xa0', '　', '\x1c', '  ']
+    paragraphs = []
+    for _ in range(num_paragraphs):
+        pieces = []
+        for _ in range(rand.randint(0, 60)):
+            pieces.append(rand.choice(words))
+            pieces.append(rand.choice(separators))
+        paragraphs.append(''.join(pieces))
+    return rand.choice(['', '\n', ' ']).join(paragraphs)
+
+
+@pytest.mark.parametrize('max_tokens', [2, 3, 4, 7, 20, 64, 200])
+def test_split_matches_reference(max_tokens):
+    rand = random.Random(max_tokens)
+    splitter = make_splitter(max_tokens)
+    for _ in range(40):
+        content = random_document(rand, rand.randint(1, 12))
+        for header in ['', '<FILENAME>\na.pdf\n</FILENAME>\n']:
+            chunks = splitter.split(content, 's3://bucket/c/a.txt', extra_header_text=header)
+            expected = split_or_error(reference_split, splitter, content, extra_header_text=header)
+            if expected is IndexError:
+                assert all(get_token_count(chunk[len(header):]) <= max_tokens for chunk in chunks)
+            else:
+                assert chunks == expected
+
+
+def test_split_matches_reference_at_edges():
+    splitter = make_splitter(5)
+    for content in [
+        '', ' ', 'one', 'one two three four five six',
+        'a b c d e f\n\n\n', '\n\n\na b c d e f', 'a b c\n\n\n\n\nd e f g h',
+        'a b c d.\n. e f g h i. ', 'a b c d e f g.', 'abc' * 10 + '. ' + 'd ' * 8
+    ]:
+        assert splitter.split(content, 'c/a.txt') == reference_split(splitter, content)
+
+
+def test_split_matches_reference_with_other_split_seqs():
+    rand = random.Random(7)
+    splitter = make_splitter(6, split_seqs=['--', 'a', ' '])
+    for _ in range(40):
+        content = ''.join(rand.choice(['a', 'b', '-', ' ', '--', 'ab ']) for _ in range(rand.randint(0, 80)))
+        assert splitter.split(content, 'c/a.txt') == reference_split(splitter, content)
+
+
+def test_small_content_is_one_chunk():
+    splitter = make_splitter(100)
+    assert splitter.split('a\tb\xa0c', 'c/a.txt', extra_header_text='h') == ['h\nabc']
+
+
+# runs without whitespace, like CJK text or code, that are bigger than a
+# chunk are cut once the split seqs run out.
+@pytest.mark.parametrize('content', ['中文' * 200, 'x' * 30 + ' ' + 'y,' * 100], ids=['cjk', 'code'])
+def test_runs_without_split_seqs_are_hard_split(content):
+    tokenizer = WordPieceTokenizer(['[UNK]', '中', '文', 'x', 'y', ','])
+    splitter = make_splitter(50)
+    splitter.estimate_tokens = tokenizer.count
+    splitter.estimate_tokens_many = tokenizer.count_many
+    chunks = splitter.split(content, 'c/a.txt', extra_header_text='h')
+    assert len(chunks) > 1
+    assert all(chunk.startswith('h ') and tokenizer.count(chunk[2:]) <= 50 for chunk in chunks)
+    # nothing's lost, though split seqs are added after parts as usual.
+    def text(value):
+        return ''.join(value.split()).replace('.', '')
+    assert ''.join(text(chunk[1:]) for chunk in chunks) == text(content)
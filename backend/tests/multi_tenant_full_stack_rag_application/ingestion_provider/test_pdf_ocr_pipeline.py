@@ -0,0 +1,118 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+import random
+from threading import Lock
+from time import sleep
+
+from multi_tenant_full_stack_rag_application.ingestion_provider.loaders.pdf_ocr_pipeline import PdfOcrPipeline, PdfPageRenderer, page_windows
+from multi_tenant_full_stack_rag_application.utils.adaptive_limiter import AdaptiveConcurrencyLimiter, is_throttling_error
+
+
+# writes a small file per page the way convert_from_path(paths_only=True) does.
+def fake_convert(tmp_path, calls):
+    def convert(pdf_path, *, fmt, output_folder, output_file, first_page, last_page, paths_only):
+        calls.append((first_page, last_page))
+        paths = []
+        for page_num in range(first_page, last_page + 1):
+            path = tmp_path / f"{output_file}{page_num}.jpg"
+            path.write_text(f"page {page_num}")
+            paths.append(str(path))
+        return paths
+    return convert
+
+
+def renderer(tmp_path, page_count, calls=None, window_pages=3):
+    return PdfPageRenderer(
+        convert=fake_convert(tmp_path, calls if calls is not None else []),
+        get_page_count=lambda path: page_count,
+        window_pages=window_pages
+    )
+
+
+def test_page_windows():
+    assert page_windows(7, 3) == [(1, 3), (4, 6), (7, 7)]
+    assert page_windows(3, 10) == [(1, 3)]
+    assert page_windows(0, 10) == []
+    assert page_windows(9, 4, first_page=3) == [(3, 6), (7, 9)]
+
+
+def test_renderer_yields_pages_in_order(tmp_path):
+    calls = []
+    pages = list(renderer(tmp_path, 7, calls).render('doc.pdf', str(tmp_path)))
+    assert [page_num for (page_num, _) in pages] == list(range(1, 8))
+    assert sorted(calls) == [(1, 3), (4, 6), (7, 7)]
+
+    pages = list(renderer(tmp_path, 7).render('doc.pdf', str(tmp_path), first_page=5, last_page=6))
+    assert [page_num for (page_num, _) in pages] == [5, 6]
+
+
+def test_pipeline_returns_pages_in_order_and_respects_concurrency(tmp_path):
+    lock = Lock()
+    running = [0, 0]
+
+    def ocr_page(page_num, path):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[0], running[1])
+        sleep(random.uniform(0, 0.01))
+        with lock:
+            running[0] -= 1
+        return f"text {page_num}"
+
+    pipeline = PdfOcrPipeline(
+        ocr_page,
+        limiter=AdaptiveConcurrencyLimiter(3),
+        renderer=renderer(tmp_path, 20)
+    )
+    assert pipeline.run('doc.pdf', str(tmp_path)) == [f"text {i}" for i in range(1, 21)]
+    assert running[1] <= 3
+    # page images are removed once they've been OCRed.
+    assert list(tmp_path.glob('*.jpg')) == []
+
+
+def test_pipeline_slows_down_when_still_throttled(tmp_path):
+    attempts = {}
+
+    def ocr_page(page_num, path):
+        attempts[page_num] = attempts.get(page_num, 0) + 1
+        if page_num == 2:
+            raise Exception("ThrottlingException: Too many requests, please wait before trying again.")
+        return f"text {page_num}"
+
+    limiter = AdaptiveConcurrencyLimiter(4)
+    pipeline = PdfOcrPipeline(
+        ocr_page,
+        limiter=limiter,
+        renderer=renderer(tmp_path, 4)
+    )
+    # the bedrock provider already retried it, so it isn't retried again.
+    with pytest.raises(Exception, match='ThrottlingException'):
+        pipeline.run('doc.pdf', str(tmp_path))
+    assert attempts[2] == 1
+    assert limiter.throttles == 1
+    assert limiter.limit == 2
+
+
+def test_pipeline_raises_other_errors(tmp_path):
+    def ocr_page(page_num, path):
+        if page_num == 5:
+            raise ValueError("bad page")
+        return f"text {page_num}"
+
+    pipeline = PdfOcrPipeline(ocr_page, renderer=renderer(tmp_path, 30))
+    with pytest.raises(ValueError):
+        pipeline.run('doc.pdf', str(tmp_path))
+
+
+def test_limiter_halves_and_recovers():
+    limiter = AdaptiveConcurrencyLimiter(8)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 2
+    for i in range(2):
+        limiter.on_success()
+    assert limiter.limit == 3
+    assert is_throttling_error(Exception("TooManyRequestsException: Rate exceeded"))
+    assert not is_throttling_error(Exception("ValidationException: bad input"))
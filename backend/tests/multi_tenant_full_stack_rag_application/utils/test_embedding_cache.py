@@ -0,0 +1,59 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+from unittest.mock import Mock
+
+from multi_tenant_full_stack_rag_application.utils.embedding_cache import EmbeddingCache, InMemorySharedEmbeddingCache, LruEmbeddingCache, embedding_cache_key
+
+
+model_id = 'amazon.titan-embed-text-v2:0'
+
+
+def test_key_normalizes_whitespace_only():
+    key = embedding_cache_key(model_id, 1024, 'search_query', 'what is  RAG?\n')
+    assert key == embedding_cache_key(model_id, 1024, 'search_query', ' what is RAG?')
+    assert key != embedding_cache_key(model_id, 1024, 'search_query', 'what is rag?')
+    assert key != embedding_cache_key(model_id, 512, 'search_query', 'what is RAG?')
+    assert key != embedding_cache_key(model_id, 1024, 'search_document', 'what is RAG?')
+
+
+def test_lru_evicts_by_entries_and_bytes():
+    cache = LruEmbeddingCache(max_entries=2, max_bytes=1024)
+    cache.put('a', [0.5] * 4)
+    cache.put('b', [0.25] * 4)
+    cache.get('a')
+    cache.put('c', [1.0] * 4)
+    assert cache.get('b') is None
+    assert cache.get('a') == [0.5] * 4
+    assert cache.evictions == 1
+
+    # 256 float32s fill the whole byte budget.
+    cache.put('d', [0.0] * 256)
+    assert len(cache) == 1
+    assert cache.size_bytes == 1024
+
+
+def test_shared_tier_fills_local_tier_and_counts_metrics():
+    shared = InMemorySharedEmbeddingCache()
+    shared.put('k', [0.5, 0.25])
+    cache = EmbeddingCache(LruEmbeddingCache(), shared)
+    assert cache.get('k') == [0.5, 0.25]
+    assert cache.get('k') == [0.5, 0.25]
+    assert cache.get('missing') is None
+    metrics = cache.metrics()
+    assert metrics['shared_hits'] == 1
+    assert metrics['local_hits'] == 1
+    assert metrics['misses'] == 1
+    assert metrics['entries'] == 1
+
+
+def test_shared_tier_failures_are_misses():
+    shared = Mock()
+    shared.get.side_effect = Exception('throttled')
+    shared.put.side_effect = Exception('throttled')
+    cache = EmbeddingCache(shared=shared)
+    assert cache.get('k') is None
+    cache.put('k', [1.0])
+    assert cache.get('k') == [1.0]
+    assert cache.metrics()['shared_errors'] == 2
@@ -0,0 +1,93 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from multi_tenant_full_stack_rag_application.utils.reranker import BedrockRerankScorer, LexicalOverlapScorer, Reranker, RerankScorer, rerank_query
+
+
+def doc(doc_id, content, score=0.5):
+    return {"id": doc_id, "content": content, "metadata": {"score": score}}
+
+
+def ids(docs):
+    return [d['id'] for d in docs]
+
+
+class FixedScorer(RerankScorer):
+    def __init__(self, scores):
+        self.scores = scores
+        self.calls = []
+
+    def score(self, query, texts):
+        self.calls.append((query, texts))
+        return [self.scores[text] for text in texts]
+
+
+class FailingScorer(RerankScorer):
+    def score(self, query, texts):
+        raise Exception('throttled')
+
+
+def test_lexical_overlap_scorer():
+    scores = LexicalOverlapScorer().score('refund policy', [
+        'our refund policy lasts 30 days',
+        'refund refund refund',
+        'shipping times',
+        ''
+    ])
+    assert scores[0] > scores[1] > scores[2] == scores[3] == 0.0
+
+
+def test_rerank_reorders_and_keeps_top_k():
+    docs = [doc('a', 'alpha'), doc('b', 'bravo'), doc('c', 'charlie')]
+    scorer = FixedScorer({'alpha': 0.1, 'bravo': 0.9, 'charlie': 0.5})
+    reranked = Reranker(scorer).rerank('q', docs, 2)
+    assert ids(reranked) == ['b', 'c']
+    assert [d['metadata'] for d in reranked] == [{"score": 0.5, "rerank_score": 0.9}, {"score": 0.5, "rerank_score": 0.5}]
+    assert scorer.calls == [('q', ['alpha', 'bravo', 'charlie'])]
+    # the docs passed in aren't changed.
+    assert docs[1]['metadata'] == {"score": 0.5}
+
+
+def test_near_duplicates_are_dropped():
+    text = 'the quick brown fox jumps over the lazy dog near the river bank today'
+    docs = [doc('a', text), doc('b', text + ' again'), doc('c', 'something else entirely')]
+    assert ids(Reranker(near_duplicate_threshold=0.8).rerank('q', docs, 3)) == ['a', 'c']
+    assert ids(Reranker(near_duplicate_threshold=1.0).rerank('q', docs, 3)) == ['a', 'b', 'c']
+
+
+def test_token_budget_packing():
+    docs = [doc('a', 'x ' * 50), doc('b', 'y ' * 80), doc('c', 'z ' * 30)]
+    reranker = Reranker(token_budget=100, token_counter=lambda texts, model_id=None: [len(text.split()) for text in texts])
+    # b doesn't fit after a, but c still does.
+    assert ids(reranker.rerank('q', docs, 3)) == ['a', 'c']
+    # the best doc is kept even when it's over the budget on its own.
+    assert ids(Reranker(token_budget=10).rerank('q', docs, 3)) == ['a']
+
+
+def test_scorer_failures_keep_search_order():
+    docs = [doc('a', 'alpha'), doc('b', 'bravo')]
+    assert Reranker(FailingScorer()).rerank('q', docs, 5) == docs
+    assert Reranker(FixedScorer({})).rerank('q', [], 5) == []
+
+
+def test_fetch_k_and_query():
+    assert Reranker(overfetch=3).fetch_k('5') == 15
+    assert Reranker(overfetch=0).fetch_k(5) == 5
+    assert rerank_query([
+        {"id": 'c1', "search_terms": 'refund policy'},
+        {"id": 'c2', "search_terms": 'returns'},
+        {"id": 'c3', "search_terms": 'refund policy'}
+    ]) == 'refund policy\nreturns'
+
+
+def test_bedrock_rerank_scorer():
+    calls = []
+
+    def invoke_bedrock(operation, kwargs, origin):
+        calls.append((operation, kwargs, origin))
+        return {"statusCode": 200, "operation": operation, "response": [0.2, 0.8]}
+
+    scorer = BedrockRerankScorer('amazon.rerank-v1:0', 'gen_handler', invoke_bedrock)
+    assert scorer.score('q', ['a', 'b']) == [0.2, 0.8]
+    assert scorer.score('q', []) == []
+    assert calls == [('rerank', {"model_id": 'amazon.rerank-v1:0', "query": 'q', "texts": ['a', 'b']}, 'gen_handler')]
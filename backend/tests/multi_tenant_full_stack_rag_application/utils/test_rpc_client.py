@@ -0,0 +1,86 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock
+
+from multi_tenant_full_stack_rag_application.utils import rpc_client
+from multi_tenant_full_stack_rag_application.utils.rpc_client import BotoLambdaTransport, InProcessTransport, JsonCodec, RpcClient
+
+
+ssm_params = {
+    'bedrock_provider_function_name': 'test-bedrock-function',
+    'vector_store_provider_function_name': 'test-vector-store-function',
+}
+
+
+@pytest.fixture
+def lambda_client():
+    client = Mock()
+    payload = MagicMock()
+    payload.read.return_value = json.dumps({"statusCode": 200, "via": "lambda"}).encode('utf-8')
+    client.invoke.return_value = {"Payload": payload}
+    return client
+
+
+@pytest.fixture
+def fake_handler(monkeypatch):
+    handler = Mock(return_value={"statusCode": 200, "via": "in_process"})
+    monkeypatch.setattr(rpc_client, 'import_module', lambda path: SimpleNamespace(handler=handler))
+    return handler
+
+
+def test_json_codec_round_trip():
+    codec = JsonCodec()
+    payload = {"operation": "embed_text", "args": {"input_text": "hello"}}
+    assert codec.decode(codec.encode(payload)) == payload
+
+
+def test_boto_transport_used_by_default(lambda_client):
+    client = RpcClient(transport=BotoLambdaTransport(lambda_client))
+    response = client.invoke('test-bedrock-function', {"operation": "list_models"})
+    assert response['via'] == 'lambda'
+    lambda_client.invoke.assert_called_once()
+
+
+def test_in_process_dispatch_for_opted_in_target(lambda_client, fake_handler):
+    client = RpcClient(
+        in_process=InProcessTransport(['bedrock_provider_function_name'], lambda: ssm_params),
+        transport=BotoLambdaTransport(lambda_client)
+    )
+    response = client.invoke('test-bedrock-function', {"operation": "list_models"})
+    assert response['via'] == 'in_process'
+    fake_handler.assert_called_once_with({"operation": "list_models"}, None)
+    lambda_client.invoke.assert_not_called()
+
+    response = client.invoke('test-vector-store-function', {"operation": "query"})
+    assert response['via'] == 'lambda'
+
+
+def test_in_process_errors_match_lambda_shape(lambda_client, fake_handler):
+    fake_handler.side_effect = Exception("boom")
+    client = RpcClient(
+        in_process=InProcessTransport(['*'], lambda: ssm_params),
+        transport=BotoLambdaTransport(lambda_client)
+    )
+    response = client.invoke('test-bedrock-function', {})
+    assert response['errorMessage'] == 'boom'
+
+
+def test_stream_in_process_yields_items(lambda_client, monkeypatch):
+    stream_handler = Mock(return_value=iter(["Hel", "lo"]))
+    monkeypatch.setattr(rpc_client, 'import_module', lambda path: SimpleNamespace(handler=Mock(), stream_handler=stream_handler))
+    client = RpcClient(
+        in_process=InProcessTransport(['*'], lambda: ssm_params),
+        transport=BotoLambdaTransport(lambda_client)
+    )
+    assert list(client.stream('test-bedrock-function', {"operation": "invoke_model_stream"})) == ["Hel", "lo"]
+    lambda_client.invoke.assert_not_called()
+
+
+def test_stream_falls_back_to_buffered_response(lambda_client):
+    lambda_client.invoke.return_value['Payload'].read.return_value = json.dumps({"statusCode": 200, "response": ["Hel", "lo"]}).encode('utf-8')
+    client = RpcClient(transport=BotoLambdaTransport(lambda_client))
+    assert list(client.stream('test-bedrock-function', {"operation": "invoke_model_stream"})) == ["Hel", "lo"]
@@ -0,0 +1,70 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+from unittest.mock import Mock
+
+from multi_tenant_full_stack_rag_application.utils.ssm_param_index import SsmParamIndex
+
+
+stack_name = 'test-stack'
+
+
+@pytest.fixture
+def ssm_client():
+    client = Mock()
+    client.get_parameters_by_path.side_effect = [
+        {
+            "Parameters": [
+                {"Name": f"/{stack_name}/origin_frontend", "Value": "localhost:5173"},
+                {"Name": f"/{stack_name}/origin_ingestion_provider", "Value": "ingestion-fn"},
+            ],
+            "NextToken": "page2"
+        },
+        {
+            "Parameters": [
+                {"Name": f"/{stack_name}/ingestion_bucket_name", "Value": "bucket"},
+            ]
+        }
+    ]
+    return client
+
+
+def test_lookups_match_prefix_scan(ssm_client):
+    index = SsmParamIndex(stack_name)
+    assert index.get('origin_ingestion_provider', ssm_client=ssm_client) == 'ingestion-fn'
+    assert index.get('origin_', ssm_client=ssm_client) == {
+        'origin_frontend': 'https://localhost:5173',
+        'origin_ingestion_provider': 'ingestion-fn'
+    }
+    assert index.get('missing', ssm_client=ssm_client) is None
+    assert len(index.get(ssm_client=ssm_client)) == 3
+    assert ssm_client.get_parameters_by_path.call_count == 2
+    assert ssm_client.get_parameters_by_path.call_args_list[0].kwargs['MaxResults'] == 10
+
+
+def test_invalidate_and_ttl_reload(ssm_client):
+    index = SsmParamIndex(stack_name, ttl=0)
+    response = {"Parameters": [{"Name": f"/{stack_name}/ingestion_bucket_name", "Value": "bucket"}]}
+    ssm_client.get_parameters_by_path.side_effect = None
+    ssm_client.get_parameters_by_path.return_value = response
+    index.get('ingestion_bucket_name', ssm_client=ssm_client)
+    index.get('ingestion_bucket_name', ssm_client=ssm_client)
+    assert ssm_client.get_parameters_by_path.call_count == 2
+
+    index.ttl = 300
+    index.get('ingestion_bucket_name', ssm_client=ssm_client)
+    assert ssm_client.get_parameters_by_path.call_count == 2
+    index.invalidate()
+    index.get('ingestion_bucket_name', ssm_client=ssm_client)
+    assert ssm_client.get_parameters_by_path.call_count == 3
+
+
+def test_prefix_results_are_bounded(ssm_client):
+    index = SsmParamIndex(stack_name, max_prefix_results=2)
+    index.get('origin_', ssm_client=ssm_client)
+    index.get('ingestion', ssm_client=ssm_client)
+    index.get('origin_', ssm_client=ssm_client)
+    assert index.get('missing', ssm_client=ssm_client) is None
+    assert list(index.prefix_results.keys()) == ['origin_', 'missing']
+    assert index.get('ingestion', ssm_client=ssm_client) == 'bucket'
@@ -0,0 +1,107 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import pytest
+from math import ceil
+
+from multi_tenant_full_stack_rag_application.utils.tokenizer_service import ByteLevelBpeTokenizer, TokenizerService, WordEstimateTokenizer, WordPieceTokenizer, load_tokenizer
+
+
+wordpiece_vocab = ['[UNK]', 'un', '##aff', '##able', 'the', 'cafe', 'is', 'open', '.', ',', '東', '京', 'run', '##ning', '(', ')', 'x']
+
+
+def test_word_estimate_matches_the_old_estimate():
+    tokenizer = WordEstimateTokenizer()
+    texts = ['', 'This is a dog', 'one\ntwo\r\nthree\x1cfour five', '  lots   of\t\tspace  ']
+    for text in texts:
+        assert tokenizer.count(text) == ceil(len(text.split()) * 1.3)
+    assert tokenizer.count_many(texts) == [tokenizer.count(text) for text in texts]
+
+
+def test_wordpiece_splits_words_into_pieces():
+    tokenizer = WordPieceTokenizer(wordpiece_vocab)
+    assert tokenizer.count('unaffable') == 3
+    assert tokenizer.count('The cafe is open, running.') == 8
+    # unknown words are one token however long they are.
+    assert tokenizer.count('zzzz unaffablezz') == 2
+
+
+def test_wordpiece_counts_cjk_and_accents():
+    tokenizer = WordPieceTokenizer(wordpiece_vocab)
+    assert tokenizer.count('東京') == 2
+    assert tokenizer.count('Café is\u200bopen') == 2
+    assert WordPieceTokenizer(wordpiece_vocab, lowercase=False).count('The') == 1
+
+
+def test_wordpiece_ascii_and_unicode_paths_agree():
+    tokenizer = WordPieceTokenizer(wordpiece_vocab)
+    text = 'the (cafe)\x0bis\x1copen,\trunning x.'
+    assert tokenizer.pre_tokenize(text) == tokenizer.pre_tokenize(text + '\u200b')
+    assert tokenizer.count(text) == tokenizer.count(text + ' 東') - 1
+
+
+def test_byte_level_bpe_applies_merges_in_rank_order():
+    merges = [('l', 'o'), ('lo', 'w'), ('Ġ', 'l'), ('Ġl', 'o'), ('e', 'r'), ('Ġlo', 'w')]
+    tokenizer = ByteLevelBpeTokenizer(merges)
+    # 'l o' outranks 'Ġ l', so ' lower' -> Ġ low er
+    assert tokenizer.count('low lower') == 4
+    assert tokenizer.count_many(['low', 'lower', '']) == [1, 2, 0]
+    # each byte of a character without merges is a token.
+    assert tokenizer.count('é') == 2
+
+
+def test_load_tokenizer_files(tmp_path):
+    (tmp_path / 'vocab.txt').write_text('\n'.join(wordpiece_vocab) + '\n')
+    assert load_tokenizer(str(tmp_path / 'vocab.txt')).count('unaffable') == 3
+
+    (tmp_path / 'wordpiece.json').write_text(json.dumps({
+        "normalizer": {"type": "BertNormalizer", "lowercase": False},
+        "model": {"type": "WordPiece", "vocab": {token: i for i, token in enumerate(wordpiece_vocab)}}
+    }))
+    tokenizer = load_tokenizer(str(tmp_path / 'wordpiece.json'))
+    assert isinstance(tokenizer, WordPieceTokenizer) and not tokenizer.lowercase
+
+    (tmp_path / 'bpe.json').write_text(json.dumps({
+        "pre_tokenizer": {"type": "ByteLevel", "add_prefix_space": False},
+        "model": {"type": "BPE", "vocab": {}, "merges": ["l o", ["lo", "w"]]}
+    }))
+    assert load_tokenizer(str(tmp_path / 'bpe.json')).count('low') == 1
+
+    (tmp_path / 'unigram.json').write_text(json.dumps({"model": {"type": "Unigram"}}))
+    with pytest.raises(ValueError):
+        load_tokenizer(str(tmp_path / 'unigram.json'))
+
+
+def test_service_loads_tokenizers_lazily_and_evicts_lru(tmp_path):
+    for model_id in ['model-a', 'model-b', 'org/model-c']:
+        (tmp_path / model_id).mkdir(parents=True)
+        (tmp_path / model_id / 'vocab.txt').write_text('\n'.join(wordpiece_vocab))
+    loaded = []
+    def loader(path):
+        loaded.append(path)
+        return load_tokenizer(path)
+    service = TokenizerService(default_model_id='model-a', loader=loader, max_loaded=2, vocab_dir=str(tmp_path))
+    assert loaded == []
+    assert service.count('unaffable') == 3
+    assert service.count_many(['unaffable', 'the'], 'model-b') == [3, 1]
+    service.count('the', 'model-a')
+    service.count('the', 'org/model-c')
+    assert list(service.tokenizers.keys()) == ['model-a', 'org/model-c']
+    assert service.loads == 3
+    service.count('the', 'model-a')
+    assert service.loads == 3
+    assert service.has_tokenizer('model-b')
+
+
+def test_service_falls_back_without_a_usable_vocab(tmp_path):
+    (tmp_path / 'broken').mkdir()
+    (tmp_path / 'broken' / 'tokenizer.json').write_text('{"model": {"type": "Unigram"}}')
+    service = TokenizerService(default_model_id=None, vocab_dir=str(tmp_path))
+    assert service.count('This is a dog') == 6
+    assert service.count('This is a dog', 'amazon.titan-embed-text-v2:0') == 6
+    assert service.count('This is a dog', 'broken') == 6
+    assert service.get_tokenizer('broken') is service.fallback
+    assert not service.has_tokenizer('broken')
+    assert not service.has_tokenizer(None)
+    assert service.missing == {'amazon.titan-embed-text-v2:0', 'broken'}
@@ -63,4 +63,24 @@ def test_invoke_lambda():
     assert int(response["statusCode"]) == 200
 
     
-    
\ No newline at end of file
+    
+
+class SavedDoc:
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+
+    def to_dict(self):
+        return {"doc_id": self.doc_id, "content": "text"}
+
+
+@pytest.mark.parametrize('response, saved', [
+    # the vector store function failed to run.
+    ({"errorMessage": "Task timed out after 60.00 seconds"}, 0),
+    ({"statusCode": 403, "body": '{"error": "Access denied"}'}, 0),
+    ({"statusCode": 200, "body": '{"doc_ids": ["a"], "errors": [{"doc_id": "b", "error": "mapper_parsing_exception"}]}'}, 1),
+    ({"statusCode": 200, "body": '{"doc_ids": ["a", "b"], "errors": []}'}, 2),
+])
+def test_save_vector_docs_only_counts_saved_docs(monkeypatch, response, saved):
+    monkeypatch.setattr(utils.utils, 'get_ssm_params', lambda param=None, **kwargs: param)
+    monkeypatch.setattr(utils.utils, 'invoke_lambda', lambda function_name, payload={}, **kwargs: response)
+    assert utils.save_vector_docs([SavedDoc('a'), SavedDoc('b')], 'coll1', 'origin') == saved
@@ -0,0 +1,51 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+from multi_tenant_full_stack_rag_application.vector_store_provider.chunk_window import chunk_position, expand_chunk_windows, neighbor_keys, parent_sources
+
+
+def hit(doc_id, content, index='idx1', source='coll1/a.pdf'):
+    return {"_index": index, "_id": doc_id, "_source": {"content": content, "metadata": {"source": source}}}
+
+
+def chunks(doc_ids):
+    return {('idx1', doc_id): {"content": doc_id.split(':')[-1]} for doc_id in doc_ids}
+
+
+def test_chunk_position():
+    assert chunk_position('a.pdf:3') == ('a.pdf', 3)
+    assert chunk_position('s3://bucket/a:b.txt:12') == ('s3://bucket/a:b.txt', 12)
+    assert chunk_position('record-123') is None
+    assert chunk_position('a.pdf:x') is None
+    assert chunk_position(':3') is None
+
+
+def test_neighbor_keys_skip_hits_and_negative_chunks():
+    results = [(0.9, hit('a.pdf:1', '1')), (0.8, hit('a.pdf:2', '2')), (0.7, hit('json-record', 'r'))]
+    assert neighbor_keys(results, 1) == [('idx1', 'a.pdf:0'), ('idx1', 'a.pdf:3')]
+
+
+def test_windows_from_one_source_are_merged():
+    results = [
+        (0.9, hit('a.pdf:5', '5')),
+        (0.8, hit('b.pdf:0', 'b0', source='coll1/b.pdf')),
+        (0.7, hit('a.pdf:3', '3')),
+        (0.6, hit('json-record', 'r')),
+    ]
+    neighbors = chunks(['a.pdf:2', 'a.pdf:4', 'a.pdf:6', 'b.pdf:1'])
+    expanded = expand_chunk_windows(results, neighbors, 1)
+    assert [(score, h['_id'], h['_source']['content'], h['_source']['metadata'].get('chunks')) for (score, h) in expanded] == [
+        (0.9, 'a.pdf:5', '2\n3\n4\n5\n6', [2, 3, 4, 5, 6]),
+        (0.8, 'b.pdf:0', 'b0\n1', [0, 1]),
+        (0.6, 'json-record', 'r', None),
+    ]
+    # the hits themselves aren't changed.
+    assert results[0][1]['_source']['content'] == '5'
+
+
+def test_parent_docs_use_every_fetched_chunk():
+    results = [(0.9, hit('a.pdf:5', '5')), (0.5, hit('a.pdf:1', '1', index='idx2'))]
+    assert parent_sources(results) == ['coll1/a.pdf']
+    neighbors = chunks(['a.pdf:0', 'a.pdf:1', 'a.pdf:9'])
+    expanded = expand_chunk_windows(results, neighbors, None)
+    assert [h['_source']['content'] for (_, h) in expanded] == ['0\n1\n5\n9', '1']
@@ -0,0 +1,65 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+
+from multi_tenant_full_stack_rag_application.vector_store_provider.metadata_filter import build_metadata_filter
+from multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_index_profile import OpenSearchIndexProfile
+
+
+def test_no_filters():
+    assert build_metadata_filter(None) is None
+    assert build_metadata_filter({}) is None
+    assert build_metadata_filter({"source": [], "fields": {}}) is None
+
+
+def test_source_filters():
+    assert build_metadata_filter({"source": "s3://bucket/user/coll/a.pdf"}) == {"bool": {"filter": [
+        {"bool": {"should": [{"term": {"metadata.source.keyword": "s3://bucket/user/coll/a.pdf"}}], "minimum_should_match": 1}}
+    ]}}
+    # a bare file name matches it in any folder, with wildcards escaped.
+    assert build_metadata_filter({"source": ["a*.pdf"]}) == {"bool": {"filter": [
+        {"bool": {"should": [
+            {"term": {"metadata.source.keyword": "a*.pdf"}},
+            {"wildcard": {"metadata.source.keyword": {"value": "*/a\\*.pdf"}}}
+        ], "minimum_should_match": 1}}
+    ]}}
+
+
+def test_date_and_field_filters():
+    result = build_metadata_filter({
+        "upsert_date": {"gte": "now-7d/d"},
+        "fields": {"author": "Jane Doe", "year": [2023, 2024], "draft": False}
+    })
+    assert result == {"bool": {"filter": [
+        {"range": {"metadata.upsert_date": {"gte": "now-7d/d"}}},
+        {"term": {"metadata.author.keyword": "Jane Doe"}},
+        {"bool": {"should": [{"term": {"metadata.year": 2023}}, {"term": {"metadata.year": 2024}}], "minimum_should_match": 1}},
+        {"term": {"metadata.draft": False}}
+    ]}}
+
+
+@pytest.mark.parametrize('filters', [
+    "source=a.pdf",
+    {"tenant": "x"},
+    {"source": 3},
+    {"upsert_date": "2024-01-01"},
+    {"upsert_date": {"after": "2024-01-01"}},
+    {"fields": {"bad field": "x"}},
+    {"fields": {"author": {"name": "x"}}},
+    {"fields": {"author": []}},
+])
+def test_invalid_filters(filters):
+    with pytest.raises(ValueError):
+        build_metadata_filter(filters)
+
+
+def test_knn_queries_filter_efficiently_where_the_engine_can():
+    metadata_filter = build_metadata_filter({"source": "a.pdf"})
+    faiss = OpenSearchIndexProfile(engine='faiss', dimensions=2).knn_query([0.1, 0.2], 5, metadata_filter)
+    assert faiss == {"knn": {"vector": {"vector": [0.1, 0.2], "k": 5, "filter": metadata_filter}}}
+    default = OpenSearchIndexProfile(dimensions=2).knn_query([0.1, 0.2], 5, metadata_filter)
+    assert default == {"bool": {
+        "must": [{"knn": {"vector": {"vector": [0.1, 0.2], "k": 5}}}],
+        "filter": [metadata_filter]
+    }}
@@ -0,0 +1,83 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import json
+import pytest
+from unittest.mock import Mock
+
+from multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_bulk_writer import OpenSearchBulkWriter
+
+
+def bulk_response(payload, failed_ids=[]):
+    lines = payload.strip().split("\n")
+    items = []
+    for action in lines[::2]:
+        doc_id = json.loads(action)['index']['_id']
+        result = {"_id": doc_id, "status": 201}
+        if doc_id in failed_ids:
+            result = {"_id": doc_id, "status": 400, "error": {"type": "mapper_parsing_exception"}}
+        items.append({"index": result})
+    return {"errors": len(failed_ids) > 0, "items": items}
+
+
+@pytest.fixture
+def os_client():
+    client = Mock()
+    client.bulk.side_effect = lambda body: bulk_response(body)
+    return client
+
+
+def test_flushes_at_doc_threshold(os_client):
+    writer = OpenSearchBulkWriter(os_client, 'test-index', max_docs=2)
+    for i in range(5):
+        writer.add(f"doc:{i}", {"content": f"content {i}", "vector": [0.1]})
+    result = writer.close()
+    assert os_client.bulk.call_count == 3
+    assert result['doc_ids'] == [f"doc:{i}" for i in range(5)]
+    assert result['errors'] == []
+
+
+def test_flushes_at_byte_threshold(os_client):
+    writer = OpenSearchBulkWriter(os_client, 'test-index', max_bytes=200, max_docs=1000)
+    for i in range(4):
+        writer.add(f"doc:{i}", {"content": "x" * 100})
+    writer.close()
+    assert os_client.bulk.call_count == 4
+
+
+def test_reports_per_item_failures():
+    client = Mock()
+    client.bulk.side_effect = lambda body: bulk_response(body, failed_ids=['doc:1'])
+    writer = OpenSearchBulkWriter(client, 'test-index')
+    for i in range(3):
+        writer.add(f"doc:{i}", {"content": f"content {i}"})
+    result = writer.close()
+    assert result['doc_ids'] == ['doc:0', 'doc:2']
+    assert len(result['errors']) == 1
+    assert result['errors'][0]['doc_id'] == 'doc:1'
+
+
+def test_failed_bulk_request_marks_all_items():
+    client = Mock()
+    client.bulk.side_effect = Exception("connection reset")
+    writer = OpenSearchBulkWriter(client, 'test-index')
+    writer.add("doc:0", {"content": "a"})
+    writer.add("doc:1", {"content": "b"})
+    result = writer.close()
+    assert result['doc_ids'] == []
+    assert [e['doc_id'] for e in result['errors']] == ['doc:0', 'doc:1']
+
+
+def test_deletes_share_the_bulk_payload():
+    client = Mock()
+    client.bulk.return_value = {"errors": False, "items": []}
+    writer = OpenSearchBulkWriter(client, 'test-index')
+    writer.add("doc:0", {"content": "a"})
+    writer.delete("doc:1")
+    result = writer.close()
+    assert client.bulk.call_count == 1
+    lines = client.bulk.call_args.kwargs['body'].strip().split("\n")
+    assert json.loads(lines[0]) == {"index": {"_index": "test-index", "_id": "doc:0"}}
+    assert json.loads(lines[2]) == {"delete": {"_index": "test-index", "_id": "doc:1"}}
+    assert len(lines) == 3
+    assert result['doc_ids'] == ['doc:0', 'doc:1']
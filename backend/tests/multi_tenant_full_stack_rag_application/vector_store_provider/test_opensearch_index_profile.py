@@ -0,0 +1,161 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import math
+import pytest
+import random
+
+from multi_tenant_full_stack_rag_application.vector_store_provider.opensearch_index_profile import OpenSearchIndexProfile
+
+
+titan_v2 = 'amazon.titan-embed-text-v2:0'
+
+
+def test_default_profile_is_the_original_mapping():
+    profile = OpenSearchIndexProfile().with_model_dimensions(titan_v2, 1024)
+    assert profile.index_body() == {
+        "settings": {"index": {"knn": True}},
+        "mappings": {
+            "_meta": {"index_profile": {"data_type": "float", "dimensions": 1024}},
+            "properties": {
+                "content": {"type": "text"},
+                "vector": {"type": "knn_vector", "dimension": 1024},
+                "metadata": {"type": "object"}
+            }
+        }
+    }
+
+
+def test_faiss_fp16_profile():
+    profile = OpenSearchIndexProfile.from_dict(
+        '{"engine": "faiss", "data_type": "fp16", "m": 16, "ef_construction": 256, "ef_search": 100, "space_type": "innerproduct", "dimensions": 512}'
+    )
+    body = profile.index_body()
+    assert body['settings']['index']['knn.algo_param.ef_search'] == 100
+    assert body['mappings']['properties']['vector'] == {
+        "type": "knn_vector",
+        "dimension": 512,
+        "method": {
+            "name": "hnsw",
+            "engine": "faiss",
+            "space_type": "innerproduct",
+            "parameters": {
+                "m": 16,
+                "ef_construction": 256,
+                "encoder": {"name": "sq", "parameters": {"type": "fp16"}}
+            }
+        }
+    }
+    # fp16 is quantized by the engine, so vectors go in as floats.
+    assert profile.encode_vector([0.5, -0.25]) == [0.5, -0.25]
+
+
+def test_lucene_byte_profile():
+    profile = OpenSearchIndexProfile(engine='lucene', data_type='byte', ef_search=64, dimensions=256)
+    body = profile.index_body()
+    assert body['mappings']['properties']['vector']['data_type'] == 'byte'
+    assert 'knn.algo_param.ef_search' not in body['settings']['index']
+    # 4 / sqrt(256) is scaled to 127.
+    assert body['mappings']['_meta']['byte_scale'] == 508
+    assert profile.encode_vector([0.25, -0.25, 0.125, 0.0, 1.0, -1.0]) == [127, -127, 64, 0, 127, -128]
+    assert profile.knn_query([0.125, -0.125], 3) == {
+        "knn": {"vector": {"vector": [64, -64], "k": 3, "method_parameters": {"ef_search": 64}}}
+    }
+
+
+def unit_vector(values):
+    norm = math.sqrt(sum(x * x for x in values))
+    return [x / norm for x in values]
+
+
+def top_k(query, vectors, k=10):
+    scores = [sum(q * x for (q, x) in zip(query, vector)) for vector in vectors]
+    return set(sorted(range(len(vectors)), key=lambda i: -scores[i])[:k])
+
+
+def test_byte_vectors_keep_the_recall_of_float_vectors():
+    dimensions = 1024
+    rng = random.Random(7)
+    docs = [unit_vector([rng.gauss(0, 1) for _ in range(dimensions)]) for _ in range(300)]
+    queries = [
+        unit_vector([x + rng.gauss(0, 0.5) / math.sqrt(dimensions) for x in rng.choice(docs)])
+        for _ in range(20)
+    ]
+    profile = OpenSearchIndexProfile(engine='faiss', data_type='byte', dimensions=dimensions)
+    encoded = [profile.encode_vector(doc) for doc in docs]
+    recall = sum(
+        len(top_k(profile.encode_vector(query), encoded) & top_k(query, docs))
+        for query in queries
+    ) / (10 * len(queries))
+    assert recall >= 0.95
+    zeros = sum(x == 0 for vector in encoded for x in vector) / (len(encoded) * dimensions)
+    assert zeros < 0.02
+
+
+def test_byte_scale_is_calibrated_on_sample_vectors():
+    rng = random.Random(7)
+    # embeddings aren't isotropic. Here a few dimensions are much larger
+    # than the rest, so the default scale clips them.
+    samples = [unit_vector([rng.gauss(0, 20 if i < 8 else 1) for i in range(256)]) for _ in range(20)]
+    profile = OpenSearchIndexProfile(engine='lucene', data_type='byte', dimensions=256)
+    calibrated = profile.with_calibrated_byte_scale(samples)
+    assert calibrated == profile
+    assert calibrated.get_byte_scale() < profile.get_byte_scale()
+
+    def clipped(profile):
+        return sum(abs(x) >= 127 for vector in samples for x in profile.encode_vector(vector))
+    assert clipped(calibrated) <= 0.002 * 256 * len(samples) < clipped(profile)
+    # the scale is kept in the mapping, so every container encodes queries the same way.
+    mapping = calibrated.index_body()['mappings']
+    assert OpenSearchIndexProfile.from_mapping(mapping).byte_scale == calibrated.byte_scale
+    # float profiles have nothing to calibrate.
+    assert OpenSearchIndexProfile(dimensions=256).with_calibrated_byte_scale(samples).byte_scale is None
+
+
+def test_byte_indices_from_before_byte_scale_was_stored_keep_scaling_by_127():
+    profile = OpenSearchIndexProfile(engine='lucene', data_type='byte', dimensions=256)
+    mapping = profile.index_body()['mappings']
+    del mapping['_meta']['byte_scale']
+    assert OpenSearchIndexProfile.from_mapping(mapping).encode_vector([0.5]) == [64]
+
+
+@pytest.mark.parametrize('kwargs', [
+    {"engine": "annoy"},
+    {"data_type": "int4"},
+    {"data_type": "fp16", "engine": "lucene"},
+    {"data_type": "byte", "engine": "nmslib"},
+    {"data_type": "byte"},
+    {"m": 16},
+    {"engine": "faiss", "m": 0},
+    {"engine": "faiss", "ef_search": "100"},
+    {"engine": "lucene", "data_type": "byte", "byte_scale": 0},
+])
+def test_invalid_profiles(kwargs):
+    with pytest.raises(ValueError):
+        OpenSearchIndexProfile(**kwargs)
+
+
+def test_dimensions_are_checked_against_the_model():
+    assert OpenSearchIndexProfile(dimensions=256).with_model_dimensions(titan_v2, 1024).dimensions == 256
+    assert OpenSearchIndexProfile().with_model_dimensions('cohere.embed-english-v3', 1024).dimensions == 1024
+    assert OpenSearchIndexProfile(dimensions=1024).with_model_dimensions('cohere.embed-english-v3', 1024).dimensions == 1024
+    with pytest.raises(ValueError):
+        OpenSearchIndexProfile(dimensions=384).with_model_dimensions(titan_v2, 1024)
+    with pytest.raises(ValueError):
+        OpenSearchIndexProfile(dimensions=512).with_model_dimensions('cohere.embed-english-v3', 1024)
+
+
+def test_profiles_round_trip_through_mappings():
+    profile = OpenSearchIndexProfile(engine='faiss', data_type='byte', m=24, dimensions=512)
+    assert OpenSearchIndexProfile.from_mapping(profile.index_body()['mappings']) == profile
+    legacy_mapping = {"properties": {"vector": {"type": "knn_vector", "dimension": 1024}}}
+    assert OpenSearchIndexProfile.from_mapping(legacy_mapping) == OpenSearchIndexProfile(dimensions=1024)
+
+
+def test_which_migrations_can_reuse_vectors():
+    float_1024 = OpenSearchIndexProfile(dimensions=1024)
+    assert float_1024.stores_vectors_like(OpenSearchIndexProfile(engine='faiss', data_type='fp16', dimensions=1024))
+    assert not float_1024.stores_vectors_like(OpenSearchIndexProfile(engine='lucene', data_type='byte', dimensions=1024))
+    assert not float_1024.stores_vectors_like(OpenSearchIndexProfile(dimensions=256))
+    assert float_1024.name() == OpenSearchIndexProfile(data_type='float', dimensions=1024).name()
+    assert float_1024.name() != OpenSearchIndexProfile(dimensions=256).name()
@@ -0,0 +1,70 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  SPDX-License-Identifier: MIT-0
+
+import pytest
+
+from multi_tenant_full_stack_rag_application.vector_store_provider.search_result_fusion import fuse, fuse_search_results, normalize_scores
+
+
+def hits(index, *scores):
+    return [{"_index": index, "_id": f"doc{i}", "_score": score} for i, score in enumerate(scores)]
+
+
+def ranked(results):
+    return [(hit['_index'], hit['_id'], round(score, 4)) for (score, hit) in results]
+
+
+# coll1's best match is weaker than coll2's worst, which per collection
+# max normalization would have hidden by scoring both 1.0.
+coll1 = hits('coll1', 0.6, 0.5)
+coll2 = hits('coll2', 0.9, 0.8, 0.7)
+
+
+def test_raw_scores_merge_into_a_global_top_k():
+    results = fuse(normalize_scores([coll1, coll2], 'raw'), 3)
+    assert ranked(results) == [('coll2', 'doc0', 0.9), ('coll2', 'doc1', 0.8), ('coll2', 'doc2', 0.7)]
+
+
+def test_min_max_is_across_collections():
+    results = fuse(normalize_scores([coll1, coll2], 'min_max'), 10)
+    assert ranked(results) == [
+        ('coll2', 'doc0', 1.0), ('coll2', 'doc1', 0.75), ('coll2', 'doc2', 0.5),
+        ('coll1', 'doc0', 0.25), ('coll1', 'doc1', 0.0)
+    ]
+    # one score, or all the same, can't be spread out.
+    assert ranked(fuse(normalize_scores([hits('coll1', 0.3, 0.3)], 'min_max'), 2)) == [('coll1', 'doc0', 1.0), ('coll1', 'doc1', 1.0)]
+
+
+def test_rrf_scores_by_rank():
+    results = fuse(normalize_scores([coll1, coll2], 'rrf', rank_constant=1), 4)
+    # equal ranks tie, and ties keep the order the lists were given in.
+    assert ranked(results) == [('coll1', 'doc0', 0.5), ('coll2', 'doc0', 0.5), ('coll1', 'doc1', 0.3333), ('coll2', 'doc1', 0.3333)]
+
+
+def test_fuse_sums_weighted_scores_of_repeated_hits():
+    lexical = [(('coll1', 'a'), 1.0, {"_id": 'a'}), (('coll1', 'b'), 0.5, {"_id": 'b'})]
+    semantic = [(('coll1', 'b'), 1.0, {"_id": 'b'}), (('coll1', 'c'), 0.8, {"_id": 'c'})]
+    results = fuse([lexical, semantic], 3, weights=[0.3, 0.7])
+    assert [(hit['_id'], round(score, 4)) for (score, hit) in results] == [('b', 0.85), ('c', 0.56), ('a', 0.3)]
+
+
+def test_score_threshold_applies_to_knn_scores():
+    results = fuse_search_results([coll1, coll2], 10, normalization='min_max', score_threshold=0.65)
+    assert ranked(results) == [('coll2', 'doc0', 1.0), ('coll2', 'doc1', 0.5), ('coll2', 'doc2', 0.0)]
+    assert fuse_search_results([coll1], 10, score_threshold=0.95) == []
+
+
+def test_hybrid_fuses_lexical_and_semantic_lists():
+    semantic = hits('coll1', 0.9, 0.8, 0.7)
+    # BM25 scores are on another scale, and rank doc2 first.
+    lexical = [{"_index": 'coll1', "_id": 'doc2', "_score": 12.0}, {"_index": 'coll1', "_id": 'doc3', "_score": 4.0}]
+    results = fuse_search_results([semantic], 3, lexical_lists=[lexical], normalization='min_max', weights={"lexical": 0.6, "semantic": 0.4})
+    assert ranked(results) == [('coll1', 'doc2', 0.6), ('coll1', 'doc0', 0.4), ('coll1', 'doc1', 0.2)]
+    # without lexical lists it's the semantic ranking, unweighted.
+    assert ranked(fuse_search_results([semantic], 1, normalization='raw')) == [('coll1', 'doc0', 0.9)]
+
+
+def test_empty_and_unknown():
+    assert fuse(normalize_scores([[], []], 'min_max'), 5) == []
+    with pytest.raises(ValueError):
+        normalize_scores([coll1], 'max')
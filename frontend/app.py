@@ -100,7 +100,8 @@ with open('backend_outputs.json', 'r') as backend_outputs:
             for subkey in list(config_in[key].keys()):
                 if subkey == 'GenerationHandlerHttpApiUrl':
                     config['generation_api_url'] = config_in[key][subkey].rstrip('/')
-                    break
+                elif subkey == 'GenerationHandlerWebSocketUrl':
+                    config['generation_stream_url'] = config_in[key][subkey]
         elif 'AuthProviderStack' in key:
             for subkey in list(config_in[key].keys()):
                 if subkey == "UserPoolClientId":
@@ -134,6 +135,9 @@ ReactUiStack(app,  config['stack_name_frontend'],
     doc_collections_api_url=config["document_collections_api_url"],
     enabled_enrichment_pipelines=config["enabled_enrichment_pipelines"],
     # generation_api_url=config["generation_api_url"],
+    # empty until the generation handler stack is deployed, and then the
+    # ui falls back to the http api.
+    generation_stream_url=config.get('generation_stream_url', ''),
     identity_pool_id=config['identity_pool_id'],
     ingestion_bucket_name=config['ingestion_bucket_name'],
     prompt_templates_api_url=config['prompt_templates_api_url'],
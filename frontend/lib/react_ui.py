@@ -21,6 +21,7 @@ class ReactUiStack(Stack):
         doc_collections_api_url: str,
         enabled_enrichment_pipelines: str,
         # generation_api_url: str,
+        generation_stream_url: str,
         identity_pool_id: str,
         ingestion_bucket_name: str,
         #initialization_api_url: str,
@@ -57,6 +58,7 @@ class ReactUiStack(Stack):
                     'DOC_COLLECTIONS_API_URL': doc_collections_api_url,
                     'ENABLED_ENRICHMENT_PIPELINES': enabled_enrichment_pipelines,
                     # 'GENERATION_API_URL': generation_api_url,
+                    'GENERATION_STREAM_URL': generation_stream_url,
                     # 'INITIALIZATION_API_URL': initialization_api_url,
                     'AWS_REGION': region,
                     'INGESTION_BUCKET_NAME': ingestion_bucket_name,
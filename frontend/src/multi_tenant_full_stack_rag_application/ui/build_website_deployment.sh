@@ -27,6 +27,9 @@ export ESCAPED_URL=$(echo $GENERATION_API_URL | sed 's/\//\\\//g') && \
 echo $ESCAPED_URL && \
 echo "Substituting $ESCAPED_URL for <GENERATION_API_URL> ." && \
 sed -i "s/<GENERATION_API_URL>/$ESCAPED_URL/g" aws-exports.js && \
+export ESCAPED_URL=$(echo $GENERATION_STREAM_URL | sed 's/\//\\\//g') && \
+echo "Substituting $ESCAPED_URL for <GENERATION_STREAM_URL> ." && \
+sed -i "s/<GENERATION_STREAM_URL>/$ESCAPED_URL/g" aws-exports.js && \
 echo "Substituting $AWS_REGION for <REGION>." && \
 sed -i "s/<REGION>/$AWS_REGION/g" aws-exports.js && \
 export ESCAPED_URL=$(echo $INITIALIZATION_API_URL | sed 's/\//\\\//g') && \
@@ -551,7 +551,12 @@ function ChatPlayground(props) {
     }
     // // console.log("Sending postObject:");
     // // console.dir(postObject);
-    const aiResponse = await api.generate(postObject);
+    // show the response as it streams in, then replace it with the
+    // finished one.
+    const aiResponse = await api.generate(postObject, (partialResponse) => {
+      setShowTypingIndicator(false)
+      setMessages(messages.concat([newMsg, createMessage(partialResponse, messageNum, aiUser)]))
+    });
     // let aiResponse = response['ai_message'];
     // const re = new RegExp("\<response\>(.*)\<\/response\>");
     // if (aiResponse.includes('<response>')) {
@@ -178,7 +178,15 @@ export default class Api {
       this.downloadBlob(response.Body, fileName)
     }
   
-    async generate(postObject) {
+    // when the generation websocket api is deployed, onFragment is called
+    // with the response so far each time a fragment arrives, and the full
+    // response is returned once it's done. Otherwise the response is
+    // fetched in one piece from the http api.
+    async generate(postObject, onFragment = null) {
+      const streamUrl = awsExports.generation_stream_url
+      if (onFragment && streamUrl && streamUrl.startsWith('wss://')) {
+        return this.generateStream(streamUrl, postObject, onFragment)
+      }
       let url = this.apiUrls['generation']
       // console.log(`Got api url ${url}`)
       let result = await this.postData(url, postObject)
@@ -189,6 +197,39 @@ export default class Api {
       return response
     }
 
+    async generateStream(url, postObject, onFragment) {
+      if (!this.idToken) {
+        await this.getCurrentAuth()
+      }
+      return new Promise((resolve, reject) => {
+        let response = ''
+        const socket = new WebSocket(url)
+        socket.onopen = () => {
+          socket.send(JSON.stringify({
+            action: 'generate',
+            auth_token: this.idToken,
+            ...postObject
+          }))
+        }
+        socket.onmessage = (evt) => {
+          const message = JSON.parse(evt.data)
+          if (message.type === 'fragment') {
+            response += message.html
+            onFragment(sanitizeHtml(response))
+          }
+          else if (message.type === 'done') {
+            socket.close()
+            resolve(sanitizeHtml(response))
+          }
+          else if (message.type === 'error') {
+            socket.close()
+            reject(new Error(message.message))
+          }
+        }
+        socket.onerror = (err) => reject(err)
+      })
+    }
+
     async getCurrentAuth() {
       if (!this.session) {
         this.session = await this.getSession()